@@ -1,17 +1,22 @@
-import sqlite3
 import os
 from datetime import datetime
 
-import os
-DATABASE = os.path.join(os.path.dirname(__file__), 'bizdrive.db')
+from archive_store import ARCHIVED_ACCIDENT_STATUSES, LIVE_SOURCES, with_archives
+from blob_store import register_blob_references, release_blobs
+from db_helpers import DATABASE, get_connection
+
 ACCIDENT_PHOTO_FOLDER = 'static/accident_photos'
+THUMBNAIL_FOLDER = os.path.join(ACCIDENT_PHOTO_FOLDER, 'thumbs')
+WEB_FOLDER = os.path.join(ACCIDENT_PHOTO_FOLDER, 'web')
 
-# Ensure photo folder exists
-os.makedirs(ACCIDENT_PHOTO_FOLDER, exist_ok=True)
+# Ensure photo folders exist; photos and derivatives are content-addressed blobs
+register_blob_references(ACCIDENT_PHOTO_FOLDER, [('accident_photos', 'filename')])
+register_blob_references(THUMBNAIL_FOLDER, [('accident_photos', 'thumbnail_filename')])
+register_blob_references(WEB_FOLDER, [('accident_photos', 'web_filename')])
 
 def init_accident_table():
     """Create accident tables if they do not exist."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     
     # Main accidents table
@@ -60,6 +65,49 @@ def init_accident_table():
         )
     ''')
     
+    # Thumbnail and web-sized versions (added after the original schema)
+    cursor.execute("PRAGMA table_info(accident_photos)")
+    photo_columns = [row[1] for row in cursor.fetchall()]
+    if 'thumbnail_filename' not in photo_columns:
+        cursor.execute("ALTER TABLE accident_photos ADD COLUMN thumbnail_filename TEXT")
+    if 'web_filename' not in photo_columns:
+        cursor.execute("ALTER TABLE accident_photos ADD COLUMN web_filename TEXT")
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accident_photos_accident
+        ON accident_photos(accident_id)
+    ''')
+    
+    # Period filters compare the raw ISO date, so these indexes apply
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accidents_user_date
+        ON accidents(user_id, accident_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accidents_date
+        ON accidents(accident_date)
+    ''')
+    
+    # Child key of the vehicles foreign key: deleting a vehicle finds its accidents by it
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accidents_vehicle
+        ON accidents(vehicle_id)
+    ''')
+    
+    # Releasing a photo counts the rows still holding each of its blob keys
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accident_photos_filename
+        ON accident_photos(filename)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accident_photos_thumbnail
+        ON accident_photos(thumbnail_filename)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_accident_photos_web
+        ON accident_photos(web_filename)
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -74,7 +122,7 @@ def add_accident(user_id, vehicle_id, accident_date, accident_time, location,
                 notes=None, status='Open'):
     """Add a new accident record."""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
         timestamp = datetime.utcnow().isoformat()
 
@@ -112,7 +160,7 @@ def add_accident(user_id, vehicle_id, accident_date, accident_time, location,
 
 def get_user_accidents(user_id, vehicle_id=None, status=None):
     """Get all accidents for a user with optional filters."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
 
     # JOIN with vehicles table to get vehicle registration
@@ -121,9 +169,14 @@ def get_user_accidents(user_id, vehicle_id=None, status=None):
                v.registration as vehicle_registration,
                v.make as vehicle_make,
                v.model as vehicle_model,
-               (SELECT COUNT(*) FROM accident_photos WHERE accident_id = a.id) as photo_count
-        FROM accidents a
+               (SELECT COUNT(*) FROM {accident_photos} WHERE accident_id = a.id) as photo_count,
+               cover.filename as cover_filename,
+               cover.thumbnail_filename as cover_thumbnail_filename
+        FROM {accidents} a
         LEFT JOIN vehicles v ON a.vehicle_id = v.id
+        LEFT JOIN {accident_photos} cover ON cover.id = (
+            SELECT id FROM {accident_photos}
+            WHERE accident_id = a.id ORDER BY uploaded_at LIMIT 1)
         WHERE a.user_id = ?
     """
     params = [user_id]
@@ -138,6 +191,11 @@ def get_user_accidents(user_id, vehicle_id=None, status=None):
     
     query += " ORDER BY a.accident_date DESC, a.accident_time DESC"
     
+    # Open claims are never archived
+    if status and status != 'All' and status not in ARCHIVED_ACCIDENT_STATUSES:
+        query = query.format_map(LIVE_SOURCES)
+    else:
+        query = with_archives(conn, query)
     cursor.execute(query, params)
     rows = cursor.fetchall()
     conn.close()
@@ -175,23 +233,33 @@ def get_user_accidents(user_id, vehicle_id=None, status=None):
             "vehicle_make": row[27],
             "vehicle_model": row[28],
             "photo_count": row[29],
+            # First photo, for the list's thumbnail (see photo_url in app.py)
+            "cover_photo": {"filename": row[30], "thumbnail_filename": row[31]} if row[30] else None,
         })
     return accidents
 
 
 def get_accident_by_id(accident_id, user_id):
     """Get a single accident record with photos."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     
-    cursor.execute("""
+    query = """
         SELECT a.*, v.registration as vehicle_registration, v.make, v.model
-        FROM accidents a
+        FROM {accidents} a
         JOIN vehicles v ON a.vehicle_id = v.id
         WHERE a.id = ? AND a.user_id = ?
-    """, (accident_id, user_id))
+    """
     
+    # Live accidents first; archived ones are shown read-only
+    sources = LIVE_SOURCES
+    cursor.execute(query.format_map(sources), (accident_id, user_id))
     row = cursor.fetchone()
+    if not row:
+        sources = {'accidents': with_archives(conn, '{accidents}'),
+                   'accident_photos': with_archives(conn, '{accident_photos}')}
+        cursor.execute(query.format_map(sources), (accident_id, user_id))
+        row = cursor.fetchone()
     
     if not row:
         conn.close()
@@ -199,11 +267,11 @@ def get_accident_by_id(accident_id, user_id):
     
     # Get photos
     cursor.execute("""
-        SELECT id, filename, description, uploaded_at
-        FROM accident_photos
+        SELECT id, filename, description, uploaded_at, thumbnail_filename, web_filename
+        FROM {accident_photos}
         WHERE accident_id = ?
         ORDER BY uploaded_at
-    """, (accident_id,))
+    """.format_map(sources), (accident_id,))
     
     photos = cursor.fetchall()
     conn.close()
@@ -214,7 +282,9 @@ def get_accident_by_id(accident_id, user_id):
             'id': photo[0],
             'filename': photo[1],
             'description': photo[2],
-            'uploaded_at': photo[3]
+            'uploaded_at': photo[3],
+            'thumbnail_filename': photo[4],
+            'web_filename': photo[5]
         })
     
     return {
@@ -254,7 +324,7 @@ def get_accident_by_id(accident_id, user_id):
 def update_accident(accident_id, user_id, **kwargs):
     """Update an accident record with provided fields."""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
         
         # Build UPDATE query dynamically based on provided kwargs
@@ -311,78 +381,128 @@ def delete_accident(accident_id, user_id):
         if not accident:
             return False, "Accident not found"
         
-        # Delete photo files
-        for photo in accident['photos']:
-            photo_path = os.path.join(ACCIDENT_PHOTO_FOLDER, photo['filename'])
-            if os.path.exists(photo_path):
-                try:
-                    os.remove(photo_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete photo file: {e}")
-        
         # Delete from database (cascade will delete photos table entries)
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
         cursor.execute("DELETE FROM accidents WHERE id = ? AND user_id = ?", (accident_id, user_id))
+        if cursor.rowcount == 0:
+            # Archived accidents are readable but not deleted from here
+            conn.rollback()
+            conn.close()
+            return False, "Accident not found"
         cursor.execute("DELETE FROM accident_photos WHERE accident_id = ?", (accident_id,))
         conn.commit()
         conn.close()
         
+        # Release photo files once no row references them
+        for photo in accident['photos']:
+            remove_photo_files(photo)
+        
         return True, "Accident deleted successfully"
     except Exception as e:
         return False, str(e)
 
 
-def add_accident_photo(accident_id, filename, description=None):
-    """Add a photo to an accident record."""
+def add_accident_photos(accident_id, photos):
+    """
+    Add several photos to an accident record in one transaction.
+    
+    Args:
+        accident_id: ID of the accident
+        photos: List of dicts with filename and optional description,
+                thumbnail_filename and web_filename
+        
+    Returns:
+        tuple: (success, message, photo_ids)
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
         timestamp = datetime.utcnow().isoformat()
         
-        cursor.execute("""
-            INSERT INTO accident_photos (accident_id, filename, description, uploaded_at)
-            VALUES (?, ?, ?, ?)
-        """, (accident_id, filename, description, timestamp))
+        photo_ids = []
+        for photo in photos:
+            cursor.execute("""
+                INSERT INTO accident_photos (accident_id, filename, description, uploaded_at,
+                                             thumbnail_filename, web_filename)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (accident_id, photo['filename'], photo.get('description'), timestamp,
+                  photo.get('thumbnail_filename'), photo.get('web_filename')))
+            photo_ids.append(cursor.lastrowid)
         
         conn.commit()
-        photo_id = cursor.lastrowid
         conn.close()
-        return True, "Photo added successfully", photo_id
+        return True, "Photos added successfully", photo_ids
     except Exception as e:
-        return False, str(e), None
+        return False, str(e), []
+
+
+def get_photos_missing_derivatives():
+    """Get photos that have no thumbnail yet."""
+    conn = get_connection(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, filename FROM accident_photos WHERE thumbnail_filename IS NULL")
+    photos = [{'id': row[0], 'filename': row[1]} for row in cursor.fetchall()]
+    conn.close()
+    return photos
+
+
+def set_photo_derivatives(photo_id, thumbnail_filename, web_filename):
+    """Record the thumbnail and web version of a photo."""
+    conn = get_connection(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE accident_photos SET thumbnail_filename = ?, web_filename = ?
+        WHERE id = ?
+    """, (thumbnail_filename, web_filename, photo_id))
+    conn.commit()
+    conn.close()
+
+
+def remove_photo_files(photo):
+    """
+    Release a photo's original, thumbnail and web version.
+    Files still referenced by another photo row are kept.
+    
+    Args:
+        photo: Dict with filename and optional thumbnail_filename/web_filename
+    """
+    release_blobs([
+        (ACCIDENT_PHOTO_FOLDER, photo['filename']),
+        (THUMBNAIL_FOLDER, photo.get('thumbnail_filename')),
+        (WEB_FOLDER, photo.get('web_filename')),
+    ])
 
 
 def delete_accident_photo(photo_id, accident_id):
     """Delete a photo from an accident record."""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
         
-        # Get filename
-        cursor.execute("SELECT filename FROM accident_photos WHERE id = ? AND accident_id = ?", 
-                      (photo_id, accident_id))
+        # Get filenames
+        cursor.execute("""
+            SELECT filename, thumbnail_filename, web_filename
+            FROM accident_photos WHERE id = ? AND accident_id = ?
+        """, (photo_id, accident_id))
         result = cursor.fetchone()
         
         if not result:
             conn.close()
             return False, "Photo not found"
         
-        filename = result[0]
-        
         # Delete from database
         cursor.execute("DELETE FROM accident_photos WHERE id = ? AND accident_id = ?", 
                       (photo_id, accident_id))
         conn.commit()
         conn.close()
         
-        # Delete file
-        photo_path = os.path.join(ACCIDENT_PHOTO_FOLDER, filename)
-        if os.path.exists(photo_path):
-            try:
-                os.remove(photo_path)
-            except Exception as e:
-                print(f"Warning: Could not delete photo file: {e}")
+        # Delete files
+        remove_photo_files({
+            'filename': result[0],
+            'thumbnail_filename': result[1],
+            'web_filename': result[2]
+        })
         
         return True, "Photo deleted successfully"
     except Exception as e:
@@ -399,11 +519,12 @@ def get_accident_photos(accident_id):
     Returns:
         List of photo dictionaries
     """
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     
     cursor.execute("""
-        SELECT id, accident_id, filename, description, uploaded_at
+        SELECT id, accident_id, filename, description, uploaded_at,
+               thumbnail_filename, web_filename
         FROM accident_photos
         WHERE accident_id = ?
         ORDER BY uploaded_at ASC
@@ -416,7 +537,9 @@ def get_accident_photos(accident_id):
             'accident_id': row[1],
             'filename': row[2],
             'description': row[3],
-            'uploaded_at': row[4]
+            'uploaded_at': row[4],
+            'thumbnail_filename': row[5],
+            'web_filename': row[6]
         })
     
     conn.close()
@@ -425,9 +548,9 @@ def get_accident_photos(accident_id):
 
 def get_accident_count(user_id):
     """Get total count of accidents for a user."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM accidents WHERE user_id = ?", (user_id,))
+    cursor.execute(with_archives(conn, "SELECT COUNT(*) FROM {accidents} WHERE user_id = ?"), (user_id,))
     count = cursor.fetchone()[0]
     conn.close()
     return count
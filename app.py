@@ -1,8 +1,8 @@
 import os
 from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, send_file
 from functools import wraps
+from calendar import monthrange
 from datetime import date, datetime
-from werkzeug.utils import secure_filename
 from io import BytesIO
 from auth_helpers import (
     authenticate_user, 
@@ -26,11 +26,12 @@ from vehicle_helpers import (
     get_vehicle_by_registration,
     update_vehicle,
     delete_vehicle,
-    get_vehicle_count
+    get_vehicle_count,
+    VEHICLE_CHANGED_MESSAGE
 )
 from trip_helpers import (
     init_trip_table,
-    add_trip,
+    add_trips,
     get_user_trips,
     get_trip_by_id,
     update_trip,
@@ -39,7 +40,14 @@ from trip_helpers import (
     get_user_trip_stats,
     get_monthly_trip_stats,
     get_trip_count,
-    get_daily_trips
+    get_daily_trips,
+    iter_user_trips,
+    TRIP_CHANGED_MESSAGE
+)
+from route_helpers import (
+    trip_form_context,
+    suggest_routes,
+    repeat_trip_day
 )
 from expense_helpers import (
     init_expense_table,
@@ -47,7 +55,8 @@ from expense_helpers import (
     get_user_expenses,
     get_expense_by_id,
     update_expense,
-    delete_expense
+    delete_expense,
+    iter_user_expenses
 )
 from accident_helpers import (
     init_accident_table,
@@ -57,16 +66,54 @@ from accident_helpers import (
     get_accident_count,
     update_accident,
     delete_accident,
-    add_accident_photo,
     get_accident_photos,
+    add_accident_photos,
     delete_accident_photo,
+    remove_photo_files,
     SEVERITY_LEVELS,
     WEATHER_CONDITIONS,
     ROAD_CONDITIONS,
     ACCIDENT_STATUSES
 )
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+from blob_store import store_blob, BlobTooLarge
+from photo_helpers import store_accident_photos
+from search_helpers import init_search_tables, search_records
+from media_helpers import (
+    PROTECTED_STATIC_PREFIXES,
+    legacy_media_location,
+    user_can_access_media,
+    resolve_media_path,
+    build_media_response
+)
+from report_engine import (
+    ReportDocument,
+    EXPENSE_COLUMNS,
+    TRIP_COLUMNS,
+    VEHICLE_COLUMNS
+)
+from archive_store import archive_sources, default_cutoff, init_archive_table, with_archives
+from cascade_deletes import delete_user
+from db_helpers import get_connection, get_directory_connection, read_snapshot, unit_of_work
+from report_snapshots import report_snapshot
+from shard_router import init_shard_router, fan_out, use_tenant
+from sql_trace import trace_summary, get_trace, set_tracing, reset_traces
+from profiler import (
+    init_profiler,
+    arm_profile,
+    list_armed_profiles,
+    list_profiles,
+    get_profile
+)
+from metrics import init_metrics, render_metrics, scrape_token_valid, PROMETHEUS_CONTENT_TYPE
+from export_helpers import stream_export, available_export_formats, stream_period_archive
+from report_jobs import (
+    init_report_jobs_table,
+    fail_abandoned_report_jobs,
+    purge_old_reports,
+    start_report_job,
+    get_report_job,
+    get_report_job_path
+)
 
 
 app = Flask(__name__)
@@ -74,12 +121,24 @@ app = Flask(__name__)
 # Load secret key from environment variable or use a secure default for development
 app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
 
+# Request instrumentation first, so every other hook runs inside it
+init_metrics(app)
+init_profiler(app)
+
+# Tenant routing before the tables are created, so they land in the shards
+init_shard_router(app)
+
 # Initialize database on startup
 init_database()
 init_vehicle_table()
 init_trip_table()
 init_expense_table()
 init_accident_table()  # CRITICAL FIX: Initialize accident tables to prevent 500 errors
+init_search_tables()
+init_archive_table()
+init_report_jobs_table()
+fail_abandoned_report_jobs()
+purge_old_reports()
 
 
 # ===============================================
@@ -290,11 +349,13 @@ def dashboard():
     total_vehicles = len(vehicles)
     active_vehicles = len([v for v in vehicles if v.get('status') == 'Active'])
     
-    # Get trip statistics
-    trip_stats = get_user_trip_stats(user_id)
+    # Totals and recent trips cover the years kept live, so the dashboard
+    # never attaches the yearly archives
+    stats_since = default_cutoff()
+    trip_stats = get_user_trip_stats(user_id, start_date=stats_since)
     
     # Get recent trips (last 5)
-    recent_trips = get_user_trips(user_id, limit=5)
+    recent_trips = get_user_trips(user_id, start_date=stats_since, limit=5)
     
     today = date.today()
     today_trips = get_daily_trips(user_id, today.strftime('%Y-%m-%d'))
@@ -305,11 +366,96 @@ def dashboard():
                          total_vehicles=total_vehicles,
                          active_vehicles=active_vehicles,
                          trip_stats=trip_stats,
+                         stats_since=date.fromisoformat(stats_since),
                          recent_trips=recent_trips,
                          today_trips=today_trips,
                          monthly_stats=monthly_stats)
 
 
+# ===============================================
+# Search Route
+# ===============================================
+
+@app.route('/search')
+@login_required
+def search():
+    """Full-text search across the user's trips, expenses and accidents."""
+    query = request.args.get('q', '').strip()
+    kinds = request.args.getlist('type') or None
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    
+    results = search_records(session['user_id'], query, kinds, page, per_page)
+    results['query'] = query
+    return results
+
+
+# ===============================================
+# Metrics
+# ===============================================
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics for admins or a scraper holding BIZDRIVE_METRICS_TOKEN."""
+    if not scrape_token_valid(request.headers.get('Authorization')):
+        if 'user_id' not in session:
+            return {'error': 'Authentication required'}, 401
+        user = get_user_by_id(session['user_id'])
+        if not user or user['role'] != 'admin':
+            return {'error': 'Admin access required'}, 403
+
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# ===============================================
+# Media Routes
+# ===============================================
+
+@app.before_request
+def protect_uploaded_media():
+    """Keep receipts and photos behind the authorised media endpoint."""
+    if request.path.startswith(PROTECTED_STATIC_PREFIXES):
+        # Links from before the media endpoint still work, through its checks
+        location = legacy_media_location(request.path)
+        if location is None:
+            return Response(status=404)
+        kind, key = location
+        return redirect(url_for('serve_media', kind=kind, key=key), code=301)
+
+
+@app.template_global()
+def media_url(kind, key):
+    """URL of a receipt or photo ('receipt', 'photo', 'thumb' or 'web')."""
+    return url_for('serve_media', kind=kind, key=key) if key else None
+
+
+@app.template_global()
+def photo_url(photo, size='photo'):
+    """
+    URL of an accident photo at a size: 'thumb', 'web' or the original
+    'photo'. Photos stored before derivatives existed fall back to the
+    original.
+    """
+    key = photo.get({'thumb': 'thumbnail_filename', 'web': 'web_filename'}.get(size, 'filename'))
+    if key:
+        return media_url(size, key)
+    return media_url('photo', photo['filename'])
+
+
+@app.route('/media/<kind>/<path:key>')
+@login_required
+def serve_media(kind, key):
+    """Serve a receipt or accident photo the current user owns."""
+    if not user_can_access_media(session['user_id'], kind, key):
+        return Response(status=404)
+    
+    path = resolve_media_path(kind, key)
+    if not path:
+        return Response(status=404)
+    
+    return build_media_response(kind, key, path, request)
+
+
 # ===============================================
 # Vehicle Routes
 # ===============================================
@@ -400,6 +546,13 @@ def edit_vehicle_route(vehicle_id):
         return redirect(url_for('vehicle_list'))
     
     if request.method == 'POST':
+        # The version the form was rendered with, so a concurrent edit is not
+        # overwritten; a form without one cannot be checked and is refused
+        version = request.form.get('version', type=int)
+        if version is None:
+            flash(VEHICLE_CHANGED_MESSAGE, 'error')
+            return redirect(url_for('edit_vehicle_route', vehicle_id=vehicle_id))
+        
         registration = request.form.get('registration', '').strip().upper()
         make = request.form.get('make', '').strip()
         model = request.form.get('model', '').strip()
@@ -424,7 +577,8 @@ def edit_vehicle_route(vehicle_id):
             return render_template('edit_vehicle.html', vehicle=vehicle, user=get_user_by_id(user_id))
         
         success, message = update_vehicle(vehicle_id, user_id, registration, make, model, 
-                                        year, color, odometer, status, purchase_date, notes)
+                                        year, color, odometer, status, purchase_date, notes,
+                                        expected_version=version)
         
         if success:
             flash(message, 'success')
@@ -440,7 +594,11 @@ def edit_vehicle_route(vehicle_id):
 def delete_vehicle_route(vehicle_id):
     """Delete a vehicle."""
     user_id = session['user_id']
-    success, message = delete_vehicle(vehicle_id, user_id)
+    version = request.form.get('version', type=int)
+    if version is None:
+        flash(VEHICLE_CHANGED_MESSAGE, 'error')
+        return redirect(url_for('vehicle_list'))
+    success, message = delete_vehicle(vehicle_id, user_id, expected_version=version)
     
     flash(message, 'success' if success else 'error')
     return redirect(url_for('vehicle_list'))
@@ -460,16 +618,22 @@ def trip_list():
     filter_type = request.args.get('type', '')
     filter_month = request.args.get('month', '')
     
-    trips = get_user_trips(user_id)
-    
-    if filter_vehicle:
-        trips = [t for t in trips if str(t.get('vehicle_id')) == filter_vehicle]
-    
-    if filter_type:
-        trips = [t for t in trips if t.get('trip_type') == filter_type]
-    
+    # Filters run in SQL; the month becomes a date range on the (user_id, trip_date) index
+    start_date = end_date = None
     if filter_month:
-        trips = [t for t in trips if t.get('trip_date', '').startswith(filter_month)]
+        try:
+            month_start = datetime.strptime(filter_month, '%Y-%m').date()
+        except ValueError:
+            month_start = None
+        if month_start:
+            start_date = month_start.isoformat()
+            end_date = month_start.replace(day=monthrange(month_start.year, month_start.month)[1]).isoformat()
+    
+    trips = get_user_trips(user_id,
+                           vehicle_id=int(filter_vehicle) if filter_vehicle.isdigit() else None,
+                           trip_type=filter_type or None,
+                           start_date=start_date,
+                           end_date=end_date)
     
     vehicles = get_user_vehicles(user_id)
     user = get_user_by_id(user_id)
@@ -521,22 +685,19 @@ def add_trip_route():
         # Validate that we have at least one trip with required fields
         if not vehicle_id or not trip_date or not trips_data:
             flash('All required fields must be filled.', 'error')
-            vehicles = get_user_vehicles(user_id)
-            return render_template('add_trip.html', vehicles=vehicles, user=get_user_by_id(user_id))
+            return render_template('add_trip.html', user=get_user_by_id(user_id), **trip_form_context(user_id))
         
         # Validate each trip has required fields
         for i, trip in enumerate(trips_data):
             if not all([trip['from_address'], trip['to_address'], trip['purpose']]):
                 flash(f'Trip {i+1}: All required fields (From, To, Purpose) must be filled.', 'error')
-                vehicles = get_user_vehicles(user_id)
-                return render_template('add_trip.html', vehicles=vehicles, user=get_user_by_id(user_id))
+                return render_template('add_trip.html', user=get_user_by_id(user_id), **trip_form_context(user_id))
         
-        # Add all trips
-        success_count = 0
+        # Convert distances and rate before handing all legs over at once
+        legs = []
         error_messages = []
         
         for trip in trips_data:
-            # Convert distance to float if provided
             trip_distance = None
             if trip['distance']:
                 try:
@@ -545,32 +706,26 @@ def add_trip_route():
                     error_messages.append(f"Invalid distance value: {trip['distance']}")
                     continue
             
-            # Convert reimbursement_rate to float if provided
-            trip_rate = None
-            if reimbursement_rate:
-                try:
-                    trip_rate = float(reimbursement_rate)
-                except ValueError:
-                    error_messages.append(f"Invalid reimbursement rate: {reimbursement_rate}")
-                    continue
-            
-            success, message, _ = add_trip(
-                user_id=user_id,
-                vehicle_id=vehicle_id,
-                trip_date=trip_date,
-                from_address=trip['from_address'],
-                to_address=trip['to_address'],
-                purpose=trip['purpose'],
-                distance=trip_distance,
-                trip_type=trip_type,
-                notes='',
-                reimbursement_rate=trip_rate
-            )
-            
-            if success:
-                success_count += 1
-            else:
-                error_messages.append(message)
+            legs.append({
+                'from_address': trip['from_address'],
+                'to_address': trip['to_address'],
+                'purpose': trip['purpose'],
+                'distance': trip_distance,
+                'notes': ''
+            })
+        
+        trip_rate = None
+        if reimbursement_rate:
+            try:
+                trip_rate = float(reimbursement_rate)
+            except ValueError:
+                error_messages.append(f"Invalid reimbursement rate: {reimbursement_rate}")
+                legs = []
+        
+        # Add all trips in one transaction
+        trip_ids, leg_errors = add_trips(user_id, vehicle_id, trip_date, trip_type, legs, trip_rate) if legs else ([], [])
+        error_messages.extend(leg_errors)
+        success_count = len(trip_ids)
         
         if success_count > 0:
             flash(f'Successfully added {success_count} trip(s).', 'success')
@@ -582,8 +737,49 @@ def add_trip_route():
             for err in error_messages:
                 flash(err, 'error')
     
-    vehicles = get_user_vehicles(user_id)
-    return render_template('add_trip.html', vehicles=vehicles, user=get_user_by_id(user_id))
+    # Vehicles, frequent routes and recent days all come from the cached route index
+    return render_template('add_trip.html',
+                         user=get_user_by_id(user_id),
+                         **trip_form_context(user_id))
+
+
+@app.route('/trips/routes/suggest')
+@login_required
+def suggest_routes_route():
+    """Suggest previously logged routes for trip entry autocomplete."""
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    
+    return {
+        'query': query,
+        'routes': suggest_routes(session['user_id'], query, limit)
+    }
+
+
+@app.route('/trips/repeat-day', methods=['POST'])
+@login_required
+def repeat_trip_day_route():
+    """Log all legs from a previous day again (one-click "log again")."""
+    user_id = session['user_id']
+    source_date = request.form.get('source_date', '').strip()
+    trip_date = request.form.get('trip_date', '').strip() or date.today().isoformat()
+    vehicle_id = request.form.get('vehicle_id', type=int)
+    
+    if not source_date:
+        flash('Please choose a day to log again.', 'error')
+        return redirect(url_for('add_trip_route'))
+    
+    trip_ids, error_messages = repeat_trip_day(user_id, source_date, trip_date, vehicle_id)
+    
+    if trip_ids:
+        flash(f'Successfully added {len(trip_ids)} trip(s).', 'success')
+        for err in error_messages:
+            flash(err, 'warning')
+        return redirect(url_for('trip_list'))
+    
+    for err in error_messages:
+        flash(err, 'error')
+    return redirect(url_for('add_trip_route'))
 
 
 @app.route('/trips/<int:trip_id>')
@@ -617,6 +813,13 @@ def edit_trip_route(trip_id):
         return redirect(url_for('trip_list'))
     
     if request.method == 'POST':
+        # The version the form was rendered with, so a concurrent edit is not
+        # overwritten; a form without one cannot be checked and is refused
+        version = request.form.get('version', type=int)
+        if version is None:
+            flash(TRIP_CHANGED_MESSAGE, 'error')
+            return redirect(url_for('edit_trip_route', trip_id=trip_id))
+        
         vehicle_id = request.form.get('vehicle_id', type=int)
         trip_date = request.form.get('trip_date', '').strip()
         from_address = request.form.get('from_address', '').strip()
@@ -627,6 +830,13 @@ def edit_trip_route(trip_id):
         notes = request.form.get('notes', '').strip()
         reimbursement_rate = request.form.get('reimbursement_rate', '').strip()
         
+        try:
+            distance = float(distance) if distance else None
+        except ValueError:
+            flash('Distance must be a number.', 'error')
+            return render_template('edit_trip.html', trip=trip, vehicles=get_user_vehicles(user_id),
+                                   user=get_user_by_id(user_id))
+        
         success, message = update_trip(
             trip_id=trip_id,
             user_id=user_id,
@@ -635,10 +845,11 @@ def edit_trip_route(trip_id):
             from_address=from_address,
             to_address=to_address,
             purpose=purpose,
-            distance=distance if distance else None,
+            distance=distance,
             trip_type=trip_type,
             notes=notes,
-            reimbursement_rate=reimbursement_rate if reimbursement_rate else None
+            reimbursement_rate=reimbursement_rate if reimbursement_rate else None,
+            expected_version=version
         )
         
         if success:
@@ -659,7 +870,11 @@ def edit_trip_route(trip_id):
 def delete_trip_route(trip_id):
     """Delete a trip."""
     user_id = session['user_id']
-    success, message = delete_trip(trip_id, user_id)
+    version = request.form.get('version', type=int)
+    if version is None:
+        flash(TRIP_CHANGED_MESSAGE, 'error')
+        return redirect(url_for('trip_list'))
+    success, message = delete_trip(trip_id, user_id, expected_version=version)
     
     flash(message, 'success' if success else 'error')
     return redirect(url_for('trip_list'))
@@ -693,23 +908,14 @@ def expense_list():
     start_date = request.args.get('start_date', '')
     end_date = request.args.get('end_date', '')
     
-    # Get all expenses and vehicles
-    expenses = get_user_expenses(user_id)
+    # Filters run in SQL so the date range uses the (user_id, expense_date) index
+    expenses = get_user_expenses(user_id,
+                                 vehicle_id=selected_vehicle or None,
+                                 expense_type=selected_category or None,
+                                 start_date=start_date or None,
+                                 end_date=end_date or None)
     vehicles = get_user_vehicles(user_id)
     
-    # Apply filters
-    if selected_vehicle:
-        expenses = [e for e in expenses if e.get('vehicle_id') == selected_vehicle]
-    
-    if selected_category:
-        expenses = [e for e in expenses if e.get('expense_type') == selected_category]
-    
-    if start_date:
-        expenses = [e for e in expenses if e.get('expense_date', '') >= start_date]
-    
-    if end_date:
-        expenses = [e for e in expenses if e.get('expense_date', '') <= end_date]
-    
     # Get summary with filters applied
     summary = get_expense_summary(user_id, selected_vehicle, start_date, end_date)
     
@@ -785,11 +991,12 @@ def add_expense_route():
         receipt_filename = None
         
         if receipt_file and receipt_file.filename and allowed_receipt_file(receipt_file.filename):
-            filename = secure_filename(receipt_file.filename)
-            # Generate unique filename
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            receipt_filename = f"{session['user_id']}_{timestamp}_{filename}"
-            receipt_file.save(os.path.join(RECEIPT_FOLDER, receipt_filename))
+            # Content-addressed: identical receipts are stored once
+            try:
+                receipt_filename = store_blob(receipt_file, RECEIPT_FOLDER, receipt_file.filename.rsplit('.', 1)[1])
+            except BlobTooLarge as e:
+                flash(str(e), 'error')
+                return render_template('add_expense.html', user=user, categories=EXPENSE_CATEGORIES, vehicles=vehicles, today=date.today().isoformat())
         
         # Add to database
         success, message, expense_id = add_expense(
@@ -837,20 +1044,12 @@ def edit_expense_route(expense_id):
         receipt_filename = expense.get('receipt_filename')
         
         if receipt_file and receipt_file.filename and allowed_receipt_file(receipt_file.filename):
-            # Delete old receipt if exists
-            if receipt_filename:
-                old_path = os.path.join(RECEIPT_FOLDER, receipt_filename)
-                try:
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete old receipt: {e}")
-            
-            # Save new receipt
-            filename = secure_filename(receipt_file.filename)
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            receipt_filename = f"{session['user_id']}_{timestamp}_{filename}"
-            receipt_file.save(os.path.join(RECEIPT_FOLDER, receipt_filename))
+            # Save new receipt; update_expense releases the old one
+            try:
+                receipt_filename = store_blob(receipt_file, RECEIPT_FOLDER, receipt_file.filename.rsplit('.', 1)[1])
+            except BlobTooLarge as e:
+                flash(str(e), 'error')
+                return render_template('edit_expense.html', expense=expense, user=user, categories=EXPENSE_CATEGORIES, vehicles=vehicles)
 
         success, message = update_expense(
             expense_id=expense_id,
@@ -883,14 +1082,7 @@ def delete_expense_route(expense_id):
         flash('Expense not found or access denied.', 'error')
         return redirect(url_for('expense_list'))
     
-    if expense.get('receipt_filename'):
-        receipt_path = os.path.join(RECEIPT_FOLDER, expense['receipt_filename'])
-        try:
-            if os.path.exists(receipt_path):
-                os.remove(receipt_path)
-        except Exception as e:
-            print(f"Warning: Could not delete receipt file: {e}")
-    
+    # delete_expense releases the receipt unless another expense shares it
     success, message = delete_expense(expense_id, user_id)
     flash(message, 'success' if success else 'error')
     return redirect(url_for('expense_list'))
@@ -973,40 +1165,45 @@ def add_accident_route():
                                  statuses=ACCIDENT_STATUSES,
                                  today=date.today().isoformat())
         
-        success, message, accident_id = add_accident(
-            user_id=user_id,
-            vehicle_id=vehicle_id,
-            accident_date=accident_date,
-            accident_time=accident_time,
-            location=location,
-            circumstances=description,
-            police_report_number=police_report_number,
-            other_driver_name=other_party_name,
-            other_driver_phone=other_party_contact,
-            insurance_claim_number=insurance_claim_number
-        )
+        uploads = [photo for photo in photos
+                   if photo and photo.filename and allowed_photo_file(photo.filename)]
+        if len(uploads) > MAX_PHOTOS_PER_ACCIDENT:
+            flash(f'Maximum {MAX_PHOTOS_PER_ACCIDENT} photos allowed per accident.', 'warning')
+            uploads = uploads[:MAX_PHOTOS_PER_ACCIDENT]
         
-        if success:
-            photo_count = 0
-            for photo in photos:
-                if photo and photo.filename and allowed_photo_file(photo.filename):
-                    if photo_count >= MAX_PHOTOS_PER_ACCIDENT:
-                        flash(f'Maximum {MAX_PHOTOS_PER_ACCIDENT} photos allowed per accident.', 'warning')
-                        break
-                    
-                    filename = secure_filename(photo.filename)
-                    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
-                    photo_filename = f"accident_{accident_id}_{timestamp}_{filename}"
-                    photo.save(os.path.join(ACCIDENT_PHOTO_FOLDER, photo_filename))
-                    
-                    # Add to database
-                    add_accident_photo(accident_id, photo_filename)
-                    photo_count += 1
-            
+        # Files first, so the transaction is not held open while images are processed
+        stored, photo_errors = store_accident_photos(uploads)
+        
+        # The accident and its photo rows commit together, or not at all
+        with unit_of_work() as work:
+            success, message, accident_id = add_accident(
+                user_id=user_id,
+                vehicle_id=vehicle_id,
+                accident_date=accident_date,
+                accident_time=accident_time,
+                location=location,
+                circumstances=description,
+                police_report_number=police_report_number,
+                other_driver_name=other_party_name,
+                other_driver_phone=other_party_contact,
+                insurance_claim_number=insurance_claim_number
+            )
+            if success and stored:
+                success, photo_message, _ = add_accident_photos(accident_id, stored)
+                if not success:
+                    message = f'Photos could not be saved: {photo_message}'
+            if not success:
+                work.rollback()
+        
+        if not work.failed:
+            for error in photo_errors:
+                flash(f'Photo could not be saved: {error}', 'warning')
             flash(message, 'success')
             return redirect(url_for('accident_list'))
-        else:
-            flash(message, 'error')
+        
+        for photo in stored:
+            remove_photo_files(photo)
+        flash(message if not work.error else f'Database error: {work.error}', 'error')
     
     return render_template('add_accident.html', 
                          vehicles=vehicles, 
@@ -1062,48 +1259,55 @@ def edit_accident_route(accident_id):
         accident_time = request.form.get('accident_time', '').strip()
         location = request.form.get('location', '').strip()
         description = request.form.get('circumstances', '').strip()
-        severity = request.form.get('severity', accident['severity'])
+        severity = request.form.get('severity', accident.get('severity'))
         police_report_number = request.form.get('police_report_number', '').strip()
         other_party_name = request.form.get('other_party_name', '').strip()
         other_party_contact = request.form.get('other_party_contact', '').strip()
         insurance_claim_number = request.form.get('insurance_claim_number', '').strip()
         new_photos = request.files.getlist('photos')
         
-        success, message = update_accident(
-            accident_id=accident_id,
-            user_id=user_id,
-            vehicle_id=vehicle_id,
-            accident_date=accident_date,
-            accident_time=accident_time,
-            location=location,
-            description=description,
-            severity=severity,
-            police_report_number=police_report_number,
-            other_party_name=other_party_name,
-            other_party_contact=other_party_contact,
-            insurance_claim_number=insurance_claim_number
-        )
+        uploads = [photo for photo in new_photos
+                   if photo and photo.filename and allowed_photo_file(photo.filename)]
+        remaining = max(MAX_PHOTOS_PER_ACCIDENT - current_photo_count, 0)
+        if len(uploads) > remaining:
+            flash(f'Maximum {MAX_PHOTOS_PER_ACCIDENT} photos allowed per accident.', 'warning')
+            uploads = uploads[:remaining]
         
-        if success:
-            photo_count = 0
-            for photo in new_photos:
-                if photo and photo.filename and allowed_photo_file(photo.filename):
-                    if current_photo_count + photo_count >= MAX_PHOTOS_PER_ACCIDENT:
-                        flash(f'Maximum {MAX_PHOTOS_PER_ACCIDENT} photos allowed per accident.', 'warning')
-                        break
-                    
-                    filename = secure_filename(photo.filename)
-                    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
-                    photo_filename = f"accident_{accident_id}_{timestamp}_{filename}"
-                    photo.save(os.path.join(ACCIDENT_PHOTO_FOLDER, photo_filename))
-                    
-                    add_accident_photo(accident_id, photo_filename)
-                    photo_count += 1
-            
+        # Files first, so the transaction is not held open while images are processed
+        stored, photo_errors = store_accident_photos(uploads)
+        
+        # The changes and the new photo rows commit together, or not at all
+        with unit_of_work() as work:
+            success, message = update_accident(
+                accident_id=accident_id,
+                user_id=user_id,
+                vehicle_id=vehicle_id,
+                accident_date=accident_date,
+                accident_time=accident_time,
+                location=location,
+                circumstances=description,
+                severity=severity,
+                police_report_number=police_report_number,
+                other_party_name=other_party_name,
+                other_party_contact=other_party_contact,
+                insurance_claim_number=insurance_claim_number
+            )
+            if success and stored:
+                success, photo_message, _ = add_accident_photos(accident_id, stored)
+                if not success:
+                    message = f'Photos could not be saved: {photo_message}'
+            if not success:
+                work.rollback()
+        
+        if not work.failed:
+            for error in photo_errors:
+                flash(f'Photo could not be saved: {error}', 'warning')
             flash(message, 'success')
             return redirect(url_for('view_accident', accident_id=accident_id))
-        else:
-            flash(message, 'error')
+        
+        for photo in stored:
+            remove_photo_files(photo)
+        flash(message if not work.error else f'Database error: {work.error}', 'error')
     
     return render_template('edit_accident.html',
                          accident=accident,
@@ -1128,15 +1332,7 @@ def delete_accident_route(accident_id):
         flash('Accident not found or access denied.', 'error')
         return redirect(url_for('accident_list'))
     
-    photos = get_accident_photos(accident_id)
-    for photo in photos:
-        photo_path = os.path.join(ACCIDENT_PHOTO_FOLDER, photo['filename'])
-        try:
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-        except Exception as e:
-            print(f"Warning: Could not delete photo file: {e}")
-    
+    # delete_accident removes the photo files along with the rows
     success, message = delete_accident(accident_id, user_id)
     flash(message, 'success' if success else 'error')
     return redirect(url_for('accident_list'))
@@ -1162,14 +1358,8 @@ def delete_accident_photo_route(photo_id):
     photo = next((p for p in photos if p['id'] == photo_id), None)
     
     if photo:
-        photo_path = os.path.join(ACCIDENT_PHOTO_FOLDER, photo['filename'])
-        try:
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-        except Exception as e:
-            print(f"Warning: Could not delete photo file: {e}")
-        
-        delete_accident_photo(photo_id)
+        # delete_accident_photo removes the original and its derivatives
+        delete_accident_photo(photo_id, int(accident_id))
         flash('Photo deleted successfully.', 'success')
     else:
         flash('Photo not found.', 'error')
@@ -1203,7 +1393,7 @@ def export_expenses_csv():
             row = [
                 exp.get('expense_date', ''),
                 exp.get('expense_type', ''),
-                exp.get('notes', ''),
+                exp.get('notes') or '',
                 str(exp.get('amount', 0))
             ]
             yield ','.join(row) + '\n'
@@ -1221,92 +1411,15 @@ def export_expenses_csv():
 @login_required
 def export_expenses_pdf():
     user_id = session['user_id']
-    expenses = get_user_expenses(user_id)
     user = get_user_by_id(user_id)
 
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
     # Get user information with proper fallback
     username = user.get('username') or user.get('email', 'User').split('@')[0] if user.get('email') else 'User'
-    
-    # Add BizDrive logo to left top header
-    try:
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
-        if os.path.exists(logo_path):
-            pdf.drawImage(logo_path, 40, height - 80, width=60, height=40, preserveAspectRatio=True)
-    except:
-        pass  # Continue without logo if there's an issue
-
-    # Title with proper positioning
-    pdf.setTitle(f"{username}_Expenses_Report")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(120, height - 80, f"Expenses Report for {username}")
-    
-    # Add generation date
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-    # Draw line under header
-    pdf.setStrokeColorRGB(0.2, 0.2, 0.2)
-    pdf.line(40, height - 110, width - 40, height - 110)
-
-    # Table headers
-    pdf.setFont("Helvetica-Bold", 11)
-    y = height - 130
-    pdf.drawString(50, y, "Date")
-    pdf.drawString(130, y, "Vehicle")
-    pdf.drawString(220, y, "Category")
-    pdf.drawString(320, y, "Description")
-    pdf.drawString(470, y, "Amount")
-    pdf.setFillColorRGB(0.2, 0.2, 0.2)
-    pdf.line(50, y - 5, width - 50, y - 5)
-    pdf.setFillColorRGB(0, 0, 0)
-
-    # Data rows
-    pdf.setFont("Helvetica", 10)
-    y -= 20
-    total_amount = 0
-    
-    for exp in expenses:
-        if y < 80:  # New page if needed
-            pdf.showPage()
-            y = height - 50
-            # Redraw headers on new page
-            pdf.setFont("Helvetica-Bold", 11)
-            pdf.drawString(50, y, "Date")
-            pdf.drawString(130, y, "Vehicle")
-            pdf.drawString(220, y, "Category")
-            pdf.drawString(320, y, "Description")
-            pdf.drawString(470, y, "Amount")
-            pdf.setFillColorRGB(0.2, 0.2, 0.2)
-            pdf.line(50, y - 5, width - 50, y - 5)
-            pdf.setFillColorRGB(0, 0, 0)
-            pdf.setFont("Helvetica", 10)
-            y -= 20
-
-        # Draw row data
-        pdf.drawString(50, y, str(exp.get('expense_date', '')))
-        pdf.drawString(130, y, str(exp.get('vehicle_registration', 'N/A')))
-        pdf.drawString(220, y, str(exp.get('expense_type', '')))
-        pdf.drawString(320, y, str(exp.get('notes', ''))[:30])  # Limit description length
-        amount = exp.get('amount', 0)
-        pdf.drawString(470, y, f"${float(amount):.2f}")
-        total_amount += float(amount)
-        y -= 15
-
-    # Add total at bottom
-    if y > 120:  # Only add total if there's space
-        pdf.setFillColorRGB(0.2, 0.2, 0.2)
-        pdf.line(50, y - 5, width - 50, y - 5)
-        pdf.setFillColorRGB(0, 0, 0)
-        pdf.setFont("Helvetica-Bold", 11)
-        pdf.drawString(420, y - 20, f"Total: ${total_amount:.2f}")
-
-    pdf.save()
+
+    buffer = BytesIO()
+    report = ReportDocument(buffer, f"{username}_Expenses_Report", f"Expenses Report for {username}")
+    report.add_table(EXPENSE_COLUMNS, iter_user_expenses(user_id))
+    report.finish()
     buffer.seek(0)
     return send_file(buffer, as_attachment=True, download_name="expenses.pdf", mimetype='application/pdf')
 
@@ -1328,10 +1441,10 @@ def export_trips_csv():
         for t in trips:
             row = [
                 t.get('trip_date', ''),
-                t.get('vehicle_registration', ''),  # ensure your helper returns vehicle registration
+                t.get('vehicle_registration') or '',  # ensure your helper returns vehicle registration
                 t.get('from_address', ''),
                 t.get('to_address', ''),
-                t.get('purpose', ''),
+                t.get('purpose') or '',
                 str(t.get('distance', '')),
                 t.get('trip_type', '')
             ]
@@ -1350,94 +1463,16 @@ def export_trips_csv():
 @login_required
 def export_trips_pdf():
     user_id = session['user_id']
-    trips = get_user_trips(user_id)
     user = get_user_by_id(user_id)
 
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
     # Get user information with proper fallback
     username = user.get('username') or user.get('email', 'User').split('@')[0] if user.get('email') else 'User'
-    
-    # Add BizDrive logo to left top header
-    try:
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
-        if os.path.exists(logo_path):
-            pdf.drawImage(logo_path, 40, height - 80, width=60, height=40, preserveAspectRatio=True)
-    except:
-        pass  # Continue without logo if there's an issue
-
-    # Title with proper positioning
-    pdf.setTitle(f"{username}_Trips_Report")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(120, height - 80, f"Trips Report for {username}")
-    
-    # Add generation date
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-    # Draw line under header
-    pdf.setStrokeColorRGB(0.2, 0.2, 0.2)
-    pdf.line(40, height - 110, width - 40, height - 110)
-
-    # Table headers
-    pdf.setFont("Helvetica-Bold", 10)
-    y = height - 130
-    headers = ["Date", "Vehicle", "From", "To", "Purpose", "Distance", "Type"]
-    x_positions = [50, 110, 180, 250, 320, 410, 470]
-    for x, h in zip(x_positions, headers):
-        pdf.drawString(x, y, h)
-    pdf.setFillColorRGB(0.2, 0.2, 0.2)
-    pdf.line(50, y - 5, width - 50, y - 5)
-    pdf.setFillColorRGB(0, 0, 0)
-
-    # Data rows
-    pdf.setFont("Helvetica", 9)
-    y -= 20
-    total_distance = 0
-    
-    for t in trips:
-        if y < 80:  # New page if needed
-            pdf.showPage()
-            y = height - 50
-            # Redraw headers on new page
-            pdf.setFont("Helvetica-Bold", 10)
-            for x, h in zip(x_positions, headers):
-                pdf.drawString(x, y, h)
-            pdf.setFillColorRGB(0.2, 0.2, 0.2)
-            pdf.line(50, y - 5, width - 50, y - 5)
-            pdf.setFillColorRGB(0, 0, 0)
-            pdf.setFont("Helvetica", 9)
-            y -= 20
-
-        # Draw row data with proper field names
-        pdf.drawString(50, y, str(t.get('trip_date', '')))
-        pdf.drawString(110, y, str(t.get('vehicle_registration', 'N/A')))
-        pdf.drawString(180, y, str(t.get('from_address', ''))[:20])  # Limit length
-        pdf.drawString(250, y, str(t.get('to_address', ''))[:20])    # Limit length
-        pdf.drawString(320, y, str(t.get('purpose', ''))[:25])       # Limit length
-        distance = t.get('distance', 0)
-        pdf.drawString(410, y, f"{float(distance):.1f} km")
-        pdf.drawString(470, y, str(t.get('trip_type', '')))
-        total_distance += float(distance)
-        y -= 15
-
-    # Add total at bottom
-    if y > 120:  # Only add total if there's space
-        pdf.setFillColorRGB(0.2, 0.2, 0.2)
-        pdf.line(50, y - 5, width - 50, y - 5)
-        pdf.setFillColorRGB(0, 0, 0)
-        pdf.setFont("Helvetica-Bold", 11)
-        pdf.drawString(420, y - 20, f"Total Distance: {total_distance:.1f} km")
-        y -= 20
-        if y < 50:
-            pdf.showPage()
-            y = height - 50
-
-    pdf.save()
+
+    buffer = BytesIO()
+    report = ReportDocument(buffer, f"{username}_Trips_Report", f"Trips Report for {username}")
+    report.add_table(TRIP_COLUMNS, iter_user_trips(user_id), font_size=9, heading_size=10,
+                     totals_label='Total Distance')
+    report.finish()
     buffer.seek(0)
     return send_file(buffer, as_attachment=True, download_name="trips.pdf", mimetype='application/pdf')
 
@@ -1485,98 +1520,61 @@ def export_vehicles_pdf():
     vehicles = get_user_vehicles(user_id)
     user = get_user_by_id(user_id)
 
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
     # Get user information with proper fallback
     username = user.get('username') or user.get('email', 'User').split('@')[0] if user.get('email') else 'User'
-    
-    # Add BizDrive logo to left top header
-    try:
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
-        if os.path.exists(logo_path):
-            pdf.drawImage(logo_path, 40, height - 80, width=60, height=40, preserveAspectRatio=True)
-    except:
-        pass  # Continue without logo if there's an issue
-
-    # Title with proper positioning
-    pdf.setTitle(f"{username}_Vehicles_Report")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(120, height - 80, f"Vehicles Report for {username}")
-    
-    # Add generation date
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-    # Draw line under header
-    pdf.setStrokeColorRGB(0.2, 0.2, 0.2)
-    pdf.line(40, height - 110, width - 40, height - 110)
-
-    # Table headers
-    pdf.setFont("Helvetica-Bold", 11)
-    y = height - 130
-    headers = ["Registration", "Make", "Model", "Year", "Odometer", "Status", "Purchase Date"]
-    x_positions = [50, 130, 210, 270, 330, 400, 480]
-    for x, h in zip(x_positions, headers):
-        pdf.drawString(x, y, h)
-    pdf.setFillColorRGB(0.2, 0.2, 0.2)
-    pdf.line(50, y - 5, width - 50, y - 5)
-    pdf.setFillColorRGB(0, 0, 0)
-
-    # Data rows
-    pdf.setFont("Helvetica", 10)
-    y -= 20
+
     total_vehicles = len(vehicles)
-    active_vehicles = 0
-    
-    for v in vehicles:
-        if y < 80:  # New page if needed
-            pdf.showPage()
-            y = height - 50
-            # Redraw headers on new page
-            pdf.setFont("Helvetica-Bold", 11)
-            for x, h in zip(x_positions, headers):
-                pdf.drawString(x, y, h)
-            pdf.setFillColorRGB(0.2, 0.2, 0.2)
-            pdf.line(50, y - 5, width - 50, y - 5)
-            pdf.setFillColorRGB(0, 0, 0)
-            pdf.setFont("Helvetica", 10)
-            y -= 20
-
-        # Draw row data
-        pdf.drawString(50, y, str(v.get('registration', '')))
-        pdf.drawString(130, y, str(v.get('make', '')))
-        pdf.drawString(210, y, str(v.get('model', '')))
-        pdf.drawString(270, y, str(v.get('year', '')))
-        pdf.drawString(330, y, str(v.get('odometer', '')))
-        status = str(v.get('status', ''))
-        pdf.drawString(400, y, status)
-        pdf.drawString(480, y, str(v.get('purchase_date', '')))
-        
-        if status.lower() == 'active':
-            active_vehicles += 1
-        y -= 15
-
-    # Add summary at bottom
-    if y > 120:  # Only add summary if there's space
-        pdf.setFillColorRGB(0.2, 0.2, 0.2)
-        pdf.line(50, y - 5, width - 50, y - 5)
-        pdf.setFillColorRGB(0, 0, 0)
-        pdf.setFont("Helvetica-Bold", 11)
-        pdf.drawString(50, y - 20, f"Total Vehicles: {total_vehicles}")
-        pdf.drawString(200, y - 20, f"Active Vehicles: {active_vehicles}")
-        pdf.drawString(350, y - 20, f"Inactive Vehicles: {total_vehicles - active_vehicles}")
-        y -= 20
-        if y < 50:
-            pdf.showPage()
-            y = height - 50
-
-    pdf.save()
+    active_vehicles = sum(1 for v in vehicles if str(v.get('status', '')).lower() == 'active')
+
+    buffer = BytesIO()
+    report = ReportDocument(buffer, f"{username}_Vehicles_Report", f"Vehicles Report for {username}")
+    report.add_table(VEHICLE_COLUMNS, vehicles)
+    report.add_key_values([
+        ("Total Vehicles:", total_vehicles),
+        ("Active Vehicles:", active_vehicles),
+        ("Inactive Vehicles:", total_vehicles - active_vehicles),
+    ])
+    report.finish()
     buffer.seek(0)
     return send_file(buffer, as_attachment=True, download_name="vehicles.pdf", mimetype='application/pdf')
+
+
+# ===============================================
+# Export Everything for a Period (ZIP)
+# ===============================================
+
+@app.route('/export/period')
+@login_required
+def export_period_archive():
+    """
+    Download trips, expenses, PDF logbooks and receipts for a date range
+    as one ZIP, streamed as it is built.
+    Query parameters: start_date, end_date (YYYY-MM-DD, both optional).
+    """
+    user_id = session['user_id']
+    user = get_user_by_id(user_id)
+    start_date = request.args.get('start_date') or None
+    end_date = request.args.get('end_date') or None
+
+    try:
+        for value in (start_date, end_date):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        return {'error': 'Dates must be in YYYY-MM-DD format'}, 400
+
+    if start_date and end_date and start_date > end_date:
+        return {'error': 'start_date must not be after end_date'}, 400
+
+    username = user.get('username') or user.get('email', 'User').split('@')[0] if user.get('email') else 'User'
+    filename = f"bizdrive_{start_date or 'all'}_{end_date or 'all'}.zip"
+
+    return Response(stream_period_archive(user_id, username, start_date, end_date),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+# ===============================================
 # Admin Routes (Admin Only)
 # ===============================================
 
@@ -1594,14 +1592,41 @@ def admin_panel():
 # Admin Panel Routes (Sprint 7)
 # ===============================================
 
+def _shard_totals(*queries):
+    """
+    Run single-row aggregate queries on every shard in parallel and add up
+    their columns (one shard when sharding is off). Each shard's queries
+    share one read snapshot, so the figures agree with each other.
+
+    Args:
+        *queries: (sql, params) pairs; {trips}, {expenses} and {accidents}
+                  placeholders read all history, archived years included
+
+    Returns:
+        list: Summed columns for each query, in order
+    """
+    def run(conn):
+        # Archives are attached before the snapshot starts
+        sources = archive_sources(conn)
+        shard_queries = [(sql.format_map(sources), params) for sql, params in queries]
+        rows = []
+        with read_snapshot(conn):
+            cursor = conn.cursor()
+            for sql, params in shard_queries:
+                cursor.execute(sql, params)
+                rows.append(cursor.fetchone())
+        return rows
+    
+    return [[sum(column) for column in zip(*shard_rows)] for shard_rows in zip(*fan_out(run))]
+
+
 @app.route('/admin/dashboard')
 @login_required
 @role_required('admin')
 def admin_dashboard():
     """Admin dashboard with system-wide statistics."""
-    import sqlite3
     
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
     
     # Get system statistics
@@ -1614,26 +1639,6 @@ def admin_dashboard():
     # Active users (assuming is_active column exists, otherwise all are active)
     stats['active_users'] = stats['total_users']
     
-    # Total vehicles
-    cursor.execute("SELECT COUNT(*) FROM vehicles")
-    stats['total_vehicles'] = cursor.fetchone()[0]
-    
-    # Active vehicles
-    cursor.execute("SELECT COUNT(*) FROM vehicles WHERE status = 'Active'")
-    stats['active_vehicles'] = cursor.fetchone()[0]
-    
-    # Total trips
-    cursor.execute("SELECT COUNT(*), COALESCE(SUM(distance), 0) FROM trips")
-    trip_data = cursor.fetchone()
-    stats['total_trips'] = trip_data[0]
-    stats['total_distance'] = round(trip_data[1], 2)
-    
-    # Total expenses
-    cursor.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM expenses")
-    expense_data = cursor.fetchone()
-    stats['expense_count'] = expense_data[0]
-    stats['total_expenses'] = float(expense_data[1])
-    
     # Recent users (last 5)
     cursor.execute("""
         SELECT username, email, role, 1 as is_active
@@ -1650,16 +1655,38 @@ def admin_dashboard():
             'is_active': row[3]
         })
     
-    # Recent accidents (last 5)
-    cursor.execute("""
-        SELECT a.accident_date, u.username, a.status, a.location
-        FROM accidents a
-        JOIN users u ON a.user_id = u.id
-        ORDER BY a.accident_date DESC
-        LIMIT 5
-    """)
+    conn.close()
+    
+    # Vehicles, trips and expenses, added up across shards
+    (total_vehicles,), (active_vehicles,), trip_data, expense_data = _shard_totals(
+        ("SELECT COUNT(*) FROM vehicles", ()),
+        ("SELECT COUNT(*) FROM vehicles WHERE status = 'Active'", ()),
+        ("SELECT COUNT(*), COALESCE(SUM(distance), 0) FROM {trips}", ()),
+        ("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM {expenses}", ()),
+    )
+    stats['total_vehicles'] = total_vehicles
+    stats['active_vehicles'] = active_vehicles
+    stats['total_trips'] = trip_data[0]
+    stats['total_distance'] = round(trip_data[1], 2)
+    stats['expense_count'] = expense_data[0]
+    stats['total_expenses'] = float(expense_data[1])
+    
+    # Recent accidents (last 5): each shard's latest, merged
+    def latest_accidents(shard_conn):
+        shard_cursor = shard_conn.cursor()
+        shard_cursor.execute("""
+            SELECT a.accident_date, u.username, a.status, a.location
+            FROM accidents a
+            JOIN users u ON a.user_id = u.id
+            ORDER BY a.accident_date DESC
+            LIMIT 5
+        """)
+        return shard_cursor.fetchall()
+    
+    latest = [row for rows in fan_out(latest_accidents) for row in rows]
+    latest.sort(key=lambda row: row[0] or '', reverse=True)
     recent_accidents = []
-    for row in cursor.fetchall():
+    for row in latest[:5]:
         recent_accidents.append({
             'accident_date': row[0],
             'username': row[1],
@@ -1668,8 +1695,6 @@ def admin_dashboard():
             'severity': 'N/A'  # Severity not in database schema
         })
     
-    conn.close()
-    
     return render_template('admin/dashboard.html',
                          stats=stats,
                          recent_users=recent_users,
@@ -1682,42 +1707,45 @@ def admin_dashboard():
 @role_required('admin')
 def admin_users():
     """User management page."""
-    import sqlite3
     
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT id, username, email, role FROM users ORDER BY id DESC")
+    user_rows = cursor.fetchall()
+    conn.close()
     
-    # Get all users with their statistics
-    cursor.execute("""
-        SELECT 
-            u.id,
-            u.username,
-            u.email,
-            u.role,
-            COUNT(DISTINCT v.id) as vehicle_count,
-            COUNT(DISTINCT t.id) as trip_count,
-            COALESCE(SUM(t.distance), 0) as total_distance
-        FROM users u
-        LEFT JOIN vehicles v ON u.id = v.user_id
-        LEFT JOIN trips t ON u.id = t.user_id
-        GROUP BY u.id, u.username, u.email, u.role
-        ORDER BY u.id DESC
-    """)
+    # Per-user vehicle and trip statistics from every shard
+    def user_statistics(shard_conn):
+        shard_cursor = shard_conn.cursor()
+        shard_cursor.execute("SELECT user_id, COUNT(*) FROM vehicles GROUP BY user_id")
+        vehicle_counts = dict(shard_cursor.fetchall())
+        shard_cursor.execute(with_archives(shard_conn, """
+            SELECT user_id, COUNT(*), COALESCE(SUM(distance), 0)
+            FROM {trips}
+            GROUP BY user_id
+        """))
+        trip_stats = {row[0]: (row[1], row[2]) for row in shard_cursor.fetchall()}
+        return vehicle_counts, trip_stats
+    
+    vehicle_counts = {}
+    trip_stats = {}
+    for shard_vehicles, shard_trips in fan_out(user_statistics):
+        vehicle_counts.update(shard_vehicles)
+        trip_stats.update(shard_trips)
     
     users = []
-    for row in cursor.fetchall():
+    for row in user_rows:
+        trip_count, total_distance = trip_stats.get(row[0], (0, 0))
         users.append({
             'id': row[0],
             'username': row[1],
             'email': row[2],
             'role': row[3],
-            'vehicle_count': row[4],
-            'trip_count': row[5],
-            'total_distance': round(row[6], 2)
+            'vehicle_count': vehicle_counts.get(row[0], 0),
+            'trip_count': trip_count,
+            'total_distance': round(total_distance, 2)
         })
     
-    conn.close()
-    
     return render_template('admin/users.html',
                          users=users,
                          user=get_user_by_id(session['user_id']))
@@ -1737,9 +1765,8 @@ def admin_reports():
 @role_required('admin')
 def admin_settings():
     """System settings page."""
-    import sqlite3
     
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
     
     # Create settings table if it doesn't exist
@@ -1776,22 +1803,17 @@ def admin_settings():
     cursor.execute("SELECT COUNT(*) FROM users")
     stats['total_users'] = cursor.fetchone()[0]
     
-    cursor.execute("SELECT COUNT(*) FROM vehicles")
-    stats['total_vehicles'] = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM trips")
-    trips_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM expenses")
-    expenses_count = cursor.fetchone()[0]
+    conn.close()
     
-    cursor.execute("SELECT COUNT(*) FROM accidents")
-    accidents_count = cursor.fetchone()[0]
+    (stats['total_vehicles'],), (trips_count,), (expenses_count,), (accidents_count,) = _shard_totals(
+        ("SELECT COUNT(*) FROM vehicles", ()),
+        ("SELECT COUNT(*) FROM {trips}", ()),
+        ("SELECT COUNT(*) FROM {expenses}", ()),
+        ("SELECT COUNT(*) FROM {accidents}", ()),
+    )
     
     stats['total_records'] = trips_count + expenses_count + accidents_count
     
-    conn.close()
-    
     return render_template('admin/settings.html',
                          settings=settings,
                          expense_categories=expense_categories,
@@ -1805,9 +1827,8 @@ def admin_settings():
 @role_required('admin')
 def admin_user_details(user_id):
     """View detailed information about a specific user."""
-    import sqlite3
     
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
     
     # Get user details
@@ -1824,6 +1845,12 @@ def admin_user_details(user_id):
         'email': user_row[2],
         'role': user_row[3]
     }
+    conn.close()
+    
+    # The rest comes from the user's shard
+    with use_tenant(user_id):
+        conn = get_connection()
+    cursor = conn.cursor()
     
     # Get user's vehicles
     cursor.execute("SELECT id, registration, make, model, status FROM vehicles WHERE user_id = ?", (user_id,))
@@ -1831,17 +1858,17 @@ def admin_user_details(user_id):
                 for r in cursor.fetchall()]
     
     # Get user's trip stats
-    cursor.execute("""
+    cursor.execute(with_archives(conn, """
         SELECT COUNT(*), COALESCE(SUM(distance), 0), COALESCE(SUM(reimbursement_amount), 0)
-        FROM trips WHERE user_id = ?
-    """, (user_id,))
+        FROM {trips} WHERE user_id = ?
+    """), (user_id,))
     trip_stats = cursor.fetchone()
     
     # Get user's expense stats
-    cursor.execute("""
+    cursor.execute(with_archives(conn, """
         SELECT COUNT(*), COALESCE(SUM(amount), 0)
-        FROM expenses WHERE user_id = ?
-    """, (user_id,))
+        FROM {expenses} WHERE user_id = ?
+    """), (user_id,))
     expense_stats = cursor.fetchone()
     
     conn.close()
@@ -1869,8 +1896,7 @@ def admin_edit_user(user_id):
             flash('Invalid role selected.', 'error')
             return redirect(url_for('admin_edit_user', user_id=user_id))
         
-        import sqlite3
-        conn = sqlite3.connect('bizdrive.db')
+        conn = get_directory_connection()
         cursor = conn.cursor()
         
         cursor.execute("UPDATE users SET role = ? WHERE id = ?", (new_role, user_id))
@@ -1881,8 +1907,7 @@ def admin_edit_user(user_id):
         return redirect(url_for('admin_user_details', user_id=user_id))
     
     # GET request - show edit form
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, username, email, role FROM users WHERE id = ?", (user_id,))
     user_row = cursor.fetchone()
@@ -1904,6 +1929,20 @@ def admin_edit_user(user_id):
                          user=get_user_by_id(session['user_id']))
 
 
+@app.route('/admin/user/<int:user_id>/delete', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_delete_user(user_id):
+    """Delete a user with all their vehicles, trips, expenses and accidents."""
+    if user_id == session['user_id']:
+        flash('You cannot delete your own account.', 'error')
+        return redirect(url_for('admin_user_details', user_id=user_id))
+    
+    success, message = delete_user(user_id)
+    flash(message, 'success' if success else 'error')
+    return redirect(url_for('admin_users'))
+
+
 # Export routes
 @app.route('/admin/export/users')
 @login_required
@@ -1913,8 +1952,7 @@ def admin_export_users():
     import csv
     from io import StringIO
     
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, username, email, role FROM users")
     users = cursor.fetchall()
@@ -1938,16 +1976,17 @@ def admin_export_vehicles():
     import csv
     from io import StringIO
     
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT v.id, u.username, v.registration, v.make, v.model, v.year, v.status
-        FROM vehicles v
-        JOIN users u ON v.user_id = u.id
-    """)
-    vehicles = cursor.fetchall()
-    conn.close()
+    def shard_vehicles(conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT v.id, u.username, v.registration, v.make, v.model, v.year, v.status
+            FROM vehicles v
+            JOIN users u ON v.user_id = u.id
+        """)
+        return cursor.fetchall()
+    
+    vehicles = [row for rows in fan_out(shard_vehicles) for row in rows]
+    vehicles.sort(key=lambda row: row[0])
     
     output = StringIO()
     writer = csv.writer(output)
@@ -1959,95 +1998,48 @@ def admin_export_vehicles():
     return response
 
 
+def _admin_dataset_export(dataset):
+    """
+    Stream an admin dataset export.
+    Query parameters: format (csv, parquet, arrow), start_date, end_date, user_id.
+    """
+    success, message, export = stream_export(
+        dataset,
+        request.args.get('format', 'csv').lower(),
+        start_date=request.args.get('start_date') or None,
+        end_date=request.args.get('end_date') or None,
+        user_id=request.args.get('user_id', type=int)
+    )
+    if not success:
+        return {'error': message, 'formats': available_export_formats()}, 400
+    
+    chunks, mimetype, filename = export
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 @app.route('/admin/export/trips')
 @login_required
 @role_required('admin')
 def admin_export_trips():
-    """Export all trips to CSV."""
-    import csv
-    from io import StringIO
-    
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT t.id, u.username, v.registration, t.trip_date, t.from_address, 
-               t.to_address, t.distance, t.trip_type, t.reimbursement_amount
-        FROM trips t
-        JOIN users u ON t.user_id = u.id
-        LEFT JOIN vehicles v ON t.vehicle_id = v.id
-    """)
-    trips = cursor.fetchall()
-    conn.close()
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'User', 'Vehicle', 'Date', 'From', 'To', 'Distance', 'Type', 'Reimbursement'])
-    writer.writerows(trips)
-    
-    response = Response(output.getvalue(), mimetype='text/csv')
-    response.headers['Content-Disposition'] = 'attachment; filename=trips_export.csv'
-    return response
+    """Export trips as CSV, Parquet or Arrow."""
+    return _admin_dataset_export('trips')
 
 
 @app.route('/admin/export/expenses')
 @login_required
 @role_required('admin')
 def admin_export_expenses():
-    """Export all expenses to CSV."""
-    import csv
-    from io import StringIO
-    
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT e.id, u.username, e.expense_date, e.expense_type, e.amount, e.notes
-        FROM expenses e
-        JOIN users u ON e.user_id = u.id
-    """)
-    expenses = cursor.fetchall()
-    conn.close()
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'User', 'Date', 'Category', 'Amount', 'Notes'])
-    writer.writerows(expenses)
-    
-    response = Response(output.getvalue(), mimetype='text/csv')
-    response.headers['Content-Disposition'] = 'attachment; filename=expenses_export.csv'
-    return response
+    """Export expenses as CSV, Parquet or Arrow."""
+    return _admin_dataset_export('expenses')
 
 
 @app.route('/admin/export/accidents')
 @login_required
 @role_required('admin')
 def admin_export_accidents():
-    """Export all accidents to CSV."""
-    import csv
-    from io import StringIO
-    
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT a.id, u.username, v.registration, a.accident_date, a.location, 
-               a.status, a.circumstances
-        FROM accidents a
-        JOIN users u ON a.user_id = u.id
-        LEFT JOIN vehicles v ON a.vehicle_id = v.id
-    """)
-    accidents = cursor.fetchall()
-    conn.close()
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'User', 'Vehicle', 'Date', 'Location', 'Status', 'Circumstances'])
-    writer.writerows(accidents)
-    
-    response = Response(output.getvalue(), mimetype='text/csv')
-    response.headers['Content-Disposition'] = 'attachment; filename=accidents_export.csv'
-    return response
+    """Export accidents as CSV, Parquet or Arrow."""
+    return _admin_dataset_export('accidents')
 
 
 # ===============================================
@@ -2059,121 +2051,74 @@ def admin_export_accidents():
 @role_required('admin')
 def admin_monthly_report():
     """Generate monthly summary PDF report"""
-    import sqlite3
     from datetime import datetime, date
     
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'bizdrive.db'))
-    cursor = conn.cursor()
-    
-    # Get current month data
+    # Get current month data as a [month_start, next_month) range, so the
+    # date indexes are used
     current_date = datetime.now()
     current_month = current_date.strftime('%Y-%m')
+    month_start = current_date.date().replace(day=1)
+    next_month = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+    month_range = (month_start.isoformat(), next_month.isoformat())
     
     # Get monthly statistics
     stats = {}
     
     # Users
+    conn = get_directory_connection()
+    cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM users")
     stats['total_users'] = cursor.fetchone()[0]
+    conn.close()
     
-    # Vehicles
-    cursor.execute("SELECT COUNT(*) FROM vehicles")
-    stats['total_vehicles'] = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM vehicles WHERE status = 'Active'")
-    stats['active_vehicles'] = cursor.fetchone()[0]
-    
-    # Monthly trips
-    cursor.execute("""
-        SELECT COUNT(*), COALESCE(SUM(distance), 0)
-        FROM trips 
-        WHERE strftime('%Y-%m', trip_date) = ?
-    """, (current_month,))
-    trip_data = cursor.fetchone()
+    # Vehicles, and this month's trips, expenses and accidents across shards
+    (total_vehicles,), (active_vehicles,), trip_data, expense_data, (monthly_accidents,) = _shard_totals(
+        ("SELECT COUNT(*) FROM vehicles", ()),
+        ("SELECT COUNT(*) FROM vehicles WHERE status = 'Active'", ()),
+        ("""
+            SELECT COUNT(*), COALESCE(SUM(distance), 0)
+            FROM trips 
+            WHERE trip_date >= ? AND trip_date < ?
+        """, month_range),
+        ("""
+            SELECT COUNT(*), COALESCE(SUM(amount), 0)
+            FROM expenses 
+            WHERE expense_date >= ? AND expense_date < ?
+        """, month_range),
+        ("""
+            SELECT COUNT(*)
+            FROM accidents 
+            WHERE accident_date >= ? AND accident_date < ?
+        """, month_range),
+    )
+    stats['total_vehicles'] = total_vehicles
+    stats['active_vehicles'] = active_vehicles
     stats['monthly_trips'] = trip_data[0]
     stats['monthly_distance'] = round(trip_data[1], 2) if trip_data[1] else 0
-    
-    # Monthly expenses
-    cursor.execute("""
-        SELECT COUNT(*), COALESCE(SUM(amount), 0)
-        FROM expenses 
-        WHERE strftime('%Y-%m', expense_date) = ?
-    """, (current_month,))
-    expense_data = cursor.fetchone()
     stats['monthly_expenses_count'] = expense_data[0]
     stats['monthly_expenses_total'] = float(expense_data[1]) if expense_data[1] else 0
-    
-    # Monthly accidents
-    cursor.execute("""
-        SELECT COUNT(*)
-        FROM accidents 
-        WHERE strftime('%Y-%m', accident_date) = ?
-    """, (current_month,))
-    stats['monthly_accidents'] = cursor.fetchone()[0]
-    
-    conn.close()
+    stats['monthly_accidents'] = monthly_accidents
     
     # Generate PDF
     buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Add BizDrive logo
-    try:
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
-        if os.path.exists(logo_path):
-            pdf.drawImage(logo_path, 40, height - 80, width=60, height=40, preserveAspectRatio=True)
-    except:
-        pass
-    
-    # Header
-    pdf.setTitle("BizDrive_Monthly_Report")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(120, height - 80, f"Monthly Summary Report - {current_date.strftime('%B %Y')}")
-    
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    pdf.setStrokeColorRGB(0.2, 0.2, 0.2)
-    pdf.line(40, height - 110, width - 40, height - 110)
-    
-    # Statistics
-    y = height - 140
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(50, y, "System Overview")
-    y -= 25
-    
-    pdf.setFont("Helvetica-Bold", 10)
-    pdf.drawString(50, y, f"Total Users:")
-    pdf.drawString(200, y, str(stats['total_users']))
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Vehicles:")
-    pdf.drawString(200, y, f"{stats['total_vehicles']} ({stats['active_vehicles']} active)")
-    y -= 30
-    
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(50, y, f"Monthly Activity - {current_date.strftime('%B %Y')}")
-    y -= 25
-    
-    pdf.setFont("Helvetica-Bold", 10)
-    pdf.drawString(50, y, f"Total Trips:")
-    pdf.drawString(200, y, f"{stats['monthly_trips']} trips")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Distance:")
-    pdf.drawString(200, y, f"{stats['monthly_distance']} km")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Expenses:")
-    pdf.drawString(200, y, f"${stats['monthly_expenses_total']:.2f} ({stats['monthly_expenses_count']} transactions)")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Accidents:")
-    pdf.drawString(200, y, str(stats['monthly_accidents']))
-    
-    pdf.save()
+    report = ReportDocument(buffer, "BizDrive_Monthly_Report",
+                            f"Monthly Summary Report - {current_date.strftime('%B %Y')}")
+    
+    report.add_heading("System Overview")
+    report.add_key_values([
+        ("Total Users:", stats['total_users']),
+        ("Total Vehicles:", f"{stats['total_vehicles']} ({stats['active_vehicles']} active)"),
+    ])
+    
+    report.add_heading(f"Monthly Activity - {current_date.strftime('%B %Y')}")
+    report.add_key_values([
+        ("Total Trips:", f"{stats['monthly_trips']} trips"),
+        ("Total Distance:", f"{stats['monthly_distance']} km"),
+        ("Total Expenses:", f"${stats['monthly_expenses_total']:.2f} ({stats['monthly_expenses_count']} transactions)"),
+        ("Total Accidents:", stats['monthly_accidents']),
+    ])
+    
+    report.finish()
     buffer.seek(0)
     
     return send_file(buffer, as_attachment=True, download_name=f"monthly_report_{current_month}.pdf", mimetype='application/pdf')
@@ -2183,225 +2128,151 @@ def admin_monthly_report():
 @login_required
 @role_required('admin')
 def admin_annual_report():
-    """Generate annual summary PDF report"""
-    import sqlite3
-    from datetime import datetime
-    
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'bizdrive.db'))
-    cursor = conn.cursor()
-    
-    current_year = datetime.now().year
-    
-    # Get annual statistics
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as total_trips,
-            COALESCE(SUM(distance), 0) as total_distance,
-            COUNT(DISTINCT vehicle_id) as vehicles_used
-        FROM trips 
-        WHERE strftime('%Y', trip_date) = ?
-    """, (str(current_year),))
-    trip_stats = cursor.fetchone()
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as total_expenses,
-            COALESCE(SUM(amount), 0) as total_amount
-        FROM expenses 
-        WHERE strftime('%Y', expense_date) = ?
-    """, (str(current_year),))
-    expense_stats = cursor.fetchone()
-    
-    cursor.execute("""
-        SELECT COUNT(*) as total_accidents
-        FROM accidents 
-        WHERE strftime('%Y', accident_date) = ?
-    """, (str(current_year),))
-    accident_stats = cursor.fetchone()
-    
-    # Monthly breakdown
-    cursor.execute("""
-        SELECT 
-            strftime('%m', trip_date) as month,
-            COUNT(*) as trips,
-            COALESCE(SUM(distance), 0) as distance
-        FROM trips 
-        WHERE strftime('%Y', trip_date) = ?
-        GROUP BY month
-        ORDER BY month
-    """, (str(current_year),))
-    monthly_data = cursor.fetchall()
-    
-    conn.close()
-    
-    # Generate PDF
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Add BizDrive logo
-    try:
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
-        if os.path.exists(logo_path):
-            pdf.drawImage(logo_path, 40, height - 80, width=60, height=40, preserveAspectRatio=True)
-    except:
-        pass
-    
-    # Header
-    pdf.setTitle(f"BizDrive_Annual_Report_{current_year}")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(120, height - 80, f"Annual Summary Report - {current_year}")
-    
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    pdf.setStrokeColorRGB(0.2, 0.2, 0.2)
-    pdf.line(40, height - 110, width - 40, height - 110)
-    
-    # Annual Summary
-    y = height - 140
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(50, y, "Annual Overview")
-    y -= 25
-    
-    pdf.setFont("Helvetica-Bold", 10)
-    pdf.drawString(50, y, f"Total Trips:")
-    pdf.drawString(200, y, f"{trip_stats[0]} trips")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Distance:")
-    pdf.drawString(200, y, f"{trip_stats[1]:.2f} km")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Vehicles Used:")
-    pdf.drawString(200, y, f"{trip_stats[2]} vehicles")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Expenses:")
-    pdf.drawString(200, y, f"${expense_stats[1]:.2f} ({expense_stats[0]} transactions)")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Accidents:")
-    pdf.drawString(200, y, str(accident_stats[0]))
-    
-    pdf.save()
-    buffer.seek(0)
-    
-    return send_file(buffer, as_attachment=True, download_name=f"annual_report_{current_year}.pdf", mimetype='application/pdf')
+    """Queue the fleet-wide annual PDF report and redirect to its job status."""
+    year = request.args.get('year', datetime.now().year, type=int)
+    success, message, job_id = start_report_job('annual', session['user_id'], year)
+    if not success:
+        return {'error': message}, 400
+    return redirect(url_for('admin_report_job_status', job_id=job_id))
 
 
 @app.route('/admin/reports/full-pdf')
 @login_required
 @role_required('admin')
 def admin_full_report():
-    """Generate complete system PDF report"""
-    import sqlite3
-    from datetime import datetime
-    
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'bizdrive.db'))
-    cursor = conn.cursor()
-    
-    # Get comprehensive system data
-    cursor.execute("SELECT COUNT(*) FROM users")
-    total_users = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM vehicles")
-    total_vehicles = cursor.fetchone()[0]
-    
-    cursor.execute("""
-        SELECT COUNT(*), COALESCE(SUM(distance), 0)
-        FROM trips
-    """)
-    trip_stats = cursor.fetchone()
-    
-    cursor.execute("""
-        SELECT COUNT(*), COALESCE(SUM(amount), 0)
-        FROM expenses
-    """)
-    expense_stats = cursor.fetchone()
-    
-    cursor.execute("SELECT COUNT(*) FROM accidents")
-    total_accidents = cursor.fetchone()[0]
-    
-    # Get recent activity
-    cursor.execute("""
-        SELECT 'Trip' as type, trip_date as date, 
-               'Distance: ' || distance || 'km' as details
-        FROM trips 
-        ORDER BY trip_date DESC 
-        LIMIT 3
-    """)
-    recent_trips = cursor.fetchall()
-    
-    cursor.execute("""
-        SELECT 'Expense' as type, expense_date as date,
-               expense_type || ': $' || amount as details
-        FROM expenses 
-        ORDER BY expense_date DESC 
-        LIMIT 3
-    """)
-    recent_expenses = cursor.fetchall()
-    
-    conn.close()
-    
-    # Generate PDF
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
+    """Queue the complete system PDF report and redirect to its job status."""
+    success, message, job_id = start_report_job('full', session['user_id'])
+    if not success:
+        return {'error': message}, 400
+    return redirect(url_for('admin_report_job_status', job_id=job_id))
+
+
+@app.route('/admin/reports/jobs/<job_id>')
+@login_required
+@role_required('admin')
+def admin_report_job_status(job_id):
+    """Progress of a queued PDF report (JSON)."""
+    job = get_report_job(job_id)
+    if not job:
+        return {'error': 'Report job not found'}, 404
     
-    # Add BizDrive logo
-    try:
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
-        if os.path.exists(logo_path):
-            pdf.drawImage(logo_path, 40, height - 80, width=60, height=40, preserveAspectRatio=True)
-    except:
-        pass
-    
-    # Header
-    pdf.setTitle("BizDrive_Complete_System_Report")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(120, height - 80, "Complete System Report")
-    
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    pdf.setStrokeColorRGB(0.2, 0.2, 0.2)
-    pdf.line(40, height - 110, width - 40, height - 110)
-    
-    # System Summary
-    y = height - 140
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(50, y, "Complete System Overview")
-    y -= 25
-    
-    pdf.setFont("Helvetica-Bold", 10)
-    pdf.drawString(50, y, f"Total Users:")
-    pdf.drawString(200, y, str(total_users))
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Vehicles:")
-    pdf.drawString(200, y, str(total_vehicles))
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Trips:")
-    pdf.drawString(200, y, f"{trip_stats[0]} trips ({trip_stats[1]:.2f} km)")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Expenses:")
-    pdf.drawString(200, y, f"${expense_stats[1]:.2f} ({expense_stats[0]} transactions)")
-    y -= 20
-    
-    pdf.drawString(50, y, f"Total Accidents:")
-    pdf.drawString(200, y, str(total_accidents))
-    
-    pdf.save()
-    buffer.seek(0)
+    if job['status'] == 'complete':
+        job['download_url'] = url_for('admin_report_job_download', job_id=job_id)
+    return job
+
+
+@app.route('/admin/reports/jobs/<job_id>/download')
+@login_required
+@role_required('admin')
+def admin_report_job_download(job_id):
+    """Download a finished PDF report."""
+    job = get_report_job(job_id)
+    path = get_report_job_path(job)
+    if not path or not os.path.exists(path):
+        return {'error': 'Report is not ready'}, 404
     
-    return send_file(buffer, as_attachment=True, download_name="complete_system_report.pdf", mimetype='application/pdf')
+    download_name = f"annual_report_{job['year']}.pdf" if job['kind'] == 'annual' else "complete_system_report.pdf"
+    return send_file(path, as_attachment=True, download_name=download_name, mimetype='application/pdf')
+
+
+# ===============================================
+# Admin SQL Trace
+# ===============================================
+
+@app.route('/admin/trace')
+@login_required
+@role_required('admin')
+def admin_sql_trace():
+    """Top statements by total time, slow queries, N+1 warnings and recent requests."""
+    return trace_summary(limit=request.args.get('limit', 25, type=int))
+
+
+@app.route('/admin/trace/<trace_id>')
+@login_required
+@role_required('admin')
+def admin_sql_trace_request(trace_id):
+    """Every statement one traced request ran, in order."""
+    trace = get_trace(trace_id)
+    if not trace:
+        return {'error': 'Trace not found'}, 404
+    return trace
+
+
+@app.route('/admin/trace/toggle', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_sql_trace_toggle():
+    """Switch SQL tracing on or off (form field enabled=1|0)."""
+    set_tracing(request.form.get('enabled') == '1')
+    return trace_summary(limit=0)['settings']
+
+
+@app.route('/admin/trace/reset', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_sql_trace_reset():
+    """Clear stored traces and statement statistics."""
+    reset_traces()
+    return {'status': 'cleared'}
+
+
+# ===============================================
+# Admin Request Profiles
+# ===============================================
+
+@app.route('/admin/profiles')
+@login_required
+@role_required('admin')
+def admin_profiles():
+    """Stored request profiles and profiles armed for upcoming requests."""
+    profiles = list_profiles()
+    for profile in profiles:
+        profile['download_url'] = url_for('admin_profile_download', profile_id=profile['id'])
+    return {'profiles': profiles, 'armed': list_armed_profiles()}
+
+
+@app.route('/admin/profiles/arm', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_profile_arm():
+    """
+    Profile a user's next requests to a path.
+    Form fields: user_id, path, mode (sample|cprofile), count, expires_minutes.
+    """
+    success, message, arm_id = arm_profile(
+        request.form.get('user_id', type=int),
+        request.form.get('path', '').strip(),
+        mode=request.form.get('mode', 'sample'),
+        count=request.form.get('count', 1, type=int),
+        expires_minutes=request.form.get('expires_minutes', 60, type=int)
+    )
+    if not success:
+        return {'error': message}, 400
+    return {'status': message, 'id': arm_id}
+
+
+@app.route('/admin/profiles/<profile_id>')
+@login_required
+@role_required('admin')
+def admin_profile_detail(profile_id):
+    """Profile metadata with its hottest frames or pstats summary."""
+    metadata, _ = get_profile(profile_id)
+    if not metadata:
+        return {'error': 'Profile not found'}, 404
+    metadata['download_url'] = url_for('admin_profile_download', profile_id=profile_id)
+    return metadata
+
+
+@app.route('/admin/profiles/<profile_id>/download')
+@login_required
+@role_required('admin')
+def admin_profile_download(profile_id):
+    """Download the collapsed stacks or pstats dump."""
+    metadata, path = get_profile(profile_id)
+    if not metadata or not os.path.exists(path):
+        return {'error': 'Profile not found'}, 404
+    mimetype = 'text/plain' if path.endswith('.collapsed') else 'application/octet-stream'
+    return send_file(path, as_attachment=True, download_name=metadata['filename'], mimetype=mimetype)
 
 
 # Routes referenced in admin_reports.html template
@@ -2414,8 +2285,7 @@ def admin_update_settings():
     """Update system settings."""
     setting_type = request.form.get('setting_type')
     
-    import sqlite3
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_directory_connection()
     cursor = conn.cursor()
     
     # Create settings table if it doesn't exist
@@ -2555,11 +2425,8 @@ def admin_custom_report():
     end_date = request.args.get('end_date')
     user_id = request.args.get('user_id', type=int)
     
-    import sqlite3
-    from datetime import datetime
-    
-    conn = sqlite3.connect('bizdrive.db')
-    cursor = conn.cursor()
+    import csv
+    from io import StringIO
     
     # Build the base query
     query_parts = []
@@ -2574,13 +2441,13 @@ def admin_custom_report():
                    COALESCE(SUM(t.reimbursement_amount), 0) as total_reimbursement
             FROM users u
             LEFT JOIN vehicles v ON u.id = v.user_id
-            LEFT JOIN trips t ON u.id = t.user_id
+            LEFT JOIN {trips} t ON u.id = t.user_id
         """)
     elif report_type == 'expenses':
         query_parts.append("""
-            SELECT e.id, u.username, v.registration, e.category, 
-                   e.amount, e.expense_date, e.description
-            FROM expenses e
+            SELECT e.id, u.username, v.registration, e.expense_type, 
+                   e.amount, e.expense_date, e.notes
+            FROM {expenses} e
             JOIN users u ON e.user_id = u.id
             LEFT JOIN vehicles v ON e.vehicle_id = v.id
         """)
@@ -2596,8 +2463,8 @@ def admin_custom_report():
                 COALESCE(SUM(t.reimbursement_amount), 0) as total_reimbursement
             FROM users u
             LEFT JOIN vehicles v ON u.id = v.user_id
-            LEFT JOIN trips t ON u.id = t.user_id
-            LEFT JOIN expenses e ON u.id = e.user_id
+            LEFT JOIN {trips} t ON u.id = t.user_id
+            LEFT JOIN {expenses} e ON u.id = e.user_id
         """)
     
     # Add date filters if provided
@@ -2631,8 +2498,18 @@ def admin_custom_report():
     # Combine query parts
     full_query = " ".join(query_parts)
     
-    cursor.execute(full_query, params)
-    results = cursor.fetchall()
+    # Read a report snapshot, not the live database
+    with report_snapshot() as databases:
+        conn = get_connection(databases[0])
+        cursor = conn.cursor()
+        # Date filters only apply to expense listings; the rest cover all history
+        if report_type == 'expenses':
+            full_query = with_archives(conn, full_query, start_date, end_date)
+        else:
+            full_query = with_archives(conn, full_query)
+        cursor.execute(full_query, params)
+        results = cursor.fetchall()
+        conn.close()
     
     # Get column names
     if report_type == 'users':
@@ -2642,8 +2519,6 @@ def admin_custom_report():
     else:
         columns = ['Users', 'Vehicles', 'Trips', 'Expenses', 'Total Distance', 'Total Amount', 'Total Reimbursement']
     
-    conn.close()
-    
     # Create CSV response
     output = StringIO()
     writer = csv.writer(output)
@@ -2668,11 +2543,11 @@ def admin_custom_report():
         writer.writerow(row)
     
     # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=bizdrive_custom_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    
-    return response
+    return Response(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=bizdrive_custom_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
+    )
 
 # ===============================================
 # Error Handlers
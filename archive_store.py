@@ -0,0 +1,484 @@
+"""
+Yearly Archives for BizDrive
+Trips, expenses and closed accidents older than a cutoff (by default the
+start of the previous financial year) are moved out of the live database
+into one archive file per calendar year, in batched transactions. The
+live tables and their indexes then only hold the years people work in.
+
+Each database that holds tenant data (every shard when sharded) keeps its
+own archives, listed in its archived_years table with the dates they
+cover. Queries name archivable tables as {trips}, {expenses}, {accidents}
+or {accident_photos}; with_archives() fills each with the live table, or,
+when the query's date range reaches into archived years, with the live
+table plus those archives, ATTACHing them as needed. Archived rows are
+read-only: they keep their IDs but are no longer found by ID, and they
+drop out of full-text search. The one exception is deleting a vehicle or
+user, which deletes their archived rows too.
+
+Usage:
+    python archive_store.py run [--before 2025-07-01] [--batch 2000] [--vacuum]
+    python archive_store.py list
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, datetime
+from urllib.parse import quote
+
+import pg_backend
+from db_helpers import get_connection, is_postgres
+from shard_router import shard_databases
+
+ARCHIVE_FOLDER = os.environ.get('BIZDRIVE_ARCHIVE_DIR') or os.path.join(os.path.dirname(__file__), 'archive')
+
+# Financial years (1 July - 30 June) kept live, counting the current one
+ARCHIVE_KEEP_YEARS = int(os.environ.get('BIZDRIVE_ARCHIVE_KEEP_YEARS', '2'))
+
+# Rows moved per transaction
+ARCHIVE_BATCH_SIZE = 2000
+
+# Archivable table -> date column. Accident photos move with their accident.
+ARCHIVE_TABLES = {
+    'trips': 'trip_date',
+    'expenses': 'expense_date',
+    'accidents': 'accident_date',
+}
+
+# Open claims stay live however old they are
+ARCHIVED_ACCIDENT_STATUSES = ('Resolved', 'Closed')
+
+# Indexes created in each archive file
+ARCHIVE_INDEXES = {
+    'trips': ['user_id, trip_date'],
+    'expenses': ['user_id, expense_date', 'receipt_filename'],
+    'accidents': ['user_id, accident_date'],
+    'accident_photos': ['accident_id', 'filename', 'thumbnail_filename', 'web_filename'],
+}
+
+# Placeholders filled with the live tables only
+LIVE_SOURCES = {table: table for table in [*ARCHIVE_TABLES, 'accident_photos']}
+
+
+# ===============================================
+# Registry
+# ===============================================
+
+ARCHIVED_YEARS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archived_years (
+        table_name TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        first_date TEXT,
+        last_date TEXT,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        archived_at TEXT,
+        PRIMARY KEY (table_name, year)
+    )
+'''
+
+
+def init_archive_table():
+    """Create the table listing a database's archive files."""
+    conn = get_connection()
+    conn.execute(ARCHIVED_YEARS_SCHEMA)
+    conn.commit()
+    conn.close()
+
+
+def archive_path(filename):
+    """Full path of an archive file."""
+    return os.path.join(ARCHIVE_FOLDER, filename)
+
+
+def archived_years(conn):
+    """
+    A database's archives.
+
+    Returns:
+        list: (table_name, year, filename, first_date, last_date, row_count) tuples
+    """
+    if isinstance(conn, pg_backend.PgConnection):
+        return []
+    try:
+        return [tuple(row) for row in conn.execute('''
+            SELECT table_name, year, filename, first_date, last_date, row_count
+            FROM main.archived_years ORDER BY year
+        ''')]
+    except sqlite3.OperationalError:
+        # Never archived (the table is created on first use)
+        return []
+
+
+def archive_files(database):
+    """Paths of every archive file of a database."""
+    conn = get_connection(database)
+    try:
+        return sorted({archive_path(row[2]) for row in archived_years(conn)})
+    finally:
+        conn.close()
+
+
+def default_cutoff(today=None):
+    """First day kept live: 1 July, ARCHIVE_KEEP_YEARS financial years back."""
+    today = today or date.today()
+    current_start = today.year if today.month >= 7 else today.year - 1
+    return f"{current_start - (ARCHIVE_KEEP_YEARS - 1)}-07-01"
+
+
+# ===============================================
+# Reading Through Archives
+# ===============================================
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def _attach(conn, year, filename, keep=()):
+    """Attach an archive file as archive_<year>, detaching unneeded archives if out of slots."""
+    alias = f"archive_{year}"
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")][1:]
+    if alias in attached:
+        return alias
+
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    spare = [name for name in attached if name.startswith('archive_') and name not in keep]
+    while len([name for name in attached if name != 'temp']) >= limit and spare:
+        name = spare.pop()
+        conn.execute(f"DETACH DATABASE {name}")
+        attached.remove(name)
+    if len([name for name in attached if name != 'temp']) >= limit:
+        raise sqlite3.OperationalError(
+            f"Query reaches more archive years than SQLite can attach ({limit}); narrow the date range")
+
+    conn.execute(f"ATTACH DATABASE ? AS {alias}", (archive_path(filename),))
+    return alias
+
+
+class _Sources(dict):
+    """Table placeholders filled on first use."""
+
+    def __init__(self, conn, start_date, end_date):
+        super().__init__()
+        self.conn = conn
+        self.start_date = start_date[:10] if start_date else None
+        self.end_date = end_date[:10] if end_date else None
+        self.years = None
+        self.aliases = set()    # archives this query reads
+
+    def _reached(self, table):
+        if self.years is None:
+            self.years = archived_years(self.conn)
+        # Photos have no date: they follow every archived accident
+        dated = 'accidents' if table == 'accident_photos' else table
+        return [(year, filename) for name, year, filename, first_date, last_date, rows in self.years
+                if name == dated and rows
+                and (table == 'accident_photos' or self.start_date is None or last_date >= self.start_date)
+                and (table == 'accident_photos' or self.end_date is None or first_date <= self.end_date)]
+
+    def __missing__(self, table):
+        reached = self._reached(table)
+        if not reached:
+            self[table] = table
+            return table
+
+        self.aliases.update(f"archive_{year}" for year, _ in reached)
+        aliases = [_attach(self.conn, year, filename, self.aliases) for year, filename in reached]
+        columns = _columns(self.conn, 'main', table)
+        selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+        for alias in aliases:
+            present = set(_columns(self.conn, alias, table))
+            select = ', '.join(column if column in present else f"NULL AS {column}" for column in columns)
+            selects.append(f"SELECT {select} FROM {alias}.{table}")
+        source = f"({' UNION ALL '.join(selects)})"
+        self[table] = source
+        return source
+
+
+def archive_sources(conn, start_date=None, end_date=None):
+    """
+    Table placeholders for queries over a date range, for format_map();
+    archives are attached as the placeholders are used. Call it outside a
+    transaction (ATTACH is not allowed inside one).
+
+    Args:
+        conn: Connection the queries will run on
+        start_date (str, optional): First date read (None: all history)
+        end_date (str, optional): Last date read (None: up to today)
+
+    Returns:
+        dict: Placeholder name -> table or UNION ALL subquery
+    """
+    return _Sources(conn, start_date, end_date)
+
+
+def with_archives(conn, sql, start_date=None, end_date=None):
+    """
+    Fill a query's {trips}, {expenses}, {accidents} and {accident_photos}
+    placeholders, attaching the archives its date range reaches. Call it
+    outside a transaction (ATTACH is not allowed inside one).
+
+    Args:
+        conn: Connection the query will run on
+        sql (str): Query with table placeholders
+        start_date (str, optional): First date the query reads (None: all history)
+        end_date (str, optional): Last date the query reads (None: up to today)
+
+    Returns:
+        str: Runnable SQL
+    """
+    return sql.format_map(archive_sources(conn, start_date, end_date))
+
+
+def query_archives(conn, table, sql, params=()):
+    """
+    Run a query against every archive file holding a table. Each file is
+    opened read-only on its own connection, so this works mid-transaction,
+    where ATTACH is not allowed.
+
+    Args:
+        conn: Connection to the live database
+        table (str): Archived table the query reads
+        sql (str): Query naming the tables plainly
+        params (tuple): Query parameters
+
+    Returns:
+        list: Rows from every archive, oldest year first
+    """
+    dated = 'accidents' if table == 'accident_photos' else table
+    rows = []
+    for name, year, filename, *_ in archived_years(conn):
+        if name != dated:
+            continue
+        uri = f"file:{quote(archive_path(filename))}?mode=ro"
+        try:
+            archive = sqlite3.connect(uri, uri=True)
+        except sqlite3.OperationalError as e:
+            print(f"Warning: archive {filename} unreadable: {e}")
+            continue
+        try:
+            rows.extend(archive.execute(sql, params).fetchall())
+        finally:
+            archive.close()
+    return rows
+
+
+def delete_archived_rows(conn, table, where, params=(), returning='id', batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Delete rows from every archive file holding a table, one transaction
+    per batch, and keep the registry's row counts in step. Archives are
+    otherwise read-only; this is for vehicles and users being deleted
+    (see cascade_deletes.py).
+
+    Args:
+        conn: Connection to the live database
+        table (str): Archived table
+        where (str): Condition on the table's rows, aliased as child
+        params (tuple): Condition parameters
+        returning (str): Columns returned for each deleted row
+        batch_size (int): Rows deleted per transaction
+
+    Returns:
+        list: The returning columns of every deleted row
+    """
+    dated = 'accidents' if table == 'accident_photos' else table
+    rows = []
+    for name, year, filename, *_ in archived_years(conn):
+        if name != dated:
+            continue
+        uri = f"file:{quote(archive_path(filename))}?mode=rw"
+        try:
+            archive = sqlite3.connect(uri, uri=True, timeout=30)
+        except sqlite3.OperationalError as e:
+            print(f"Warning: archive {filename} unwritable: {e}")
+            continue
+        deleted = 0
+        try:
+            while True:
+                batch = archive.execute(f'''
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT child.id FROM {table} AS child WHERE {where} LIMIT ?
+                    ) RETURNING {returning}
+                ''', tuple(params) + (batch_size,)).fetchall()
+                archive.commit()
+                rows.extend(batch)
+                deleted += len(batch)
+                if len(batch) < batch_size:
+                    break
+        finally:
+            archive.close()
+        if deleted and table == name:
+            conn.execute('''
+                UPDATE main.archived_years SET row_count = row_count - ?
+                WHERE table_name = ? AND year = ?
+            ''', (deleted, name, year))
+            conn.commit()
+    return rows
+
+
+# ===============================================
+# Archiving
+# ===============================================
+
+def _ensure_archive_table(conn, alias, table):
+    """Create or widen an archive table to match the live one."""
+    live = conn.execute(f'PRAGMA main.table_info("{table}")').fetchall()
+    if not _columns(conn, alias, table):
+        conn.execute(f"CREATE TABLE {alias}.{table} AS SELECT * FROM main.{table} WHERE 0")
+    present = set(_columns(conn, alias, table))
+    for _, column, column_type, *_ in live:
+        if column not in present:
+            conn.execute(f"ALTER TABLE {alias}.{table} ADD COLUMN {column} {column_type}")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {alias}.idx_{table}_id ON {table}(id)")
+    for number, columns in enumerate(ARCHIVE_INDEXES[table]):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_{table}_{number} ON {table}({columns})")
+    conn.commit()
+
+
+def _copy_rows(conn, alias, table, ids):
+    columns = ', '.join(_columns(conn, 'main', table))
+    key = 'accident_id' if table == 'accident_photos' else 'id'
+    conn.execute(f'''
+        INSERT OR REPLACE INTO {alias}.{table} ({columns})
+        SELECT {columns} FROM main.{table} WHERE {key} IN ({', '.join('?' * len(ids))})
+    ''', ids)
+
+
+def _delete_rows(conn, table, ids):
+    key = 'accident_id' if table == 'accident_photos' else 'id'
+    conn.execute(f"DELETE FROM main.{table} WHERE {key} IN ({', '.join('?' * len(ids))})", ids)
+
+
+def _register(conn, alias, table, year, filename):
+    first_date, last_date, row_count = conn.execute(f'''
+        SELECT MIN(substr({ARCHIVE_TABLES[table]}, 1, 10)), MAX(substr({ARCHIVE_TABLES[table]}, 1, 10)), COUNT(*)
+        FROM {alias}.{table}
+    ''').fetchone()
+    conn.execute('''
+        INSERT OR REPLACE INTO main.archived_years
+            (table_name, year, filename, first_date, last_date, row_count, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (table, year, filename, first_date, last_date, row_count, datetime.utcnow().isoformat()))
+
+
+def archive_database(database, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move one database's rows dated before the cutoff into its yearly archives.
+
+    Returns:
+        dict: Rows moved per table
+    """
+    conn = get_connection(database, timeout=30)
+    stem = os.path.splitext(os.path.basename(database))[0]
+    moved = {}
+    try:
+        conn.execute(ARCHIVED_YEARS_SCHEMA)
+        conn.commit()
+        for table, date_column in ARCHIVE_TABLES.items():
+            condition = f"{date_column} >= ? AND {date_column} < ?"
+            if table == 'accidents':
+                condition += f" AND status IN ({', '.join('?' * len(ARCHIVED_ACCIDENT_STATUSES))})"
+            extra = list(ARCHIVED_ACCIDENT_STATUSES) if table == 'accidents' else []
+
+            years = [int(row[0]) for row in conn.execute(f'''
+                SELECT DISTINCT substr({date_column}, 1, 4) FROM main.{table} WHERE {condition}
+            ''', ['0001-01-01', cutoff] + extra) if row[0].isdigit()]
+
+            for year in years:
+                filename = f"{stem}.{year}.db"
+                alias = _attach(conn, year, filename)
+                # WAL like the live databases, so backups archive its changes
+                conn.execute(f"PRAGMA {alias}.journal_mode=WAL")
+                _ensure_archive_table(conn, alias, table)
+                if table == 'accidents':
+                    _ensure_archive_table(conn, alias, 'accident_photos')
+                bounds = [f"{year}-01-01", min(f"{year + 1}-01-01", cutoff)] + extra
+
+                while True:
+                    ids = [row[0] for row in conn.execute(
+                        f"SELECT id FROM main.{table} WHERE {condition} LIMIT ?", bounds + [batch_size])]
+                    if not ids:
+                        break
+                    # WAL commits are not atomic across files, so the copy is
+                    # committed first: a crash in between leaves duplicates
+                    # that the next run replaces, never lost rows. The delete
+                    # and the registry update are one transaction, so readers
+                    # always find the moved rows.
+                    if table == 'accidents':
+                        _copy_rows(conn, alias, 'accident_photos', ids)
+                    _copy_rows(conn, alias, table, ids)
+                    conn.commit()
+                    if table == 'accidents':
+                        _delete_rows(conn, 'accident_photos', ids)
+                    _delete_rows(conn, table, ids)
+                    _register(conn, alias, table, year, filename)
+                    conn.commit()
+                    moved[table] = moved.get(table, 0) + len(ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return moved
+
+
+def archive_rows(cutoff=None, batch_size=ARCHIVE_BATCH_SIZE, vacuum=False):
+    """
+    Archive every tenant database (every shard when sharded).
+
+    Args:
+        cutoff (str, optional): First date kept live (YYYY-MM-DD);
+                                defaults to default_cutoff()
+        batch_size (int): Rows moved per transaction
+        vacuum (bool): VACUUM each database afterwards to return the space
+                       (blocks writers while it runs)
+
+    Returns:
+        dict: Rows moved per database and table
+    """
+    if is_postgres():
+        raise RuntimeError("Yearly archives are for SQLite; use table partitioning on PostgreSQL")
+
+    cutoff = cutoff or default_cutoff()
+    os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
+    report = {}
+    for database in shard_databases():
+        report[database] = archive_database(database, cutoff, batch_size)
+        if vacuum and report[database]:
+            conn = get_connection(database, timeout=30)
+            conn.execute("VACUUM")
+            conn.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='BizDrive yearly archives')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='Move old rows into yearly archives')
+    run.add_argument('--before', default=None, help='First date kept live (default: %s)' % default_cutoff())
+    run.add_argument('--batch', type=int, default=ARCHIVE_BATCH_SIZE)
+    run.add_argument('--vacuum', action='store_true', help='VACUUM afterwards (blocks writers)')
+    commands.add_parser('list', help='Archive files and the dates they hold')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        try:
+            report = archive_rows(args.before, args.batch, args.vacuum)
+        except RuntimeError as e:
+            print(e)
+            return 1
+        for database, moved in report.items():
+            summary = ', '.join(f"{rows} {table}" for table, rows in moved.items()) or 'nothing to move'
+            print(f"{database}: {summary}")
+    else:
+        for database in shard_databases():
+            conn = get_connection(database)
+            for table, year, filename, first_date, last_date, rows in archived_years(conn):
+                print(f"{database}  {year}  {table:<10} {rows:>8} rows  {first_date} .. {last_date}  {filename}")
+            conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,19 +4,20 @@ This module contains utility functions for user authentication and password mana
 """
 
 import bcrypt
-import os
 import secrets
 import re
 import sqlite3
 from datetime import datetime, timedelta
 
+from db_helpers import get_directory_connection
+
 # ===============================================
 # Database Setup
 # ===============================================
 
 def get_db_connection():
-    """Create and return a database connection."""
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'bizdrive.db'))
+    """Create and return a connection to the directory (users) database."""
+    conn = get_directory_connection()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -0,0 +1,694 @@
+"""
+Backups for BizDrive
+Online backups of the SQLite databases with point-in-time restore.
+
+A backup generation starts with a base copy of every database (the
+directory and each shard when sharded, and their yearly archives), taken with the SQLite online
+backup API in BACKUP_PAGES-page steps from a pinned read transaction. In
+WAL mode that copy is consistent and writers carry on throughout. The
+archiver then copies newly committed WAL frames into numbered segment
+files every ARCHIVE_INTERVAL seconds. Between rounds it holds a read
+transaction, so SQLite cannot restart the WAL over frames it has not
+copied yet. Every HANDOVER_FRAMES frames it checkpoints the WAL itself,
+holding writers back only while the last few frames are copied. If the
+WAL restarts behind its back anyway, a new generation is started.
+
+Receipt and photo files are copied once into a content-addressed store
+shared by every generation, and listed with their SHA-256 in each
+generation's manifest.
+
+A restore replays segments onto the base copies up to a point in time
+(UTC), then verifies the result: PRAGMA integrity_check on every database
+and the SHA-256 of every receipt and photo the restored rows reference.
+Archives are restored under archive/; point BIZDRIVE_ARCHIVE_DIR there.
+PostgreSQL deployments should use pg_basebackup and WAL archiving instead.
+
+Usage:
+    python backups.py backup                            Base copies only (a new generation)
+    python backups.py archive [--interval 5]            Base copies, then archive the WAL until stopped
+    python backups.py list
+    python backups.py restore GENERATION --to DIR [--at 2026-05-04T17:30:00]
+    python backups.py verify [GENERATION] [--at 2026-05-04T17:30:00]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Imported for their side effect only: each registers its blob root in
+# BLOB_REFERENCES, which lists the media folders a backup copies
+import accident_helpers  # noqa: F401
+import expense_helpers  # noqa: F401
+from archive_store import archive_files
+from blob_store import BLOB_REFERENCES, CHUNK_SIZE
+from db_helpers import DATABASE, is_postgres
+from shard_router import SHARDING, shard_databases
+
+BACKUP_FOLDER = os.environ.get('BIZDRIVE_BACKUP_DIR') or os.path.join(os.path.dirname(__file__), 'backups')
+
+# Pages copied per backup step, and the pause between steps (seconds)
+BACKUP_PAGES = int(os.environ.get('BIZDRIVE_BACKUP_PAGES', '256'))
+BACKUP_STEP_PAUSE = float(os.environ.get('BIZDRIVE_BACKUP_STEP_PAUSE', '0.001'))
+
+# A copy of a database not in WAL mode restarts when another connection
+# writes to it; give up after this many restarts
+MAX_BACKUP_RESTARTS = 20
+
+# Seconds between archive rounds
+ARCHIVE_INTERVAL = 5.0
+
+# WAL frames archived before the archiver checkpoints the WAL itself
+HANDOVER_FRAMES = 1000
+
+# Longest the archiver waits for the write lock at a handover (seconds)
+HANDOVER_TIMEOUT = 1.0
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+
+class WalGap(Exception):
+    """The WAL restarted over frames that were never archived."""
+
+
+# ===============================================
+# Sources & Manifests
+# ===============================================
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def _sources():
+    """(key, path) of every database to back up; the key is its path in a backup."""
+    sources = [(os.path.basename(DATABASE), DATABASE)]
+    if SHARDING:
+        sources += [(f"shards/{os.path.basename(path)}", path) for path in shard_databases()]
+    for database in shard_databases():
+        sources += [(f"archive/{os.path.basename(path)}", path) for path in archive_files(database)]
+    return sources
+
+
+def _generation_dir(generation):
+    return os.path.join(BACKUP_FOLDER, generation)
+
+
+def _write_manifest(manifest):
+    path = os.path.join(_generation_dir(manifest['generation']), 'manifest.json')
+    partial = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(partial, 'w') as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+
+def load_manifest(generation):
+    """Manifest of a backup generation."""
+    with open(os.path.join(_generation_dir(generation), 'manifest.json')) as f:
+        return json.load(f)
+
+
+def list_generations():
+    """Manifests of every backup generation, oldest first."""
+    if not os.path.isdir(BACKUP_FOLDER):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(BACKUP_FOLDER)):
+        if os.path.isfile(os.path.join(BACKUP_FOLDER, name, 'manifest.json')):
+            manifests.append(load_manifest(name))
+    return manifests
+
+
+# ===============================================
+# File Store
+# ===============================================
+
+def _store_path(digest):
+    return os.path.join(BACKUP_FOLDER, 'files', digest[:2], digest)
+
+
+def _copy_hashed(source, destination):
+    """Copy a file, returning the SHA-256 and size of what was copied."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _file_key(root, name):
+    return os.path.join(root, name).replace(os.sep, '/')
+
+
+def sync_files(files, known=None):
+    """
+    Copy receipts and photos not yet in the file store.
+
+    Args:
+        files (dict): Manifest file entries, updated in place
+        known (dict, optional): Entries from an earlier generation to reuse
+
+    Returns:
+        int: Files added to the manifest
+    """
+    known = known or {}
+    staging = os.path.join(BACKUP_FOLDER, 'files', 'tmp')
+    os.makedirs(staging, exist_ok=True)
+    added = 0
+
+    for root in BLOB_REFERENCES:
+        for folder, dirs, names in os.walk(root):
+            # Nested roots (thumbnails) are walked on their own; tmp holds partial uploads
+            dirs[:] = [d for d in dirs if d != 'tmp' and os.path.join(folder, d) not in BLOB_REFERENCES]
+            for name in names:
+                path = os.path.join(folder, name)
+                key = _file_key(root, os.path.relpath(path, root))
+                if key in files:
+                    continue
+                entry = known.get(key)
+                if entry is None or not os.path.exists(_store_path(entry['sha256'])):
+                    partial = os.path.join(staging, uuid.uuid4().hex)
+                    try:
+                        digest, size = _copy_hashed(path, partial)
+                    except FileNotFoundError:
+                        continue    # deleted while we walked
+                    stored = _store_path(digest)
+                    if os.path.exists(stored):
+                        os.remove(partial)
+                    else:
+                        os.makedirs(os.path.dirname(stored), exist_ok=True)
+                        os.replace(partial, stored)
+                    entry = {'sha256': digest, 'bytes': size, 'added_at': _now()}
+                files[key] = entry
+                added += 1
+    return added
+
+
+# ===============================================
+# WAL Frames
+# ===============================================
+
+def _wal_checksum(data, s0, s1, big_endian):
+    """SQLite's WAL checksum over data (a multiple of 8 bytes), continuing from (s0, s1)."""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+def _parse_wal_header(header):
+    """Page size and salt of a WAL header (None if invalid)."""
+    magic, _, page_size, _, salt1, salt2, check1, check2 = struct.unpack('>8I', header)
+    if magic not in (0x377f0682, 0x377f0683):
+        return None
+    if _wal_checksum(header[:24], 0, 0, bool(magic & 1)) != (check1, check2):
+        return None
+    return {'page_size': 65536 if page_size == 1 else page_size, 'salt': (salt1, salt2)}
+
+
+def _apply_segment(db, data):
+    """Write a segment's frames into an open database file."""
+    page_size = _parse_wal_header(data[:WAL_HEADER_SIZE])['page_size']
+    frame_size = WAL_FRAME_HEADER_SIZE + page_size
+    database_pages = None
+    for offset in range(WAL_HEADER_SIZE, len(data), frame_size):
+        page, commit = struct.unpack('>2I', data[offset:offset + 8])
+        db.seek((page - 1) * page_size)
+        db.write(data[offset + WAL_FRAME_HEADER_SIZE:offset + frame_size])
+        if commit:
+            database_pages = commit
+    if database_pages:
+        db.truncate(database_pages * page_size)
+
+
+# ===============================================
+# Archiving
+# ===============================================
+
+class SourceArchiver:
+    """Base copy and WAL segments of one database within a generation."""
+
+    def __init__(self, key, path, generation):
+        self.key = key
+        self.path = path
+        self.generation = generation
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.wal = self.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        self.probe = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.header = None
+        self.salt = None
+        self.frames = 0
+        self.expect_restart = False
+        self.entry = {'base': key, 'journal_mode': 'wal' if self.wal else 'rollback', 'segments': []}
+        if self.wal:
+            self.pin()
+
+    def pin(self):
+        """Hold a read transaction so the WAL cannot restart under us."""
+        self.conn.execute("BEGIN")
+        self.conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+    def unpin(self):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+    def close(self):
+        self.unpin()
+        self.conn.close()
+        self.probe.close()
+
+    def _read_header(self):
+        try:
+            with open(self.path + '-wal', 'rb') as f:
+                header = f.read(WAL_HEADER_SIZE)
+        except FileNotFoundError:
+            return None
+        return header if len(header) == WAL_HEADER_SIZE else None
+
+    def scan(self):
+        """
+        Read the frames committed since the last scan.
+
+        Returns:
+            tuple: (bytes, frames)
+        """
+        # A passive checkpoint reports how many frames the WAL holds; all of
+        # them are complete. The header is read on both sides so the count
+        # is known to belong to this WAL.
+        header = self._read_header()
+        _, logged, _ = self.probe.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        if header is None or header != self._read_header():
+            return b'', 0
+        parsed = _parse_wal_header(header)
+        if parsed is None:
+            return b'', 0
+
+        restarted = parsed['salt'] != self.salt
+        if restarted:
+            if self.salt is not None and not self.expect_restart:
+                raise WalGap(f"the WAL of {self.key} restarted before it was archived")
+            self.header = header
+            self.salt = parsed['salt']
+            self.frames = 0
+            self.expect_restart = False
+        if logged <= self.frames:
+            return b'', 0
+
+        frame_size = WAL_FRAME_HEADER_SIZE + parsed['page_size']
+        with open(self.path + '-wal', 'rb') as f:
+            f.seek(WAL_HEADER_SIZE + self.frames * frame_size)
+            data = f.read((logged - self.frames) * frame_size)
+        frames = len(data) // frame_size
+        if frames != logged - self.frames:
+            raise WalGap(f"the WAL of {self.key} is shorter than SQLite reports")
+
+        self.frames = logged
+        if not restarted:
+            # Writers appended to the old WAL, so it can no longer restart under our pin
+            self.expect_restart = False
+        return data, frames
+
+    def archive(self):
+        """
+        Write newly committed frames to the next segment.
+
+        Returns:
+            int: Frames archived
+        """
+        if not self.wal:
+            return 0
+        data, frames = self.scan()
+        if not frames:
+            return 0
+
+        segments = self.entry['segments']
+        name = f"wal/{self.key}/{len(segments):08d}.wal"
+        path = os.path.join(_generation_dir(self.generation), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        segment = self.header + data
+        with open(path + '.tmp', 'wb') as f:
+            f.write(segment)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+        segments.append({
+            'seq': len(segments),
+            'file': name,
+            'archived_at': _now(),
+            'frames': frames,
+            'bytes': len(segment),
+            'sha256': hashlib.sha256(segment).hexdigest(),
+        })
+        return frames
+
+    def handover(self):
+        """
+        Checkpoint the WAL so it can restart, without losing a frame: new
+        writes wait while the last frames are copied and the checkpoint runs.
+
+        Returns:
+            int: Frames archived
+        """
+        writer = sqlite3.connect(self.path, isolation_level=None, timeout=HANDOVER_TIMEOUT)
+        try:
+            writer.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            writer.close()
+            print(f"Warning: checkpoint of {self.key} postponed: {e}")
+            return 0
+
+        try:
+            frames = self.archive()
+            self.unpin()
+            busy, logged, checkpointed = self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            self.pin()
+            # The next writer restarts the WAL once every frame is in the database
+            self.expect_restart = not busy and logged == checkpointed
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+        return frames
+
+    def base_copy(self):
+        """
+        Copy the database with the online backup API, a few pages at a time.
+
+        Returns:
+            dict: The source's manifest entry
+        """
+        # Frames already in the WAL are replayed over the copy, so a
+        # restore always ends at or after the copy's snapshot
+        self.archive()
+        self.entry['through_seq'] = len(self.entry['segments']) - 1
+
+        path = os.path.join(_generation_dir(self.generation), self.key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        steps = {'remaining': None, 'restarts': 0}
+
+        def progress(status, remaining, total):
+            if steps['remaining'] is not None and remaining > steps['remaining']:
+                steps['restarts'] += 1
+                if steps['restarts'] > MAX_BACKUP_RESTARTS:
+                    raise sqlite3.OperationalError(f"{self.key} changed too often to copy online")
+            steps['remaining'] = remaining
+            if BACKUP_STEP_PAUSE:
+                time.sleep(BACKUP_STEP_PAUSE)
+
+        started = time.perf_counter()
+        target = sqlite3.connect(path + '.tmp')
+        try:
+            self.conn.backup(target, pages=BACKUP_PAGES, progress=progress)
+        finally:
+            target.close()
+        seconds = time.perf_counter() - started
+        os.replace(path + '.tmp', path)
+
+        with open(path, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        self.entry.update({
+            'bytes': os.path.getsize(path),
+            'sha256': digest,
+            'seconds': round(seconds, 3),
+            'finished_at': _now(),
+        })
+        return self.entry
+
+
+def start_generation(reason, known=None):
+    """
+    Start a backup generation: base copies of every database plus files.
+
+    Args:
+        reason (str): Why it was started (recorded in the manifest)
+        known (dict, optional): File entries of the previous generation
+
+    Returns:
+        tuple: (manifest, archivers)
+    """
+    generation = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(_generation_dir(generation))
+    manifest = {'generation': generation, 'started_at': _now(), 'reason': reason,
+                'sources': {}, 'files': {}}
+
+    archivers = []
+    try:
+        for key, path in _sources():
+            archiver = SourceArchiver(key, path, generation)
+            archivers.append(archiver)
+            manifest['sources'][key] = archiver.base_copy()
+    except Exception:
+        for archiver in archivers:
+            archiver.close()
+        raise
+
+    sync_files(manifest['files'], known)
+    manifest['ready_at'] = _now()
+    _write_manifest(manifest)
+    return manifest, archivers
+
+
+def archive_round(manifest, archivers):
+    """
+    Archive new WAL frames of every database and any new files.
+
+    Returns:
+        int: Frames archived
+    """
+    frames = 0
+    for archiver in archivers:
+        frames += archiver.archive()
+        if archiver.frames >= HANDOVER_FRAMES:
+            frames += archiver.handover()
+    added = sync_files(manifest['files'])
+    if frames or added:
+        _write_manifest(manifest)
+    return frames
+
+
+def run_archiver(interval=ARCHIVE_INTERVAL, stop=None):
+    """
+    Take base copies, then archive every interval seconds until stopped.
+    A WAL gap or a new shard starts a new generation.
+
+    Args:
+        interval (float): Seconds between rounds
+        stop (threading.Event, optional): Set to stop after a final round
+
+    Returns:
+        dict: Generations started and frames archived
+    """
+    stop = stop or threading.Event()
+    manifest, archivers = start_generation('archiver started')
+    stats = {'generations': [manifest['generation']], 'frames': 0, 'rounds': 0}
+    try:
+        while True:
+            stopping = stop.wait(interval)
+            try:
+                stats['frames'] += archive_round(manifest, archivers)
+                stats['rounds'] += 1
+                reason = None
+                if [key for key, _ in _sources()] != list(manifest['sources']):
+                    reason = 'shards changed'
+            except WalGap as e:
+                reason = str(e)
+            if reason and not stopping:
+                print(f"Warning: {reason}; starting a new backup generation")
+                for archiver in archivers:
+                    archiver.close()
+                archivers = []
+                manifest, archivers = start_generation(reason, known=manifest['files'])
+                stats['generations'].append(manifest['generation'])
+            if stopping:
+                return stats
+    finally:
+        for archiver in archivers:
+            archiver.close()
+
+
+def take_backup():
+    """Base copies of every database and the files, without archiving."""
+    manifest, archivers = start_generation('backup')
+    for archiver in archivers:
+        archiver.close()
+    return manifest
+
+
+# ===============================================
+# Restore & Verification
+# ===============================================
+
+def _hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def _restore_files(manifest, conn, target_dir, report):
+    """Copy the receipts and photos a restored database references, checking each."""
+    for root, references in BLOB_REFERENCES.items():
+        for table, column in references:
+            try:
+                keys = [row[0] for row in conn.execute(
+                    f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")]
+            except sqlite3.OperationalError:
+                continue    # the directory database holds no tenant tables
+            for key in keys:
+                entry = manifest['files'].get(_file_key(root, key))
+                stored = _store_path(entry['sha256']) if entry else None
+                if stored is None or not os.path.exists(stored):
+                    report['missing'].append(_file_key(root, key))
+                    continue
+                destination = os.path.join(target_dir, root, key)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                digest, _ = _copy_hashed(stored, destination)
+                if digest != entry['sha256']:
+                    report['corrupt'].append(_file_key(root, key))
+                else:
+                    report['verified'] += 1
+
+
+def restore(generation, target_dir, at=None):
+    """
+    Restore a generation into a folder and verify it.
+
+    Args:
+        generation (str): Generation name
+        target_dir (str): Folder for the databases (and files under it)
+        at (str, optional): Latest UTC time to replay to (ISO format);
+                            everything archived when omitted
+
+    Returns:
+        dict: Per-database restore point, integrity and row counts, the
+              file check, and 'ok'
+    """
+    manifest = load_manifest(generation)
+    if at is not None:
+        at = datetime.fromisoformat(at).isoformat()
+    gen_dir = _generation_dir(generation)
+    report = {'generation': generation, 'at': at, 'databases': {},
+              'files': {'verified': 0, 'missing': [], 'corrupt': []}}
+    ok = True
+
+    for key, source in manifest['sources'].items():
+        if at is not None and at < source['finished_at']:
+            raise ValueError(f"{at} is before the base copy of {key} ({source['finished_at']})")
+
+        base = os.path.join(gen_dir, source['base'])
+        if _hash_file(base) != source['sha256']:
+            raise ValueError(f"base copy of {key} is corrupt")
+        destination = os.path.join(target_dir, key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(base, destination)
+
+        restored_to = source['finished_at']
+        with open(destination, 'r+b') as db:
+            for segment in source['segments']:
+                if (at is not None and segment['seq'] > source['through_seq']
+                        and segment['archived_at'] > at):
+                    break
+                with open(os.path.join(gen_dir, segment['file']), 'rb') as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() != segment['sha256']:
+                    raise ValueError(f"WAL segment {segment['file']} is corrupt")
+                _apply_segment(db, data)
+                restored_to = max(restored_to, segment['archived_at'])
+
+        conn = sqlite3.connect(destination)
+        try:
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL%'")]
+            rows = {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+            _restore_files(manifest, conn, target_dir, report['files'])
+        finally:
+            conn.close()
+
+        ok = ok and integrity == 'ok'
+        report['databases'][key] = {'restored_to': restored_to, 'integrity': integrity, 'rows': rows}
+
+    report['ok'] = ok and not report['files']['missing'] and not report['files']['corrupt']
+    return report
+
+
+def latest_generation(at=None):
+    """Newest generation that can be restored to a time (or to now)."""
+    for manifest in reversed(list_generations()):
+        if 'ready_at' in manifest and (at is None or manifest['ready_at'] <= datetime.fromisoformat(at).isoformat()):
+            return manifest['generation']
+    return None
+
+
+def verify(generation=None, at=None):
+    """Restore a generation (default: the latest) into a temporary folder and check it."""
+    generation = generation or latest_generation(at)
+    if generation is None:
+        raise ValueError("No backup to verify")
+    target_dir = tempfile.mkdtemp(prefix='bizdrive-restore-')
+    try:
+        return restore(generation, target_dir, at)
+    finally:
+        shutil.rmtree(target_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='BizDrive backups')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('backup', help='Base copies only (a new generation)')
+    archive = commands.add_parser('archive', help='Base copies, then archive the WAL until stopped')
+    archive.add_argument('--interval', type=float, default=ARCHIVE_INTERVAL)
+    commands.add_parser('list', help='Backup generations')
+    restore_parser = commands.add_parser('restore', help='Restore and verify a generation')
+    restore_parser.add_argument('generation')
+    restore_parser.add_argument('--to', required=True)
+    restore_parser.add_argument('--at', default=None, help='UTC time, e.g. 2026-05-04T17:30:00')
+    verify_parser = commands.add_parser('verify', help='Restore to a temporary folder and check it')
+    verify_parser.add_argument('generation', nargs='?')
+    verify_parser.add_argument('--at', default=None, help='UTC time, e.g. 2026-05-04T17:30:00')
+    args = parser.parse_args(argv)
+
+    if is_postgres():
+        print("PostgreSQL: use pg_basebackup and WAL archiving instead")
+        return 1
+
+    if args.command == 'backup':
+        manifest = take_backup()
+        for key, source in manifest['sources'].items():
+            print(f"{key}: {source['bytes'] / 1024 / 1024:.1f} MB in {source['seconds']}s")
+        print(f"{len(manifest['files'])} files; generation {manifest['generation']}")
+    elif args.command == 'archive':
+        try:
+            run_archiver(args.interval)
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'list':
+        for manifest in list_generations():
+            segments = sum(len(source['segments']) for source in manifest['sources'].values())
+            last = max([segment['archived_at'] for source in manifest['sources'].values()
+                        for segment in source['segments']] + [manifest.get('ready_at', '')])
+            print(f"{manifest['generation']}  {manifest['started_at'][:19]} .. {last[:19]}  "
+                  f"{segments} segments  {len(manifest['files'])} files  ({manifest['reason']})")
+    else:
+        report = restore(args.generation, args.to, args.at) if args.command == 'restore' \
+            else verify(args.generation, args.at)
+        print(json.dumps(report, indent=2))
+        return 0 if report['ok'] else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2525 @@
+"""
+Benchmarks for BizDrive
+Stdlib-only performance checks run against a live instance of the app
+served in-process on a local port. Each benchmark seeds its own data (under
+a throwaway user or in a temporary database), prints a JSON report and
+removes what it created.
+
+Usage:
+    python benchmark.py media [--concurrency 16] [--requests 2000] [--size 262144]
+    python benchmark.py pdf [--rows 100000]
+    python benchmark.py reports [--users 24] [--months 12] [--rows 150] [--workers 1,2,4,8]
+    python benchmark.py exports [--users 20] [--months 12] [--rows 500]
+    python benchmark.py metrics [--requests 200] [--rounds 40] [--trips 200]
+    python benchmark.py suite [--users 40] [--months 12] [--rounds 10] [--save FILE] [--compare FILE]
+    python benchmark.py plans [--users 10] [--months 12]
+    python benchmark.py backends [--postgres postgresql://localhost/bizdrive_test] [--writers 1,4,8,16]
+    python benchmark.py shards [--users 20] [--shards 4] [--writers 4] [--seconds 5]
+    python benchmark.py snapshots [--users 20] [--months 6] [--writers 4] [--seconds 5]
+    python benchmark.py backups [--users 20] [--months 6] [--writers 4] [--seconds 5] [--interval 0.5]
+    python benchmark.py archive [--users 20] [--months 36] [--rounds 5]
+    python benchmark.py edits [--users 5] [--editors 8] [--rounds 50]
+    python benchmark.py cascade [--rows 50000] [--writers 4] [--seconds 6] [--batch 500]
+    python benchmark.py units [--rounds 20]
+    python benchmark.py pipeline [--writers 200] [--seconds 5]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+from werkzeug.serving import make_server
+
+DATABASE = os.environ.get('BIZDRIVE_DATABASE') or os.path.join(os.path.dirname(__file__), 'bizdrive.db')
+
+BENCH_USERNAME = 'benchmark_user'
+BENCH_EMAIL = 'benchmark@bizdrive.invalid'
+
+
+# ===============================================
+# Harness
+# ===============================================
+
+class LiveServer:
+    """Run the Flask app on a local port in a background thread."""
+
+    def __init__(self, app):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarise_latencies(latencies, elapsed):
+    """Throughput and latency percentiles (milliseconds) for a run."""
+    return {
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+def run_concurrent(port, path, headers, total, concurrency, expected_status):
+    """
+    Issue GET requests from a pool of client threads.
+
+    Args:
+        port (int): Server port
+        path (str): Request path
+        headers (dict): Request headers
+        total (int): Number of requests
+        concurrency (int): Number of client threads
+        expected_status (int): Status every response must have
+
+    Returns:
+        dict: Latency summary plus bytes received
+    """
+    def fetch(_):
+        start = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        if response.status != expected_status:
+            raise RuntimeError(f"{path} returned {response.status}, expected {expected_status}")
+        return time.perf_counter() - start, len(body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, range(total)))
+    elapsed = time.perf_counter() - start
+
+    report = summarise_latencies([latency for latency, _ in results], elapsed)
+    report['bytes'] = sum(size for _, size in results)
+    return report
+
+
+def create_bench_user():
+    """Create (or reuse) the throwaway benchmark user and return its ID."""
+    from auth_helpers import add_user, get_user_by_email
+
+    add_user(BENCH_USERNAME, os.urandom(16).hex() + 'Aa1!', BENCH_EMAIL)
+    return get_user_by_email(BENCH_EMAIL)['id']
+
+
+def delete_bench_user(user_id):
+    """Remove the benchmark user row."""
+    conn = sqlite3.connect(DATABASE)
+    conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+
+def session_cookie(app, user_id):
+    """Signed Flask session cookie header for a user."""
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': user_id})}"
+
+
+# ===============================================
+# Media Serving
+# ===============================================
+
+def benchmark_media(concurrency=16, requests=2000, size=256 * 1024):
+    """
+    Measure concurrent receipt fetches through the authorised media endpoint:
+    full downloads, 64 KB Range requests and ETag revalidations (304).
+
+    Args:
+        concurrency (int): Number of client threads
+        requests (int): Requests per scenario
+        size (int): Receipt size in bytes
+
+    Returns:
+        dict: Per-scenario latency and throughput
+    """
+    from app import app
+    from blob_store import store_blob
+    from expense_helpers import RECEIPT_FOLDER, add_expense, delete_expense
+    from vehicle_helpers import add_vehicle, delete_vehicle
+
+    user_id = create_bench_user()
+    _, _, vehicle_id = add_vehicle(user_id, f"BENCH{os.getpid() % 100000}", 'Bench', 'Mark')
+    key = store_blob(os.urandom(size), RECEIPT_FOLDER, 'pdf')
+    _, _, expense_id = add_expense(user_id, vehicle_id, '2024-01-01', 'Benchmark', 1.0, receipt_filename=key)
+
+    path = f"/media/receipt/{key}"
+    cookie = session_cookie(app, user_id)
+    etag = key.rsplit('/', 1)[-1].split('.', 1)[0]
+    offload = os.environ.get('BIZDRIVE_MEDIA_OFFLOAD') or 'none'
+
+    # With offload enabled the front-end server answers Range requests
+    scenarios = {
+        'full': ({'Cookie': cookie}, 200),
+        'range_64k': ({'Cookie': cookie, 'Range': 'bytes=0-65535'}, 206 if offload == 'none' else 200),
+        'revalidate': ({'Cookie': cookie, 'If-None-Match': f'"{etag}"'}, 304),
+    }
+
+    report = {
+        'benchmark': 'media',
+        'concurrency': concurrency,
+        'file_bytes': size,
+        'offload': offload,
+        'scenarios': {},
+    }
+
+    try:
+        with LiveServer(app) as server:
+            for name, (headers, status) in scenarios.items():
+                report['scenarios'][name] = run_concurrent(
+                    server.port, path, headers, requests, concurrency, status
+                )
+    finally:
+        delete_expense(expense_id, user_id)
+        delete_vehicle(vehicle_id, user_id)
+        delete_bench_user(user_id)
+
+    return report
+
+
+# ===============================================
+# PDF Rendering
+# ===============================================
+
+def _synthetic_expenses(rows):
+    """Expense-shaped rows without touching the database."""
+    categories = ['Fuel', 'Tolls', 'Parking', 'Servicing', 'Insurance']
+    for i in range(rows):
+        yield {
+            'expense_date': f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            'vehicle_registration': f"ABC{i % 500:03d}",
+            'expense_type': categories[i % len(categories)],
+            'notes': f"Synthetic expense number {i} for benchmarking",
+            'amount': (i % 9000) / 100,
+        }
+
+
+def _render_legacy_expenses(rows):
+    """The per-cell drawString layout the exports used before the report engine."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    headers = ["Date", "Vehicle", "Category", "Description", "Amount"]
+    x_positions = [50, 130, 220, 320, 470]
+
+    def draw_headers(y):
+        pdf.setFont("Helvetica-Bold", 11)
+        for x, h in zip(x_positions, headers):
+            pdf.drawString(x, y, h)
+        pdf.line(50, y - 5, width - 50, y - 5)
+        pdf.setFont("Helvetica", 10)
+
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(120, height - 60, "BizDrive Fleet Management")
+    y = height - 130
+    draw_headers(y)
+    y -= 20
+    total = 0
+    for exp in rows:
+        if y < 80:
+            pdf.showPage()
+            y = height - 50
+            draw_headers(y)
+            y -= 20
+        pdf.drawString(50, y, str(exp.get('expense_date', '')))
+        pdf.drawString(130, y, str(exp.get('vehicle_registration', 'N/A')))
+        pdf.drawString(220, y, str(exp.get('expense_type', '')))
+        pdf.drawString(320, y, str(exp.get('notes', ''))[:30])
+        pdf.drawString(470, y, f"${float(exp['amount']):.2f}")
+        total += float(exp['amount'])
+        y -= 15
+    pdf.save()
+    return buffer.getbuffer().nbytes
+
+
+def _render_engine_expenses(rows):
+    from report_engine import ReportDocument, EXPENSE_COLUMNS
+
+    buffer = BytesIO()
+    report = ReportDocument(buffer, "Benchmark_Expenses_Report", "Expenses Report for benchmark")
+    report.add_table(EXPENSE_COLUMNS, rows)
+    report.finish()
+    return buffer.getbuffer().nbytes
+
+
+def benchmark_pdf(rows=100000):
+    """
+    Compare the report engine against the legacy export layout.
+    The legacy path loads every row into a list first, as the old exports
+    did; the engine consumes a generator, as it does from a cursor.
+    Peak Python memory is measured in a separate tracemalloc pass.
+
+    Args:
+        rows (int): Number of expense rows to render
+
+    Returns:
+        dict: Seconds, output size and peak memory per renderer
+    """
+    renderers = {
+        'legacy': lambda: _render_legacy_expenses(list(_synthetic_expenses(rows))),
+        'engine': lambda: _render_engine_expenses(_synthetic_expenses(rows)),
+    }
+
+    report = {'benchmark': 'pdf', 'rows': rows, 'renderers': {}}
+    for name, render in renderers.items():
+        start = time.perf_counter()
+        size = render()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        render()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report['renderers'][name] = {
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed),
+            'pdf_bytes': size,
+            'peak_memory_mb': round(peak / (1024 * 1024), 1),
+        }
+
+    legacy, engine = report['renderers']['legacy'], report['renderers']['engine']
+    report['speedup'] = round(legacy['seconds'] / engine['seconds'], 2)
+    return report
+
+
+# ===============================================
+# Parallel Admin Reports
+# ===============================================
+
+def _copy_schema(database, tables):
+    """Create an empty database with the application's table definitions."""
+    source = sqlite3.connect(DATABASE)
+    cursor = source.cursor()
+    placeholders = ', '.join('?' for _ in tables)
+    cursor.execute(f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})", tables)
+    statements = [row[0] for row in cursor.fetchall()]
+    source.close()
+
+    conn = sqlite3.connect(database)
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+def _seed_report_data(conn, users, months, rows):
+    """Insert users with a vehicle and `rows` trips and expenses per month."""
+    now = datetime.utcnow().isoformat()
+    year = datetime.now().year - 1
+    for user in range(users):
+        cursor = conn.execute(
+            "INSERT INTO users (username, password_hash, email) VALUES (?, 'x', ?)",
+            (f"driver{user:03d}", f"driver{user:03d}@bizdrive.invalid")
+        )
+        user_id = cursor.lastrowid
+        cursor = conn.execute(
+            "INSERT INTO vehicles (user_id, registration, make, model) VALUES (?, ?, 'Toyota', 'Hilux')",
+            (user_id, f"BEN{user:04d}")
+        )
+        vehicle_id = cursor.lastrowid
+
+        trips = []
+        expenses = []
+        for month in range(1, months + 1):
+            for i in range(rows):
+                day = f"{year}-{month:02d}-{1 + i % 28:02d}"
+                trips.append((user_id, vehicle_id, day, f"{i} George St Sydney", f"{i} Church St Parramatta",
+                              'Client visit', 12.5 + i % 40, 'Business', now))
+                expenses.append((user_id, vehicle_id, day, 'Fuel', 40 + i % 60, f"Fuel stop {i}", now))
+
+        conn.executemany('''
+            INSERT INTO trips (user_id, vehicle_id, trip_date, from_address, to_address, purpose,
+                               distance, trip_type, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', trips)
+        conn.executemany('''
+            INSERT INTO expenses (user_id, vehicle_id, expense_date, expense_type, amount, notes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', expenses)
+    conn.commit()
+    return year
+
+
+def benchmark_reports(users=24, months=12, rows=150, workers='1,2,4,8'):
+    """
+    Measure the annual admin report rendered by 1..N worker processes
+    against a synthetic fleet in a temporary database. Section rendering
+    is timed separately from concatenation, which needs pypdf.
+
+    Args:
+        users (int): Drivers in the synthetic fleet
+        months (int): Months of activity per driver
+        rows (int): Trips and expenses per driver per month
+        workers (str): Comma-separated worker counts
+
+    Returns:
+        dict: Timings per worker count and the speedup over one process
+    """
+    import report_jobs
+
+    workdir = tempfile.mkdtemp(prefix='bizdrive-bench-')
+    database = os.path.join(workdir, 'bench.db')
+    conn = _copy_schema(database, ['users', 'vehicles', 'trips', 'expenses', 'accidents'])
+    year = _seed_report_data(conn, users, months, rows)
+    conn.close()
+
+    title, subtitle, sections = report_jobs.plan_report('annual', year, database=database)
+    report = {
+        'benchmark': 'reports',
+        'cpu_count': os.cpu_count(),
+        'sections': len(sections),
+        'rows': users * months * rows * 2,
+        'merge': 'pypdf' if report_jobs.PdfWriter else 'unavailable (pypdf not installed)',
+        'workers': {},
+    }
+
+    try:
+        start = time.perf_counter()
+        report_jobs.render_report(title, subtitle, sections, os.path.join(workdir, 'single.pdf'), workers=1)
+        report['single_process_seconds'] = round(time.perf_counter() - start, 3)
+
+        for count in [int(value) for value in workers.split(',')]:
+            # Start the pool's processes before timing
+            report_jobs.render_sections(sections[:1] * count, workers=count)
+
+            start = time.perf_counter()
+            parts = report_jobs.render_sections(sections, workers=count)
+            render_seconds = time.perf_counter() - start
+
+            result = {'render_seconds': round(render_seconds, 3)}
+            if report_jobs.PdfWriter:
+                start = time.perf_counter()
+                report_jobs.merge_pdfs(parts, os.path.join(workdir, f"parallel_{count}.pdf"))
+                result['merge_seconds'] = round(time.perf_counter() - start, 3)
+            result['total_seconds'] = round(render_seconds + result.get('merge_seconds', 0), 3)
+            result['speedup'] = round(report['single_process_seconds'] / result['total_seconds'], 2)
+            report['workers'][count] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+# ===============================================
+# Request Metrics Overhead
+# ===============================================
+
+class _PlainConnection(sqlite3.Connection):
+    """sqlite3 connection without the tallying cursor."""
+
+
+class _Uninstrumented:
+    """Temporarily remove the metrics hooks and the query-tallying connection."""
+
+    def __init__(self, app):
+        self.app = app
+        self.removed = []
+
+    def __enter__(self):
+        import db_helpers
+
+        for registry in (self.app.before_request_funcs, self.app.after_request_funcs,
+                         self.app.teardown_request_funcs):
+            hooks = registry.get(None, [])
+            for hook in [h for h in hooks if h.__name__.startswith('_metrics_')]:
+                hooks.remove(hook)
+                self.removed.append((hooks, hook))
+        self.connection_class = db_helpers.TallyConnection
+        db_helpers.TallyConnection = _PlainConnection
+        return self
+
+    def __exit__(self, *exc):
+        import db_helpers
+
+        for hooks, hook in self.removed:
+            hooks.insert(0, hook)
+        db_helpers.TallyConnection = self.connection_class
+
+
+def _instrumentation_cost(app, queries, repeats=20000):
+    """
+    CPU cost (seconds) the metrics hooks, query tally and SQL tracer add to
+    one request that runs `queries` statements, timed in tight loops
+    against the same statements on a plain connection.
+    """
+    import timeit
+    from flask import Response
+    from db_helpers import get_connection
+
+    plain = sqlite3.connect(':memory:')
+    tallied = get_connection(':memory:')
+
+    with app.test_request_context('/debug-expense'):
+        before, after, teardown = [registry[None][0] for registry in (
+            app.before_request_funcs, app.after_request_funcs, app.teardown_request_funcs)]
+        response = Response()
+
+        def instrumented_request():
+            before()
+            for _ in range(queries):
+                tallied.execute('SELECT 1').fetchall()
+            after(response)
+            teardown(None)
+            for callback in response._on_close:
+                callback()
+            response._on_close.clear()
+
+        def plain_request():
+            for _ in range(queries):
+                plain.execute('SELECT 1').fetchall()
+
+        instrumented = min(timeit.repeat(instrumented_request, number=repeats, repeat=5)) / repeats
+        baseline = min(timeit.repeat(plain_request, number=repeats, repeat=5)) / repeats
+
+    plain.close()
+    tallied.close()
+    return max(instrumented - baseline, 0.0)
+
+
+def benchmark_metrics(requests=200, rounds=40, trips=200):
+    """
+    Measure the cost of request instrumentation on two routes: a cheap one
+    (two queries) and a trips CSV export.
+
+    The overhead is the instrumentation's own CPU cost (request hooks, query
+    tally and, when enabled, SQL tracing, for as many statements as the
+    requests actually ran) over the uninstrumented per-request CPU time. As a
+    cross-check the same requests are also run end to end in adjacent
+    instrumented/baseline pairs; on a shared machine that ratio is noisy.
+
+    Args:
+        requests (int): Requests per round and mode
+        rounds (int): Round pairs for the end-to-end comparison
+        trips (int): Trips seeded for the benchmark user
+
+    Returns:
+        dict: Per-request costs, computed overhead and end-to-end ratio
+    """
+    import metrics
+    from app import app
+    from sql_trace import reset_traces, tracing_enabled
+    from trip_helpers import add_trip
+    from vehicle_helpers import add_vehicle, delete_vehicle
+
+    if not metrics.METRICS_ENABLED:
+        raise RuntimeError('Unset BIZDRIVE_METRICS=0 to benchmark the instrumentation')
+
+    user_id = create_bench_user()
+    _, _, vehicle_id = add_vehicle(user_id, f"BENCH{os.getpid() % 100000}", 'Bench', 'Mark')
+    for i in range(trips):
+        add_trip(user_id, vehicle_id, f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", 'Depot', 'Site',
+                 'Business', purpose='Benchmark', distance=10.0 + i % 50)
+
+    paths = ['/debug-expense', '/trips/export/csv']
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+
+    def run_round(instrumented):
+        if instrumented:
+            start = time.process_time()
+            for i in range(requests):
+                response = client.get(paths[i % len(paths)])
+                response.get_data()
+                response.close()
+            return (time.process_time() - start) / requests
+
+        with _Uninstrumented(app):
+            return run_round(True)
+
+    timings = {True: [], False: []}
+    ratios = []
+    try:
+        run_round(True)  # warm up
+        metrics.metrics.reset()
+        for round_number in range(rounds):
+            # Alternate which mode goes first so drift cancels out
+            order = (True, False) if round_number % 2 else (False, True)
+            pair = {mode: run_round(mode) for mode in order}
+            timings[True].append(pair[True])
+            timings[False].append(pair[False])
+            ratios.append(pair[True] / pair[False])
+
+        with metrics.metrics._lock:
+            histograms = list(metrics.metrics.db_queries.values())
+        queries_per_request = sum(h.total for h in histograms) / sum(h.count for h in histograms)
+        cost = _instrumentation_cost(app, max(round(queries_per_request), 1))
+    finally:
+        metrics.metrics.reset()
+        reset_traces()
+        conn = sqlite3.connect(DATABASE)
+        conn.execute("DELETE FROM trips WHERE user_id = ?", (user_id,))
+        conn.commit()
+        conn.close()
+        delete_vehicle(vehicle_id, user_id)
+        delete_bench_user(user_id)
+
+    baseline = statistics.median(timings[False])
+    return {
+        'benchmark': 'metrics',
+        'requests_per_round': requests,
+        'rounds': rounds,
+        'baseline_cpu_ms': round(baseline * 1000, 3),
+        'queries_per_request': round(queries_per_request, 2),
+        'sql_tracing': tracing_enabled(),
+        'instrumentation_cost_us': round(cost * 1e6, 2),
+        'overhead_percent': round(cost / baseline * 100, 2),
+        'end_to_end_overhead_percent': round((statistics.median(ratios) - 1) * 100, 2),
+    }
+
+
+# ===============================================
+# Admin Data Exports
+# ===============================================
+
+def _legacy_csv_export(database):
+    """The fetchall + StringIO trips export the admin route used before."""
+    import csv
+    from io import StringIO
+
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT t.id, u.username, v.registration, t.trip_date, t.from_address,
+               t.to_address, t.distance, t.trip_type, t.reimbursement_amount
+        FROM trips t
+        JOIN users u ON t.user_id = u.id
+        LEFT JOIN vehicles v ON t.vehicle_id = v.id
+    """)
+    trips = cursor.fetchall()
+    conn.close()
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['ID', 'User', 'Vehicle', 'Date', 'From', 'To', 'Distance', 'Type', 'Reimbursement'])
+    writer.writerows(trips)
+    return len(output.getvalue().encode('utf-8'))
+
+
+def _streamed_export(database, export_format):
+    from export_helpers import stream_export
+
+    _, _, (chunks, _, _) = stream_export('trips', export_format, database=database)
+    return sum(len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk) for chunk in chunks)
+
+
+def benchmark_exports(users=20, months=12, rows=500):
+    """
+    Compare the admin trips export formats on a synthetic fleet: the old
+    in-memory CSV, the streamed CSV and, when pyarrow is installed,
+    zstd-compressed Parquet and Arrow IPC. Peak Python memory comes from a
+    separate tracemalloc pass; Arrow's own buffers are reported from its
+    memory pool.
+
+    Args:
+        users (int): Drivers in the synthetic fleet
+        months (int): Months of activity per driver
+        rows (int): Trips per driver per month
+
+    Returns:
+        dict: Seconds, output bytes and peak memory per format
+    """
+    from export_helpers import available_export_formats, pa
+
+    workdir = tempfile.mkdtemp(prefix='bizdrive-bench-')
+    database = os.path.join(workdir, 'bench.db')
+    conn = _copy_schema(database, ['users', 'vehicles', 'trips', 'expenses', 'accidents'])
+    _seed_report_data(conn, users, months, rows)
+    conn.close()
+
+    exporters = {'legacy_csv': lambda: _legacy_csv_export(database)}
+    for export_format in available_export_formats():
+        exporters[export_format] = lambda export_format=export_format: _streamed_export(database, export_format)
+
+    report = {'benchmark': 'exports', 'rows': users * months * rows, 'formats': {}}
+
+    try:
+        for name, export in exporters.items():
+            start = time.perf_counter()
+            size = export()
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            export()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            result = {
+                'seconds': round(elapsed, 3),
+                'bytes': size,
+                'peak_python_memory_mb': round(peak / (1024 * 1024), 1),
+            }
+            if pa is not None and name in ('parquet', 'arrow'):
+                result['peak_arrow_memory_mb'] = round(pa.default_memory_pool().max_memory() / (1024 * 1024), 1)
+            report['formats'][name] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if pa is None:
+        report['note'] = 'pyarrow not installed: Parquet and Arrow were skipped'
+    return report
+
+
+# ===============================================
+# End-to-End Suite
+# ===============================================
+
+class SeededFleet:
+    """
+    Point the app at a throwaway database and blob store (the working
+    directory moves there too) and seed a synthetic fleet into it. Must be
+    entered before anything imports db_helpers.
+    """
+
+    def __init__(self, users, months, seed=42):
+        self.users = users
+        self.months = months
+        self.seed = seed
+        self.workdir = None
+
+    def __enter__(self):
+        if 'db_helpers' in sys.modules:
+            raise RuntimeError('The database must be configured before the app is imported')
+
+        self.workdir = tempfile.mkdtemp(prefix='bizdrive-fleet-')
+        self.previous_cwd = os.getcwd()
+        os.environ['BIZDRIVE_DATABASE'] = os.path.join(self.workdir, 'fleet.db')
+        os.chdir(self.workdir)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+        try:
+            import report_jobs
+            import report_snapshots
+            from seed_fleet import seed_fleet
+            from db_helpers import get_connection
+
+            report_jobs.REPORT_FOLDER = os.path.join(self.workdir, 'reports')
+            report_snapshots.SNAPSHOT_FOLDER = os.path.join(self.workdir, 'reports', 'snapshots')
+            os.makedirs(report_snapshots.SNAPSHOT_FOLDER, exist_ok=True)
+
+            self.fleet = seed_fleet(users=self.users, months=self.months, seed=self.seed)
+            conn = get_connection()
+            ranked = conn.execute('''
+                SELECT u.id, u.username, COUNT(t.id) AS trips FROM users u
+                JOIN trips t ON t.user_id = u.id
+                GROUP BY u.id ORDER BY trips
+            ''').fetchall()
+            self.admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()[0]
+            conn.close()
+        except BaseException:
+            self.__exit__()
+            raise
+
+        # A busy driver: 90th percentile by trips
+        self.driver_id, self.driver_name, self.driver_trips = ranked[min(int(len(ranked) * 0.9), len(ranked) - 1)]
+        return self
+
+    def __exit__(self, *exc):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# (name, group, session, path). Sessions: 'driver' is a busy seeded driver
+# (90th percentile by trips), 'admin' the default admin, None logs in.
+SUITE_CASES = [
+    ('login', 'auth', None, '/login'),
+    ('dashboard', 'pages', 'driver', '/dashboard'),
+    ('trip_list', 'pages', 'driver', '/trips'),
+    ('expense_list', 'pages', 'driver', '/expenses'),
+    ('accident_list', 'pages', 'driver', '/accidents'),
+    ('trips_csv', 'exports', 'driver', '/trips/export/csv'),
+    ('expenses_pdf', 'exports', 'driver', '/expenses/export/pdf'),
+    ('period_archive', 'exports', 'driver', '/export/period?start_date={quarter_start}'),
+    ('admin_dashboard', 'admin', 'admin', '/admin/dashboard'),
+    ('admin_export_trips', 'admin', 'admin', '/admin/export/trips?format=csv'),
+    ('admin_monthly_report', 'admin', 'admin', '/admin/reports/monthly-pdf'),
+    ('admin_annual_report', 'admin', 'admin', '/admin/reports/annual-pdf?year={year}'),
+]
+
+SUITE_JOB_TIMEOUT = 600
+
+
+def _bench_stats(samples):
+    """pytest-benchmark style statistics (seconds) for one case."""
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else [samples[0]] * 3
+    mean = statistics.fmean(samples)
+    return {
+        'min': round(min(samples), 6),
+        'max': round(max(samples), 6),
+        'mean': round(mean, 6),
+        'stddev': round(statistics.stdev(samples), 6) if len(samples) > 1 else 0.0,
+        'median': round(statistics.median(samples), 6),
+        'iqr': round(quartiles[2] - quartiles[0], 6),
+        'ops': round(1 / mean, 3) if mean else None,
+        'rounds': len(samples),
+    }
+
+
+def _commit_info():
+    """Current git commit, so saved results can be matched to a revision."""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+
+    return {
+        'id': git('rev-parse', 'HEAD') or None,
+        'branch': git('rev-parse', '--abbrev-ref', 'HEAD') or None,
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+def _suite_request(app, role, path, credentials):
+    """
+    Run one request of a suite case to completion.
+
+    Returns:
+        tuple: (bytes received, status)
+    """
+    client = app.test_client()
+    if role is None:
+        response = client.post(path, data=credentials)
+        size, status = len(response.get_data()), response.status_code
+        response.close()
+        return size, status if status != 302 else 200
+
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = credentials[role]
+    response = client.get(path)
+    size, status = len(response.get_data()), response.status_code
+    location = response.headers.get('Location', '')
+    response.close()
+
+    # Queued reports redirect to their job; the case lasts until the PDF is ready
+    if status == 302 and '/admin/reports/jobs/' in location:
+        deadline = time.monotonic() + SUITE_JOB_TIMEOUT
+        while time.monotonic() < deadline:
+            job = client.get(location).get_json()
+            if job['status'] == 'complete':
+                response = client.get(job['download_url'])
+                size, status = len(response.get_data()), response.status_code
+                response.close()
+                return size, status
+            if job['status'] == 'failed':
+                raise RuntimeError(f"report job failed: {job.get('error')}")
+            time.sleep(0.05)
+        raise RuntimeError('report job timed out')
+    return size, status
+
+
+def _compare_results(report, baseline, threshold):
+    """Median change per case against an earlier saved run."""
+    previous = {case['name']: case for case in baseline.get('benchmarks', []) if 'stats' in case}
+    comparison = {
+        'baseline_commit': baseline.get('commit_info', {}).get('id'),
+        'threshold_percent': threshold,
+        'cases': {},
+        'regressions': [],
+    }
+    for case in report['benchmarks']:
+        before = previous.get(case['name'])
+        if before is None or 'stats' not in case:
+            continue
+        change = (case['stats']['median'] / before['stats']['median'] - 1) * 100
+        entry = {'median_change_percent': round(change, 1)}
+        queries, previous_queries = case['extra_info'].get('queries'), before['extra_info'].get('queries')
+        if queries is not None and previous_queries is not None:
+            entry['queries_change'] = round(queries - previous_queries, 2)
+        comparison['cases'][case['name']] = entry
+        # Extra queries per request are a regression even when timing noise hides them
+        if change > threshold or entry.get('queries_change', 0) > 0:
+            comparison['regressions'].append(case['name'])
+    return comparison
+
+
+def benchmark_suite(users=40, months=12, rounds=10, warmup=2, seed=42, only=None,
+                    save=None, compare=None, threshold=10.0):
+    """
+    Time the hot routes end to end (through the Flask test client) against
+    a synthetic fleet seeded into a temporary database and blob store.
+    The results follow pytest-benchmark's JSON layout (machine_info,
+    commit_info, benchmarks[].stats) so runs from different commits can be
+    saved and compared; SQL statements per request are recorded too, as
+    they do not vary with machine load.
+
+    Args:
+        users (int): Drivers in the seeded fleet
+        months (int): Months of history per driver
+        rounds (int): Timed requests per case
+        warmup (int): Untimed requests per case
+        seed (int): Fleet generator seed
+        only (str): Comma-separated case names to run (default: all)
+        save (str): Path to write the results to
+        compare (str): Path of earlier results to compare against
+        threshold (float): Median slowdown (percent) counted as a regression
+
+    Returns:
+        dict: Per-case statistics, bytes and queries per request
+    """
+    cases = SUITE_CASES
+    if only:
+        names = set(only.split(','))
+        cases = [case for case in SUITE_CASES if case[0] in names]
+
+    with SeededFleet(users, months, seed) as seeded:
+        import metrics
+        from app import app
+        from seed_fleet import SEED_PASSWORD
+
+        fleet = seeded.fleet
+        credentials = {
+            'driver': seeded.driver_id,
+            'admin': seeded.admin_id,
+            'username': seeded.driver_name,
+            'password': SEED_PASSWORD,
+        }
+        today = datetime.now()
+        quarter_start = f"{today.year}-{(today.month - 1) // 3 * 3 + 1:02d}-01"
+
+        report = {
+            'benchmark': 'suite',
+            'datetime': datetime.utcnow().isoformat(),
+            'machine_info': {
+                'python_version': platform.python_version(),
+                'python_implementation': platform.python_implementation(),
+                'machine': platform.machine(),
+                'system': platform.system(),
+                'cpu_count': os.cpu_count(),
+                'sqlite_version': sqlite3.sqlite_version,
+            },
+            'commit_info': _commit_info(),
+            'fleet': {
+                'users': fleet['users'],
+                'vehicles': fleet['vehicles'],
+                'trips': fleet['trips'],
+                'expenses': fleet['expenses'],
+                'accidents': fleet['accidents'],
+                'photos': fleet['photos'],
+                'seed': seed,
+                'driver_trips': seeded.driver_trips,
+            },
+            'benchmarks': [],
+        }
+
+        for name, group, role, path in cases:
+            path = path.format(year=today.year, quarter_start=quarter_start)
+            result = {'name': name, 'group': group, 'path': path}
+            try:
+                for _ in range(warmup):
+                    _suite_request(app, role, path, credentials)
+
+                metrics.metrics.reset()
+                samples = []
+                size = 0
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    size, status = _suite_request(app, role, path, credentials)
+                    samples.append(time.perf_counter() - start)
+                    if status != 200:
+                        raise RuntimeError(f"{path} returned {status}")
+
+                result['stats'] = _bench_stats(samples)
+                result['extra_info'] = {'bytes': size}
+                with metrics.metrics._lock:
+                    histograms = list(metrics.metrics.db_queries.values())
+                requests = sum(h.count for h in histograms)
+                if requests:
+                    # Follow-up requests (job polling, downloads) are averaged in
+                    result['extra_info']['queries'] = round(sum(h.total for h in histograms) / requests, 2)
+            except Exception as e:
+                result['error'] = str(e)
+            report['benchmarks'].append(result)
+
+    if compare:
+        with open(compare) as f:
+            report['comparison'] = _compare_results(report, json.load(f), threshold)
+    if save:
+        with open(save, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+# ===============================================
+# Period Query Plans
+# ===============================================
+
+PERIOD_TABLES = ('trips', 'expenses', 'accidents')
+
+_TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(trips|expenses|accidents)(?:\s+(?:AS\s+)?(?!WHERE|JOIN|LEFT|ON|GROUP|ORDER)(\w+))?', re.I)
+
+
+def _period_scenarios(seeded):
+    """The period-filtered reads of the app, as (name, callable) pairs."""
+    from flask import session
+    from app import app
+    from export_helpers import stream_export
+    from expense_helpers import get_expense_summary, get_monthly_expenses, get_user_expenses, iter_user_expenses
+    from report_jobs import plan_report, render_section
+    from trip_helpers import get_daily_trips, get_monthly_trip_stats, get_user_trips, iter_user_trips
+
+    user_id = seeded.driver_id
+    today = datetime.now()
+    month_start, month_end = f"{today:%Y-%m}-01", f"{today:%Y-%m}-28"
+
+    def admin_monthly_report():
+        with app.test_request_context('/admin/reports/monthly-pdf'):
+            session['user_id'] = seeded.admin_id
+            app.view_functions['admin_monthly_report']().close()
+
+    def annual_report_sections():
+        _, _, sections = plan_report('annual', today.year)
+        for section in sections[:2]:
+            render_section(section)
+
+    return [
+        ('admin_monthly_report', admin_monthly_report),
+        ('annual_report_sections', annual_report_sections),
+        ('monthly_expenses', lambda: get_monthly_expenses(user_id)),
+        ('monthly_trip_stats', lambda: get_monthly_trip_stats(user_id, today.year, today.month)),
+        ('daily_trips', lambda: get_daily_trips(user_id, today.strftime('%Y-%m-%d'))),
+        ('trip_list_month', lambda: get_user_trips(user_id, start_date=month_start, end_date=month_end)),
+        ('expense_list_range', lambda: get_user_expenses(user_id, start_date=month_start, end_date=month_end)),
+        ('expense_summary_range', lambda: get_expense_summary(user_id, None, month_start, month_end)),
+        ('period_archive_rows', lambda: (list(iter_user_trips(user_id, start_date=month_start, end_date=month_end)),
+                                         list(iter_user_expenses(user_id, start_date=month_start,
+                                                                 end_date=month_end)))),
+        ('admin_export_range', lambda: list(stream_export('trips', 'csv', start_date=month_start,
+                                                          end_date=month_end)[2][0])),
+    ]
+
+
+def _full_scans(sql, plan):
+    """Plan lines that scan a whole trips/expenses/accidents table."""
+    names = set()
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        names.add(table.lower())
+        if alias:
+            names.add(alias)
+    return [line for line in plan
+            if (match := re.match(r'\s*SCAN (\w+)', line)) and match.group(1) in names]
+
+
+def benchmark_plans(users=10, months=12):
+    """
+    Check that every period-filtered query the app runs is answered from
+    an index. The real code paths (report views, list filters, exports) run
+    with SQL tracing on against a seeded fleet; each statement touching
+    trips, expenses or accidents is then explained, and any full table scan
+    is reported as a failure (non-zero exit status).
+
+    Args:
+        users (int): Drivers in the seeded fleet
+        months (int): Months of history per driver
+
+    Returns:
+        dict: Plans per scenario statement and the list of failures
+    """
+    with SeededFleet(users, months) as seeded:
+        from db_helpers import DATABASE, start_query_tally, stop_query_tally
+        from sql_trace import explain_query_plan
+
+        report = {'benchmark': 'plans', 'scenarios': {}, 'failures': []}
+        for name, scenario in _period_scenarios(seeded):
+            tally = start_query_tally(trace=True)
+            try:
+                scenario()
+            finally:
+                stop_query_tally()
+
+            checked = []
+            seen = set()
+            for statement in tally.statements:
+                if statement.sql in seen or not _TABLE_ALIAS.search(statement.sql):
+                    continue
+                seen.add(statement.sql)
+                plan = explain_query_plan(statement.sql, DATABASE)
+                scans = _full_scans(statement.sql, plan)
+                checked.append({'sql': ' '.join(statement.sql.split()), 'plan': plan, 'ok': not scans})
+                if scans:
+                    report['failures'].append({'scenario': name, 'sql': ' '.join(statement.sql.split()),
+                                               'scans': [line.strip() for line in scans]})
+            report['scenarios'][name] = checked
+
+    report['statements'] = sum(len(checked) for checked in report['scenarios'].values())
+    return report
+
+
+# ===============================================
+# Storage Backends
+# ===============================================
+
+# Columns filled in by the database clock; they differ between any two runs
+_VOLATILE_COLUMNS = {'created_at', 'updated_at', 'uploaded_at', 'last_login', 'resolved_at'}
+
+
+def _normalise(value):
+    """Helper results as plain JSON-comparable data (rows to dicts, floats rounded)."""
+    if isinstance(value, dict) or hasattr(value, 'keys'):
+        return {key: _normalise(value[key]) for key in value.keys() if key not in _VOLATILE_COLUMNS}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(item) for item in value]
+    if isinstance(value, float):
+        return round(value, 2)
+    if hasattr(value, 'is_finite'):   # Decimal
+        return round(float(value), 2)
+    return value
+
+
+def _parity_results():
+    """Run a fixed data set through the helper API and collect what it returns."""
+    from accident_helpers import add_accident, get_user_accidents, get_accident_count
+    from auth_helpers import get_user_info
+    from db_helpers import get_connection
+    from expense_helpers import add_expense, get_user_expenses, get_expense_summary, get_monthly_expenses
+    from route_helpers import get_frequent_routes, get_day_templates
+    from search_helpers import search_records
+    from trip_helpers import (add_trip, add_trips, get_user_trips, get_trip_by_id, get_daily_trips,
+                              get_user_trip_stats, get_monthly_trip_stats, get_trip_count)
+    from vehicle_helpers import add_vehicle, get_user_vehicles
+
+    year = datetime.now().year
+    conn = get_connection()
+    user_id = conn.execute('''
+        INSERT INTO users (username, password_hash, email, role) VALUES (?, ?, ?, ?)
+    ''', ('parity_driver', 'not-a-password-hash', 'parity@bizdrive.invalid', 'driver')).lastrowid
+    conn.commit()
+    conn.close()
+
+    _, _, vehicle_id = add_vehicle(user_id, 'PAR123', 'Toyota', 'HiLux', year=2021, odometer=1000)
+    trip_ids = []
+    for day, distance in ((3, 12.5), (3, 40.0), (17, 8.25)):
+        _, _, trip_id = add_trip(user_id, vehicle_id, f"{year}-03-{day:02d}", '1 George St, Sydney NSW',
+                                 'Parramatta NSW', 'Business', purpose='Site visit', distance=distance)
+        trip_ids.append(trip_id)
+    add_trips(user_id, vehicle_id, f"{year}-04-09", 'Personal',
+              [{'from_address': 'Parramatta NSW', 'to_address': 'Penrith NSW', 'distance': 31.4},
+               {'from_address': 'Penrith NSW', 'to_address': 'Parramatta NSW', 'distance': 31.4}])
+    for month, expense_type, amount in ((3, 'Fuel', 84.1), (3, 'Tolls', 12.35), (4, 'Fuel', 66.0)):
+        add_expense(user_id, vehicle_id, f"{year}-{month:02d}-05", expense_type, amount, notes='Parramatta run')
+    add_accident(user_id, vehicle_id, f"{year}-03-20", '14:30', 'Church St, Parramatta',
+                 circumstances='Rear-ended at lights', estimated_damage=1500)
+
+    return _normalise({
+        'get_user_info': get_user_info('parity_driver'),
+        'get_user_vehicles': get_user_vehicles(user_id),
+        'get_user_trips': get_user_trips(user_id),
+        'get_user_trips_filtered': get_user_trips(user_id, trip_type='Business',
+                                                  start_date=f"{year}-03-01", end_date=f"{year}-03-31"),
+        'get_trip_by_id': get_trip_by_id(trip_ids[0], user_id),
+        'get_daily_trips': get_daily_trips(user_id, f"{year}-03-03"),
+        'get_user_trip_stats': get_user_trip_stats(user_id),
+        'get_monthly_trip_stats': get_monthly_trip_stats(user_id, year, 3),
+        'get_trip_count': get_trip_count(user_id),
+        'get_user_expenses': get_user_expenses(user_id),
+        'get_expense_summary': get_expense_summary(user_id),
+        'get_monthly_expenses': get_monthly_expenses(user_id),
+        'get_user_accidents': get_user_accidents(user_id),
+        'get_accident_count': get_accident_count(user_id),
+        'get_frequent_routes': get_frequent_routes(user_id),
+        'get_day_templates': get_day_templates(user_id),
+        # Ranking and snippets are engine-specific (bm25 vs ts_rank); the hits are not
+        'search_records': sorted((hit['kind'], hit['id'])
+                                 for hit in search_records(user_id, 'parramatta march')['results']),
+    })
+
+
+def _concurrent_writes(writers, seconds, phase='W'):
+    """Threads logging trips through add_trip as fast as they can (phase: a letter naming the run)."""
+    from db_helpers import get_connection
+    from trip_helpers import add_trip
+    from vehicle_helpers import add_vehicle
+
+    conn = get_connection()
+    drivers = []
+    for i in range(writers):
+        user_id = conn.execute('''
+            INSERT INTO users (username, password_hash, email, role) VALUES (?, ?, ?, ?)
+        ''', (f"writer_{phase}{writers}_{i}", 'not-a-password-hash', None, 'driver')).lastrowid
+        drivers.append(user_id)
+    conn.commit()
+    conn.close()
+    drivers = [(user_id, add_vehicle(user_id, f"{phase}{writers:02d}{i:03d}", 'Ford', 'Ranger')[2])
+               for i, user_id in enumerate(drivers)]
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + seconds
+
+    def writer(user_id, vehicle_id):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            success, message, _ = add_trip(user_id, vehicle_id, '2026-05-04', 'Depot', 'Customer site',
+                                           'Business', purpose='Delivery', distance=14.2)
+            latencies.append(time.perf_counter() - start)
+            if not success:
+                errors.append(message)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=writer, args=driver) for driver in drivers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarise_latencies(latencies, elapsed)
+    result.update({'writers': writers, 'errors': len(errors), 'first_error': errors[0] if errors else None})
+    return result
+
+
+def backend_worker(database, writers='1,4,8,16', seconds=5.0):
+    """
+    One side of the backends benchmark, run in its own process because the
+    database is fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    from accident_helpers import init_accident_table
+    from auth_helpers import init_database
+    from db_helpers import is_postgres
+    from expense_helpers import init_expense_table
+    from search_helpers import init_search_tables
+    from trip_helpers import init_trip_table
+    from vehicle_helpers import init_vehicle_table
+
+    for init in (init_database, init_vehicle_table, init_trip_table, init_expense_table,
+                 init_accident_table, init_search_tables):
+        init()
+
+    return {
+        'backend': 'postgresql' if is_postgres() else 'sqlite',
+        'parity': _parity_results(),
+        'writes': [_concurrent_writes(int(n), seconds) for n in str(writers).split(',')],
+    }
+
+
+def _parity_differences(left, right, path=''):
+    """Paths at which two normalised results differ."""
+    if isinstance(left, dict) and isinstance(right, dict):
+        differences = []
+        for key in sorted(set(left) | set(right)):
+            differences += _parity_differences(left.get(key), right.get(key), f"{path}.{key}" if path else key)
+        return differences
+    if isinstance(left, list) and isinstance(right, list) and len(left) == len(right):
+        differences = []
+        for i, (a, b) in enumerate(zip(left, right)):
+            differences += _parity_differences(a, b, f"{path}[{i}]")
+        return differences
+    # SQLite returns whole DECIMAL values as int; equal numbers are equal
+    numbers = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (left, right))
+    if left != right or (type(left) is not type(right) and not numbers):
+        return [{'path': path, 'sqlite': left, 'postgresql': right}]
+    return []
+
+
+def benchmark_backends(postgres=None, writers='1,4,8,16', seconds=5.0):
+    """
+    Compare the SQLite and PostgreSQL backends. Each runs in a fresh
+    database (PostgreSQL: a throwaway schema, dropped afterwards): a fixed
+    data set goes through the helper API and the results must match, then
+    N threads write trips concurrently for a few seconds per level.
+
+    Args:
+        postgres (str): postgresql:// URL of a server to test against; without
+                        it only SQLite runs
+        writers (str): Comma-separated writer thread counts
+        seconds (float): Duration of each write level
+
+    Returns:
+        dict: Write throughput per backend and level, and parity mismatches
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-backends-')
+    databases = {'sqlite': os.path.join(workdir, 'bizdrive.db')}
+
+    schema = f"bizdrive_bench_{os.getpid()}"
+    if postgres:
+        import psycopg2
+
+        admin = psycopg2.connect(postgres)
+        admin.autocommit = True
+        admin.cursor().execute(f"CREATE SCHEMA {schema}")
+        separator = '&' if '?' in postgres else '?'
+        databases['postgresql'] = f"{postgres}{separator}options=-csearch_path%3D{schema}"
+
+    results = {}
+    try:
+        for name, database in databases.items():
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), 'backend-worker', '--database', database,
+                 '--writers', str(writers), '--seconds', str(seconds)],
+                cwd=workdir, capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"{name} worker failed:\n{completed.stderr[-2000:]}")
+            results[name] = json.loads(completed.stdout)
+    finally:
+        if postgres:
+            admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+            admin.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'backends',
+        'writers': writers,
+        'seconds': seconds,
+        'writes': {name: result['writes'] for name, result in results.items()},
+    }
+    if 'postgresql' in results:
+        report['failures'] = _parity_differences(results['sqlite']['parity'], results['postgresql']['parity'])
+        report['speedup'] = {
+            str(lite['writers']): round(pg['requests_per_second'] / lite['requests_per_second'], 2)
+            for lite, pg in zip(results['sqlite']['writes'], results['postgresql']['writes'])
+            if lite['requests_per_second']
+        }
+    return report
+
+
+
+# ===============================================
+# Tenant Shards
+# ===============================================
+
+def _slow_exports(user_ids, stop, pause, exported):
+    """Stream the users' trip exports to a slow client until stopped."""
+    from export_helpers import iter_export_batches
+
+    while not stop.is_set():
+        for user_id in user_ids:
+            for rows in iter_export_batches('trips', user_id=user_id, batch_size=100):
+                exported.append(len(rows))
+                time.sleep(pause)
+                if stop.is_set():
+                    break
+
+
+def shard_worker(database, shard_dir=None, users=20, months=6, shards=4, writers=4, seconds=5.0, pause=0.01):
+    """
+    One side of the shards benchmark, run in its own process because the
+    database and shard directory are fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    if shard_dir:
+        os.environ['BIZDRIVE_SHARD_DIR'] = shard_dir
+    from seed_fleet import seed_fleet
+    from shard_router import SHARDING, assign_user_shard, fan_out
+
+    fleet = seed_fleet(users=users, months=months, photos_per_accident=0, receipt_rate=0)
+    organisations = {f"org{n + 1}": fleet['user_ids'][n::shards] for n in range(shards)}
+    if SHARDING:
+        for name, user_ids in organisations.items():
+            for user_id in user_ids:
+                success, message, _ = assign_user_shard(user_id, name)
+                if not success:
+                    raise RuntimeError(message)
+
+    def totals(conn):
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(distance), 0) FROM trips").fetchone()
+
+    fan_out(totals)
+    fanout_seconds = []
+    for _ in range(20):
+        start = time.perf_counter()
+        trips = sum(row[0] for row in fan_out(totals))
+        fanout_seconds.append(time.perf_counter() - start)
+
+    # org1 streams its exports to a slow client while other tenants log trips
+    stop = threading.Event()
+    exported = []
+    exporter = threading.Thread(target=_slow_exports, args=(organisations['org1'], stop, pause, exported))
+    exporter.start()
+    try:
+        writes = _concurrent_writes(writers, seconds)
+    finally:
+        stop.set()
+        exporter.join()
+
+    return {
+        'sharded': SHARDING,
+        'trips': trips,
+        'admin_totals': _bench_stats(fanout_seconds),
+        'writes': writes,
+        'exported_rows': sum(exported),
+    }
+
+
+def benchmark_shards(users=20, months=6, shards=4, writers=4, seconds=5.0, pause=0.01):
+    """
+    One database vs per-organisation shards. The same fleet is seeded into
+    each layout (sharded: users spread over N organisation shards); one
+    organisation then streams its trip exports to a slow client while
+    other tenants log trips. Admin totals are timed as a fan-out.
+
+    Args:
+        users (int): Seeded drivers
+        months (int): Months of history
+        shards (int): Organisations (shards) the drivers are spread over
+        writers (int): Concurrent writer threads from other tenants
+        seconds (float): Duration of the write phase
+        pause (float): Client delay per 100-row export batch, in seconds
+
+    Returns:
+        dict: Write latency per layout and the sharded/single ratios
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-shards-')
+    results = {}
+    try:
+        for name in ('single', 'sharded'):
+            layout = os.path.join(workdir, name)
+            os.makedirs(layout)
+            command = [sys.executable, os.path.abspath(__file__), 'shard-worker',
+                       '--database', os.path.join(layout, 'bizdrive.db'),
+                       '--users', str(users), '--months', str(months), '--shards', str(shards),
+                       '--writers', str(writers), '--seconds', str(seconds), '--pause', str(pause)]
+            if name == 'sharded':
+                command += ['--shard-dir', os.path.join(layout, 'shards')]
+            completed = subprocess.run(command, cwd=layout, capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"{name} worker failed:\n{completed.stderr[-2000:]}")
+            results[name] = json.loads(completed.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    single, sharded = results['single'], results['sharded']
+    report = {
+        'benchmark': 'shards',
+        'users': users,
+        'shards': shards,
+        'writers': writers,
+        'single': single,
+        'sharded': sharded,
+        'write_p95_ratio': round(sharded['writes']['p95_ms'] / single['writes']['p95_ms'], 3)
+        if single['writes']['p95_ms'] else None,
+        'write_throughput_ratio': round(sharded['writes']['requests_per_second']
+                                        / single['writes']['requests_per_second'], 2)
+        if single['writes']['requests_per_second'] else None,
+    }
+    if single['trips'] != sharded['trips']:
+        report['failures'] = [f"trip totals differ: {single['trips']} vs {sharded['trips']}"]
+    return report
+
+
+# ===============================================
+# Report Snapshots
+# ===============================================
+
+def _report_loop(snapshot, stop, durations, drift):
+    """Render full reports back to back until stopped, noting how far the data moved under each."""
+    from db_helpers import get_connection, DATABASE as live_database
+    from report_jobs import plan_report, render_report
+    from report_snapshots import report_snapshot
+
+    def trip_count(databases):
+        total = 0
+        for database in databases:
+            conn = get_connection(database)
+            total += conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+            conn.close()
+        return total
+
+    path = os.path.join(tempfile.gettempdir(), f"bizdrive-snapshot-bench-{os.getpid()}.pdf")
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            if snapshot:
+                with report_snapshot(max_age=0) as databases:
+                    before = trip_count(databases)
+                    title, subtitle, sections = plan_report('full', databases=databases)
+                    render_report(title, subtitle, sections, path, workers=1)
+                    drift.append(trip_count(databases) - before)
+            else:
+                before = trip_count([live_database])
+                title, subtitle, sections = plan_report('full')
+                render_report(title, subtitle, sections, path, workers=1)
+                drift.append(trip_count([live_database]) - before)
+            durations.append(time.perf_counter() - start)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def snapshot_worker(database, mode='snapshot', users=20, months=6, writers=4, seconds=5.0):
+    """
+    One side of the snapshots benchmark, run in its own process because the
+    database and journal mode are fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    os.environ['BIZDRIVE_JOURNAL_MODE'] = 'wal' if mode == 'snapshot' else 'delete'
+    import report_snapshots
+    from seed_fleet import seed_fleet
+
+    report_snapshots.SNAPSHOT_FOLDER = os.path.join(os.path.dirname(database), 'snapshots')
+    os.makedirs(report_snapshots.SNAPSHOT_FOLDER, exist_ok=True)
+
+    seed_fleet(users=users, months=months, photos_per_accident=0, receipt_rate=0)
+    stop = threading.Event()
+    durations, drift = [], []
+    reporter = threading.Thread(target=_report_loop, args=(mode == 'snapshot', stop, durations, drift))
+    reporter.start()
+    try:
+        writes = _concurrent_writes(writers, seconds)
+    finally:
+        stop.set()
+        reporter.join()
+
+    return {
+        'mode': mode,
+        'writes': writes,
+        'reports': _bench_stats(durations) if durations else None,
+        'reports_with_drift': sum(1 for rows in drift if rows),
+        'max_drift_trips': max(drift, default=0),
+    }
+
+
+def benchmark_snapshots(users=20, months=6, writers=4, seconds=5.0):
+    """
+    Driver writes while full admin reports render back to back: reports on
+    the live database in rollback-journal mode (the old path) vs reports on
+    a snapshot with the live database in WAL mode. Also counts the reports
+    whose data changed between their first and last query.
+
+    Args:
+        users (int): Seeded drivers
+        months (int): Months of history
+        writers (int): Concurrent writer threads
+        seconds (float): Duration of the write phase
+
+    Returns:
+        dict: Write latency per mode and the snapshot/live ratios
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-snapshots-')
+    results = {}
+    try:
+        for mode in ('live', 'snapshot'):
+            layout = os.path.join(workdir, mode)
+            os.makedirs(layout)
+            command = [sys.executable, os.path.abspath(__file__), 'snapshot-worker',
+                       '--database', os.path.join(layout, 'bizdrive.db'), '--mode', mode,
+                       '--users', str(users), '--months', str(months),
+                       '--writers', str(writers), '--seconds', str(seconds)]
+            completed = subprocess.run(command, cwd=layout, capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"{mode} worker failed:\n{completed.stderr[-2000:]}")
+            results[mode] = json.loads(completed.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    live, snapshot = results['live'], results['snapshot']
+    report = {
+        'benchmark': 'snapshots',
+        'users': users,
+        'writers': writers,
+        'live': live,
+        'snapshot': snapshot,
+        'write_p95_ratio': round(snapshot['writes']['p95_ms'] / live['writes']['p95_ms'], 3)
+        if live['writes']['p95_ms'] else None,
+        'write_throughput_ratio': round(snapshot['writes']['requests_per_second']
+                                        / live['writes']['requests_per_second'], 2)
+        if live['writes']['requests_per_second'] else None,
+    }
+    failures = []
+    if snapshot['reports_with_drift']:
+        failures.append(f"{snapshot['reports_with_drift']} snapshot reports saw their data change")
+    if snapshot['writes']['errors']:
+        failures.append(f"{snapshot['writes']['errors']} writes failed during snapshot reports")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+# ===============================================
+# Backups
+# ===============================================
+
+def backup_worker(database, users=20, months=6, writers=4, seconds=5.0, interval=0.5):
+    """
+    Run the backups benchmark in its own process, because the database is
+    fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    os.environ['BIZDRIVE_BACKUP_DIR'] = os.path.join(os.path.dirname(database), 'backups')
+    import backups
+    from db_helpers import get_connection
+    from seed_fleet import seed_fleet
+
+    seed_fleet(users=users, months=months, photos_per_accident=1, receipt_rate=0.5)
+    idle = _concurrent_writes(writers, seconds, phase='I')
+
+    # Base copies back to back while drivers log trips
+    stop = threading.Event()
+    copies = []
+
+    def copy_loop():
+        while not stop.is_set():
+            copies.append(backups.take_backup())
+
+    copier = threading.Thread(target=copy_loop)
+    copier.start()
+    try:
+        during_copies = _concurrent_writes(writers, seconds, phase='B')
+    finally:
+        stop.set()
+        copier.join()
+    copied = [source for manifest in copies for source in manifest['sources'].values()]
+    copy_bytes = sum(source['bytes'] for source in copied)
+    copy_seconds = sum(source['seconds'] for source in copied)
+
+    # WAL archiving while drivers log trips, then a verified restore
+    stop = threading.Event()
+    archived = {}
+    archiver = threading.Thread(target=lambda: archived.update(backups.run_archiver(interval, stop)))
+    archiver.start()
+    try:
+        during_archiving = _concurrent_writes(writers, seconds, phase='A')
+    finally:
+        stop.set()
+        archiver.join()
+
+    conn = get_connection()
+    live_trips = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+    conn.close()
+    restored = backups.verify(archived['generations'][-1])
+    segments = [segment for source in backups.load_manifest(archived['generations'][-1])['sources'].values()
+                for segment in source['segments']]
+
+    return {
+        'idle': idle,
+        'during_base_copies': during_copies,
+        'during_archiving': during_archiving,
+        'base_copies': len(copied),
+        'base_copy_mb_per_second': round(copy_bytes / copy_seconds / 1024 / 1024, 1) if copy_seconds else None,
+        'archived_frames': archived['frames'],
+        'archived_mb': round(sum(segment['bytes'] for segment in segments) / 1024 / 1024, 2),
+        'generations': len(archived['generations']),
+        'restore_ok': restored['ok'],
+        'restored_files': restored['files']['verified'],
+        'live_trips': live_trips,
+        'restored_trips': sum(database['rows'].get('trips', 0) for database in restored['databases'].values()),
+    }
+
+
+def benchmark_backups(users=20, months=6, writers=4, seconds=5.0, interval=0.5):
+    """
+    Driver write latency with no backup running, during back-to-back
+    online base copies and during WAL archiving, then a verified restore
+    of the archive compared with the live database.
+
+    Args:
+        users (int): Seeded drivers
+        months (int): Months of history
+        writers (int): Concurrent writer threads
+        seconds (float): Duration of each write phase
+        interval (float): Seconds between archive rounds
+
+    Returns:
+        dict: Write latency per phase, backup throughput and the restore check
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-backups-')
+    try:
+        command = [sys.executable, os.path.abspath(__file__), 'backup-worker',
+                   '--database', os.path.join(workdir, 'bizdrive.db'),
+                   '--users', str(users), '--months', str(months), '--writers', str(writers),
+                   '--seconds', str(seconds), '--interval', str(interval)]
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"backup worker failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    idle_p95 = result['idle']['p95_ms']
+    report = {
+        'benchmark': 'backups',
+        'users': users,
+        'writers': writers,
+        **result,
+        'base_copy_p95_ratio': round(result['during_base_copies']['p95_ms'] / idle_p95, 3) if idle_p95 else None,
+        'archiving_p95_ratio': round(result['during_archiving']['p95_ms'] / idle_p95, 3) if idle_p95 else None,
+    }
+    failures = []
+    if not result['restore_ok']:
+        failures.append('restored backup failed verification')
+    if result['restored_trips'] != result['live_trips']:
+        failures.append(f"restored {result['restored_trips']} trips, live database has {result['live_trips']}")
+    for phase in ('during_base_copies', 'during_archiving'):
+        if result[phase]['errors']:
+            failures.append(f"{result[phase]['errors']} writes failed {phase.replace('_', ' ')}")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+def _archive_queries(user_ids, start_date, end_date, rounds):
+    """Time one driver's trip list, trip stats and expense summary over a date range."""
+    from expense_helpers import get_expense_summary
+    from trip_helpers import get_user_trip_stats, get_user_trips
+
+    samples = []
+    for _ in range(rounds):
+        for user_id in user_ids:
+            start = time.perf_counter()
+            get_user_trips(user_id, start_date=start_date, end_date=end_date)
+            get_user_trip_stats(user_id, start_date, end_date)
+            get_expense_summary(user_id, start_date=start_date, end_date=end_date)
+            samples.append(time.perf_counter() - start)
+    return _bench_stats(samples)
+
+
+def _all_time_totals():
+    """Row counts and rounded totals of every export, summed over all history."""
+    from export_helpers import iter_export_batches
+
+    totals = {}
+    for dataset, column in (('trips', 8), ('expenses', 4), ('accidents', 0)):
+        count, total = 0, 0.0
+        for rows in iter_export_batches(dataset):
+            count += len(rows)
+            total += sum(row[column] or 0 for row in rows)
+        totals[dataset] = {'rows': count, 'total': round(total, 2)}
+    return totals
+
+
+def archive_worker(database, users=20, months=36, rounds=5):
+    """
+    Run the archive benchmark in its own process, because the database is
+    fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    os.environ['BIZDRIVE_ARCHIVE_DIR'] = os.path.join(os.path.dirname(database), 'archive')
+    import archive_store
+    import report_snapshots
+    from seed_fleet import seed_fleet
+
+    report_snapshots.SNAPSHOT_FOLDER = os.path.join(os.path.dirname(database), 'snapshots')
+    os.makedirs(report_snapshots.SNAPSHOT_FOLDER, exist_ok=True)
+
+    seeded = seed_fleet(users=users, months=months, photos_per_accident=0, receipt_rate=0)
+    user_ids = seeded['user_ids']
+    cutoff = archive_store.default_cutoff()
+    today = datetime.utcnow().date().isoformat()
+    archived_year = int(cutoff[:4]) - 1
+
+    def live_mb():
+        return round(os.path.getsize(database) / 1024 / 1024, 2)
+
+    def snapshot_seconds():
+        # A report snapshot copies the whole live database
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            report_snapshots.take_snapshot(database)
+            samples.append(time.perf_counter() - start)
+        return _bench_stats(samples)
+
+    before = {
+        'live_mb': live_mb(),
+        'snapshot': snapshot_seconds(),
+        'current_year': _archive_queries(user_ids, cutoff, today, rounds),
+        'archived_year': _archive_queries(user_ids, f"{archived_year}-01-01", f"{archived_year}-12-31", rounds),
+        'totals': _all_time_totals(),
+    }
+    start = time.perf_counter()
+    moved = archive_store.archive_rows(cutoff, vacuum=True)
+    archive_seconds = time.perf_counter() - start
+    after = {
+        'live_mb': live_mb(),
+        'snapshot': snapshot_seconds(),
+        'current_year': _archive_queries(user_ids, cutoff, today, rounds),
+        'archived_year': _archive_queries(user_ids, f"{archived_year}-01-01", f"{archived_year}-12-31", rounds),
+        'totals': _all_time_totals(),
+    }
+
+    return {
+        'cutoff': cutoff,
+        'moved': moved[database],
+        'archive_seconds': round(archive_seconds, 3),
+        'archive_mb': round(sum(os.path.getsize(path) for path in archive_store.archive_files(database))
+                            / 1024 / 1024, 2),
+        'before': before,
+        'after': after,
+    }
+
+
+def benchmark_archive(users=20, months=36, rounds=5):
+    """
+    Current-financial-year query times, live database size and report
+    snapshot time before and after moving older years into archives, plus
+    a check that all-time exports return the same rows and totals either way.
+
+    Args:
+        users (int): Seeded drivers
+        months (int): Months of history
+        rounds (int): Passes over every driver per measurement
+
+    Returns:
+        dict: Query and snapshot timings, sizes and the all-time totals before and after
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-archive-')
+    try:
+        command = [sys.executable, os.path.abspath(__file__), 'archive-worker',
+                   '--database', os.path.join(workdir, 'bizdrive.db'),
+                   '--users', str(users), '--months', str(months), '--rounds', str(rounds)]
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"archive worker failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    before, after = result['before'], result['after']
+    report = {
+        'benchmark': 'archive',
+        'users': users,
+        'months': months,
+        **result,
+        'current_year_speedup': round(before['current_year']['median'] / after['current_year']['median'], 3),
+        'live_size_ratio': round(after['live_mb'] / before['live_mb'], 3),
+        'snapshot_speedup': round(before['snapshot']['median'] / after['snapshot']['median'], 3),
+    }
+    failures = []
+    for dataset, totals in before['totals'].items():
+        if after['totals'][dataset] != totals:
+            failures.append(f"all-time {dataset} export changed: {totals} before, {after['totals'][dataset]} after")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+def _edit_costs(trip, vehicle, rounds):
+    """Statements and time per call of each edit helper, on one trip and vehicle."""
+    from db_helpers import start_query_tally, stop_query_tally
+    from trip_helpers import delete_trip, update_trip
+    from vehicle_helpers import delete_vehicle, update_vehicle
+
+    cases = {
+        'update_trip': lambda i: update_trip(trip['id'], trip['user_id'], distance=10.0 + i % 50,
+                                             expected_version=trip['version'] + i),
+        'update_vehicle': lambda i: update_vehicle(vehicle['id'], vehicle['user_id'], notes=f"edit {i}",
+                                                   expected_version=vehicle['version'] + i),
+    }
+    costs = {}
+    for name, call in cases.items():
+        samples, statements = [], 0
+        for i in range(rounds):
+            tally = start_query_tally()
+            start = time.perf_counter()
+            success, message = call(i)
+            samples.append(time.perf_counter() - start)
+            stop_query_tally()
+            if not success:
+                raise RuntimeError(f"{name}: {message}")
+            statements += tally.count
+        costs[name] = dict(_bench_stats(samples), statements_per_call=round(statements / rounds, 2))
+
+    for name, call in (('delete_trip', lambda: delete_trip(trip['id'], trip['user_id'])),
+                       ('delete_vehicle', lambda: delete_vehicle(vehicle['id'], vehicle['user_id']))):
+        tally = start_query_tally()
+        success, message = call()
+        stop_query_tally()
+        if not success:
+            raise RuntimeError(f"{name}: {message}")
+        costs[name] = {'statements_per_call': tally.count}
+    return costs
+
+
+def edit_worker(database, users=5, editors=8, rounds=50):
+    """
+    Run the edits benchmark in its own process, because the database is
+    fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    from db_helpers import get_connection
+    from seed_fleet import seed_fleet
+    from trip_helpers import get_trip_by_id, update_trip
+
+    seed_fleet(users=users, months=1, photos_per_accident=0, receipt_rate=0)
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    trips = [dict(row) for row in conn.execute("SELECT * FROM trips ORDER BY id LIMIT 2")]
+    vehicle = dict(conn.execute("SELECT * FROM vehicles ORDER BY id DESC LIMIT 1").fetchone())
+    conn.close()
+
+    costs = _edit_costs(trips[0], vehicle, rounds)
+
+    # Editors that each load the trip, then save their change
+    contested = trips[1]
+    outcomes = {'saved': 0, 'conflicts': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def editor(number):
+        for i in range(rounds):
+            loaded = get_trip_by_id(contested['id'], contested['user_id'])
+            success, message = update_trip(contested['id'], contested['user_id'], notes=f"editor {number} #{i}",
+                                           expected_version=loaded['version'])
+            with lock:
+                if success:
+                    outcomes['saved'] += 1
+                elif 'changed by someone else' in message:
+                    outcomes['conflicts'] += 1
+                else:
+                    outcomes['errors'] += 1
+
+    threads = [threading.Thread(target=editor, args=(number,)) for number in range(editors)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    final = get_trip_by_id(contested['id'], contested['user_id'])
+
+    return {
+        'costs': costs,
+        'contested': dict(outcomes, final_version=final['version'],
+                          lost_updates=contested['version'] + outcomes['saved'] - final['version']),
+    }
+
+
+def benchmark_edits(users=5, editors=8, rounds=50):
+    """
+    Statements and latency per trip and vehicle edit or delete, and
+    concurrent editors saving the same trip: every save must either land
+    on the version it loaded or be refused, so none is silently lost.
+
+    Args:
+        users (int): Seeded drivers
+        editors (int): Threads editing one trip at once
+        rounds (int): Edits per helper, and per editor
+
+    Returns:
+        dict: Per-helper costs and the contested-edit outcome
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-edits-')
+    try:
+        command = [sys.executable, os.path.abspath(__file__), 'edit-worker',
+                   '--database', os.path.join(workdir, 'bizdrive.db'),
+                   '--users', str(users), '--editors', str(editors), '--rounds', str(rounds)]
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"edit worker failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'benchmark': 'edits', 'editors': editors, **result}
+    contested = result['contested']
+    failures = []
+    if contested['lost_updates']:
+        failures.append(f"{contested['lost_updates']} concurrent edits were lost")
+    if contested['errors']:
+        failures.append(f"{contested['errors']} concurrent edits failed with errors")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+def _bulk_vehicle(conn, registration, rows):
+    """A vehicle with rows trips and rows // 10 expenses, cloned from the seeded ones."""
+    user_id = conn.execute("SELECT id FROM users WHERE role = 'driver' ORDER BY id LIMIT 1").fetchone()[0]
+    vehicle_id = conn.execute('''
+        INSERT INTO vehicles (user_id, registration, make, model, status, created_at)
+        VALUES (?, ?, 'Toyota', 'HiAce', 'Active', '2026-01-01')
+    ''', (user_id, registration)).lastrowid
+    for table, count in (('trips', rows), ('expenses', rows // 10)):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != 'id']
+        copied = ', '.join('?' if column in ('user_id', 'vehicle_id') else column for column in columns)
+        conn.execute(f'''
+            INSERT INTO {table} ({', '.join(columns)})
+            SELECT {copied} FROM {table} ORDER BY id LIMIT ?
+        ''', [user_id if column == 'user_id' else vehicle_id
+              for column in columns if column in ('user_id', 'vehicle_id')] + [count])
+        while conn.execute(f"SELECT COUNT(*) FROM {table} WHERE vehicle_id = ?", (vehicle_id,)).fetchone()[0] < count:
+            conn.execute(f'''
+                INSERT INTO {table} ({', '.join(columns)})
+                SELECT {', '.join(columns)} FROM {table} WHERE vehicle_id = ? LIMIT ?
+            ''', (vehicle_id, count - conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE vehicle_id = ?", (vehicle_id,)).fetchone()[0]))
+    conn.commit()
+    return user_id, vehicle_id
+
+
+def _single_transaction_delete(vehicle_id, user_id):
+    """The whole cascade in one transaction: the write lock is held until it ends."""
+    from cascade_deletes import DEPENDENT_TABLES, _delete_batch, _owned_by
+    from db_helpers import get_connection
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    for table in DEPENDENT_TABLES:
+        _delete_batch(cursor, table, _owned_by(table, 'vehicle_id'), (vehicle_id,))
+    cursor.execute("DELETE FROM vehicles WHERE id = ? AND user_id = ?", (vehicle_id, user_id))
+    conn.commit()
+    conn.close()
+    return True, 'deleted'
+
+
+def cascade_worker(database, rows=50000, writers=4, seconds=6.0, batch=500):
+    """
+    Run the cascade benchmark in its own process, because the database is
+    fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    os.environ['BIZDRIVE_CASCADE_BATCH_SIZE'] = str(batch)
+    import cascade_deletes
+    from db_helpers import get_connection
+    from seed_fleet import seed_fleet
+    from vehicle_helpers import delete_vehicle
+
+    seed_fleet(users=4, months=1, photos_per_accident=0, receipt_rate=0)
+    conn = get_connection()
+    bulk = {mode: _bulk_vehicle(conn, f"BULK{number}", rows)
+            for number, mode in enumerate(('one_transaction', 'batched'))}
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    # The writers contend with each other too: warm them up, then measure a
+    # run without any delete as the baseline
+    _concurrent_writes(writers, 1.0, phase='U')
+
+    deletes = {
+        'one_transaction': _single_transaction_delete,
+        'batched': lambda vehicle_id, user_id: delete_vehicle(vehicle_id, user_id),
+    }
+    runs = {'no_delete': {'writes': _concurrent_writes(writers, seconds, phase='N')}}
+    for mode, (user_id, vehicle_id) in bulk.items():
+        timing = {}
+
+        def delete():
+            time.sleep(0.5)
+            start = time.perf_counter()
+            success, message = deletes[mode](vehicle_id, user_id)
+            timing.update(seconds=round(time.perf_counter() - start, 3), success=success, message=message)
+
+        deleter = threading.Thread(target=delete)
+        deleter.start()
+        writes = _concurrent_writes(writers, seconds, phase=mode[0].upper())
+        deleter.join()
+        conn = get_connection()
+        left = conn.execute("SELECT COUNT(*) FROM trips WHERE vehicle_id = ?", (vehicle_id,)).fetchone()[0]
+        conn.close()
+        runs[mode] = {'delete': timing, 'rows_left': left, 'writes': writes}
+
+    # Orphans left by a delete that bypassed the foreign keys
+    raw = sqlite3.connect(database)
+    raw.execute("DELETE FROM vehicles WHERE id = (SELECT MIN(vehicle_id) FROM trips)")
+    raw.commit()
+    raw.close()
+    orphans = cascade_deletes.find_orphans()
+    repaired = cascade_deletes.repair_orphans(batch)
+
+    conn = get_connection()
+    try:
+        conn.execute("INSERT INTO trips (user_id, vehicle_id, trip_date, distance) VALUES (1, -1, '2026-01-01', 1)")
+        enforced = False
+    except sqlite3.IntegrityError:
+        enforced = True
+    conn.rollback()
+    conn.close()
+
+    return {
+        'runs': runs,
+        'orphans_found': orphans,
+        'orphans_repaired': repaired,
+        'orphans_after_repair': cascade_deletes.find_orphans(),
+        'foreign_keys_enforced': enforced,
+    }
+
+
+def benchmark_cascade(rows=50000, writers=4, seconds=6.0, batch=500):
+    """
+    Deleting a vehicle with rows trips (and a tenth as many expenses) while
+    drivers log trips: the whole cascade in one transaction vs batches of
+    batch rows, against a run with no delete. Reports the drivers' write
+    latency (max_ms is the worst wait for the write lock), then checks
+    orphan repair and foreign key enforcement.
+
+    Args:
+        rows (int): Trips on each deleted vehicle
+        writers (int): Threads logging trips during the delete
+        seconds (float): How long they log trips (the delete starts 0.5s in)
+        batch (int): Rows deleted per transaction
+
+    Returns:
+        dict: Delete time and writer latency per mode, plus the orphan checks
+    """
+    workdir = tempfile.mkdtemp(prefix='bizdrive-cascade-')
+    try:
+        command = [sys.executable, os.path.abspath(__file__), 'cascade-worker',
+                   '--database', os.path.join(workdir, 'bizdrive.db'),
+                   '--rows', str(rows), '--writers', str(writers), '--seconds', str(seconds),
+                   '--batch', str(batch)]
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"cascade worker failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'benchmark': 'cascade', 'rows': rows, 'writers': writers, 'seconds': seconds,
+              'batch': batch, **result}
+    failures = []
+    for mode, run in result['runs'].items():
+        if 'delete' in run and (not run['delete'].get('success') or run['rows_left']):
+            failures.append(f"{mode} delete left {run['rows_left']} trips: {run['delete'].get('message')}")
+        if run['writes']['errors']:
+            failures.append(f"{run['writes']['errors']} writes failed during the {mode} delete")
+    if result['orphans_after_repair']:
+        failures.append(f"orphans left after repair: {result['orphans_after_repair']}")
+    if not result['foreign_keys_enforced']:
+        failures.append("foreign keys are not enforced")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+def _jpeg(size=(1200, 900)):
+    """A generated JPEG upload body."""
+    from io import BytesIO
+
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', size, (180, 140, 90)).save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def _unit_requests(client, vehicle_id, accident_id, photo):
+    """The multi-step write routes: endpoint -> function posting round i."""
+    from io import BytesIO
+
+    def photos(count):
+        return [(BytesIO(photo), f"photo{n}.jpg") for n in range(count)]
+
+    accident = {'vehicle_id': vehicle_id, 'accident_date': '2026-03-02', 'accident_time': '08:30',
+                'location': 'Depot', 'circumstances': 'Reversed into a bollard', 'severity': 'Minor'}
+    legs = {f"trips[{leg}][{field}]": value for leg in range(3)
+            for field, value in (('from_address', 'Depot'), ('to_address', f"Site {leg}"),
+                                 ('purpose', 'Delivery'), ('distance', '12.5'))}
+    return {
+        'add_accident_route': lambda i: client.post(
+            '/accidents/add', data=dict(accident, photos=photos(3)), content_type='multipart/form-data'),
+        'edit_accident_route': lambda i: client.post(
+            f"/accidents/{accident_id}/edit", data=dict(accident, location=f"Depot {i}", photos=photos(i % 2)),
+            content_type='multipart/form-data'),
+        'add_trip_route': lambda i: client.post('/trips/add', data=dict(
+            legs, vehicle_id=vehicle_id, trip_date='2026-03-02', trip_type='Business')),
+        'add_expense_route': lambda i: client.post('/expenses/add', data={
+            'vehicle_id': vehicle_id, 'date': '2026-03-02', 'category': 'Fuel', 'amount': '55.20',
+            'description': f"Fill {i}"}),
+    }
+
+
+def unit_worker(database, rounds=20):
+    """
+    Run one mode of the units benchmark in its own process, because the
+    database and BIZDRIVE_UNIT_OF_WORK are fixed when db_helpers is imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    import db_helpers
+    import metrics
+    from accident_helpers import add_accident
+    from app import app
+    from db_helpers import get_connection, unit_of_work
+    from seed_fleet import seed_fleet
+
+    seed_fleet(users=2, months=1, photos_per_accident=0, receipt_rate=0)
+    conn = get_connection()
+    user_id, vehicle_id = conn.execute(
+        "SELECT u.id, v.id FROM users u JOIN vehicles v ON v.user_id = u.id "
+        "WHERE u.role = 'driver' ORDER BY v.id LIMIT 1").fetchone()
+    conn.close()
+    _, _, accident_id = add_accident(user_id, vehicle_id, '2026-03-01', '07:00', 'Yard',
+                                     circumstances='Scraped a gate')
+
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+
+    routes = {}
+    for endpoint, post in _unit_requests(client, vehicle_id, accident_id, _jpeg()).items():
+        metrics.metrics.reset()
+        samples, errors = [], 0
+        for i in range(rounds):
+            start = time.perf_counter()
+            response = post(i)
+            samples.append(time.perf_counter() - start)
+            errors += response.status_code != 302
+            response.close()
+        commits = metrics.metrics.db_commits.get(endpoint, 0)
+        routes[endpoint] = dict(_bench_stats(samples), errors=errors,
+                                commits_per_request=round(commits / rounds, 2))
+
+    def count(sql, *params):
+        conn = get_connection()
+        value = conn.execute(sql, params).fetchone()[0]
+        conn.close()
+        return value
+
+    # A unit abandoned part-way leaves nothing behind
+    before = count("SELECT COUNT(*) FROM accidents")
+    try:
+        with unit_of_work():
+            add_accident(user_id, vehicle_id, '2026-03-03', '09:00', 'Yard', circumstances='Abandoned')
+            raise RuntimeError('abandon the unit')
+    except RuntimeError:
+        pass
+
+    return {
+        'unit_of_work': db_helpers.UNIT_OF_WORK,
+        'routes': routes,
+        'edited_accident_photos': count("SELECT COUNT(*) FROM accident_photos WHERE accident_id = ?", accident_id),
+        'left_by_abandoned_unit': count("SELECT COUNT(*) FROM accidents") - before,
+    }
+
+
+def benchmark_units(rounds=20):
+    """
+    Commits (one fsync each) and latency per request of the routes that
+    write in several steps - an accident with photos, an accident edit
+    adding photos, a multi-leg trip and an expense - with every helper
+    committing on its own (BIZDRIVE_UNIT_OF_WORK=0) vs one unit of work.
+    Also checks that a unit abandoned part-way writes nothing.
+
+    Args:
+        rounds (int): Requests per route
+
+    Returns:
+        dict: Per-route commits and latency for each mode
+    """
+    runs = {}
+    for mode, setting in (('per_helper', '0'), ('unit_of_work', '1')):
+        workdir = tempfile.mkdtemp(prefix='bizdrive-units-')
+        try:
+            command = [sys.executable, os.path.abspath(__file__), 'unit-worker',
+                       '--database', os.path.join(workdir, 'bizdrive.db'), '--rounds', str(rounds)]
+            completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True,
+                                       env=dict(os.environ, BIZDRIVE_UNIT_OF_WORK=setting))
+            if completed.returncode != 0:
+                raise RuntimeError(f"unit worker failed:\n{completed.stderr[-2000:]}")
+            runs[mode] = json.loads(completed.stdout)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'benchmark': 'units', 'rounds': rounds, 'runs': runs}
+    failures = []
+    for mode, run in runs.items():
+        for endpoint, route in run['routes'].items():
+            if route['errors']:
+                failures.append(f"{mode}: {route['errors']} {endpoint} requests failed")
+    after = runs['unit_of_work']
+    for endpoint, route in after['routes'].items():
+        if route['commits_per_request'] > 1:
+            failures.append(f"{endpoint} commits {route['commits_per_request']} times per request")
+    if after['left_by_abandoned_unit']:
+        failures.append(f"an abandoned unit of work left {after['left_by_abandoned_unit']} accidents")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+def pipeline_worker(database, writers=200, seconds=5.0):
+    """
+    Run one mode of the pipeline benchmark in its own process, because the
+    database and BIZDRIVE_WRITE_PIPELINE are fixed when they are imported.
+    """
+    os.environ['BIZDRIVE_DATABASE'] = database
+    import write_pipeline
+    from db_helpers import get_connection
+    from seed_fleet import seed_fleet
+
+    seed_fleet(users=2, months=1, photos_per_accident=0, receipt_rate=0)
+    _concurrent_writes(writers, 1.0, phase='U')
+
+    def trips():
+        conn = get_connection()
+        count = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+        conn.close()
+        return count
+
+    before = trips()
+    groups = write_pipeline.pipeline_stats()
+    writes = _concurrent_writes(writers, seconds, phase='P')
+    stats = write_pipeline.pipeline_stats()
+    stored = trips() - before
+    return {
+        'pipeline': stats['enabled'],
+        'writes': writes,
+        'trips_stored': stored,
+        'groups': stats['groups'] - groups['groups'],
+        'writes_per_group': round((stats['writes'] - groups['writes']) / max(stats['groups'] - groups['groups'], 1), 1),
+    }
+
+
+def benchmark_pipeline(writers=200, seconds=5.0):
+    """
+    Sustained insert rate and tail latency with writers threads logging
+    trips through add_trip as fast as they can: every thread committing
+    on its own vs the single writer thread with group commit
+    (BIZDRIVE_WRITE_PIPELINE=1). Also checks every trip a writer was told
+    was saved is in the database.
+
+    Args:
+        writers (int): Concurrent writer threads
+        seconds (float): How long they write
+
+    Returns:
+        dict: Insert rate, latency and commit groups per mode
+    """
+    runs = {}
+    for mode, setting in (('direct', '0'), ('pipeline', '1')):
+        workdir = tempfile.mkdtemp(prefix='bizdrive-pipeline-')
+        try:
+            command = [sys.executable, os.path.abspath(__file__), 'pipeline-worker',
+                       '--database', os.path.join(workdir, 'bizdrive.db'),
+                       '--writers', str(writers), '--seconds', str(seconds)]
+            completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True,
+                                       env=dict(os.environ, BIZDRIVE_WRITE_PIPELINE=setting))
+            if completed.returncode != 0:
+                raise RuntimeError(f"pipeline worker failed:\n{completed.stderr[-2000:]}")
+            runs[mode] = json.loads(completed.stdout)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'benchmark': 'pipeline', 'writers': writers, 'seconds': seconds, 'runs': runs}
+    failures = []
+    for mode, run in runs.items():
+        saved = run['writes']['requests'] - run['writes']['errors']
+        if run['trips_stored'] != saved:
+            failures.append(f"{mode}: {saved} trips reported saved but {run['trips_stored']} stored")
+    if runs['pipeline']['writes']['errors']:
+        failures.append(f"{runs['pipeline']['writes']['errors']} pipelined writes failed: "
+                        f"{runs['pipeline']['writes']['first_error']}")
+    if failures:
+        report['failures'] = failures
+    return report
+
+
+BENCHMARKS = {
+    'media': benchmark_media,
+    'pdf': benchmark_pdf,
+    'reports': benchmark_reports,
+    'exports': benchmark_exports,
+    'metrics': benchmark_metrics,
+    'suite': benchmark_suite,
+    'plans': benchmark_plans,
+    'backends': benchmark_backends,
+    'backend-worker': backend_worker,
+    'shards': benchmark_shards,
+    'shard-worker': shard_worker,
+    'snapshots': benchmark_snapshots,
+    'snapshot-worker': snapshot_worker,
+    'backups': benchmark_backups,
+    'backup-worker': backup_worker,
+    'archive': benchmark_archive,
+    'archive-worker': archive_worker,
+    'edits': benchmark_edits,
+    'edit-worker': edit_worker,
+    'cascade': benchmark_cascade,
+    'cascade-worker': cascade_worker,
+    'units': benchmark_units,
+    'unit-worker': unit_worker,
+    'pipeline': benchmark_pipeline,
+    'pipeline-worker': pipeline_worker,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BizDrive benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    media = subparsers.add_parser('media', help='Concurrent receipt fetches')
+    media.add_argument('--concurrency', type=int, default=16)
+    media.add_argument('--requests', type=int, default=2000)
+    media.add_argument('--size', type=int, default=256 * 1024)
+
+    pdf = subparsers.add_parser('pdf', help='Report engine vs legacy PDF layout')
+    pdf.add_argument('--rows', type=int, default=100000)
+
+    reports = subparsers.add_parser('reports', help='Parallel admin report rendering')
+    reports.add_argument('--users', type=int, default=24)
+    reports.add_argument('--months', type=int, default=12)
+    reports.add_argument('--rows', type=int, default=150)
+    reports.add_argument('--workers', default='1,2,4,8')
+
+    exports = subparsers.add_parser('exports', help='CSV vs Parquet vs Arrow admin exports')
+    exports.add_argument('--users', type=int, default=20)
+    exports.add_argument('--months', type=int, default=12)
+    exports.add_argument('--rows', type=int, default=500)
+
+    metrics = subparsers.add_parser('metrics', help='Request instrumentation overhead')
+    metrics.add_argument('--requests', type=int, default=200)
+    metrics.add_argument('--rounds', type=int, default=40)
+    metrics.add_argument('--trips', type=int, default=200)
+
+    suite = subparsers.add_parser('suite', help='End-to-end hot routes against a seeded fleet')
+    suite.add_argument('--users', type=int, default=40)
+    suite.add_argument('--months', type=int, default=12)
+    suite.add_argument('--rounds', type=int, default=10)
+    suite.add_argument('--warmup', type=int, default=2)
+    suite.add_argument('--seed', type=int, default=42)
+    suite.add_argument('--only', default=None, help='Comma-separated case names')
+    suite.add_argument('--save', default=None, help='Write the results to this JSON file')
+    suite.add_argument('--compare', default=None, help='Earlier results to compare against')
+    suite.add_argument('--threshold', type=float, default=10.0,
+                       help='Median slowdown (percent) reported as a regression')
+
+    plans = subparsers.add_parser('plans', help='Check period queries use indexes (exits 1 on full scans)')
+    plans.add_argument('--users', type=int, default=10)
+    plans.add_argument('--months', type=int, default=12)
+
+    backends = subparsers.add_parser('backends', help='SQLite vs PostgreSQL: helper parity and concurrent writes')
+    backends.add_argument('--postgres', default=None, help='postgresql:// URL of a test server')
+    backends.add_argument('--writers', default='1,4,8,16')
+    backends.add_argument('--seconds', type=float, default=5.0)
+
+    worker = subparsers.add_parser('backend-worker', help="One backend of 'backends' (run in a subprocess)")
+    worker.add_argument('--database', required=True)
+    worker.add_argument('--writers', default='1,4,8,16')
+    worker.add_argument('--seconds', type=float, default=5.0)
+
+    shards = subparsers.add_parser('shards', help='One database vs per-organisation shards under a slow export')
+    shards.add_argument('--users', type=int, default=20)
+    shards.add_argument('--months', type=int, default=6)
+    shards.add_argument('--shards', type=int, default=4)
+    shards.add_argument('--writers', type=int, default=4)
+    shards.add_argument('--seconds', type=float, default=5.0)
+    shards.add_argument('--pause', type=float, default=0.01)
+
+    shard_worker_parser = subparsers.add_parser('shard-worker', help="One layout of 'shards' (run in a subprocess)")
+    shard_worker_parser.add_argument('--database', required=True)
+    shard_worker_parser.add_argument('--shard-dir', default=None)
+    shard_worker_parser.add_argument('--users', type=int, default=20)
+    shard_worker_parser.add_argument('--months', type=int, default=6)
+    shard_worker_parser.add_argument('--shards', type=int, default=4)
+    shard_worker_parser.add_argument('--writers', type=int, default=4)
+    shard_worker_parser.add_argument('--seconds', type=float, default=5.0)
+    shard_worker_parser.add_argument('--pause', type=float, default=0.01)
+
+    snapshots = subparsers.add_parser('snapshots', help='Driver writes during full reports: live database vs snapshot')
+    snapshots.add_argument('--users', type=int, default=20)
+    snapshots.add_argument('--months', type=int, default=6)
+    snapshots.add_argument('--writers', type=int, default=4)
+    snapshots.add_argument('--seconds', type=float, default=5.0)
+
+    snapshot_worker_parser = subparsers.add_parser('snapshot-worker', help="One mode of 'snapshots' (run in a subprocess)")
+    snapshot_worker_parser.add_argument('--database', required=True)
+    snapshot_worker_parser.add_argument('--mode', choices=('live', 'snapshot'), default='snapshot')
+    snapshot_worker_parser.add_argument('--users', type=int, default=20)
+    snapshot_worker_parser.add_argument('--months', type=int, default=6)
+    snapshot_worker_parser.add_argument('--writers', type=int, default=4)
+    snapshot_worker_parser.add_argument('--seconds', type=float, default=5.0)
+
+    backups = subparsers.add_parser('backups', help='Write latency during online backups and WAL archiving, plus a verified restore')
+    backups.add_argument('--users', type=int, default=20)
+    backups.add_argument('--months', type=int, default=6)
+    backups.add_argument('--writers', type=int, default=4)
+    backups.add_argument('--seconds', type=float, default=5.0)
+    backups.add_argument('--interval', type=float, default=0.5)
+
+    backup_worker_parser = subparsers.add_parser('backup-worker', help="The work of 'backups' (run in a subprocess)")
+    backup_worker_parser.add_argument('--database', required=True)
+    backup_worker_parser.add_argument('--users', type=int, default=20)
+    backup_worker_parser.add_argument('--months', type=int, default=6)
+    backup_worker_parser.add_argument('--writers', type=int, default=4)
+    backup_worker_parser.add_argument('--seconds', type=float, default=5.0)
+    backup_worker_parser.add_argument('--interval', type=float, default=0.5)
+
+    archive = subparsers.add_parser('archive', help='Current-year queries and live size before and after yearly archival')
+    archive.add_argument('--users', type=int, default=20)
+    archive.add_argument('--months', type=int, default=36)
+    archive.add_argument('--rounds', type=int, default=5)
+
+    archive_worker_parser = subparsers.add_parser('archive-worker', help="The work of 'archive' (run in a subprocess)")
+    archive_worker_parser.add_argument('--database', required=True)
+    archive_worker_parser.add_argument('--users', type=int, default=20)
+    archive_worker_parser.add_argument('--months', type=int, default=36)
+    archive_worker_parser.add_argument('--rounds', type=int, default=5)
+
+    edits = subparsers.add_parser('edits', help='Statements per edit and concurrent editors of one trip')
+    edits.add_argument('--users', type=int, default=5)
+    edits.add_argument('--editors', type=int, default=8)
+    edits.add_argument('--rounds', type=int, default=50)
+
+    edit_worker_parser = subparsers.add_parser('edit-worker', help="The work of 'edits' (run in a subprocess)")
+    edit_worker_parser.add_argument('--database', required=True)
+    edit_worker_parser.add_argument('--users', type=int, default=5)
+    edit_worker_parser.add_argument('--editors', type=int, default=8)
+    edit_worker_parser.add_argument('--rounds', type=int, default=50)
+
+    cascade = subparsers.add_parser('cascade', help='Writer stalls while a large vehicle is deleted, plus orphan repair')
+    cascade.add_argument('--rows', type=int, default=50000)
+    cascade.add_argument('--writers', type=int, default=4)
+    cascade.add_argument('--seconds', type=float, default=6.0)
+    cascade.add_argument('--batch', type=int, default=500)
+
+    cascade_worker_parser = subparsers.add_parser('cascade-worker', help="The work of 'cascade' (run in a subprocess)")
+    cascade_worker_parser.add_argument('--database', required=True)
+    cascade_worker_parser.add_argument('--rows', type=int, default=50000)
+    cascade_worker_parser.add_argument('--writers', type=int, default=4)
+    cascade_worker_parser.add_argument('--seconds', type=float, default=6.0)
+    cascade_worker_parser.add_argument('--batch', type=int, default=500)
+
+    units = subparsers.add_parser('units', help='Commits per request of multi-step writes: per helper vs one unit of work')
+    units.add_argument('--rounds', type=int, default=20)
+
+    unit_worker_parser = subparsers.add_parser('unit-worker', help="One mode of 'units' (run in a subprocess)")
+    unit_worker_parser.add_argument('--database', required=True)
+    unit_worker_parser.add_argument('--rounds', type=int, default=20)
+
+    pipeline = subparsers.add_parser('pipeline', help='Insert rate and tail latency of concurrent writers: direct vs group commit')
+    pipeline.add_argument('--writers', type=int, default=200)
+    pipeline.add_argument('--seconds', type=float, default=5.0)
+
+    pipeline_worker_parser = subparsers.add_parser('pipeline-worker', help="One mode of 'pipeline' (run in a subprocess)")
+    pipeline_worker_parser.add_argument('--database', required=True)
+    pipeline_worker_parser.add_argument('--writers', type=int, default=200)
+    pipeline_worker_parser.add_argument('--seconds', type=float, default=5.0)
+
+    args = vars(parser.parse_args())
+    benchmark = BENCHMARKS[args.pop('benchmark')]
+    report = benchmark(**args)
+    print(json.dumps(report, indent=2))
+    if report.get('failures'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+"""
+Blob Store for BizDrive
+Content-addressed storage for receipts and accident photos. Files are
+named by the SHA-256 of their content and fanned out into two levels of
+hashed subdirectories (ab/cd/abcd....jpg), so identical uploads are stored
+once and no directory grows beyond a few thousand entries.
+
+The stored key is the relative path, which is what expenses.receipt_filename
+and accident_photos.filename hold. A blob's reference count is the number
+of rows pointing at it, archived rows included; unreferenced blobs are
+removed on release or by the garbage collector.
+
+A blob is only removed once it has gone GC_GRACE_SECONDS without being
+stored again. store_blob touches a blob it deduplicates against, so a row
+about to reference it (uploaded but not committed yet) keeps it alive; a
+blob released inside that window is left to the garbage collector.
+
+Usage:
+    python blob_store.py migrate     Move legacy timestamped files into the store
+    python blob_store.py gc          Delete unreferenced blobs
+    python blob_store.py gc --dry-run
+"""
+
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from archive_store import query_archives
+from db_helpers import DATABASE, get_connection
+from shard_router import each_shard, fan_out
+
+
+# Largest accepted upload, in bytes
+MAX_BLOB_BYTES = int(os.environ.get('BIZDRIVE_MAX_BLOB_BYTES', str(20 * 1024 * 1024)))
+
+# Blobs stored (or stored again) more recently than this are never
+# removed, so an upload whose row has not been committed yet is not
+# mistaken for an orphan
+GC_GRACE_SECONDS = 3600
+
+# Keys counted per query when releasing many blobs at once
+RELEASE_BATCH_SIZE = 500
+
+CHUNK_SIZE = 64 * 1024
+
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+# Blob roots and the (table, column) pairs that reference blobs in them.
+# Populated by the helper modules that own each folder.
+BLOB_REFERENCES = {}
+
+# Serialises placing or touching a blob against checking and removing it
+_blob_lock = threading.Lock()
+
+
+class BlobTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_BLOB_BYTES."""
+
+
+# ===============================================
+# Registration & Keys
+# ===============================================
+
+def register_blob_references(root, references):
+    """
+    Register a blob root and the columns that reference its blobs.
+
+    Args:
+        root (str): Folder holding the blobs
+        references (list): (table, column) pairs holding blob keys
+    """
+    os.makedirs(root, exist_ok=True)
+    BLOB_REFERENCES[root] = references
+
+
+def is_blob_key(filename):
+    """Check whether a stored filename is a content-addressed key."""
+    return bool(filename) and bool(BLOB_KEY_PATTERN.match(filename))
+
+
+def make_blob_key(digest, extension):
+    """
+    Build the fanned-out key for a content hash.
+
+    Args:
+        digest (str): SHA-256 hex digest
+        extension (str): File extension without the dot ('' for none)
+
+    Returns:
+        str: Relative key such as 'ab/cd/abcd...ef.jpg'
+    """
+    suffix = f".{extension.lower()}" if extension else ''
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+
+def blob_path(root, key):
+    """Absolute path of a blob within a root."""
+    return os.path.join(root, *key.split('/'))
+
+
+# ===============================================
+# Storing & Releasing Blobs
+# ===============================================
+
+def store_blob(source, root, extension):
+    """
+    Store content in the blob store, deduplicating identical content.
+    The content is streamed to a temporary file while it is hashed, then
+    moved into place; if the blob already exists the copy is discarded
+    and the blob's mtime refreshed, which restarts its grace period.
+
+    Args:
+        source: File-like object, Werkzeug FileStorage or bytes
+        root (str): Blob root folder
+        extension (str): File extension without the dot
+
+    Returns:
+        str: Blob key to store in the database
+
+    Raises:
+        BlobTooLarge: If the content exceeds MAX_BLOB_BYTES
+    """
+    stream = getattr(source, 'stream', source)
+    digest = hashlib.sha256()
+    size = 0
+
+    tmp_dir = os.path.join(root, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            if isinstance(source, (bytes, bytearray)):
+                chunks = [bytes(source)]
+            else:
+                chunks = iter(lambda: stream.read(CHUNK_SIZE), b'')
+
+            for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_BLOB_BYTES:
+                    raise BlobTooLarge(f"File exceeds the {MAX_BLOB_BYTES // (1024 * 1024)} MB upload limit.")
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        key = make_blob_key(digest.hexdigest(), extension)
+        target = blob_path(root, key)
+
+        with _blob_lock:
+            try:
+                os.utime(target)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+            else:
+                os.remove(tmp_path)
+
+        return key
+
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _count_references(conn, root, keys):
+    """Rows referencing each of keys in one database, archives included."""
+    cursor = conn.cursor()
+    counts = dict.fromkeys(keys, 0)
+    for start in range(0, len(keys), RELEASE_BATCH_SIZE):
+        batch = keys[start:start + RELEASE_BATCH_SIZE]
+        placeholders = ', '.join('?' * len(batch))
+        for table, column in BLOB_REFERENCES.get(root, []):
+            query = (f"SELECT {column}, COUNT(*) FROM {table} "
+                     f"WHERE {column} IN ({placeholders}) GROUP BY {column}")
+            cursor.execute(query, batch)
+            rows = cursor.fetchall()
+            # Archived rows still hold their blobs
+            rows += query_archives(conn, table, query, batch)
+            for key, count in rows:
+                counts[key] += count
+    return counts
+
+
+def _remove_unless_recent(path, cutoff):
+    """Remove a blob whose mtime is older than cutoff; True if removed."""
+    with _blob_lock:
+        try:
+            if os.stat(path).st_mtime > cutoff:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def release_blobs(blobs):
+    """
+    Delete stored files once nothing references them any more, counting
+    the references of all of them together (one query per table, shard
+    and archive for each RELEASE_BATCH_SIZE keys). Call this after the
+    referencing rows have been deleted or updated. Blobs stored again
+    within GC_GRACE_SECONDS are kept for the garbage collector to judge.
+    Legacy (non content-addressed) filenames are deleted directly.
+
+    Args:
+        blobs: Iterable of (root, filename) pairs; empty filenames are skipped
+
+    Returns:
+        int: Number of files deleted
+    """
+    keys_by_root = {}
+    deleted = 0
+    for root, filename in blobs:
+        if not filename:
+            continue
+        if is_blob_key(filename):
+            keys_by_root.setdefault(root, set()).add(filename)
+            continue
+        try:
+            path = os.path.join(root, filename)
+            if os.path.exists(path):
+                os.remove(path)
+                deleted += 1
+        except Exception as e:
+            print(f"Warning: Could not delete file {filename}: {e}")
+
+    cutoff = time.time() - GC_GRACE_SECONDS
+    for root, keys in keys_by_root.items():
+        keys = sorted(keys)
+        referenced = set()
+        for counts in fan_out(lambda shard_conn: _count_references(shard_conn, root, keys)):
+            referenced.update(key for key, count in counts.items() if count)
+        for key in keys:
+            if key in referenced:
+                continue
+            try:
+                deleted += _remove_unless_recent(blob_path(root, key), cutoff)
+            except Exception as e:
+                print(f"Warning: Could not delete file {key}: {e}")
+    return deleted
+
+
+def release_blob(root, filename):
+    """
+    Delete a stored file once nothing references it any more.
+    See release_blobs.
+
+    Args:
+        root (str): Blob root folder
+        filename (str): Stored key or legacy filename
+
+    Returns:
+        bool: True if the file was deleted
+    """
+    return release_blobs([(root, filename)]) > 0
+
+
+# ===============================================
+# Garbage Collection
+# ===============================================
+
+def iter_blob_keys(root):
+    """Yield every blob key stored under a root."""
+    if not os.path.isdir(root):
+        return
+
+    for first in os.listdir(root):
+        first_path = os.path.join(root, first)
+        if not re.fullmatch(r'[0-9a-f]{2}', first) or not os.path.isdir(first_path):
+            continue
+        for second in os.listdir(first_path):
+            second_path = os.path.join(first_path, second)
+            if not re.fullmatch(r'[0-9a-f]{2}', second) or not os.path.isdir(second_path):
+                continue
+            for name in os.listdir(second_path):
+                key = f"{first}/{second}/{name}"
+                if is_blob_key(key):
+                    yield key
+
+
+def collect_garbage(dry_run=False):
+    """
+    Delete blobs that no row references.
+
+    Args:
+        dry_run (bool): Only report what would be deleted
+
+    Returns:
+        dict: Per-root counts of orphans and bytes reclaimed
+    """
+    cutoff = time.time() - GC_GRACE_SECONDS
+    report = {}
+
+    for root, references in BLOB_REFERENCES.items():
+        def referenced_keys(conn):
+            cursor = conn.cursor()
+            keys = set()
+            for table, column in references:
+                query = f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL"
+                cursor.execute(query)
+                keys.update(row[0] for row in cursor.fetchall())
+                keys.update(row[0] for row in query_archives(conn, table, query))
+            return keys
+
+        referenced = set().union(*fan_out(referenced_keys))
+
+        orphans = 0
+        reclaimed = 0
+        for key in iter_blob_keys(root):
+            if key in referenced:
+                continue
+            path = blob_path(root, key)
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            # Re-checked under the lock, in case it was just stored again
+            if not dry_run and not _remove_unless_recent(path, cutoff):
+                continue
+            orphans += 1
+            reclaimed += stat.st_size
+
+        # Temporary files left behind by interrupted uploads
+        tmp_dir = os.path.join(root, 'tmp')
+        if os.path.isdir(tmp_dir) and not dry_run:
+            for name in os.listdir(tmp_dir):
+                path = os.path.join(tmp_dir, name)
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+
+        report[root] = {'orphans': orphans, 'bytes': reclaimed}
+
+    return report
+
+
+# ===============================================
+# Legacy File Migration
+# ===============================================
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def migrate_legacy_files(dry_run=False):
+    """
+    Move timestamp-named files into the blob store and rewrite their rows.
+    Files that duplicate an existing blob are deleted instead of moved.
+    Rows whose file is missing are left untouched and reported. Every
+    shard is migrated in turn.
+
+    Args:
+        dry_run (bool): Only report what would be migrated
+
+    Returns:
+        dict: Counts of migrated rows, deduplicated files and missing files
+    """
+    stats = {'migrated': 0, 'deduplicated': 0, 'missing': 0}
+
+    for _ in each_shard():
+        conn = get_connection(DATABASE)
+        cursor = conn.cursor()
+
+        for root, references in BLOB_REFERENCES.items():
+            for table, column in references:
+                cursor.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+                legacy = [row[0] for row in cursor.fetchall() if not is_blob_key(row[0])]
+
+                for filename in legacy:
+                    path = os.path.join(root, filename)
+                    if not os.path.exists(path):
+                        stats['missing'] += 1
+                        continue
+
+                    extension = filename.rsplit('.', 1)[1] if '.' in filename else ''
+                    key = make_blob_key(_hash_file(path), extension)
+                    target = blob_path(root, key)
+
+                    if dry_run:
+                        stats['migrated'] += 1
+                        continue
+
+                    if os.path.exists(target):
+                        os.remove(path)
+                        stats['deduplicated'] += 1
+                    else:
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        os.replace(path, target)
+
+                    cursor.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?", (key, filename))
+                    conn.commit()
+                    stats['migrated'] += 1
+
+        conn.close()
+    return stats
+
+
+if __name__ == '__main__':
+    # Importing the helpers registers their blob roots
+    import expense_helpers  # noqa: F401
+    import accident_helpers  # noqa: F401
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    dry_run = '--dry-run' in sys.argv
+
+    if command == 'migrate':
+        print(migrate_legacy_files(dry_run=dry_run))
+    elif command == 'gc':
+        print(collect_garbage(dry_run=dry_run))
+    else:
+        print(__doc__)
@@ -0,0 +1,401 @@
+"""
+Cascading Deletes for BizDrive
+Deletes a vehicle, or a whole user, together with everything that hangs
+off it: trips, expenses, accidents and accident photos, in the live tables
+and in the yearly archives, then releases receipts and photos no other row
+references. Dependent rows go in batches of CASCADE_BATCH_SIZE, one short
+transaction each, so deleting a vehicle with years of history never holds
+the write lock for long. The parent row goes last, in one transaction with
+anything added while the batches ran.
+
+SQLite connections enforce foreign keys (see db_helpers.py), so a parent
+can no longer be deleted out from under its rows. Shard files cannot
+enforce them (their users table lives in the attached directory), so
+shards rely on these deletes alone. Databases from before enforcement may
+already hold orphans, rows whose vehicle, user or accident is gone, which
+every aggregate still scans; the orphans command finds them and --repair
+deletes them the same batched way.
+
+Usage:
+    python cascade_deletes.py orphans [--repair] [--batch 500]
+    python cascade_deletes.py vehicle <vehicle_id> <username>
+    python cascade_deletes.py user <username>
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from accident_helpers import ACCIDENT_PHOTO_FOLDER, THUMBNAIL_FOLDER, WEB_FOLDER
+from archive_store import delete_archived_rows, query_archives
+from blob_store import release_blobs
+from db_helpers import get_connection, get_directory_connection
+from expense_helpers import RECEIPT_FOLDER
+from shard_router import SHARDING, each_shard, use_tenant
+
+# Dependent rows deleted per transaction
+CASCADE_BATCH_SIZE = int(os.environ.get('BIZDRIVE_CASCADE_BATCH_SIZE', '500'))
+
+# Pause after each batch, as a multiple of the time the batch took
+CASCADE_PAUSE = float(os.environ.get('BIZDRIVE_CASCADE_PAUSE', '1.0'))
+
+# Tables cleared before their parent, children first. Photos are found
+# through their accident; the others carry vehicle_id and user_id.
+DEPENDENT_TABLES = ('accident_photos', 'accidents', 'expenses', 'trips')
+
+# Columns holding blob keys -> blob root
+BLOB_COLUMNS = {
+    'accident_photos': {
+        'filename': ACCIDENT_PHOTO_FOLDER,
+        'thumbnail_filename': THUMBNAIL_FOLDER,
+        'web_filename': WEB_FOLDER,
+    },
+    'expenses': {'receipt_filename': RECEIPT_FOLDER},
+}
+
+# Foreign keys checked for orphans: (table, column, parent table). Parents
+# come first, so repairing them exposes their children to the later checks.
+ORPHAN_CHECKS = [
+    ('vehicles', 'user_id', 'users'),
+    ('trips', 'user_id', 'users'),
+    ('trips', 'vehicle_id', 'vehicles'),
+    ('expenses', 'user_id', 'users'),
+    ('expenses', 'vehicle_id', 'vehicles'),
+    ('accidents', 'user_id', 'users'),
+    ('accidents', 'vehicle_id', 'vehicles'),
+    ('accident_photos', 'accident_id', 'accidents'),
+]
+
+
+# ===============================================
+# Batched Deletes
+# ===============================================
+
+def _owned_by(table, column):
+    """WHERE clause for a dependent table's rows of one vehicle or user (as 'child')."""
+    if table == 'accident_photos':
+        return f"child.accident_id IN (SELECT id FROM accidents WHERE {column} = ?)"
+    return f"child.{column} = ?"
+
+
+def _orphaned(column, parent):
+    """WHERE clause for rows (as 'child') whose parent row is gone."""
+    return f"NOT EXISTS (SELECT 1 FROM {parent} AS parent WHERE parent.id = child.{column})"
+
+
+def _blob_keys(table, rows):
+    """(root, key) pairs held by deleted rows."""
+    columns = BLOB_COLUMNS.get(table, {})
+    return {(root, row[number]) for row in rows
+            for number, root in enumerate(columns.values()) if row[number]}
+
+
+def _delete_batch(cursor, table, where, params, limit=None):
+    """
+    Delete matching rows, at most limit of them, in the caller's transaction.
+
+    Returns:
+        tuple: (rows deleted, set of (root, key) blobs they held)
+    """
+    returning = ', '.join(BLOB_COLUMNS.get(table, {})) or 'id'
+    selected = f"SELECT child.id FROM {table} AS child WHERE {where}"
+    if limit:
+        selected += " LIMIT ?"
+        params = tuple(params) + (limit,)
+    cursor.execute(f"DELETE FROM {table} WHERE id IN ({selected}) RETURNING {returning}", params)
+    rows = cursor.fetchall()
+    return len(rows), _blob_keys(table, rows)
+
+
+def _release(blobs):
+    """Delete files once nothing references them (after the deleting commit)."""
+    # One reference count per table and shard for the whole batch
+    release_blobs(sorted(blobs))
+
+
+def _delete_in_batches(conn, table, where, params, batch_size):
+    """Delete matching rows, one transaction per batch, releasing their files as it goes."""
+    cursor = conn.cursor()
+    total = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            count, blobs = _delete_batch(cursor, table, where, params, batch_size)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _release(blobs)
+        total += count
+        if count < batch_size:
+            return total
+        # Writers waiting on the lock back off and retry; leave them a window
+        time.sleep((time.perf_counter() - started) * CASCADE_PAUSE)
+
+
+def _delete_archived(conn, table, where, params, batch_size):
+    """Delete matching archived rows and release their files."""
+    returning = ', '.join(BLOB_COLUMNS.get(table, {})) or 'id'
+    rows = delete_archived_rows(conn, table, where, params, returning, batch_size)
+    _release(_blob_keys(table, rows))
+    return len(rows)
+
+
+def clear_dependents(column, value, batch_size=CASCADE_BATCH_SIZE):
+    """
+    Delete every photo, accident, expense and trip of a vehicle or user,
+    live and archived, in batches. The parent row is left in place.
+    Runs against the current shard (see shard_router.use_tenant).
+
+    Args:
+        column (str): 'vehicle_id' or 'user_id'
+        value (int): The vehicle or user ID
+        batch_size (int): Rows deleted per transaction
+
+    Returns:
+        dict: Rows deleted per table
+    """
+    deleted = {}
+    conn = get_connection()
+    try:
+        for table in DEPENDENT_TABLES:
+            where = _owned_by(table, column)
+            deleted[table] = _delete_in_batches(conn, table, where, (value,), batch_size)
+            deleted[table] += _delete_archived(conn, table, where, (value,), batch_size)
+    finally:
+        conn.close()
+    return deleted
+
+
+def delete_vehicle_rows(vehicle_id, user_id, batch_size=CASCADE_BATCH_SIZE):
+    """
+    Delete a vehicle with all its dependent rows and their files.
+    Callers check ownership first; see vehicle_helpers.delete_vehicle.
+
+    Args:
+        vehicle_id (int): Vehicle ID
+        user_id (int): Owner's user ID
+        batch_size (int): Rows deleted per transaction
+
+    Returns:
+        str: The deleted vehicle's registration, or None if it was not found
+    """
+    clear_dependents('vehicle_id', vehicle_id, batch_size)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    blobs = set()
+    try:
+        # Rows added while the batches ran go with the vehicle
+        for table in DEPENDENT_TABLES:
+            blobs |= _delete_batch(cursor, table, _owned_by(table, 'vehicle_id'), (vehicle_id,))[1]
+        cursor.execute("DELETE FROM vehicles WHERE id = ? AND user_id = ? RETURNING registration",
+                       (vehicle_id, user_id))
+        deleted = cursor.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    _release(blobs)
+    return deleted[0] if deleted else None
+
+
+def delete_user(user_id, batch_size=CASCADE_BATCH_SIZE):
+    """
+    Delete a user with their vehicles, trips, expenses, accidents and
+    files, then their account. Tenant rows go first, in batches, so an
+    interrupted delete can simply be run again.
+
+    Args:
+        user_id (int): User ID
+        batch_size (int): Rows deleted per transaction
+
+    Returns:
+        tuple: (success, message)
+    """
+    conn = get_directory_connection()
+    row = conn.execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return False, "User not found"
+    username = row[0]
+
+    try:
+        with use_tenant(user_id):
+            deleted = clear_dependents('user_id', user_id, batch_size)
+            conn = get_connection()
+            try:
+                deleted['vehicles'] = _delete_in_batches(conn, 'vehicles', 'child.user_id = ?',
+                                                         (user_id,), batch_size)
+                # Anything added while the batches ran
+                cursor = conn.cursor()
+                blobs = set()
+                for table in (*DEPENDENT_TABLES, 'vehicles'):
+                    blobs |= _delete_batch(cursor, table, _owned_by(table, 'user_id'), (user_id,))[1]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            _release(blobs)
+
+        conn = get_directory_connection()
+        try:
+            conn.execute("DELETE FROM password_reset_tokens WHERE user_id = ?", (user_id,))
+            if SHARDING:
+                conn.execute("DELETE FROM user_shards WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    except Exception as e:
+        return False, f"Database error: {str(e)}"
+
+    summary = ', '.join(f"{count} {table}" for table, count in deleted.items() if count)
+    return True, f"User {username} deleted" + (f" with {summary}" if summary else "")
+
+
+# ===============================================
+# Orphan Repair
+# ===============================================
+
+def _archived_orphan_ids(conn, table, column, parent):
+    """Parent IDs referenced by archived rows that no longer exist live."""
+    referenced = {row[0] for row in query_archives(conn, table, f"SELECT DISTINCT {column} FROM {table}")}
+    if not referenced:
+        return []
+    existing = {row[0] for row in conn.execute(f"SELECT id FROM {parent}")}
+    return sorted(referenced - existing)
+
+
+def find_orphans():
+    """
+    Count rows whose vehicle, user or accident no longer exists, in every
+    shard's live tables and archives.
+
+    Returns:
+        dict: 'table.column' -> orphaned rows, for each check that found any
+    """
+    found = {}
+    for _ in each_shard():
+        conn = get_connection()
+        try:
+            for table, column, parent in ORPHAN_CHECKS:
+                where = _orphaned(column, parent)
+                count = conn.execute(f"SELECT COUNT(*) FROM {table} AS child WHERE {where}").fetchone()[0]
+                if table in DEPENDENT_TABLES and table != 'accident_photos':
+                    for orphan_id in _archived_orphan_ids(conn, table, column, parent):
+                        count += sum(row[0] for row in query_archives(
+                            conn, table, f"SELECT COUNT(*) FROM {table} WHERE {column} = ?", (orphan_id,)))
+                if count:
+                    key = f"{table}.{column}"
+                    found[key] = found.get(key, 0) + count
+        finally:
+            conn.close()
+    return found
+
+
+def repair_orphans(batch_size=CASCADE_BATCH_SIZE):
+    """
+    Delete orphaned rows (and the files only they referenced) in every
+    shard, in batches. Orphaned vehicles take their rows with them.
+
+    Args:
+        batch_size (int): Rows deleted per transaction
+
+    Returns:
+        dict: 'table.column' -> rows deleted, for each check that found any
+    """
+    repaired = {}
+    for _ in each_shard():
+        conn = get_connection()
+        try:
+            for table, column, parent in ORPHAN_CHECKS:
+                where = _orphaned(column, parent)
+                count = 0
+                if table == 'vehicles':
+                    # Enforced foreign keys refuse the vehicle while its rows remain
+                    for (vehicle_id,) in conn.execute(f"SELECT child.id FROM vehicles AS child WHERE {where}").fetchall():
+                        for dependent, rows in clear_dependents('vehicle_id', vehicle_id, batch_size).items():
+                            if rows:
+                                key = f"{dependent}.vehicle_id"
+                                repaired[key] = repaired.get(key, 0) + rows
+                elif table == 'accidents':
+                    # Photos first, so their files are released (a cascade would not say which)
+                    count += _delete_in_batches(
+                        conn, 'accident_photos',
+                        f"child.accident_id IN (SELECT child.id FROM accidents AS child WHERE {where})",
+                        (), batch_size)
+                count += _delete_in_batches(conn, table, where, (), batch_size)
+                if table in DEPENDENT_TABLES and table != 'accident_photos':
+                    for orphan_id in _archived_orphan_ids(conn, table, column, parent):
+                        if table == 'accidents':
+                            count += _delete_archived(conn, 'accident_photos',
+                                                      _owned_by('accident_photos', column),
+                                                      (orphan_id,), batch_size)
+                        count += _delete_archived(conn, table, f"child.{column} = ?",
+                                                  (orphan_id,), batch_size)
+                if count:
+                    key = f"{table}.{column}"
+                    repaired[key] = repaired.get(key, 0) + count
+        finally:
+            conn.close()
+    return repaired
+
+
+# ===============================================
+# Command Line
+# ===============================================
+
+def _user_id(username):
+    conn = get_directory_connection()
+    row = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='BizDrive cascading deletes')
+    commands = parser.add_subparsers(dest='command', required=True)
+    orphans = commands.add_parser('orphans', help='Count rows whose parent is gone')
+    orphans.add_argument('--repair', action='store_true', help='Delete them')
+    orphans.add_argument('--batch', type=int, default=CASCADE_BATCH_SIZE)
+    vehicle = commands.add_parser('vehicle', help='Delete a vehicle and its rows')
+    vehicle.add_argument('vehicle_id', type=int)
+    vehicle.add_argument('username')
+    user = commands.add_parser('user', help='Delete a user and all their data')
+    user.add_argument('username')
+    args = parser.parse_args(argv)
+
+    if args.command == 'orphans':
+        counts = repair_orphans(args.batch) if args.repair else find_orphans()
+        for key, count in counts.items():
+            print(f"{key}: {count} {'deleted' if args.repair else 'orphaned'}")
+        if not counts:
+            print("No orphans")
+        return 0
+
+    user_id = _user_id(args.username)
+    if user_id is None:
+        print(f"No user {args.username}")
+        return 1
+    if args.command == 'user':
+        success, message = delete_user(user_id)
+    else:
+        from vehicle_helpers import delete_vehicle
+        with use_tenant(user_id):
+            success, message = delete_vehicle(args.vehicle_id, user_id)
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
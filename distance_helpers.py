@@ -0,0 +1,380 @@
+"""
+Distance Helper Functions for BizDrive
+Resolves trip distances from from/to addresses so address-only trips still
+get a reimbursement. Resolved address pairs are cached in memory and in an
+on-disk SQLite cache, so repeat routes never hit a backend twice.
+"""
+
+import csv
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from db_helpers import DATABASE, get_connection, is_postgres
+
+# BIZDRIVE_DISTANCE_CACHE sets the resolved-distance cache file; by default
+# it sits beside the SQLite application database
+DISTANCE_CACHE_DB = os.environ.get('BIZDRIVE_DISTANCE_CACHE') or os.path.join(
+    os.path.dirname(os.path.abspath(DATABASE if not is_postgres() else __file__)), 'distance_cache.db')
+
+POSTCODE_TABLE = os.environ.get(
+    'BIZDRIVE_POSTCODE_TABLE',
+    os.path.join(os.path.dirname(__file__), 'postcode_centroids.csv')
+)
+
+# Straight-line distance underestimates road distance; 1.3 is the usual
+# urban circuity factor for Australian road networks.
+ROAD_DISTANCE_FACTOR = 1.3
+
+# Upper bound on in-process cached pairs before the memory cache is reset
+MEMORY_CACHE_SIZE = 10000
+
+# SQLite limits host parameters per statement; stay well below it
+BATCH_LOOKUP_SIZE = 500
+
+AUSTRALIAN_STATES = ['NSW', 'VIC', 'QLD', 'SA', 'WA', 'TAS', 'NT', 'ACT']
+
+# Street type abbreviations used to normalise addresses
+STREET_ABBREVIATIONS = {
+    'street': 'st',
+    'road': 'rd',
+    'avenue': 'ave',
+    'drive': 'dr',
+    'highway': 'hwy',
+    'parade': 'pde',
+    'place': 'pl',
+    'court': 'ct',
+    'crescent': 'cres',
+    'boulevard': 'blvd',
+    'lane': 'ln',
+    'terrace': 'tce',
+    'circuit': 'cct',
+}
+
+
+# ===============================================
+# Address Normalisation
+# ===============================================
+
+def normalise_address(address):
+    """
+    Normalise an address so trivially different spellings share a cache key.
+    Lowercases, strips punctuation, abbreviates street types and drops a
+    trailing country name.
+
+    Args:
+        address (str): Free-text address
+
+    Returns:
+        str: Normalised address ('' if address is empty)
+    """
+    if not address:
+        return ''
+
+    text = re.sub(r'[^\w\s]', ' ', address.lower())
+    words = [STREET_ABBREVIATIONS.get(word, word) for word in text.split()]
+
+    if words and words[-1] == 'australia':
+        words = words[:-1]
+
+    return ' '.join(words)
+
+
+def make_pair_key(from_address, to_address):
+    """
+    Build the cache key for an address pair.
+    The key is direction-independent: A to B and B to A share one entry.
+
+    Args:
+        from_address (str): Starting address
+        to_address (str): Destination address
+
+    Returns:
+        str: Pair key, or '' if either address is empty
+    """
+    start = normalise_address(from_address)
+    end = normalise_address(to_address)
+    if not start or not end:
+        return ''
+
+    return '|'.join(sorted([start, end]))
+
+
+# ===============================================
+# Distance Backends
+# ===============================================
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between two coordinates."""
+    radius = 6371.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * radius * math.asin(math.sqrt(a))
+
+
+class DistanceBackend:
+    """
+    Base class for distance backends.
+    Subclasses implement resolve() and return kilometres or None.
+    """
+
+    name = 'base'
+
+    def resolve(self, from_address, to_address):
+        raise NotImplementedError
+
+
+class PostcodeCentroidBackend(DistanceBackend):
+    """
+    Offline backend using the bundled postcode centroid table.
+    Each address is located by its postcode (or suburb and state), and the
+    distance is the haversine distance between centroids scaled by
+    ROAD_DISTANCE_FACTOR. Addresses in the same postcode cannot be resolved.
+    """
+
+    name = 'postcode'
+
+    def __init__(self, table_path=POSTCODE_TABLE):
+        self.by_postcode = {}
+        self.by_suburb = {}
+
+        if os.path.exists(table_path):
+            with open(table_path, newline='') as f:
+                for row in csv.DictReader(f):
+                    point = (float(row['latitude']), float(row['longitude']))
+                    postcode = row['postcode'].zfill(4)
+                    self.by_postcode[postcode] = point
+                    suburb_key = f"{row['suburb'].lower()} {row['state'].lower()}"
+                    self.by_suburb[suburb_key] = (postcode, point)
+
+    def locate(self, address):
+        """
+        Find the centroid for an address.
+
+        Returns:
+            tuple or None: (postcode, (latitude, longitude))
+        """
+        upper = address.upper()
+        states = '|'.join(AUSTRALIAN_STATES)
+
+        match = re.search(rf'\b(?:{states})\s*,?\s*(\d{{4}})\b', upper)
+        if not match:
+            match = re.search(r'\b(\d{4})\s*(?:,?\s*AUSTRALIA)?\s*$', upper)
+        if match and match.group(1) in self.by_postcode:
+            return match.group(1), self.by_postcode[match.group(1)]
+
+        normalised = normalise_address(address)
+        for suburb_key, located in self.by_suburb.items():
+            if re.search(rf'\b{re.escape(suburb_key)}\b', normalised):
+                return located
+
+        return None
+
+    def resolve(self, from_address, to_address):
+        start = self.locate(from_address)
+        end = self.locate(to_address)
+        if not start or not end or start[0] == end[0]:
+            return None
+
+        distance = haversine_km(*start[1], *end[1]) * ROAD_DISTANCE_FACTOR
+        return round(distance, 1)
+
+
+# Registered backends by name, selected with BIZDRIVE_DISTANCE_BACKEND
+DISTANCE_BACKENDS = {
+    'postcode': PostcodeCentroidBackend,
+}
+
+
+def register_distance_backend(name, backend_class):
+    """
+    Register a distance backend so it can be selected by name.
+
+    Args:
+        name (str): Backend name
+        backend_class (type): DistanceBackend subclass
+    """
+    DISTANCE_BACKENDS[name] = backend_class
+
+
+# ===============================================
+# Distance Cache
+# ===============================================
+
+def get_cache_connection():
+    """Create and return a connection to the distance cache database."""
+    conn = get_connection(DISTANCE_CACHE_DB)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_distance_cache():
+    """Initialize the on-disk distance cache table."""
+    conn = get_cache_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS distance_cache (
+            pair_key TEXT PRIMARY KEY,
+            distance REAL NOT NULL,
+            backend TEXT NOT NULL,
+            resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+
+class DistanceResolver:
+    """
+    Resolves address pairs through a memory cache, the SQLite cache and
+    finally the configured backend. Backend results are written back to
+    both caches; unresolvable pairs are not cached, so they are retried
+    on the next lookup.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.memory = {}
+        self.lock = threading.Lock()
+
+    def _remember(self, pair_key, distance):
+        with self.lock:
+            if len(self.memory) >= MEMORY_CACHE_SIZE:
+                self.memory.clear()
+            self.memory[pair_key] = distance
+
+    def resolve(self, from_address, to_address):
+        """
+        Resolve the distance for one address pair.
+
+        Returns:
+            float or None: Distance in km, or None if it cannot be resolved
+        """
+        return self.resolve_many([(from_address, to_address)])[0]
+
+    def resolve_many(self, pairs):
+        """
+        Resolve distances for many address pairs at once (e.g. a multi-leg day).
+        Cache misses are looked up in one query per batch, and new results
+        are written in a single transaction.
+
+        Args:
+            pairs (list): List of (from_address, to_address) tuples
+
+        Returns:
+            list: Distances in km (or None) in the same order as pairs
+        """
+        keys = [make_pair_key(start, end) for start, end in pairs]
+        results = {}
+        missing = []
+
+        for key in set(keys):
+            if not key:
+                continue
+            if key in self.memory:
+                results[key] = self.memory[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            conn = get_cache_connection()
+            cursor = conn.cursor()
+
+            for i in range(0, len(missing), BATCH_LOOKUP_SIZE):
+                batch = missing[i:i + BATCH_LOOKUP_SIZE]
+                placeholders = ', '.join('?' * len(batch))
+                cursor.execute(f'''
+                    SELECT pair_key, distance FROM distance_cache
+                    WHERE pair_key IN ({placeholders})
+                ''', batch)
+                for row in cursor.fetchall():
+                    results[row['pair_key']] = row['distance']
+                    self._remember(row['pair_key'], row['distance'])
+
+            resolved = []
+            for key, (start, end) in zip(keys, pairs):
+                if key and key not in results:
+                    distance = self.backend.resolve(start, end)
+                    results[key] = distance
+                    if distance is not None:
+                        self._remember(key, distance)
+                        resolved.append((key, distance, self.backend.name, datetime.now()))
+
+            if resolved:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO distance_cache (pair_key, distance, backend, resolved_at)
+                    VALUES (?, ?, ?, ?)
+                ''', resolved)
+                conn.commit()
+
+            conn.close()
+
+        return [results.get(key) for key in keys]
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_distance_resolver():
+    """
+    Get the process-wide distance resolver.
+    The backend is chosen by BIZDRIVE_DISTANCE_BACKEND (default: postcode).
+
+    Returns:
+        DistanceResolver: Shared resolver instance
+    """
+    global _resolver
+
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                backend_name = os.environ.get('BIZDRIVE_DISTANCE_BACKEND', 'postcode')
+                backend_class = DISTANCE_BACKENDS.get(backend_name, PostcodeCentroidBackend)
+                init_distance_cache()
+                _resolver = DistanceResolver(backend_class())
+
+    return _resolver
+
+
+def resolve_trip_distance(from_address, to_address):
+    """
+    Resolve the driving distance between two addresses.
+
+    Args:
+        from_address (str): Starting address
+        to_address (str): Destination address
+
+    Returns:
+        float or None: Distance in km, or None if it cannot be resolved
+    """
+    try:
+        return get_distance_resolver().resolve(from_address, to_address)
+    except sqlite3.Error as e:
+        print(f"Warning: Distance lookup failed: {e}")
+        return None
+
+
+def resolve_trip_distances(pairs):
+    """
+    Resolve distances for several legs in one batch.
+
+    Args:
+        pairs (list): List of (from_address, to_address) tuples
+
+    Returns:
+        list: Distances in km (or None) in the same order as pairs
+    """
+    try:
+        return get_distance_resolver().resolve_many(pairs)
+    except sqlite3.Error as e:
+        print(f"Warning: Distance lookup failed: {e}")
+        return [None] * len(pairs)
@@ -1,16 +1,19 @@
 import sqlite3
-import os
 from datetime import datetime
 
-DATABASE = os.path.join(os.path.dirname(__file__), 'bizdrive.db')
+from archive_store import with_archives
+from blob_store import register_blob_references, release_blob
+from db_helpers import DATABASE, get_connection
+from write_pipeline import run_write
+
 RECEIPT_FOLDER = 'static/receipts'
 
-# Ensure receipt folder exists
-os.makedirs(RECEIPT_FOLDER, exist_ok=True)
+# Ensure receipt folder exists; receipts are content-addressed blobs
+register_blob_references(RECEIPT_FOLDER, [('expenses', 'receipt_filename')])
 
 def init_expense_table():
     """Create expense table if it does not exist."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS expenses (
@@ -27,25 +30,47 @@ def init_expense_table():
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
     ''')
+
+    # Period filters compare the raw ISO date (expense_date >= ? AND expense_date < ?)
+    # so these indexes apply; never wrap the column in strftime()
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_date
+        ON expenses(user_id, expense_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_date
+        ON expenses(expense_date)
+    ''')
+    # Child key of the vehicles foreign key: deleting a vehicle finds its expenses by it
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_vehicle
+        ON expenses(vehicle_id)
+    ''')
+    # Releasing a receipt counts the rows still holding its blob key
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_receipt
+        ON expenses(receipt_filename)
+    ''')
     conn.commit()
     conn.close()
 
 
+def _insert_expense(conn, row):
+    """The write of add_expense (committed by run_write)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO expenses (user_id, vehicle_id, expense_date, expense_type, amount, notes, receipt_filename, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, row)
+    return cursor.lastrowid
+
+
 def add_expense(user_id, vehicle_id, expense_date, expense_type, amount, notes=None, receipt_filename=None):
     """Add a new expense record."""
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
         created_at = datetime.utcnow().isoformat()
-
-        cursor.execute("""
-            INSERT INTO expenses (user_id, vehicle_id, expense_date, expense_type, amount, notes, receipt_filename, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, vehicle_id, expense_date, expense_type, amount, notes, receipt_filename, created_at))
-
-        conn.commit()
-        expense_id = cursor.lastrowid
-        conn.close()
+        expense_id = run_write(_insert_expense, (user_id, vehicle_id, expense_date, expense_type,
+                                                 amount, notes, receipt_filename, created_at))
         return True, "Expense added successfully", expense_id
 
     except Exception as e:
@@ -54,13 +79,13 @@ def add_expense(user_id, vehicle_id, expense_date, expense_type, amount, notes=N
 
 def get_user_expenses(user_id, vehicle_id=None, expense_type=None, start_date=None, end_date=None):
     """Get all expenses for a user with optional filters."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
 
     # JOIN with vehicles table to get vehicle registration
     query = """
         SELECT e.*, v.registration as vehicle_registration
-        FROM expenses e
+        FROM {expenses} e
         LEFT JOIN vehicles v ON e.vehicle_id = v.id
         WHERE e.user_id = ?
     """
@@ -84,7 +109,7 @@ def get_user_expenses(user_id, vehicle_id=None, expense_type=None, start_date=No
     
     query += " ORDER BY e.expense_date DESC, e.id DESC"
     
-    cursor.execute(query, params)
+    cursor.execute(with_archives(conn, query, start_date, end_date), params)
     rows = cursor.fetchall()
     conn.close()
 
@@ -105,9 +130,55 @@ def get_user_expenses(user_id, vehicle_id=None, expense_type=None, start_date=No
     return expenses
 
 
+def iter_user_expenses(user_id, batch_size=500, start_date=None, end_date=None):
+    """
+    Stream a user's expenses for exports without loading them all at once.
+
+    Args:
+        user_id (int): User ID
+        batch_size (int): Rows fetched from the cursor per batch
+        start_date (str, optional): Filter from date (YYYY-MM-DD)
+        end_date (str, optional): Filter to date (YYYY-MM-DD)
+
+    Yields:
+        sqlite3.Row: Expense columns plus vehicle_registration
+    """
+    conn = get_connection(DATABASE)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    query = """
+        SELECT e.*, COALESCE(v.registration, 'N/A') as vehicle_registration
+        FROM {expenses} e
+        LEFT JOIN vehicles v ON e.vehicle_id = v.id
+        WHERE e.user_id = ?
+    """
+    params = [user_id]
+
+    if start_date:
+        query += " AND e.expense_date >= ?"
+        params.append(start_date)
+
+    if end_date:
+        query += " AND e.expense_date <= ?"
+        params.append(end_date)
+
+    query += " ORDER BY e.expense_date DESC, e.id DESC"
+    cursor.execute(with_archives(conn, query, start_date, end_date), params)
+
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
 def get_expense_by_id(expense_id, user_id):
     """Get a single expense for editing or viewing."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     cursor.execute("""
         SELECT e.*
@@ -134,11 +205,16 @@ def get_expense_by_id(expense_id, user_id):
 
 
 def update_expense(expense_id, user_id, vehicle_id, expense_date, expense_type, amount, notes=None, receipt_filename=None):
-    """Update an existing expense."""
+    """Update an existing expense. A replaced receipt is released from the blob store."""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
 
+        cursor.execute("SELECT receipt_filename FROM expenses WHERE id = ? AND user_id = ?",
+                       (expense_id, user_id))
+        row = cursor.fetchone()
+        old_receipt = row[0] if row else None
+
         # If receipt_filename is provided, update it; otherwise keep existing
         if receipt_filename is not None:
             cursor.execute("""
@@ -155,6 +231,10 @@ def update_expense(expense_id, user_id, vehicle_id, expense_date, expense_type,
 
         conn.commit()
         conn.close()
+
+        if receipt_filename is not None and old_receipt and old_receipt != receipt_filename:
+            release_blob(RECEIPT_FOLDER, old_receipt)
+
         return True, "Expense updated successfully"
     except Exception as e:
         return False, str(e)
@@ -170,7 +250,7 @@ def delete_expense(expense_id, user_id):
             return False, "Expense not found"
         
         # Delete from database
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection(DATABASE)
         cursor = conn.cursor()
         cursor.execute("""
             DELETE FROM expenses
@@ -179,14 +259,9 @@ def delete_expense(expense_id, user_id):
         conn.commit()
         conn.close()
         
-        # Delete receipt file if exists
+        # Delete receipt file unless another expense shares it
         if expense['receipt_filename']:
-            receipt_path = os.path.join(RECEIPT_FOLDER, expense['receipt_filename'])
-            if os.path.exists(receipt_path):
-                try:
-                    os.remove(receipt_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete receipt file: {e}")
+            release_blob(RECEIPT_FOLDER, expense['receipt_filename'])
         
         return True, "Expense deleted successfully"
     except Exception as e:
@@ -195,11 +270,11 @@ def delete_expense(expense_id, user_id):
 
 def get_expense_summary(user_id, vehicle_id=None, start_date=None, end_date=None):
     """Get expense summary statistics."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     
     # Total expenses
-    query = "SELECT COUNT(*), SUM(amount) FROM expenses WHERE user_id = ?"
+    query = "SELECT COUNT(*), SUM(amount) FROM {expenses} WHERE user_id = ?"
     params = [user_id]
     
     if vehicle_id:
@@ -214,13 +289,13 @@ def get_expense_summary(user_id, vehicle_id=None, start_date=None, end_date=None
         query += " AND expense_date <= ?"
         params.append(end_date)
     
-    cursor.execute(query, params)
+    cursor.execute(with_archives(conn, query, start_date, end_date), params)
     total_count, total_amount = cursor.fetchone()
     
     # Expenses by category
     query_cat = """
         SELECT expense_type, COUNT(*), SUM(amount)
-        FROM expenses
+        FROM {expenses}
         WHERE user_id = ?
     """
     params_cat = [user_id]
@@ -239,14 +314,14 @@ def get_expense_summary(user_id, vehicle_id=None, start_date=None, end_date=None
     
     query_cat += " GROUP BY expense_type ORDER BY SUM(amount) DESC"
     
-    cursor.execute(query_cat, params_cat)
+    cursor.execute(with_archives(conn, query_cat, start_date, end_date), params_cat)
     categories = cursor.fetchall()
     
     # Expenses by vehicle (without vehicle details due to cross-database limitation)
     # Note: We can only get vehicle_id, not registration/make/model
     query_veh = """
         SELECT e.vehicle_id, COUNT(e.id), SUM(e.amount)
-        FROM expenses e
+        FROM {expenses} e
         WHERE e.user_id = ? AND e.vehicle_id IS NOT NULL
     """
     params_veh = [user_id]
@@ -265,7 +340,7 @@ def get_expense_summary(user_id, vehicle_id=None, start_date=None, end_date=None
     
     query_veh += " GROUP BY e.vehicle_id ORDER BY SUM(e.amount) DESC"
     
-    cursor.execute(query_veh, params_veh)
+    cursor.execute(with_archives(conn, query_veh, start_date, end_date), params_veh)
     vehicles = cursor.fetchall()
     
     conn.close()
@@ -301,15 +376,17 @@ def get_expense_summary(user_id, vehicle_id=None, start_date=None, end_date=None
 
 def get_monthly_expenses(user_id, vehicle_id=None):
     """Get monthly expense totals for the current year."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection(DATABASE)
     cursor = conn.cursor()
     
+    # A date range rather than strftime('%Y', expense_date), so the index is used
+    year = datetime.utcnow().year
     query = """
-        SELECT strftime('%Y-%m', expense_date) as month, SUM(amount) as total
-        FROM expenses
-        WHERE user_id = ? AND strftime('%Y', expense_date) = strftime('%Y', 'now')
+        SELECT substr(expense_date, 1, 7) as month, SUM(amount) as total
+        FROM {expenses}
+        WHERE user_id = ? AND expense_date >= ? AND expense_date < ?
     """
-    params = [user_id]
+    params = [user_id, f"{year}-01-01", f"{year + 1}-01-01"]
     
     if vehicle_id:
         query += " AND vehicle_id = ?"
@@ -317,7 +394,7 @@ def get_monthly_expenses(user_id, vehicle_id=None):
     
     query += " GROUP BY month ORDER BY month"
     
-    cursor.execute(query, params)
+    cursor.execute(with_archives(conn, query, params[1], params[2]), params)
     results = cursor.fetchall()
     conn.close()
     
@@ -0,0 +1,473 @@
+"""
+Export Helper Functions for BizDrive
+Admin data pulls of trips, expenses and accidents in CSV, Parquet or
+Arrow IPC. Date-range and user filters are applied in SQL, rows are read
+from the cursor in fetchmany batches, and each batch is encoded and
+handed to the response before the next is read, so memory stays bounded
+by the batch size whatever the export size.
+
+Parquet and Arrow need pyarrow; CSV is always available.
+
+Drivers can also download everything for a period (trip and expense CSVs,
+PDF logbooks and every referenced receipt) as one ZIP archive that is
+written straight into the response as it is built.
+"""
+
+import csv
+import heapq
+import os
+import tempfile
+import zipfile
+from datetime import date
+from io import StringIO
+from itertools import chain, islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow missing: only CSV exports are offered
+    pa = None
+    pq = None
+
+from archive_store import with_archives
+from db_helpers import DATABASE, get_connection
+from shard_router import SHARDING, shard_database, shard_databases, shard_for_user
+from expense_helpers import iter_user_expenses
+from trip_helpers import iter_user_trips
+from media_helpers import resolve_media_path
+from report_engine import ReportDocument, EXPENSE_COLUMNS, TRIP_COLUMNS
+
+
+EXPORT_BATCH_SIZE = 50000
+
+# Period archive: bytes read from a receipt per chunk, and the PDF size
+# kept in memory before the rendered logbook spills to a temporary file
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_PDF_SPOOL_SIZE = 8 * 1024 * 1024
+
+# Already-compressed receipt formats are stored rather than deflated
+STORED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.zip'}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Dataset -> query, filter columns and (header, type) per output column.
+# Types: int, float, str, date (ISO text stored in SQLite).
+EXPORT_DATASETS = {
+    'trips': {
+        'query': '''
+            SELECT t.id, u.username, v.registration, t.trip_date, t.from_address,
+                   t.to_address, t.distance, t.trip_type, t.reimbursement_amount
+            FROM {trips} t
+            JOIN users u ON t.user_id = u.id
+            LEFT JOIN vehicles v ON t.vehicle_id = v.id
+        ''',
+        'date_column': 't.trip_date',
+        'user_column': 't.user_id',
+        'order_by': 't.trip_date, t.id',
+        'columns': [('ID', 'int'), ('User', 'str'), ('Vehicle', 'str'), ('Date', 'date'),
+                    ('From', 'str'), ('To', 'str'), ('Distance', 'float'), ('Type', 'str'),
+                    ('Reimbursement', 'float')],
+    },
+    'expenses': {
+        'query': '''
+            SELECT e.id, u.username, e.expense_date, e.expense_type, e.amount, e.notes
+            FROM {expenses} e
+            JOIN users u ON e.user_id = u.id
+        ''',
+        'date_column': 'e.expense_date',
+        'user_column': 'e.user_id',
+        'order_by': 'e.expense_date, e.id',
+        'columns': [('ID', 'int'), ('User', 'str'), ('Date', 'date'), ('Category', 'str'),
+                    ('Amount', 'float'), ('Notes', 'str')],
+    },
+    'accidents': {
+        'query': '''
+            SELECT a.id, u.username, v.registration, a.accident_date, a.location,
+                   a.status, a.circumstances
+            FROM {accidents} a
+            JOIN users u ON a.user_id = u.id
+            LEFT JOIN vehicles v ON a.vehicle_id = v.id
+        ''',
+        'date_column': 'a.accident_date',
+        'user_column': 'a.user_id',
+        'order_by': 'a.accident_date, a.id',
+        'columns': [('ID', 'int'), ('User', 'str'), ('Vehicle', 'str'), ('Date', 'date'),
+                    ('Location', 'str'), ('Status', 'str'), ('Circumstances', 'str')],
+    },
+}
+
+
+def available_export_formats():
+    """Formats that can be produced with the installed libraries."""
+    return [name for name in EXPORT_FORMATS if name == 'csv' or pa is not None]
+
+
+# ===============================================
+# Query & Batches
+# ===============================================
+
+def build_export_query(dataset, start_date=None, end_date=None, user_id=None):
+    """
+    Build the filtered export query for a dataset.
+
+    Args:
+        dataset (str): 'trips', 'expenses' or 'accidents'
+        start_date (str, optional): First date included (YYYY-MM-DD)
+        end_date (str, optional): Last date included (YYYY-MM-DD)
+        user_id (int, optional): Only this user's records
+
+    Returns:
+        tuple: (sql, params)
+    """
+    spec = EXPORT_DATASETS[dataset]
+    conditions = []
+    params = []
+
+    if start_date:
+        conditions.append(f"{spec['date_column']} >= ?")
+        params.append(start_date)
+
+    if end_date:
+        # Dates may carry a time part, so compare against the next day
+        conditions.append(f"{spec['date_column']} < date(?, '+1 day')")
+        params.append(end_date)
+
+    if user_id:
+        conditions.append(f"{spec['user_column']} = ?")
+        params.append(user_id)
+
+    sql = spec['query']
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f" ORDER BY {spec['order_by']}"
+    return sql, params
+
+
+def _iter_query_batches(sql, params, database, batch_size, start_date=None, end_date=None):
+    conn = get_connection(database)
+    cursor = conn.cursor()
+    cursor.arraysize = batch_size
+
+    try:
+        # Archived years the date range reaches are read alongside the live rows
+        cursor.execute(with_archives(conn, sql, start_date, end_date), params)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def iter_export_batches(dataset, start_date=None, end_date=None, user_id=None,
+                        batch_size=EXPORT_BATCH_SIZE, database=DATABASE):
+    """
+    Read a dataset in fetchmany batches. With sharding on, a user's export
+    reads only their shard; a fleet-wide export merges every shard's rows
+    in (date, id) order.
+
+    Yields:
+        list: Up to batch_size row tuples
+    """
+    sql, params = build_export_query(dataset, start_date, end_date, user_id)
+
+    if not (SHARDING and database == DATABASE):
+        databases = [database]
+    elif user_id:
+        databases = [shard_database(shard_for_user(user_id))]
+    else:
+        databases = shard_databases()
+
+    if len(databases) == 1:
+        yield from _iter_query_batches(sql, params, databases[0], batch_size, start_date, end_date)
+        return
+
+    # NULL dates sort first, as in SQLite
+    date_index = [kind for _, kind in EXPORT_DATASETS[dataset]['columns']].index('date')
+    rows = heapq.merge(
+        *(chain.from_iterable(_iter_query_batches(sql, params, shard, batch_size, start_date, end_date))
+          for shard in databases),
+        key=lambda row: (row[date_index] is not None, row[date_index] or '', row[0])
+    )
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+class StreamSink:
+    """
+    Write-only file object that buffers output until it is drained.
+    Lets file-oriented writers (csv, Parquet, zip) feed a streaming
+    response chunk by chunk.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        else:
+            data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        """Return and clear everything written since the last drain."""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# ===============================================
+# Encoders
+# ===============================================
+
+def _arrow_schema(dataset):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'date': pa.date32()}
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_DATASETS[dataset]['columns']])
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value[:10]) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _record_batch(schema, kinds, rows):
+    """Convert row tuples into an Arrow record batch."""
+    arrays = []
+    for index, (field, kind) in enumerate(zip(schema, kinds)):
+        values = [row[index] for row in rows]
+        if kind == 'date':
+            values = [_parse_date(value) for value in values]
+        elif kind == 'str':
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=field.type, from_pandas=False))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_csv(dataset, batches):
+    """Yield CSV text one batch at a time."""
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow([name for name, _ in EXPORT_DATASETS[dataset]['columns']])
+
+    for rows in batches:
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+    if output.tell():
+        yield output.getvalue()
+
+
+def stream_parquet(dataset, batches, compression='zstd'):
+    """Yield a Parquet file one row group (batch) at a time."""
+    schema = _arrow_schema(dataset)
+    kinds = [kind for _, kind in EXPORT_DATASETS[dataset]['columns']]
+    sink = StreamSink()
+
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, kinds, rows))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def stream_arrow(dataset, batches, compression='zstd'):
+    """Yield an Arrow IPC stream one record batch at a time."""
+    schema = _arrow_schema(dataset)
+    kinds = [kind for _, kind in EXPORT_DATASETS[dataset]['columns']]
+    sink = StreamSink()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    with pa.ipc.new_stream(sink, schema, options=options) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, kinds, rows))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+STREAM_ENCODERS = {
+    'csv': stream_csv,
+    'parquet': stream_parquet,
+    'arrow': stream_arrow,
+}
+
+
+def stream_export(dataset, export_format='csv', start_date=None, end_date=None,
+                  user_id=None, database=DATABASE):
+    """
+    Stream a filtered dataset export.
+
+    Args:
+        dataset (str): 'trips', 'expenses' or 'accidents'
+        export_format (str): 'csv', 'parquet' or 'arrow'
+        start_date (str, optional): First date included (YYYY-MM-DD)
+        end_date (str, optional): Last date included (YYYY-MM-DD)
+        user_id (int, optional): Only this user's records
+        database (str): Database path
+
+    Returns:
+        tuple: (success, message, (chunks, mimetype, filename))
+    """
+    if dataset not in EXPORT_DATASETS:
+        return False, f"Unknown dataset: {dataset}", None
+
+    if export_format not in available_export_formats():
+        return False, f"Export format '{export_format}' is not available.", None
+
+    batches = iter_export_batches(dataset, start_date, end_date, user_id, database=database)
+    chunks = STREAM_ENCODERS[export_format](dataset, batches)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return True, "Export ready", (chunks, mimetype, f"{dataset}_export.{extension}")
+
+
+# ===============================================
+# Period Archive (ZIP)
+# ===============================================
+
+def _write_csv_entry(archive, sink, name, header, rows):
+    """Write a CSV file into the archive, yielding output as it accumulates."""
+    with archive.open(name, 'w', force_zip64=True) as entry:
+        text = StringIO()
+        writer = csv.writer(text)
+        writer.writerow(header)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if count % 1000 == 0:
+                entry.write(text.getvalue().encode('utf-8'))
+                text.seek(0)
+                text.truncate()
+                yield sink.drain()
+        entry.write(text.getvalue().encode('utf-8'))
+    yield sink.drain()
+
+
+def _write_file_entry(archive, sink, name, source, compress_type=zipfile.ZIP_DEFLATED):
+    """Copy a binary file object into the archive chunk by chunk."""
+    info = zipfile.ZipInfo(name, date_time=date.today().timetuple()[:6])
+    info.compress_type = compress_type
+    with archive.open(info, 'w', force_zip64=True) as entry:
+        while True:
+            data = source.read(ARCHIVE_CHUNK_SIZE)
+            if not data:
+                break
+            entry.write(data)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _render_period_pdf(title, subtitle, columns, rows, **table_options):
+    """Render a report table into a spooled temporary file, rewound for reading."""
+    output = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_PDF_SPOOL_SIZE)
+    report = ReportDocument(output, title, subtitle)
+    report.add_table(columns, rows, **table_options)
+    report.finish()
+    output.seek(0)
+    return output
+
+
+def _receipt_archive_name(expense):
+    extension = os.path.splitext(expense['receipt_filename'])[1].lower()
+    return f"receipts/{expense['expense_date'][:10]}_{expense['id']}{extension}"
+
+
+def stream_period_archive(user_id, username, start_date=None, end_date=None):
+    """
+    Stream a driver's records for a period as a ZIP archive.
+
+    The archive holds trips.csv, expenses.csv, logbook.pdf, expenses.pdf
+    and every receipt referenced by an expense in the period. Entries are
+    written with data descriptors and ZIP64 headers, so nothing is staged
+    and archives larger than 4 GB stay valid.
+
+    Args:
+        user_id (int): User ID
+        username (str): Name shown on the PDF reports
+        start_date (str, optional): First date included (YYYY-MM-DD)
+        end_date (str, optional): Last date included (YYYY-MM-DD)
+
+    Yields:
+        bytes: Archive data
+    """
+    period = f"{start_date or 'start'} to {end_date or 'today'}"
+    sink = StreamSink()
+
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        trips = (
+            (t['trip_date'], t['registration'], t['from_address'], t['to_address'],
+             t['purpose'], t['distance'], t['trip_type'], t['reimbursement_amount'])
+            for t in iter_user_trips(user_id, start_date=start_date, end_date=end_date)
+        )
+        yield from _write_csv_entry(archive, sink, 'trips.csv',
+                                    ['Date', 'Vehicle', 'From', 'To', 'Purpose', 'Distance',
+                                     'Type', 'Reimbursement'], trips)
+
+        expenses = (
+            (e['expense_date'], e['vehicle_registration'], e['expense_type'], e['notes'],
+             e['amount'], _receipt_archive_name(e) if e['receipt_filename'] else '')
+            for e in iter_user_expenses(user_id, start_date=start_date, end_date=end_date)
+        )
+        yield from _write_csv_entry(archive, sink, 'expenses.csv',
+                                    ['Date', 'Vehicle', 'Category', 'Description', 'Amount',
+                                     'Receipt'], expenses)
+
+        with _render_period_pdf(f"{username}_Logbook", f"Logbook for {username}, {period}",
+                                TRIP_COLUMNS,
+                                iter_user_trips(user_id, start_date=start_date, end_date=end_date),
+                                font_size=9, heading_size=10, totals_label='Total Distance') as pdf:
+            yield from _write_file_entry(archive, sink, 'logbook.pdf', pdf)
+
+        with _render_period_pdf(f"{username}_Expenses_Report", f"Expenses for {username}, {period}",
+                                EXPENSE_COLUMNS,
+                                iter_user_expenses(user_id, start_date=start_date, end_date=end_date)) as pdf:
+            yield from _write_file_entry(archive, sink, 'expenses.pdf', pdf)
+
+        for expense in iter_user_expenses(user_id, start_date=start_date, end_date=end_date):
+            if not expense['receipt_filename']:
+                continue
+
+            path = resolve_media_path('receipt', expense['receipt_filename'])
+            if not path:
+                print(f"Warning: receipt for expense {expense['id']} is missing")
+                continue
+
+            name = _receipt_archive_name(expense)
+            extension = os.path.splitext(name)[1]
+            compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as receipt:
+                yield from _write_file_entry(archive, sink, name, receipt, compress_type)
+
+    # Central directory
+    yield sink.drain()
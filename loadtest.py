@@ -0,0 +1,392 @@
+"""
+Load Test for BizDrive
+Closed-loop HTTP load test with scripted driver journeys, swept across
+concurrency levels, to find how many concurrent drivers a deployment
+sustains. Stdlib only and fully offline.
+
+Each virtual driver logs in as its own seeded driver and repeats the
+journey until the level's time is up:
+    login page -> log in -> dashboard -> add-trip form -> add three trips
+    -> trips CSV export -> log out
+
+Per level the report gives journeys and requests per second plus
+p50/p95/p99 latency and the error rate per endpoint. The highest level
+that meets the latency and error targets is reported as sustainable.
+
+Against a running deployment (drivers seeded with seed_fleet.py):
+    python loadtest.py --url http://127.0.0.1:8000 [--levels 1,2,4,8,16,32] [--duration 30]
+
+Against a local server on a freshly seeded throwaway database:
+    python loadtest.py --local [--workers 4] [--levels 1,2,4,8,16,32] [--duration 30]
+
+--local serves the app with werkzeug (one thread per request, or a forked
+process per request with --workers > 1). For sizing a production worker
+count, run the production server (e.g. gunicorn -w N) and use --url.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from benchmark import percentile
+
+JOURNEY_STEPS = ['login_page', 'login', 'dashboard', 'add_trip_form', 'add_trip', 'trips_csv', 'logout']
+
+TRIPS_PER_JOURNEY = 3
+
+VEHICLE_OPTION = re.compile(r'name="vehicle_id".*?<option value="(\d+)"', re.S)
+
+REQUEST_TIMEOUT = 60
+SERVER_START_TIMEOUT = 120
+
+
+# ===============================================
+# Virtual Driver
+# ===============================================
+
+class DriverSession:
+    """One simulated driver: a cookie jar and the request log of its journeys."""
+
+    def __init__(self, host, port, username, password, samples, lock):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.cookies = {}
+        self.samples = samples      # step -> [(seconds, ok)]
+        self.lock = lock
+        self.vehicle_id = None
+
+    def request(self, step, method, path, expected, form=None):
+        """
+        Issue one request and record its latency against a journey step.
+
+        Args:
+            step (str): Journey step the request is reported under
+            method (str): HTTP method
+            path (str): Request path
+            expected (int): Status that counts as success
+            form (dict): Form fields for a POST
+
+        Returns:
+            tuple: (ok, body, headers)
+        """
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            conn.close()
+            ok = response.status == expected
+            response_headers = response.headers
+        except (OSError, http.client.HTTPException):
+            ok, data, response_headers = False, b'', None
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.samples.setdefault(step, []).append((elapsed, ok))
+
+        if response_headers is not None:
+            for cookie in response_headers.get_all('Set-Cookie') or []:
+                name, _, value = cookie.split(';', 1)[0].partition('=')
+                if value:
+                    self.cookies[name] = value
+                else:
+                    self.cookies.pop(name, None)
+        return ok, data, response_headers
+
+    def run_journey(self, trip_date):
+        """Run the scripted journey once; returns True if every step succeeded."""
+        self.cookies.clear()
+        if not self.request('login_page', 'GET', '/login', 200)[0]:
+            return False
+        ok, _, headers = self.request('login', 'POST', '/login', 302,
+                                      {'username': self.username, 'password': self.password})
+        # A failed login re-renders the form with 200; a redirect anywhere else is an error too
+        if not ok or not headers.get('Location', '').endswith('/dashboard'):
+            return False
+        if not self.request('dashboard', 'GET', '/dashboard', 200)[0]:
+            return False
+
+        ok, body, _ = self.request('add_trip_form', 'GET', '/trips/add', 200)
+        if not ok:
+            return False
+        match = VEHICLE_OPTION.search(body.decode('utf-8', 'replace'))
+        if match is None:
+            return False
+        vehicle_id = match.group(1)
+
+        for leg in range(TRIPS_PER_JOURNEY):
+            ok, _, _ = self.request('add_trip', 'POST', '/trips/add', 302, {
+                'vehicle_id': vehicle_id,
+                'trip_date': trip_date,
+                'trip_type': 'Business',
+                'trips[0][from_address]': f"{leg + 1} George St, Sydney NSW 2000",
+                'trips[0][to_address]': f"{leg + 10} Church St, Parramatta NSW 2150",
+                'trips[0][purpose]': 'Load test',
+                'trips[0][distance]': '24.5',
+            })
+            if not ok:
+                return False
+
+        if not self.request('trips_csv', 'GET', '/trips/export/csv', 200)[0]:
+            return False
+        return self.request('logout', 'GET', '/logout', 302)[0]
+
+
+# ===============================================
+# Sweep
+# ===============================================
+
+def _step_summary(samples):
+    latencies = [seconds for seconds, _ in samples]
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+    }
+
+
+def run_level(host, port, concurrency, duration, usernames, password, think_time=0.0):
+    """
+    Run `concurrency` virtual drivers for `duration` seconds.
+
+    Args:
+        host (str): Server host
+        port (int): Server port
+        concurrency (int): Simultaneous virtual drivers
+        duration (float): Seconds to keep starting journeys
+        usernames (list): Driver usernames, one per virtual driver
+        password (str): Password shared by the drivers
+        think_time (float): Pause between journeys, in seconds
+
+    Returns:
+        dict: Throughput, overall error rate and per-endpoint latencies
+    """
+    samples = {}
+    lock = threading.Lock()
+    journeys = {'completed': 0, 'failed': 0}
+    deadline = time.monotonic() + duration
+    # Spread the added trips over the last week so daily views stay realistic
+    trip_dates = [(date.today() - timedelta(days=n)).isoformat() for n in range(7)]
+
+    def drive(index):
+        driver = DriverSession(host, port, usernames[index], password, samples, lock)
+        n = 0
+        while time.monotonic() < deadline:
+            ok = driver.run_journey(trip_dates[n % len(trip_dates)])
+            n += 1
+            with lock:
+                journeys['completed' if ok else 'failed'] += 1
+            if think_time:
+                time.sleep(think_time)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=drive, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(step) for step in samples.values())
+    errors = sum(1 for step in samples.values() for _, ok in step if not ok)
+    all_latencies = [seconds for step in samples.values() for seconds, _ in step]
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'journeys': journeys['completed'],
+        'failed_journeys': journeys['failed'],
+        'journeys_per_second': round(journeys['completed'] / elapsed, 2),
+        'requests': total,
+        'requests_per_second': round(total / elapsed, 1),
+        'error_rate': round(errors / total, 4) if total else None,
+        'p95_ms': round(percentile(all_latencies, 95) * 1000, 1) if all_latencies else None,
+        'endpoints': {step: _step_summary(samples[step]) for step in JOURNEY_STEPS if step in samples},
+    }
+
+
+def sweep(host, port, levels, duration, usernames, password, think_time=0.0,
+          slo_p95_ms=1000.0, max_error_rate=0.01):
+    """
+    Run each concurrency level in turn and find the sustainable level.
+
+    Returns:
+        dict: Per-level results and max_sustainable_concurrency
+    """
+    results = []
+    sustainable = None
+    for concurrency in levels:
+        level = run_level(host, port, concurrency, duration, usernames, password, think_time)
+        # Every request of the level must meet the targets, not just the average endpoint
+        level['meets_targets'] = (level['error_rate'] is not None
+                                  and level['error_rate'] <= max_error_rate
+                                  and level['p95_ms'] <= slo_p95_ms)
+        if level['meets_targets']:
+            sustainable = concurrency
+        results.append(level)
+        print(f"concurrency {concurrency}: {level['journeys_per_second']} journeys/s, "
+              f"p95 {level['p95_ms']} ms, errors {level['error_rate']}", file=sys.stderr)
+    return {
+        'targets': {'p95_ms': slo_p95_ms, 'max_error_rate': max_error_rate},
+        'max_sustainable_concurrency': sustainable,
+        'levels': results,
+    }
+
+
+# ===============================================
+# Local Server
+# ===============================================
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(host, port, process):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start in time')
+
+
+def serve(port, workers=1):
+    """Serve the app on 127.0.0.1 (used by --local in a child process)."""
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    if workers > 1:
+        server = make_server('127.0.0.1', port, app, processes=workers)
+    else:
+        server = make_server('127.0.0.1', port, app, threaded=True)
+    server.serve_forever()
+
+
+def run_local(levels, duration, workers=1, think_time=0.0, slo_p95_ms=1000.0, max_error_rate=0.01,
+              months=3, seed=42):
+    """
+    Seed a throwaway fleet, serve it locally and run the sweep against it.
+
+    Returns:
+        dict: Sweep results plus the fleet and server settings
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix='bizdrive-load-')
+    env = dict(os.environ, BIZDRIVE_DATABASE=os.path.join(workdir, 'fleet.db'))
+    server = None
+
+    try:
+        seeded = subprocess.run(
+            [sys.executable, os.path.join(here, 'seed_fleet.py'), '--users', str(max(levels)),
+             '--months', str(months), '--seed', str(seed)],
+            env=env, cwd=workdir, capture_output=True, text=True, check=True
+        )
+        fleet = json.loads(seeded.stdout)
+
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'serve', '--port', str(port), '--workers', str(workers)],
+            env=env, cwd=workdir
+        )
+        _wait_for_server('127.0.0.1', port, server)
+
+        usernames = [f"fleet{n:05d}" for n in range(max(levels))]
+        report = sweep('127.0.0.1', port, levels, duration, usernames, fleet['password'],
+                       think_time, slo_p95_ms, max_error_rate)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report['server'] = {'kind': 'werkzeug', 'workers': workers}
+    report['fleet'] = {key: fleet[key] for key in ('users', 'vehicles', 'trips', 'expenses')}
+    return report
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        parser = argparse.ArgumentParser(prog='loadtest.py serve')
+        parser.add_argument('--port', type=int, required=True)
+        parser.add_argument('--workers', type=int, default=1)
+        args = parser.parse_args(sys.argv[2:])
+        serve(args.port, args.workers)
+        return
+
+    parser = argparse.ArgumentParser(description='BizDrive load test')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of a running deployment')
+    target.add_argument('--local', action='store_true', help='Seed and serve a throwaway fleet locally')
+    parser.add_argument('--levels', default='1,2,4,8,16,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per level')
+    parser.add_argument('--think-ms', type=float, default=0, help='Pause between journeys')
+    parser.add_argument('--slo-p95-ms', type=float, default=1000)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=1, help='--local: server processes')
+    parser.add_argument('--months', type=int, default=3, help='--local: months of seeded history')
+    parser.add_argument('--username-prefix', default='fleet', help='--url: seeded driver usernames')
+    parser.add_argument('--password', default=None, help='--url: driver password (default: the seed password)')
+    args = parser.parse_args()
+
+    levels = sorted(int(level) for level in args.levels.split(','))
+    think_time = args.think_ms / 1000
+
+    if args.local:
+        report = run_local(levels, args.duration, args.workers, think_time,
+                           args.slo_p95_ms, args.max_error_rate, args.months)
+    else:
+        url = urlsplit(args.url)
+        if url.scheme != 'http':
+            parser.error('--url must be an http:// URL')
+        password = args.password
+        if password is None:
+            from seed_fleet import SEED_PASSWORD
+            password = SEED_PASSWORD
+        usernames = [f"{args.username_prefix}{n:05d}" for n in range(max(levels))]
+        report = sweep(url.hostname, url.port or 80, levels, args.duration, usernames, password,
+                       think_time, args.slo_p95_ms, args.max_error_rate)
+        report['server'] = {'url': args.url}
+
+    report['duration_per_level'] = args.duration
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Media Helper Functions for BizDrive
+Authorised serving of receipts and accident photos. Every stored file is
+a content-addressed blob, so its key never changes meaning: the content
+hash doubles as a strong ETag and responses can be cached as immutable.
+
+Bytes are sent by Flask (with HTTP Range support) by default. Setting
+BIZDRIVE_MEDIA_OFFLOAD hands the transfer to the front-end web server:
+    nginx     X-Accel-Redirect to an internal location
+              (BIZDRIVE_MEDIA_ACCEL_PREFIX, default /_media)
+    sendfile  X-Sendfile with the absolute path (Apache/lighttpd)
+
+Example nginx location for the accel mode, with the app run from /srv/bizdrive:
+    location /_media/ {
+        internal;
+        alias /srv/bizdrive/static/;
+    }
+"""
+
+import mimetypes
+import os
+
+from flask import Response, send_file
+
+from archive_store import query_archives
+from blob_store import blob_path, is_blob_key
+from db_helpers import DATABASE, get_connection
+from expense_helpers import RECEIPT_FOLDER
+from accident_helpers import ACCIDENT_PHOTO_FOLDER, THUMBNAIL_FOLDER, WEB_FOLDER
+
+
+MEDIA_OFFLOAD = os.environ.get('BIZDRIVE_MEDIA_OFFLOAD', '').lower()
+MEDIA_ACCEL_PREFIX = os.environ.get('BIZDRIVE_MEDIA_ACCEL_PREFIX', '/_media').rstrip('/')
+
+# Blobs never change under a key, so browsers may keep them for a year
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# Media kind -> (blob root, ownership query taking (key, user_id))
+MEDIA_KINDS = {
+    'receipt': (RECEIPT_FOLDER, '''
+        SELECT 1 FROM expenses WHERE receipt_filename = ? AND user_id = ? LIMIT 1
+    '''),
+    'photo': (ACCIDENT_PHOTO_FOLDER, '''
+        SELECT 1 FROM accident_photos p JOIN accidents a ON p.accident_id = a.id
+        WHERE p.filename = ? AND a.user_id = ? LIMIT 1
+    '''),
+    'thumb': (THUMBNAIL_FOLDER, '''
+        SELECT 1 FROM accident_photos p JOIN accidents a ON p.accident_id = a.id
+        WHERE p.thumbnail_filename = ? AND a.user_id = ? LIMIT 1
+    '''),
+    'web': (WEB_FOLDER, '''
+        SELECT 1 FROM accident_photos p JOIN accidents a ON p.accident_id = a.id
+        WHERE p.web_filename = ? AND a.user_id = ? LIMIT 1
+    '''),
+}
+
+# Static URL prefixes that must not bypass the authorised endpoint
+PROTECTED_STATIC_PREFIXES = ('/static/receipts/', '/static/accident_photos/')
+
+
+def legacy_media_location(path):
+    """
+    Map an old /static/ URL of a receipt or photo to its media kind and key.
+    Nested folders (thumbs/, web/) are matched before their parent.
+
+    Args:
+        path (str): Request path such as '/static/receipts/ab/cd/abcd....pdf'
+
+    Returns:
+        tuple: (kind, key), or None if the path names no stored file
+    """
+    for kind, (root, _) in sorted(MEDIA_KINDS.items(), key=lambda item: -len(item[1][0])):
+        prefix = f"/{root}/"
+        if path.startswith(prefix) and len(path) > len(prefix):
+            return kind, path[len(prefix):]
+    return None
+
+
+# ===============================================
+# Authorisation
+# ===============================================
+
+def user_can_access_media(user_id, kind, key):
+    """
+    Check that a user owns a record referencing a media file.
+
+    Args:
+        user_id (int): User ID
+        kind (str): Media kind ('receipt', 'photo', 'thumb' or 'web')
+        key (str): Stored blob key or legacy filename
+
+    Returns:
+        bool: True if the user may fetch the file
+    """
+    if kind not in MEDIA_KINDS or not key:
+        return False
+
+    conn = get_connection(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(MEDIA_KINDS[kind][1], (key, user_id))
+    allowed = cursor.fetchone() is not None
+    if not allowed:
+        table = 'expenses' if kind == 'receipt' else 'accident_photos'
+        allowed = bool(query_archives(conn, table, MEDIA_KINDS[kind][1], (key, user_id)))
+    conn.close()
+    return allowed
+
+
+def resolve_media_path(kind, key):
+    """
+    Get the file path for a media key, rejecting anything outside its root.
+
+    Args:
+        kind (str): Media kind
+        key (str): Stored blob key or legacy filename
+
+    Returns:
+        str: Absolute path, or None if the key is invalid or the file is missing
+    """
+    root = os.path.abspath(MEDIA_KINDS[kind][0])
+
+    if is_blob_key(key):
+        path = os.path.abspath(blob_path(root, key))
+    elif '/' not in key and '\\' not in key and not key.startswith('.'):
+        path = os.path.abspath(os.path.join(root, key))
+    else:
+        return None
+
+    if not path.startswith(root + os.sep):
+        return None
+
+    return path if os.path.isfile(path) else None
+
+
+def media_url_path(kind, key):
+    """Relative URL path of a media file under the static folder."""
+    root = MEDIA_KINDS[kind][0].replace(os.sep, '/')
+    return f"{root.split('static/', 1)[-1]}/{key}"
+
+
+# ===============================================
+# Responses
+# ===============================================
+
+def _media_etag(key):
+    """Strong ETag for a blob key: its SHA-256 content hash."""
+    if is_blob_key(key):
+        return key.rsplit('/', 1)[-1].split('.', 1)[0]
+    return None
+
+
+def _set_immutable_caching(response):
+    """Mark a response as privately cacheable forever."""
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    response.cache_control.immutable = True
+    # send_file's Expires would contradict max-age; setting it to None leaves it in place
+    response.headers.pop('Expires', None)
+    return response
+
+
+def build_media_response(kind, key, path, request):
+    """
+    Build the response for an authorised media request.
+    Blob keys get a strong content-hash ETag and immutable caching;
+    legacy filenames fall back to Werkzeug's mtime-based ETag and are
+    revalidated on every use.
+
+    Args:
+        kind (str): Media kind
+        key (str): Stored blob key or legacy filename
+        path (str): Path returned by resolve_media_path
+        request: The current Flask request
+
+    Returns:
+        Response: File, 304 or offload response
+    """
+    etag = _media_etag(key)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if MEDIA_OFFLOAD in ('nginx', 'sendfile'):
+        if etag and etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(mimetype=mimetype)
+            if MEDIA_OFFLOAD == 'nginx':
+                response.headers['X-Accel-Redirect'] = f"{MEDIA_ACCEL_PREFIX}/{media_url_path(kind, key)}"
+            else:
+                response.headers['X-Sendfile'] = path
+        if etag:
+            response.set_etag(etag)
+            _set_immutable_caching(response)
+        return response
+
+    response = send_file(path, mimetype=mimetype, conditional=True,
+                         etag=etag or True, max_age=MEDIA_MAX_AGE if etag else 0)
+    if etag:
+        _set_immutable_caching(response)
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,267 @@
+"""
+Request Metrics for BizDrive
+Per-endpoint request counts, latency histograms, in-flight requests and
+the database work done by each request, exposed in the Prometheus text
+format. Everything is kept in process memory behind one lock; with several
+worker processes each process reports its own series.
+
+Finished requests are handed to the SQL tracer (sql_trace.py) when
+tracing is on. Set BIZDRIVE_METRICS=0 to switch instrumentation off,
+which also stops SQL tracing.
+"""
+
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+from db_helpers import start_query_tally, stop_query_tally
+from sql_trace import record_request, tracing_enabled
+
+METRICS_ENABLED = os.environ.get('BIZDRIVE_METRICS', '1') != '0'
+
+# Bearer token that lets a Prometheus server scrape without an admin session
+METRICS_TOKEN = os.environ.get('BIZDRIVE_METRICS_TOKEN', '')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of one labelled series."""
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """In-memory store for request and database metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}          # (endpoint, method, status) -> count
+        self.latency = {}           # endpoint -> Histogram
+        self.db_queries = {}        # endpoint -> Histogram of queries per request
+        self.db_seconds = {}        # endpoint -> seconds spent in SQLite
+        self.db_commits = {}        # endpoint -> commits that wrote (one fsync each)
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, endpoint, method, status, seconds, queries, db_seconds, commits=0):
+        with self._lock:
+            self.in_flight -= 1
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            latency = self.latency.get(endpoint)
+            if latency is None:
+                latency = self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+            latency.observe(seconds)
+
+            db_queries = self.db_queries.get(endpoint)
+            if db_queries is None:
+                db_queries = self.db_queries[endpoint] = Histogram(QUERY_COUNT_BUCKETS)
+            db_queries.observe(queries)
+
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + db_seconds
+            self.db_commits[endpoint] = self.db_commits.get(endpoint, 0) + commits
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.latency.clear()
+            self.db_queries.clear()
+            self.db_seconds.clear()
+            self.db_commits.clear()
+
+
+metrics = RequestMetrics()
+
+
+# ===============================================
+# Flask Hooks
+# ===============================================
+
+def _finish_request(state, status):
+    if state.get('done'):
+        return
+    state['done'] = True
+    stop_query_tally()
+    tally = state['tally']
+    seconds = time.perf_counter() - state['start']
+    metrics.request_finished(state['endpoint'], state['method'], status,
+                             seconds, tally.count, tally.seconds, tally.commits)
+    if tally.statements is not None:
+        record_request(state['endpoint'], state['method'], status, seconds, tally)
+
+
+def init_metrics(app):
+    """
+    Register the instrumentation hooks. Call before any other
+    before_request hook so short-circuited requests are still counted.
+
+    Args:
+        app (Flask): The application
+    """
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _metrics_start_request():
+        current = request._get_current_object()
+        metrics.request_started()
+        # Unmatched URLs share one label to bound cardinality
+        g._metrics = {
+            'start': time.perf_counter(),
+            'tally': start_query_tally(trace=tracing_enabled()),
+            'endpoint': current.endpoint or 'unmatched',
+            'method': current.method,
+        }
+
+    @app.after_request
+    def _metrics_after_request(response):
+        state = g.get('_metrics')
+        if state is not None:
+            status = str(response.status_code)
+            if response.direct_passthrough:
+                # File responses skip close callbacks: finish at teardown
+                state['status'] = status
+            else:
+                # Streamed bodies are still being produced: finish on close
+                response.call_on_close(lambda: _finish_request(state, status))
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown_request(error):
+        # Unhandled errors may never produce a response to close
+        state = g.get('_metrics')
+        if state is not None and (error is not None or 'status' in state):
+            _finish_request(state, '500' if error is not None else state['status'])
+
+
+# ===============================================
+# Prometheus Exposition
+# ===============================================
+
+def scrape_token_valid(authorization):
+    """
+    Check an Authorization header against BIZDRIVE_METRICS_TOKEN.
+
+    Args:
+        authorization (str): Authorization header value, or None
+
+    Returns:
+        bool: True if a token is configured and the header carries it
+    """
+    if not METRICS_TOKEN or not authorization or not authorization.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(authorization[len('Bearer '):].strip(), METRICS_TOKEN)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, endpoint, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(endpoint=endpoint, le=_format_number(float(bound)))} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(endpoint=endpoint, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(endpoint=endpoint)} {_format_number(histogram.total)}")
+    lines.append(f"{name}_count{_labels(endpoint=endpoint)} {histogram.count}")
+    return lines
+
+
+def _copy_histogram(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.total = histogram.total
+    copy.count = histogram.count
+    return copy
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format (0.0.4).
+
+    Returns:
+        str: Metrics text
+    """
+    with metrics._lock:
+        requests = dict(metrics.requests)
+        latency = {endpoint: _copy_histogram(h) for endpoint, h in metrics.latency.items()}
+        db_queries = {endpoint: _copy_histogram(h) for endpoint, h in metrics.db_queries.items()}
+        db_seconds = dict(metrics.db_seconds)
+        db_commits = dict(metrics.db_commits)
+        in_flight = metrics.in_flight
+
+    lines = [
+        '# HELP bizdrive_http_requests_in_flight Requests currently being served.',
+        '# TYPE bizdrive_http_requests_in_flight gauge',
+        f'bizdrive_http_requests_in_flight {in_flight}',
+        '# HELP bizdrive_http_requests_total Requests served, by endpoint, method and status.',
+        '# TYPE bizdrive_http_requests_total counter',
+    ]
+    for (endpoint, method, status), count in sorted(requests.items()):
+        lines.append(f"bizdrive_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+    lines += [
+        '# HELP bizdrive_http_request_duration_seconds Request latency, including streamed bodies.',
+        '# TYPE bizdrive_http_request_duration_seconds histogram',
+    ]
+    for endpoint, histogram in sorted(latency.items()):
+        lines += _histogram_lines('bizdrive_http_request_duration_seconds', endpoint, histogram)
+
+    lines += [
+        '# HELP bizdrive_db_queries_per_request SQL statements executed per request.',
+        '# TYPE bizdrive_db_queries_per_request histogram',
+    ]
+    for endpoint, histogram in sorted(db_queries.items()):
+        lines += _histogram_lines('bizdrive_db_queries_per_request', endpoint, histogram)
+
+    lines += [
+        '# HELP bizdrive_db_seconds_total Time spent in SQLite while serving requests.',
+        '# TYPE bizdrive_db_seconds_total counter',
+    ]
+    for endpoint, seconds in sorted(db_seconds.items()):
+        lines.append(f"bizdrive_db_seconds_total{_labels(endpoint=endpoint)} {_format_number(seconds)}")
+
+    lines += [
+        '# HELP bizdrive_db_commits_total Commits that wrote (one fsync each) while serving requests.',
+        '# TYPE bizdrive_db_commits_total counter',
+    ]
+    for endpoint, commits in sorted(db_commits.items()):
+        lines.append(f"bizdrive_db_commits_total{_labels(endpoint=endpoint)} {commits}")
+
+    return '\n'.join(lines) + '\n'
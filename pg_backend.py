@@ -0,0 +1,685 @@
+"""
+PostgreSQL Backend for BizDrive
+Runs the helper modules unchanged against PostgreSQL. db_helpers opens a
+connection here when BIZDRIVE_DATABASE is a postgresql:// URL. Connections
+are borrowed from a per-URL pool and behave like the sqlite3 connections
+the helpers were written for:
+    - SQLite-dialect SQL ('?' placeholders, INSERT OR REPLACE,
+      AUTOINCREMENT, strftime(), GROUP_CONCAT(), ...) is translated once
+      per statement text
+    - conn.row_factory = sqlite3.Row gives rows with index and key access
+    - cursor.lastrowid is filled in from INSERT ... RETURNING id
+    - DATE and TIMESTAMP values come back as ISO strings and NUMERIC as
+      float, the way SQLite returns them
+    - driver errors are re-raised as the matching sqlite3 exception, so
+      existing `except sqlite3.IntegrityError` handlers keep working
+
+A failed statement aborts the PostgreSQL transaction (SQLite only undoes
+the statement); the helpers already close the connection after an error.
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import db_helpers
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+except ImportError:
+    psycopg2 = None
+
+POOL_SIZE = int(os.environ.get('BIZDRIVE_PG_POOL_SIZE', '10'))
+
+# Seconds to wait for a pooled connection (like sqlite3's busy timeout)
+POOL_TIMEOUT = float(os.environ.get('BIZDRIVE_PG_POOL_TIMEOUT', '30'))
+
+# Translated statements kept per pool
+STATEMENT_CACHE_SIZE = 2000
+
+URL_SCHEMES = ('postgresql://', 'postgres://')
+
+
+def is_postgres_url(database):
+    """True if a database setting names a PostgreSQL server."""
+    return isinstance(database, str) and database.startswith(URL_SCHEMES)
+
+
+def redact_url(url):
+    """A database URL without its password, for logs and traces."""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = parts.netloc.replace(f":{parts.password}@", ':***@', 1)
+    return parts._replace(netloc=netloc).geturl()
+
+
+# ===============================================
+# Dialect Translation
+# ===============================================
+
+# String literals, quoted identifiers, placeholders and percent signs
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\?|%")
+
+_STRFTIME_FORMATS = [('%Y', 'YYYY'), ('%m', 'MM'), ('%d', 'DD'), ('%H', 'HH24'), ('%M', 'MI'), ('%S', 'SS')]
+
+_DATE_MODIFIER = re.compile(r"^'([+-]\d+) (day|month|year)s?'$", re.IGNORECASE)
+
+# Column types and defaults SQLite accepts but PostgreSQL reads differently
+_DDL_REWRITES = [
+    (re.compile(r'\bINTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b', re.IGNORECASE), 'SERIAL PRIMARY KEY'),
+    (re.compile(r'\bREAL\b', re.IGNORECASE), 'DOUBLE PRECISION'),
+    (re.compile(r'\bBOOLEAN\b', re.IGNORECASE), 'INTEGER'),
+    (re.compile(r'\bDATETIME\b', re.IGNORECASE), 'TIMESTAMP'),
+    (re.compile(r'\bBLOB\b', re.IGNORECASE), 'BYTEA'),
+    # SQLite's CURRENT_TIMESTAMP is UTC to the second
+    (re.compile(r'\bDEFAULT\s+CURRENT_TIMESTAMP\b', re.IGNORECASE),
+     "DEFAULT CAST(timezone('UTC', now()) AS TIMESTAMP(0))"),
+]
+
+_PRAGMA_TABLE_INFO = re.compile(r'^\s*PRAGMA\s+table_info\(\s*(\w+)\s*\)\s*;?\s*$', re.IGNORECASE)
+_PRAGMA = re.compile(r'^\s*PRAGMA\b', re.IGNORECASE)
+_INSERT_OR = re.compile(r'^(\s*)INSERT\s+OR\s+(REPLACE|IGNORE)\s+INTO\b', re.IGNORECASE)
+_INSERT_TABLE = re.compile(r'^\s*INSERT\s+INTO\s+(\w+)\s*(?:\(([^)]*)\))?', re.IGNORECASE)
+_DDL = re.compile(r'^\s*(CREATE|ALTER|DROP)\b', re.IGNORECASE)
+_TABLE_DDL = re.compile(r'^\s*(CREATE\s+TABLE|ALTER\s+TABLE)\b', re.IGNORECASE)
+
+
+def _literal_spans(sql):
+    """(start, end) of every quoted string or identifier."""
+    return [m.span() for m in _TOKEN.finditer(sql) if m.group()[0] in '\'"']
+
+
+def _in_spans(position, spans):
+    return any(start <= position < end for start, end in spans)
+
+
+def _call_arguments(sql, open_paren):
+    """Top-level arguments of the call whose '(' is at open_paren, and the index after ')'."""
+    depth = 0
+    args = []
+    start = open_paren + 1
+    i = open_paren
+    while i < len(sql):
+        char = sql[i]
+        if char in '\'"':
+            i = sql.index(char, i + 1)
+            while sql.startswith(char, i + 1):
+                i = sql.index(char, i + 2)
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                args.append(sql[start:i].strip())
+                return args, i + 1
+        elif char == ',' and depth == 1:
+            args.append(sql[start:i].strip())
+            start = i + 1
+        i += 1
+    raise ValueError(f"Unbalanced parentheses in SQL: {sql[:80]}")
+
+
+def _rewrite_calls(sql, name, rewrite):
+    """
+    Replace every call name(...) outside literals with rewrite(args).
+    Calls are rewritten innermost-last-first, so nested calls are handled
+    and rewrite() returning None leaves a call untouched.
+    """
+    pattern = re.compile(rf'\b{name}\s*\(', re.IGNORECASE)
+    spans = _literal_spans(sql)
+    starts = [m.start() for m in pattern.finditer(sql) if not _in_spans(m.start(), spans)]
+    for start in reversed(starts):
+        open_paren = sql.index('(', start)
+        args, end = _call_arguments(sql, open_paren)
+        replacement = rewrite(args)
+        if replacement is not None:
+            sql = sql[:start] + replacement + sql[end:]
+    return sql
+
+
+def _strftime(args):
+    if len(args) != 2 or not args[0].startswith("'"):
+        return None
+    pattern = args[0][1:-1]
+    for sqlite_code, pg_code in _STRFTIME_FORMATS:
+        pattern = pattern.replace(sqlite_code, pg_code)
+    return f"to_char(CAST({args[1]} AS TIMESTAMP), '{pattern}')"
+
+
+def _date(args):
+    if len(args) == 1:
+        return f"CAST({args[0]} AS DATE)"
+    modifier = _DATE_MODIFIER.match(args[1]) if len(args) == 2 else None
+    if not modifier:
+        return None
+    amount, unit = modifier.groups()
+    return f"CAST(CAST({args[0]} AS DATE) + INTERVAL '{amount} {unit.lower()}' AS DATE)"
+
+
+def _group_concat(args):
+    value = args[0]
+    distinct = ''
+    if value.upper().startswith('DISTINCT '):
+        distinct, value = 'DISTINCT ', value[9:]
+    separator = args[1] if len(args) > 1 else "','"
+    return f"string_agg({distinct}CAST({value} AS TEXT), {separator})"
+
+
+_FUNCTION_REWRITES = [
+    ('strftime', _strftime),
+    ('date', _date),
+    ('group_concat', _group_concat),
+    ('substr', lambda args: f"substr(CAST({args[0]} AS TEXT), {', '.join(args[1:])})"),
+    # round(double precision, int) does not exist in PostgreSQL
+    ('round', lambda args: f"round(CAST({args[0]} AS NUMERIC), {args[1]})" if len(args) == 2 else None),
+    ('ifnull', lambda args: f"COALESCE({', '.join(args)})"),
+]
+
+
+def _translate_tokens(sql):
+    """'?' to %s, '%' to %%, and LIKE to ILIKE (SQLite's LIKE ignores ASCII case)."""
+    out = []
+    last = 0
+    for match in _TOKEN.finditer(sql):
+        out.append(re.sub(r'\bLIKE\b', 'ILIKE', sql[last:match.start()], flags=re.IGNORECASE))
+        token = match.group()
+        if token == '?':
+            out.append('%s')
+        else:
+            out.append(token.replace('%', '%%'))
+        last = match.end()
+    out.append(re.sub(r'\bLIKE\b', 'ILIKE', sql[last:], flags=re.IGNORECASE))
+    return ''.join(out)
+
+
+class Statement:
+    """A translated statement: PostgreSQL SQL plus how to run it."""
+
+    __slots__ = ('sql', 'returns_id', 'is_ddl')
+
+    def __init__(self, sql, returns_id=False, is_ddl=False):
+        self.sql = sql
+        self.returns_id = returns_id
+        self.is_ddl = is_ddl
+
+
+class Dialect:
+    """
+    Translates SQLite-dialect statements for one PostgreSQL database.
+    Upserts and lastrowid need to know each table's unique keys and
+    whether it has an id column; these are read from the catalog on first
+    use and re-read after DDL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._catalog = None    # {table: {'id': bool, 'unique': [[columns], ...]}}
+
+    def translate(self, sql, connection, many=False):
+        """
+        PostgreSQL form of a SQLite statement.
+
+        Args:
+            sql (str): SQLite-dialect SQL
+            connection: psycopg2 connection, used for catalog lookups
+            many (bool): Statement is for executemany (no RETURNING)
+
+        Returns:
+            Statement: Translated statement, or None for a no-op PRAGMA
+        """
+        key = (sql, many)
+        statement = self._statements.get(key)
+        if statement is not None or key in self._statements:
+            return statement
+
+        statement = self._translate(sql, connection, many)
+        with self._lock:
+            if len(self._statements) >= STATEMENT_CACHE_SIZE:
+                self._statements.clear()
+            self._statements[key] = statement
+        return statement
+
+    def forget_catalog(self):
+        """Drop cached table metadata and translations (after DDL)."""
+        with self._lock:
+            self._catalog = None
+            self._statements.clear()
+
+    def _translate(self, sql, connection, many):
+        table_info = _PRAGMA_TABLE_INFO.match(sql)
+        if table_info:
+            return Statement(
+                "SELECT ordinal_position - 1, column_name, data_type, "
+                "CASE WHEN is_nullable = 'NO' THEN 1 ELSE 0 END, column_default, 0 "
+                "FROM information_schema.columns "
+                f"WHERE table_schema = current_schema() AND table_name = '{table_info.group(1).lower()}' "
+                "ORDER BY ordinal_position")
+        if _PRAGMA.match(sql):
+            return None
+
+        is_ddl = bool(_DDL.match(sql))
+        if _TABLE_DDL.match(sql):
+            for pattern, replacement in _DDL_REWRITES:
+                sql = pattern.sub(replacement, sql)
+
+        for name, rewrite in _FUNCTION_REWRITES:
+            if name in sql.lower():
+                sql = _rewrite_calls(sql, name, rewrite)
+
+        suffix = ''
+        conflict = _INSERT_OR.match(sql)
+        if conflict:
+            sql = _INSERT_OR.sub(r'\1INSERT INTO', sql, count=1)
+            suffix = self._on_conflict(sql, conflict.group(2).upper(), connection)
+
+        returns_id = False
+        insert = _INSERT_TABLE.match(sql)
+        if insert and not many and 'RETURNING' not in sql.upper():
+            table = self._table(insert.group(1), connection)
+            returns_id = bool(table and table['id'])
+            if returns_id:
+                suffix += ' RETURNING id'
+
+        sql = _translate_tokens(sql)
+        if suffix:
+            sql = sql.rstrip().rstrip(';') + suffix
+        return Statement(sql, returns_id, is_ddl)
+
+    def _on_conflict(self, sql, action, connection):
+        if action == 'IGNORE':
+            return ' ON CONFLICT DO NOTHING'
+
+        insert = _INSERT_TABLE.match(sql)
+        table = self._table(insert.group(1), connection) if insert else None
+        columns = [c.strip().lower() for c in (insert.group(2) or '').split(',') if c.strip()] if insert else []
+        keys = [key for key in (table or {}).get('unique', []) if set(key) <= set(columns)]
+        if not keys:
+            raise sqlite3.OperationalError(f"No unique key to replace on for: {sql.strip()[:80]}")
+
+        updates = [c for c in columns if c not in keys[0]]
+        if not updates:
+            return f" ON CONFLICT ({', '.join(keys[0])}) DO NOTHING"
+        assignments = ', '.join(f"{c} = EXCLUDED.{c}" for c in updates)
+        return f" ON CONFLICT ({', '.join(keys[0])}) DO UPDATE SET {assignments}"
+
+    def _table(self, name, connection):
+        with self._lock:
+            catalog = self._catalog
+        if catalog is None or name.lower() not in catalog:
+            # Runs inside the caller's transaction, so its own new tables are visible
+            catalog = self._load_catalog(connection)
+        return catalog.get(name.lower())
+
+    def _load_catalog(self, connection):
+        catalog = {}
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT table_name, column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND column_name = 'id'
+            """)
+            for table, _ in cursor.fetchall():
+                catalog.setdefault(table, {'id': False, 'unique': []})['id'] = True
+
+            # Unique indexes (primary keys included), listed column by column
+            cursor.execute("""
+                SELECT t.relname, i.relname, a.attname
+                FROM pg_index x
+                JOIN pg_class t ON t.oid = x.indrelid
+                JOIN pg_class i ON i.oid = x.indexrelid
+                JOIN pg_namespace n ON n.oid = t.relnamespace
+                JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, position) ON true
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+                WHERE x.indisunique AND n.nspname = current_schema()
+                ORDER BY t.relname, x.indisprimary, i.relname, k.position
+            """)
+            indexes = {}
+            for table, index, column in cursor.fetchall():
+                indexes.setdefault((table, index), []).append(column)
+            for (table, _), columns in indexes.items():
+                catalog.setdefault(table, {'id': False, 'unique': []})['unique'].append(columns)
+
+        with self._lock:
+            self._catalog = catalog
+        return catalog
+
+
+# ===============================================
+# Rows, Cursors and Connections
+# ===============================================
+
+class Row:
+    """sqlite3.Row stand-in: index, column-name and keys() access."""
+
+    __slots__ = ('_values', '_index')
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return self._values[self._index[key]]
+            except KeyError:
+                return self._values[self._index[key.lower()]]
+        return self._values[key]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self._values == other._values and self.keys() == other.keys()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._values)
+
+    def __repr__(self):
+        return f"<Row {dict(zip(self.keys(), self._values))}>"
+
+    def keys(self):
+        return list(self._index)
+
+
+def _sqlite_error(error):
+    """The sqlite3 exception matching a psycopg2 error."""
+    if isinstance(error, psycopg2.IntegrityError):
+        cls = sqlite3.IntegrityError
+    elif isinstance(error, (psycopg2.OperationalError, psycopg2.ProgrammingError)):
+        cls = sqlite3.OperationalError
+    elif isinstance(error, psycopg2.DataError):
+        cls = sqlite3.DataError
+    else:
+        cls = sqlite3.DatabaseError
+    return cls(str(error).strip())
+
+
+class PgCursor:
+    """DB-API cursor with sqlite3 semantics over a psycopg2 cursor."""
+
+    arraysize = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._raw.cursor()
+        self._index = None
+        self._statement = None  # trace record of the last statement
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _params(self, parameters):
+        # SQLite stores booleans as 0/1; PostgreSQL would reject them for INTEGER columns
+        return tuple(int(p) if isinstance(p, bool) else p for p in (parameters or ()))
+
+    def _run(self, sql, parameters, many=False):
+        connection = self.connection
+        statement = connection._pool.dialect.translate(sql, connection._raw, many)
+        self._index = None
+        self.lastrowid = None
+        if statement is None:
+            return self
+
+        tally = db_helpers.current_query_tally()
+        start = time.perf_counter()
+        try:
+            if many:
+                psycopg2.extras.execute_batch(self._cursor, statement.sql,
+                                              [self._params(p) for p in parameters], page_size=500)
+            else:
+                self._cursor.execute(statement.sql, self._params(parameters))
+                if statement.returns_id:
+                    row = self._cursor.fetchone()
+                    self.lastrowid = row[0] if row else None
+        except psycopg2.Error as e:
+            raise _sqlite_error(e) from e
+        finally:
+            if tally is not None:
+                self._statement = tally.record(connection, sql, start, time.perf_counter() - start)
+
+        if statement.is_ddl:
+            connection._pool.dialect.forget_catalog()
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._run(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sql, seq_of_parameters, many=True)
+
+    def executescript(self, sql_script):
+        for sql in sql_script.split(';'):
+            if sql.strip():
+                self._run(sql, ())
+        self.connection.commit()
+        return self
+
+    def _rows(self, rows):
+        if self.connection.row_factory is not sqlite3.Row:
+            return rows
+        if self._index is None:
+            self._index = {column.name: i for i, column in enumerate(self._cursor.description)}
+        return [Row(row, self._index) for row in rows]
+
+    def _fetch(self, method, *args):
+        if self._cursor.description is None:
+            return None if method == 'fetchone' else []
+        tally = db_helpers.current_query_tally()
+        start = time.perf_counter()
+        try:
+            rows = getattr(self._cursor, method)(*args)
+        except psycopg2.Error as e:
+            raise _sqlite_error(e) from e
+        if tally is not None:
+            elapsed = time.perf_counter() - start
+            tally.seconds += elapsed
+            if self._statement is not None:
+                self._statement.add_fetch((rows is not None) if method == 'fetchone' else len(rows), elapsed)
+        if method == 'fetchone':
+            return None if rows is None else self._rows([rows])[0]
+        return self._rows(rows)
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, size=None):
+        return self._fetch('fetchmany', self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._cursor.close()
+
+
+class PgConnection:
+    """A pooled psycopg2 connection that behaves like a sqlite3 connection."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.database = pool.label
+        self.row_factory = None
+        self._unit = None   # the db_helpers.UnitOfWork this connection belongs to, if any
+
+    def cursor(self):
+        return PgCursor(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    @property
+    def in_transaction(self):
+        return self._raw is not None and \
+            self._raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        if self._unit is not None:
+            return
+        db_helpers.count_commit(self)
+        try:
+            self._raw.commit()
+        except psycopg2.Error as e:
+            raise _sqlite_error(e) from e
+
+    def rollback(self):
+        if self._unit is not None:
+            self._unit.failed = True
+        self._raw.rollback()
+
+    def close(self):
+        """Return the connection to its pool; uncommitted work is rolled back."""
+        if self._unit is not None:
+            self._unit.leave(self)
+        elif self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same as sqlite3: commit or roll back, but leave the connection open
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# ===============================================
+# Connection Pools
+# ===============================================
+
+if psycopg2 is not None:
+    # SQLite hands back dates and timestamps as text and DECIMAL as float
+    _ISO_TEXT = psycopg2.extensions.new_type((1082, 1083, 1114, 1184), 'BIZDRIVE_ISO_TEXT',
+                                             lambda value, cursor: value)
+    _NUMERIC_FLOAT = psycopg2.extensions.new_type((1700,), 'BIZDRIVE_NUMERIC_FLOAT',
+                                                  lambda value, cursor: None if value is None else float(value))
+
+
+class ConnectionPool:
+    """A bounded pool of psycopg2 connections for one database URL."""
+
+    def __init__(self, url, size=POOL_SIZE):
+        self.url = url
+        self.label = redact_url(url)
+        self.size = size
+        self.dialect = Dialect()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout=POOL_TIMEOUT):
+        """
+        Borrow a connection, opening one if none are idle.
+
+        Raises:
+            sqlite3.OperationalError: If no connection frees up within timeout
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError(
+                f"database pool exhausted: {self.size} connections busy for {timeout:g}s")
+        with self._lock:
+            raw = self._idle.pop() if self._idle else None
+        if raw is not None and raw.closed:
+            raw = None
+        if raw is None:
+            try:
+                raw = psycopg2.connect(self.url)
+            except psycopg2.Error as e:
+                self._slots.release()
+                raise _sqlite_error(e) from e
+            psycopg2.extensions.register_type(_ISO_TEXT, raw)
+            psycopg2.extensions.register_type(_NUMERIC_FLOAT, raw)
+        return raw
+
+    def release(self, raw):
+        """Return a connection, rolling back anything left uncommitted."""
+        try:
+            if not raw.closed:
+                if raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+                with self._lock:
+                    self._idle.append(raw)
+        except psycopg2.Error:
+            raw.close()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close idle connections (borrowed ones close when returned)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw in idle:
+            raw.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url):
+    """The shared pool for a database URL."""
+    pool = _pools.get(url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(url, ConnectionPool(url))
+    return pool
+
+
+def connect(url, timeout=POOL_TIMEOUT, **kwargs):
+    """
+    Borrow a connection for a PostgreSQL URL.
+
+    Args:
+        url (str): postgresql:// URL
+        timeout (float): Seconds to wait for a free pooled connection
+        **kwargs: sqlite3.connect options with no PostgreSQL meaning (ignored)
+
+    Returns:
+        PgConnection: Connection; close() returns it to the pool
+    """
+    if psycopg2 is None:
+        raise RuntimeError("PostgreSQL support requires psycopg2 (pip install psycopg2-binary)")
+    pool = get_pool(url)
+    return PgConnection(pool, pool.acquire(timeout))
@@ -0,0 +1,148 @@
+"""
+Photo Helper Functions for BizDrive
+Accident photo ingestion pipeline: uploads are written concurrently and
+thumbnails and EXIF-stripped web versions are generated in a worker pool,
+before the route records all photo rows for a request in one transaction
+(accident_helpers.add_accident_photos).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from blob_store import blob_path, store_blob
+from shard_router import each_shard
+from accident_helpers import (
+    ACCIDENT_PHOTO_FOLDER,
+    THUMBNAIL_FOLDER,
+    WEB_FOLDER,
+    get_photos_missing_derivatives,
+    set_photo_derivatives
+)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow missing: originals are still stored, no derivatives
+    Image = None
+
+THUMBNAIL_SIZE = (320, 320)
+WEB_SIZE = (1600, 1600)
+JPEG_QUALITY = 82
+
+PHOTO_WORKERS = int(os.environ.get('BIZDRIVE_PHOTO_WORKERS', '4'))
+
+_photo_pool = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix='photo')
+
+
+# ===============================================
+# Derivative Images
+# ===============================================
+
+def _encode_jpeg(img, **options):
+    """Encode an image as JPEG bytes with no metadata."""
+    buffer = BytesIO()
+    img.save(buffer, 'JPEG', quality=JPEG_QUALITY, **options)
+    return buffer.getvalue()
+
+
+def generate_photo_derivatives(filename):
+    """
+    Create the thumbnail and web version of a stored photo.
+    Orientation from EXIF is applied to the pixels, then all metadata
+    (including GPS) is dropped by re-encoding without it. Both versions
+    are stored as blobs keyed by their own content.
+
+    Args:
+        filename (str): Photo blob key in ACCIDENT_PHOTO_FOLDER
+
+    Returns:
+        tuple: (thumbnail_filename, web_filename), or (None, None) if the
+               image could not be processed
+    """
+    if Image is None:
+        return None, None
+
+    try:
+        with Image.open(blob_path(ACCIDENT_PHOTO_FOLDER, filename)) as img:
+            # JPEG decoders can downscale while decoding, far cheaper than a full decode
+            img.draft('RGB', WEB_SIZE)
+            img = ImageOps.exif_transpose(img).convert('RGB')
+
+            web = img.copy()
+            web.thumbnail(WEB_SIZE)
+            web_filename = store_blob(_encode_jpeg(web, optimize=True), WEB_FOLDER, 'jpg')
+
+            img.thumbnail(THUMBNAIL_SIZE)
+            thumbnail_filename = store_blob(_encode_jpeg(img), THUMBNAIL_FOLDER, 'jpg')
+
+        return thumbnail_filename, web_filename
+    except Exception as e:
+        print(f"Warning: Could not create photo derivatives for {filename}: {e}")
+        return None, None
+
+
+# ===============================================
+# Photo Ingestion
+# ===============================================
+
+def _store_upload(upload):
+    """Write one upload to the blob store and build its derivatives."""
+    extension = upload.filename.rsplit('.', 1)[1].lower() if '.' in upload.filename else ''
+    photo_filename = store_blob(upload, ACCIDENT_PHOTO_FOLDER, extension)
+    thumbnail_filename, web_filename = generate_photo_derivatives(photo_filename)
+    return {
+        'filename': photo_filename,
+        'thumbnail_filename': thumbnail_filename,
+        'web_filename': web_filename,
+    }
+
+
+def store_accident_photos(uploads):
+    """
+    Write uploaded photos to the blob store and build their derivatives,
+    concurrently in the photo worker pool. No rows are written, so a route
+    can do this before its transaction starts. Uploads over the blob size
+    limit are skipped and reported.
+
+    Args:
+        uploads (list): Werkzeug FileStorage objects (already validated)
+
+    Returns:
+        tuple: (photos, errors) - photo dicts for add_accident_photos and
+               one message per failed upload
+    """
+    futures = [_photo_pool.submit(_store_upload, upload) for upload in uploads]
+
+    photos = []
+    errors = []
+    for future in futures:
+        try:
+            photos.append(future.result())
+        except Exception as e:
+            errors.append(str(e))
+    return photos, errors
+
+
+def backfill_photo_derivatives():
+    """
+    Generate thumbnails and web versions for photos stored before the
+    pipeline existed, shard by shard.
+
+    Returns:
+        int: Number of photos processed
+    """
+    processed = 0
+    for _ in each_shard():
+        photos = get_photos_missing_derivatives()
+        results = _photo_pool.map(lambda photo: (photo['id'], generate_photo_derivatives(photo['filename'])), photos)
+
+        for photo_id, (thumbnail_filename, web_filename) in results:
+            if thumbnail_filename:
+                set_photo_derivatives(photo_id, thumbnail_filename, web_filename)
+                processed += 1
+
+    return processed
+
+
+if __name__ == '__main__':
+    print(f"Generated derivatives for {backfill_photo_derivatives()} photo(s).")
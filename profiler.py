@@ -0,0 +1,351 @@
+"""
+Request Profiler for BizDrive
+Profiles individual requests on demand, so a slow page can be examined
+in production without reproducing it locally. Two modes:
+    sample    a background thread samples the request thread's stack every
+              BIZDRIVE_PROFILE_INTERVAL_MS (default 5) and writes collapsed
+              stacks (one 'frame;frame;frame count' line per stack), ready
+              for flamegraph.pl or speedscope
+    cprofile  deterministic cProfile of the request thread, saved as a
+              pstats dump (python -m pstats <file>)
+
+A request is profiled when an admin sends it with the X-BizDrive-Profile
+header or ?_profile= query flag (value 'sample' or 'cprofile'), or when an
+admin has armed a profile for a user and path (the driver's next matching
+requests are profiled). Armed profiles live in process memory.
+
+Unprofiled requests only pay for a header/query lookup. At most
+PROFILE_CONCURRENCY requests are profiled at once, and sampling stops
+after PROFILE_MAX_SECONDS.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request, session
+
+from auth_helpers import get_user_by_id
+
+PROFILE_FOLDER = os.path.join(os.path.dirname(__file__), 'profiles')
+PROFILE_MODES = ('sample', 'cprofile')
+PROFILE_HEADER = 'X-BizDrive-Profile'
+PROFILE_QUERY_FLAG = '_profile'
+
+PROFILE_INTERVAL = float(os.environ.get('BIZDRIVE_PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_MAX_SECONDS = 120
+PROFILE_CONCURRENCY = 2
+
+# Profiles kept on disk; older ones are deleted
+PROFILE_KEEP = 200
+
+os.makedirs(PROFILE_FOLDER, exist_ok=True)
+
+_lock = threading.Lock()
+_active = 0
+_armed = []     # [{'id', 'user_id', 'path', 'mode', 'remaining', 'expires'}]
+
+
+# ===============================================
+# Profilers
+# ===============================================
+
+class StackSampler:
+    """Sample one thread's Python stack from a background thread."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bizdrive-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        deadline = time.monotonic() + PROFILE_MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed-stack text, hottest stacks first."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, limit=15):
+        """Leaf frames with the most samples."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [{'frame': frame, 'samples': count} for frame, count in leaves.most_common(limit)]
+
+
+def _pstats_summary(profile, limit=25):
+    output = io.StringIO()
+    stats = pstats.Stats(profile, stream=output)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+# ===============================================
+# Triggering
+# ===============================================
+
+def arm_profile(user_id, path, mode='sample', count=1, expires_minutes=60):
+    """
+    Profile a user's next requests to a path.
+
+    Args:
+        user_id (int): User whose requests are profiled
+        path (str): Path prefix, e.g. '/trips'
+        mode (str): 'sample' or 'cprofile'
+        count (int): Number of requests to profile
+        expires_minutes (int): Disarm after this long
+
+    Returns:
+        tuple: (success, message, arm_id)
+    """
+    if mode not in PROFILE_MODES:
+        return False, f"Mode must be one of: {', '.join(PROFILE_MODES)}", None
+    if not path or not path.startswith('/'):
+        return False, "Path must start with /", None
+    if count < 1:
+        return False, "Count must be at least 1", None
+
+    arm_id = uuid.uuid4().hex[:12]
+    with _lock:
+        _armed.append({
+            'id': arm_id,
+            'user_id': user_id,
+            'path': path,
+            'mode': mode,
+            'remaining': count,
+            'expires': time.time() + expires_minutes * 60,
+        })
+    return True, "Profile armed", arm_id
+
+
+def list_armed_profiles():
+    """Armed profiles that have not expired."""
+    now = time.time()
+    with _lock:
+        _armed[:] = [arm for arm in _armed if arm['expires'] > now and arm['remaining'] > 0]
+        return [dict(arm, expires=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(arm['expires'])))
+                for arm in _armed]
+
+
+def _take_armed(user_id, path):
+    """Consume a matching armed profile and return its mode, or None."""
+    now = time.time()
+    with _lock:
+        for arm in _armed:
+            if (arm['user_id'] == user_id and path.startswith(arm['path'])
+                    and arm['remaining'] > 0 and arm['expires'] > now):
+                arm['remaining'] -= 1
+                return arm['mode']
+    return None
+
+
+def _requested_mode():
+    """Profile mode asked for by the current request, if its user may ask."""
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_FLAG)
+    user_id = session.get('user_id')
+
+    if flag and user_id:
+        mode = 'sample' if flag == '1' else flag.lower()
+        user = get_user_by_id(user_id)
+        if mode in PROFILE_MODES and user and user['role'] == 'admin':
+            return mode
+
+    if _armed and user_id:
+        return _take_armed(user_id, request.path)
+    return None
+
+
+# ===============================================
+# Flask Hooks
+# ===============================================
+
+def init_profiler(app):
+    """
+    Register the profiling hooks.
+
+    Args:
+        app (Flask): The application
+    """
+
+    @app.before_request
+    def _profile_start_request():
+        global _active
+        if not (_armed or PROFILE_HEADER in request.headers or PROFILE_QUERY_FLAG in request.args):
+            return
+
+        mode = _requested_mode()
+        if mode is None:
+            return
+
+        with _lock:
+            if _active >= PROFILE_CONCURRENCY:
+                print(f"Warning: profile of {request.path} skipped, {_active} already running")
+                return
+            _active += 1
+
+        state = {
+            'id': f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+            'mode': mode,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint or 'unmatched',
+            'method': request.method,
+            'user_id': session.get('user_id'),
+            'started': time.time(),
+            'start': time.perf_counter(),
+        }
+        if mode == 'cprofile':
+            state['profiler'] = cProfile.Profile()
+            state['profiler'].enable()
+        else:
+            state['profiler'] = StackSampler(threading.get_ident())
+            state['profiler'].start()
+        g._profile = state
+
+    @app.after_request
+    def _profile_after_request(response):
+        state = g.get('_profile')
+        if state is not None:
+            response.headers['X-BizDrive-Profile-Id'] = state['id']
+            status = response.status_code
+            if response.direct_passthrough:
+                # File responses skip close callbacks: stop at teardown
+                state['status'] = status
+            else:
+                # Streamed bodies are still being produced: stop on close
+                response.call_on_close(lambda: _finish_profile(state, status))
+        return response
+
+    @app.teardown_request
+    def _profile_teardown_request(error):
+        state = g.get('_profile')
+        if state is not None and (error is not None or 'status' in state):
+            _finish_profile(state, 500 if error is not None else state['status'])
+
+
+def _finish_profile(state, status):
+    global _active
+    if state.get('done'):
+        return
+    state['done'] = True
+    seconds = time.perf_counter() - state['start']
+    profiler = state['profiler']
+
+    try:
+        if state['mode'] == 'cprofile':
+            profiler.disable()
+            filename = f"{state['id']}.pstats"
+            profiler.dump_stats(os.path.join(PROFILE_FOLDER, filename))
+            summary = _pstats_summary(profiler)
+            samples = None
+        else:
+            profiler.stop()
+            filename = f"{state['id']}.collapsed"
+            with open(os.path.join(PROFILE_FOLDER, filename), 'w') as f:
+                f.write(profiler.collapsed())
+            summary = profiler.summary()
+            samples = profiler.samples
+
+        metadata = {
+            'id': state['id'],
+            'mode': state['mode'],
+            'path': state['path'],
+            'endpoint': state['endpoint'],
+            'method': state['method'],
+            'status': status,
+            'user_id': state['user_id'],
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state['started'])),
+            'ms': round(seconds * 1000, 2),
+            'samples': samples,
+            'filename': filename,
+            'summary': summary,
+        }
+        with open(os.path.join(PROFILE_FOLDER, f"{state['id']}.json"), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        _prune_profiles()
+    except OSError as e:
+        print(f"Warning: could not save profile {state['id']}: {e}")
+    finally:
+        with _lock:
+            _active -= 1
+
+
+# ===============================================
+# Stored Profiles
+# ===============================================
+
+def _prune_profiles():
+    """Delete the oldest profiles beyond PROFILE_KEEP."""
+    ids = sorted(name[:-5] for name in os.listdir(PROFILE_FOLDER) if name.endswith('.json'))
+    for profile_id in ids[:-PROFILE_KEEP]:
+        for name in os.listdir(PROFILE_FOLDER):
+            if name.startswith(profile_id + '.'):
+                try:
+                    os.remove(os.path.join(PROFILE_FOLDER, name))
+                except OSError:
+                    pass
+
+
+def list_profiles():
+    """
+    Stored profiles, newest first, without their summaries.
+
+    Returns:
+        list: Profile metadata dictionaries
+    """
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_FOLDER), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(PROFILE_FOLDER, name)) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metadata.pop('summary', None)
+        profiles.append(metadata)
+    return profiles
+
+
+def get_profile(profile_id):
+    """
+    Metadata (with summary) and file path of a stored profile.
+
+    Returns:
+        tuple: (metadata, path), or (None, None) if unknown
+    """
+    if not profile_id or '/' in profile_id or '\\' in profile_id or profile_id.startswith('.'):
+        return None, None
+    try:
+        with open(os.path.join(PROFILE_FOLDER, f"{profile_id}.json")) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    return metadata, os.path.join(PROFILE_FOLDER, metadata['filename'])
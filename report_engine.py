@@ -0,0 +1,401 @@
+"""
+Report Engine for BizDrive
+Shared PDF layout for every export. Each document draws its header (logo,
+titles, rule) and footer rule once into a form XObject and stamps it on
+every page; each table draws its column headings once into a form as
+well, so a page break costs two form references instead of re-drawing
+the page furniture.
+
+Rows come from any iterable, normally a streaming cursor, and are written
+into one text object per page, so memory is bounded by a page rather than
+the result set. Columns and totals are declared with Column specs.
+"""
+
+import os
+from datetime import datetime
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import getFont
+from reportlab.pdfgen import canvas
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'static', 'images', 'BizDrive-logo.png')
+BRAND_TITLE = "BizDrive Fleet Management"
+
+PAGE_SIZE = letter
+MARGIN = 40
+TABLE_LEFT = 50
+CONTENT_TOP = 130       # Distance from the top of the page to the first line
+CONTENT_BOTTOM = 80     # Rows stop above this height
+ROW_HEIGHT = 15
+
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+
+# Process-wide logo cache: (mtime, ImageReader)
+_logo_cache = {}
+
+# Characters that must be escaped (or flattened) inside a PDF string
+_PDF_ESCAPES = str.maketrans({'\\': '\\\\', '(': '\\(', ')': '\\)', '\n': ' ', '\r': ' ', '\t': ' '})
+
+
+def _pdf_number(value):
+    """Format a coordinate the way PDF operators expect it."""
+    return str(int(value)) if value == int(value) else f"{value:.2f}"
+
+
+def get_logo():
+    """
+    Load the BizDrive logo once and reuse it across documents.
+    The image is re-read only if the file changes.
+
+    Returns:
+        ImageReader: The logo, or None if it is missing or unreadable
+    """
+    try:
+        mtime = os.path.getmtime(LOGO_PATH)
+    except OSError:
+        return None
+
+    cached = _logo_cache.get(LOGO_PATH)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        logo = ImageReader(LOGO_PATH)
+    except Exception as e:
+        print(f"Warning: Could not load report logo: {e}")
+        logo = None
+
+    _logo_cache[LOGO_PATH] = (mtime, logo)
+    return logo
+
+
+# ===============================================
+# Column Specs
+# ===============================================
+
+class Column:
+    """
+    Declarative table column.
+
+    Args:
+        title (str): Heading text
+        key (str or callable): Row key, or function of the row
+        x (float): Left edge of the column (right edge if align='right')
+        max_chars (int, optional): Truncate longer values
+        fmt (callable, optional): Formats the raw value for display
+        align (str): 'left' or 'right'
+        total (str, optional): 'sum' or 'count' to add a totals row entry
+    """
+
+    def __init__(self, title, key, x, max_chars=None, fmt=None, align='left', total=None):
+        self.title = title
+        self.key = key
+        self.x = x
+        self.max_chars = max_chars
+        self.fmt = fmt
+        self.align = align
+        self.total = total
+
+    def value(self, row):
+        if callable(self.key):
+            return self.key(row)
+        try:
+            return row[self.key]
+        except (KeyError, IndexError):
+            return None
+
+    def text(self, value):
+        if self.fmt:
+            text = self.fmt(value)
+        else:
+            text = '' if value is None else str(value)
+        if self.max_chars:
+            text = text[:self.max_chars]
+        return text
+
+
+def money(value):
+    """Format a number as dollars."""
+    return f"${float(value or 0):.2f}"
+
+
+def kilometres(value):
+    """Format a number as kilometres."""
+    return f"{float(value or 0):.1f} km"
+
+
+# ===============================================
+# Documents
+# ===============================================
+
+class ReportDocument:
+    """
+    A branded, paginated PDF report.
+
+    Args:
+        output: File path or binary file-like object
+        title (str): PDF document title
+        subtitle (str): Heading shown under the BizDrive title
+        pagesize (tuple): Page size in points
+        page_prefix (str): Text shown before the page number in the footer
+    """
+
+    def __init__(self, output, title, subtitle, pagesize=PAGE_SIZE, page_prefix=''):
+        self.canvas = canvas.Canvas(output, pagesize=pagesize)
+        self.canvas.setTitle(title)
+        self.width, self.height = pagesize
+        self.subtitle = subtitle
+        self.page_prefix = page_prefix
+        self.page_number = 0
+        self.table_count = 0
+        self.y = None
+
+        self._define_page_template()
+        self._start_page()
+
+    def _define_page_template(self):
+        """Draw the static header and footer once into a form XObject."""
+        c = self.canvas
+        width, height = self.width, self.height
+
+        c.beginForm('page_template')
+
+        logo = get_logo()
+        if logo:
+            c.drawImage(logo, MARGIN, height - 80, width=60, height=40,
+                        preserveAspectRatio=True, mask='auto')
+
+        c.setFont(BOLD_FONT, 16)
+        c.drawString(120, height - 60, BRAND_TITLE)
+        c.setFont(BOLD_FONT, 14)
+        c.drawString(120, height - 80, self.subtitle)
+        c.setFont(FONT, 10)
+        c.drawString(120, height - 95, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+        c.setStrokeColorRGB(0.2, 0.2, 0.2)
+        c.line(MARGIN, height - 110, width - MARGIN, height - 110)
+        c.line(MARGIN, 50, width - MARGIN, 50)
+        c.setFont(FONT, 8)
+        c.drawString(MARGIN, 38, f"{BRAND_TITLE} - {self.subtitle}")
+
+        c.endForm()
+
+    def _start_page(self):
+        self.page_number += 1
+        self.canvas.doForm('page_template')
+        self.y = self.height - CONTENT_TOP
+
+    def _end_page(self):
+        self.canvas.setFont(FONT, 8)
+        self.canvas.drawRightString(self.width - MARGIN, 38, f"{self.page_prefix}Page {self.page_number}")
+
+    def new_page(self):
+        """Finish the current page and start another."""
+        self._end_page()
+        self.canvas.showPage()
+        self._start_page()
+
+    def ensure_space(self, needed):
+        """Start a new page unless `needed` points remain above the bottom margin."""
+        if self.y - needed < CONTENT_BOTTOM:
+            self.new_page()
+
+    # ---------------------------------------------
+    # Content
+    # ---------------------------------------------
+
+    def add_heading(self, text, size=12):
+        """Add a bold section heading."""
+        self.ensure_space(45)
+        self.canvas.setFont(BOLD_FONT, size)
+        self.canvas.drawString(TABLE_LEFT, self.y, text)
+        self.y -= 25
+
+    def add_key_values(self, pairs, value_x=200, size=10):
+        """
+        Add label/value lines, such as summary statistics.
+
+        Args:
+            pairs (list): (label, value) tuples
+            value_x (float): Left edge of the values
+            size (int): Font size
+        """
+        c = self.canvas
+        for label, value in pairs:
+            self.ensure_space(20)
+            c.setFont(BOLD_FONT, size)
+            c.drawString(TABLE_LEFT, self.y, label)
+            c.drawString(value_x, self.y, str(value))
+            self.y -= 20
+        self.y -= 10
+
+    def _define_table_heading(self, name, columns, size):
+        """Draw a table's column headings once into a form XObject."""
+        c = self.canvas
+        # Drawn at the origin and positioned with a translation when used
+        c.beginForm(name, lowerx=0, lowery=-10, upperx=self.width, uppery=size + 5)
+        c.setFont(BOLD_FONT, size)
+        for column in columns:
+            if column.align == 'right':
+                c.drawRightString(column.x, 0, column.title)
+            else:
+                c.drawString(column.x, 0, column.title)
+        c.setStrokeColorRGB(0.2, 0.2, 0.2)
+        c.line(TABLE_LEFT, -5, self.width - TABLE_LEFT, -5)
+        c.endForm()
+
+    def _draw_table_heading(self, name):
+        c = self.canvas
+        c.saveState()
+        c.translate(0, self.y)
+        c.doForm(name)
+        c.restoreState()
+        self.y -= 20
+
+    def add_table(self, columns, rows, font_size=10, heading_size=11, totals_label='Total'):
+        """
+        Add a table, breaking pages as needed.
+
+        Args:
+            columns (list): Column specs
+            rows (iterable): Rows (dicts, sqlite3.Row or sequences); consumed once
+            font_size (int): Body font size
+            heading_size (int): Column heading font size
+            totals_label (str): Label for the totals row
+
+        Returns:
+            dict: row_count and totals keyed by column title
+        """
+        c = self.canvas
+        self.table_count += 1
+        heading = f"table_heading_{self.table_count}"
+        self._define_table_heading(heading, columns, heading_size)
+
+        totals = {column.title: 0 for column in columns if column.total}
+        layout = [(column, column.align == 'right', _pdf_number(column.x)) for column in columns]
+        widths = getFont(FONT).widths
+        scale = font_size / 1000
+        row_count = 0
+
+        self.ensure_space(40)
+        self._draw_table_heading(heading)
+        c.setFont(FONT, font_size)
+
+        # Plain ASCII cells are written straight into one text object per
+        # page; anything else goes through reportlab's encoder
+        operations = []
+
+        for row in rows:
+            if self.y < CONTENT_BOTTOM:
+                self._write_text(operations)
+                self.new_page()
+                self._draw_table_heading(heading)
+                c.setFont(FONT, font_size)
+
+            y = _pdf_number(self.y)
+            for column, right, x in layout:
+                value = column.value(row)
+                cell = column.text(value)
+                if column.total == 'sum':
+                    totals[column.title] += float(value or 0)
+                elif column.total == 'count' and value:
+                    totals[column.title] += 1
+                if not cell:
+                    continue
+
+                if not cell.isascii():
+                    if right:
+                        c.drawRightString(column.x, self.y, cell)
+                    else:
+                        c.drawString(column.x, self.y, cell)
+                    continue
+
+                if right:
+                    x = f"{column.x - sum(widths[ord(char)] for char in cell) * scale:.2f}"
+                operations.append(f"1 0 0 1 {x} {y} Tm ({cell.translate(_PDF_ESCAPES)}) Tj")
+
+            row_count += 1
+            self.y -= ROW_HEIGHT
+
+        self._write_text(operations)
+
+        if totals:
+            self._draw_totals(columns, totals, totals_label, heading_size)
+
+        return {'row_count': row_count, 'totals': totals}
+
+    def _write_text(self, operations):
+        """Emit buffered text operations as a single text object."""
+        if operations:
+            self.canvas.addLiteral("BT\n" + "\n".join(operations) + "\nET")
+            operations.clear()
+
+    def _draw_totals(self, columns, totals, label, size):
+        c = self.canvas
+        self.ensure_space(30)
+        c.setStrokeColorRGB(0.2, 0.2, 0.2)
+        c.line(TABLE_LEFT, self.y + 10, self.width - TABLE_LEFT, self.y + 10)
+        c.setFont(BOLD_FONT, size)
+        self.y -= 5
+
+        if not columns[0].total:
+            c.drawString(columns[0].x, self.y, f"{label}:")
+
+        for column in columns:
+            if not column.total:
+                continue
+            total = totals[column.title]
+            cell = column.text(total) if column.total == 'sum' else str(total)
+            if column.align == 'right':
+                c.drawRightString(column.x, self.y, cell)
+            else:
+                c.drawString(column.x, self.y, cell)
+
+        self.y -= 25
+
+    def finish(self):
+        """Close the last page and write the PDF."""
+        self._end_page()
+        self.canvas.save()
+
+
+# ===============================================
+# Report Definitions
+# ===============================================
+
+EXPENSE_COLUMNS = [
+    Column("Date", 'expense_date', 50),
+    Column("Vehicle", 'vehicle_registration', 130),
+    Column("Category", 'expense_type', 220),
+    Column("Description", 'notes', 320, max_chars=30),
+    Column("Amount", 'amount', 540, fmt=money, align='right', total='sum'),
+]
+
+TRIP_COLUMNS = [
+    Column("Date", 'trip_date', 50),
+    Column("Vehicle", 'registration', 110),
+    Column("From", 'from_address', 180, max_chars=20),
+    Column("To", 'to_address', 250, max_chars=20),
+    Column("Purpose", 'purpose', 320, max_chars=25),
+    Column("Distance", 'distance', 455, fmt=kilometres, align='right', total='sum'),
+    Column("Type", 'trip_type', 470),
+]
+
+VEHICLE_COLUMNS = [
+    Column("Registration", 'registration', 50),
+    Column("Make", 'make', 130, max_chars=14),
+    Column("Model", 'model', 210, max_chars=10),
+    Column("Year", 'year', 270),
+    Column("Odometer", 'odometer', 330),
+    Column("Status", 'status', 400),
+    Column("Purchase Date", 'purchase_date', 480),
+]
+
+# Admin report rows are plain (month, trips, distance) tuples
+MONTHLY_TRIP_COLUMNS = [
+    Column("Month", 0, 50, fmt=lambda month: datetime.strptime(month, '%m').strftime('%B')),
+    Column("Trips", 1, 250, align='right', total='sum', fmt=lambda trips: f"{int(trips or 0)}"),
+    Column("Distance", 2, 400, fmt=kilometres, align='right', total='sum'),
+]
@@ -0,0 +1,556 @@
+"""
+Report Jobs for BizDrive
+Fleet-wide admin PDF reports are split into sections (a summary plus one
+section per user per month), rendered in a process pool and concatenated.
+Reports run as background jobs whose progress and finished file are
+tracked in the report_jobs table, so the admin pages poll a status
+endpoint instead of holding a request open for minutes. With sharding on,
+each user section reads the user's shard and the summary adds up every
+shard. Jobs read report snapshots (report_snapshots.py) rather than the
+live database, so a report is consistent and never holds up drivers.
+
+Jobs run on daemon threads, so a restart abandons them: on startup, jobs
+whose process has gone are marked failed. Finished PDFs (and their job
+rows) are removed after REPORT_RETENTION_DAYS.
+
+Concatenation needs pypdf. Without it, or with a single worker, the
+sections are drawn one after another into a single document instead.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from io import BytesIO
+
+from archive_store import archive_sources, with_archives
+from db_helpers import DATABASE, get_connection, get_directory_connection
+from shard_router import SHARDING, shard_databases
+from report_snapshots import report_snapshot
+from report_engine import (
+    ReportDocument,
+    Column,
+    EXPENSE_COLUMNS,
+    MONTHLY_TRIP_COLUMNS,
+    kilometres
+)
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # pypdf missing: reports render in a single process
+    PdfWriter = None
+
+REPORT_FOLDER = os.path.join(os.path.dirname(__file__), 'reports')
+
+REPORT_WORKERS = int(os.environ.get('BIZDRIVE_REPORT_WORKERS', str(os.cpu_count() or 1)))
+
+REPORT_KINDS = ('annual', 'full')
+
+# Days finished reports are kept before their PDF and job row are removed
+REPORT_RETENTION_DAYS = int(os.environ.get('BIZDRIVE_REPORT_RETENTION_DAYS', '30'))
+
+# Trips inside a user section: the vehicle column replaces the type
+SECTION_TRIP_COLUMNS = [
+    Column("Date", 'trip_date', 50),
+    Column("Vehicle", 'registration', 110),
+    Column("From", 'from_address', 180, max_chars=20),
+    Column("To", 'to_address', 290, max_chars=20),
+    Column("Purpose", 'purpose', 400, max_chars=15),
+    Column("Distance", 'distance', 560, fmt=kilometres, align='right', total='sum'),
+]
+
+os.makedirs(REPORT_FOLDER, exist_ok=True)
+
+
+# ===============================================
+# Job Table
+# ===============================================
+
+def init_report_jobs_table():
+    """Create the report_jobs table if it does not exist."""
+    conn = get_directory_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            year INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            sections_total INTEGER DEFAULT 0,
+            sections_done INTEGER DEFAULT 0,
+            filename TEXT,
+            error TEXT,
+            requested_by INTEGER,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    ''')
+
+    # Process running the job (added after the original schema)
+    cursor.execute("PRAGMA table_info(report_jobs)")
+    if 'worker_pid' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE report_jobs ADD COLUMN worker_pid INTEGER")
+    conn.commit()
+    conn.close()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fail_abandoned_report_jobs():
+    """
+    Mark queued or running jobs whose process has exited as failed, so the
+    admin pages stop polling them. Jobs of other live worker processes
+    are left alone.
+
+    Returns:
+        int: Number of jobs marked failed
+    """
+    conn = get_directory_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, worker_pid FROM report_jobs WHERE status IN ('queued', 'running')")
+    abandoned = [job_id for job_id, pid in cursor.fetchall()
+                 if pid is None or pid == os.getpid() or not _process_alive(pid)]
+    for job_id in abandoned:
+        cursor.execute('''
+            UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', ("Interrupted: the server restarted while the report was running",
+              datetime.utcnow().isoformat(), job_id))
+    conn.commit()
+    conn.close()
+    return len(abandoned)
+
+
+def purge_old_reports(days=REPORT_RETENTION_DAYS):
+    """
+    Delete report PDFs and finished job rows older than the retention
+    period. PDFs no job points at (left by interrupted jobs) go too.
+
+    Args:
+        days (int): Days to keep finished reports
+
+    Returns:
+        int: Number of PDFs deleted
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    conn = get_directory_connection()
+    conn.execute('''
+        DELETE FROM report_jobs
+        WHERE status IN ('complete', 'failed') AND COALESCE(finished_at, created_at) < ?
+    ''', (cutoff.isoformat(),))
+    conn.commit()
+    conn.close()
+
+    deleted = 0
+    for name in os.listdir(REPORT_FOLDER):
+        path = os.path.join(REPORT_FOLDER, name)
+        if not name.endswith('.pdf') or not os.path.isfile(path):
+            continue
+        try:
+            if datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff:
+                os.remove(path)
+                deleted += 1
+        except OSError as e:
+            print(f"Warning: Could not delete report {name}: {e}")
+    return deleted
+
+
+def _update_job(job_id, **fields):
+    conn = get_directory_connection()
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE report_jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+    conn.commit()
+    conn.close()
+
+
+def get_report_job(job_id):
+    """
+    Get a report job's status.
+
+    Args:
+        job_id (str): Job ID
+
+    Returns:
+        dict: Job row with a progress fraction, or None if not found
+    """
+    conn = get_directory_connection()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM report_jobs WHERE id = ?", (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    job = dict(row)
+    job['progress'] = round(job['sections_done'] / job['sections_total'], 3) if job['sections_total'] else 0
+    return job
+
+
+def get_report_job_path(job):
+    """Absolute path of a finished job's PDF, or None."""
+    if job and job['status'] == 'complete' and job['filename']:
+        return os.path.join(REPORT_FOLDER, job['filename'])
+    return None
+
+
+# ===============================================
+# Report Planning
+# ===============================================
+
+def plan_report(kind, year=None, database=DATABASE, databases=None):
+    """
+    Split a report into independently renderable sections.
+
+    Args:
+        kind (str): 'annual' (one calendar year) or 'full' (all time)
+        year (int, optional): Year for annual reports (defaults to this year)
+        database (str): Database path the sections read from (the
+                        application database covers every shard)
+        databases (list, optional): Databases to read instead, one per
+                                    shard (the report's snapshots)
+
+    Returns:
+        tuple: (title, subtitle, sections) where sections are picklable dicts
+    """
+    if kind == 'annual':
+        year = year or datetime.now().year
+        start, end = f"{year}-01-01", f"{year + 1}-01-01"
+        title = f"BizDrive_Annual_Report_{year}"
+        subtitle = f"Annual Summary Report - {year}"
+    else:
+        start, end = '0001-01-01', '9999-12-31'
+        title = "BizDrive_Complete_System_Report"
+        subtitle = "Complete System Report"
+
+    # Sharded: the application database stands for every shard
+    if not databases:
+        databases = shard_databases() if SHARDING and database == DATABASE else [database]
+
+    user_months = []
+    for shard in databases:
+        conn = get_connection(shard)
+        cursor = conn.cursor()
+        cursor.execute(with_archives(conn, '''
+            SELECT a.user_id, u.username, a.month
+            FROM (
+                SELECT user_id, substr(trip_date, 1, 7) as month FROM {trips}
+                WHERE trip_date >= ? AND trip_date < ?
+                UNION
+                SELECT user_id, substr(expense_date, 1, 7) as month FROM {expenses}
+                WHERE expense_date >= ? AND expense_date < ?
+            ) a
+            JOIN users u ON u.id = a.user_id
+            ORDER BY u.username, a.month
+        ''', start, end), (start, end, start, end))
+        user_months.extend((username, month, user_id, shard) for user_id, username, month in cursor.fetchall())
+        conn.close()
+    if len(databases) > 1:
+        user_months.sort()
+
+    base = {'title': title, 'subtitle': subtitle}
+    sections = [dict(base, type='summary', database=databases[0], databases=databases,
+                     start=start, end=end, year=year)]
+
+    for username, month, user_id, shard in user_months:
+        try:
+            month_start = datetime.strptime(month, '%Y-%m').date()
+        except (TypeError, ValueError):
+            continue
+        next_month = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        sections.append(dict(
+            base, type='user_month', database=shard, user_id=user_id, username=username,
+            label=f"{username} - {month_start.strftime('%B %Y')}",
+            start=month_start.isoformat(), end=next_month.isoformat()
+        ))
+
+    return title, subtitle, sections
+
+
+# ===============================================
+# Section Rendering
+# ===============================================
+
+def _summary_figures(cursor, start, end, monthly):
+    """Vehicle, trip, expense and accident totals (and trips per month) from one database."""
+    sources = archive_sources(cursor.connection, start, end)
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(CASE WHEN status = 'Active' THEN 1 ELSE 0 END), 0) FROM vehicles")
+    figures = list(cursor.fetchone())
+    cursor.execute('''
+        SELECT COUNT(*), COALESCE(SUM(distance), 0), COUNT(DISTINCT vehicle_id)
+        FROM {trips} WHERE trip_date >= ? AND trip_date < ?
+    '''.format_map(sources), (start, end))
+    figures.extend(cursor.fetchone())
+    cursor.execute('''
+        SELECT COUNT(*), COALESCE(SUM(amount), 0)
+        FROM {expenses} WHERE expense_date >= ? AND expense_date < ?
+    '''.format_map(sources), (start, end))
+    figures.extend(cursor.fetchone())
+    cursor.execute('''
+        SELECT COUNT(*) FROM {accidents} WHERE accident_date >= ? AND accident_date < ?
+    '''.format_map(sources), (start, end))
+    figures.append(cursor.fetchone()[0])
+
+    months = {}
+    if monthly:
+        cursor.execute('''
+            SELECT strftime('%m', trip_date) as month, COUNT(*) as trips,
+                   COALESCE(SUM(distance), 0) as distance
+            FROM {trips}
+            WHERE trip_date >= ? AND trip_date < ?
+            GROUP BY month
+            ORDER BY month
+        '''.format_map(sources), (start, end))
+        months = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    return figures, months
+
+
+def _draw_summary(report, cursor, section):
+    start, end = section['start'], section['end']
+    monthly = bool(section.get('year'))
+
+    cursor.execute("SELECT COUNT(*) FROM users")
+    total_users = cursor.fetchone()[0]
+
+    # Vehicles live in exactly one shard, so every figure adds up across shards
+    figures, months = _summary_figures(cursor, start, end, monthly)
+    for database in section.get('databases', [section['database']])[1:]:
+        conn = get_connection(database)
+        try:
+            more, more_months = _summary_figures(conn.cursor(), start, end, monthly)
+        finally:
+            conn.close()
+        figures = [total + value for total, value in zip(figures, more)]
+        for month, (trips, distance) in more_months.items():
+            so_far = months.get(month, (0, 0))
+            months[month] = (so_far[0] + trips, so_far[1] + distance)
+
+    (total_vehicles, active_vehicles, trip_count, distance, vehicles_used,
+     expense_count, expense_total, accident_count) = figures
+
+    report.add_heading("Annual Overview" if monthly else "Complete System Overview")
+    report.add_key_values([
+        ("Total Users:", total_users),
+        ("Total Vehicles:", f"{total_vehicles} ({active_vehicles} active)"),
+        ("Total Trips:", f"{trip_count} trips ({distance:.2f} km)"),
+        ("Vehicles Used:", f"{vehicles_used} vehicles"),
+        ("Total Expenses:", f"${expense_total:.2f} ({expense_count} transactions)"),
+        ("Total Accidents:", accident_count),
+    ])
+
+    if monthly:
+        report.add_heading("Monthly Breakdown")
+        report.add_table(MONTHLY_TRIP_COLUMNS, [(month,) + months[month] for month in sorted(months)])
+
+
+def _draw_user_month(report, cursor, section):
+    params = (section['user_id'], section['start'], section['end'])
+    sources = archive_sources(cursor.connection, section['start'], section['end'])
+
+    report.add_heading(section['label'])
+
+    report.add_heading("Trips", size=11)
+    cursor.execute('''
+        SELECT t.trip_date, v.registration, t.from_address, t.to_address, t.purpose, t.distance
+        FROM {trips} t
+        JOIN vehicles v ON t.vehicle_id = v.id
+        WHERE t.user_id = ? AND t.trip_date >= ? AND t.trip_date < ?
+        ORDER BY t.trip_date, t.id
+    '''.format_map(sources), params)
+    report.add_table(SECTION_TRIP_COLUMNS, cursor, font_size=9, heading_size=10)
+
+    report.add_heading("Expenses", size=11)
+    cursor.execute('''
+        SELECT e.expense_date, COALESCE(v.registration, 'N/A') as vehicle_registration,
+               e.expense_type, e.notes, e.amount
+        FROM {expenses} e
+        LEFT JOIN vehicles v ON e.vehicle_id = v.id
+        WHERE e.user_id = ? AND e.expense_date >= ? AND e.expense_date < ?
+        ORDER BY e.expense_date, e.id
+    '''.format_map(sources), params)
+    report.add_table(EXPENSE_COLUMNS, cursor, font_size=9, heading_size=10)
+
+
+SECTION_RENDERERS = {
+    'summary': _draw_summary,
+    'user_month': _draw_user_month,
+}
+
+
+def draw_section(report, section):
+    """Draw one section onto a report document."""
+    conn = get_connection(section['database'])
+    conn.row_factory = sqlite3.Row
+    try:
+        SECTION_RENDERERS[section['type']](report, conn.cursor(), section)
+    finally:
+        conn.close()
+
+
+def render_section(section):
+    """
+    Render one section as a standalone PDF (runs in a worker process).
+
+    Args:
+        section (dict): Section from plan_report
+
+    Returns:
+        bytes: PDF data
+    """
+    buffer = BytesIO()
+    report = ReportDocument(buffer, section['title'], section['subtitle'],
+                            page_prefix=f"{section.get('label', 'Summary')} - ")
+    draw_section(report, section)
+    report.finish()
+    return buffer.getvalue()
+
+
+# ===============================================
+# Parallel Rendering
+# ===============================================
+
+_report_pools = {}
+_report_pools_lock = threading.Lock()
+
+
+def _get_report_pool(workers):
+    """Process pool per worker count, created on first use."""
+    with _report_pools_lock:
+        pool = _report_pools.get(workers)
+        if pool is None:
+            # Spawned workers do not inherit the web server's threads or connections
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+            _report_pools[workers] = pool
+        return pool
+
+
+def render_sections(sections, workers=REPORT_WORKERS, progress=None):
+    """
+    Render sections in parallel.
+
+    Args:
+        sections (list): Sections from plan_report
+        workers (int): Worker processes
+        progress (callable, optional): Called with the number of finished sections
+
+    Returns:
+        list: PDF bytes per section, in section order
+    """
+    pool = _get_report_pool(workers)
+    futures = {pool.submit(render_section, section): index for index, section in enumerate(sections)}
+    parts = [None] * len(sections)
+
+    for done, future in enumerate(as_completed(futures), start=1):
+        parts[futures[future]] = future.result()
+        if progress:
+            progress(done)
+
+    return parts
+
+
+def merge_pdfs(parts, path):
+    """Concatenate PDF documents into one file (requires pypdf)."""
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(BytesIO(part))
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def render_report(title, subtitle, sections, path, workers=REPORT_WORKERS, progress=None):
+    """
+    Render a planned report to a file.
+
+    Args:
+        title (str): PDF title (single-process mode)
+        subtitle (str): Page heading (single-process mode)
+        sections (list): Sections from plan_report
+        path (str): Output file
+        workers (int): Worker processes; 1 renders in this process
+        progress (callable, optional): Called with the number of finished sections
+
+    Returns:
+        str: 'parallel' or 'single' to report how the file was produced
+    """
+    if PdfWriter is not None and workers > 1 and len(sections) > 1:
+        merge_pdfs(render_sections(sections, workers, progress), path)
+        return 'parallel'
+
+    report = ReportDocument(path, title, subtitle)
+    for done, section in enumerate(sections, start=1):
+        if done > 1:
+            report.new_page()
+        draw_section(report, section)
+        if progress:
+            progress(done)
+    report.finish()
+    return 'single'
+
+
+# ===============================================
+# Jobs
+# ===============================================
+
+def _run_report_job(job_id, kind, year):
+    try:
+        # Every section reads the same point in time; writers carry on
+        with report_snapshot() as databases:
+            title, subtitle, sections = plan_report(kind, year, databases=databases)
+            _update_job(job_id, status='running', sections_total=len(sections))
+
+            filename = f"{job_id}.pdf"
+            render_report(title, subtitle, sections, os.path.join(REPORT_FOLDER, filename),
+                          progress=lambda done: _update_job(job_id, sections_done=done))
+
+        _update_job(job_id, status='complete', filename=filename,
+                    finished_at=datetime.utcnow().isoformat())
+    except Exception as e:
+        print(f"Warning: Report job {job_id} failed: {e}")
+        _update_job(job_id, status='failed', error=str(e),
+                    finished_at=datetime.utcnow().isoformat())
+
+
+def start_report_job(kind, requested_by, year=None):
+    """
+    Queue a fleet-wide PDF report.
+
+    Args:
+        kind (str): 'annual' or 'full'
+        requested_by (int): Admin user ID
+        year (int, optional): Year for annual reports
+
+    Returns:
+        tuple: (success, message, job_id)
+    """
+    if kind not in REPORT_KINDS:
+        return False, f"Unknown report type: {kind}", None
+
+    job_id = uuid.uuid4().hex
+    conn = get_directory_connection()
+    conn.execute('''
+        INSERT INTO report_jobs (id, kind, year, requested_by, created_at, worker_pid)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (job_id, kind, year, requested_by, datetime.utcnow().isoformat(), os.getpid()))
+    conn.commit()
+    conn.close()
+
+    # Long-running servers clean up as they go, not only on restart
+    purge_old_reports()
+
+    threading.Thread(target=_run_report_job, args=(job_id, kind, year),
+                     name=f"report-{job_id[:8]}", daemon=True).start()
+    return True, "Report queued", job_id
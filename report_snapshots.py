@@ -0,0 +1,210 @@
+"""
+Report Snapshots for BizDrive
+Fleet-wide reports read a point-in-time copy of the database instead of
+the live file, so every section of a report sees the same totals however
+long it takes to render, and drivers logging trips never wait on it.
+
+Snapshots are written with VACUUM INTO, a single read transaction that
+does not block writers in WAL mode, to a temporary name and renamed into
+place. Any report started within SNAPSHOT_MAX_AGE seconds of a snapshot
+reuses it, across processes; a cron job running 'refresh' keeps them warm
+so no report waits for a copy. Superseded snapshots are deleted once no
+report in this process holds them and they are older than
+SNAPSHOT_HOLD_SECONDS (the longest a report in another process is
+expected to run).
+
+With sharding on, every shard is copied, each with the users table
+alongside so the report queries run unchanged. PostgreSQL reports read
+the live database: readers never block writers there.
+
+Usage:
+    python report_snapshots.py refresh    Take fresh snapshots now
+    python report_snapshots.py list
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from db_helpers import DATABASE, get_connection, is_postgres
+from shard_router import SHARDING, shard_databases
+
+SNAPSHOT_FOLDER = os.path.join(os.path.dirname(__file__), 'reports', 'snapshots')
+
+# Reports reuse a snapshot up to this old (seconds)
+SNAPSHOT_MAX_AGE = float(os.environ.get('BIZDRIVE_REPORT_SNAPSHOT_MAX_AGE', '300'))
+
+# Superseded snapshots are kept this long for reports running elsewhere
+SNAPSHOT_HOLD_SECONDS = 3600
+
+# <database name>.<milliseconds since the epoch>.db
+SNAPSHOT_NAME = re.compile(r'^(?P<source>.+)\.(?P<taken>\d{13})\.db$')
+
+os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
+
+_lock = threading.Lock()
+_take_lock = threading.RLock()
+_leases = {}    # snapshot path -> reports in this process reading it
+
+
+# ===============================================
+# Taking Snapshots
+# ===============================================
+
+def _source_name(database):
+    return os.path.splitext(os.path.basename(database))[0]
+
+
+def _snapshots(database):
+    """(taken, path) of a database's snapshots, newest first."""
+    source = _source_name(database)
+    found = []
+    for name in os.listdir(SNAPSHOT_FOLDER):
+        match = SNAPSHOT_NAME.match(name)
+        if match and match.group('source') == source:
+            found.append((int(match.group('taken')) / 1000, os.path.join(SNAPSHOT_FOLDER, name)))
+    return sorted(found, reverse=True)
+
+
+def take_snapshot(database):
+    """
+    Copy a database to a new snapshot file.
+
+    Args:
+        database (str): SQLite database or shard file
+
+    Returns:
+        str: Path of the snapshot
+    """
+    taken = int(time.time() * 1000)
+    path = os.path.join(SNAPSHOT_FOLDER, f"{_source_name(database)}.{taken}.db")
+    partial = os.path.join(SNAPSHOT_FOLDER, f".{uuid.uuid4().hex}.tmp")
+
+    conn = get_connection(database)
+    try:
+        conn.execute("VACUUM INTO ?", (partial,))
+    finally:
+        conn.close()
+
+    snapshot = sqlite3.connect(partial)
+    try:
+        if SHARDING:
+            snapshot.execute("ATTACH DATABASE ? AS directory", (DATABASE,))
+            snapshot.execute("CREATE TABLE main.users AS SELECT * FROM directory.users")
+            snapshot.commit()
+            snapshot.execute("DETACH DATABASE directory")
+        # Readers open it in WAL mode like any other database
+        snapshot.execute("PRAGMA journal_mode=WAL")
+    finally:
+        snapshot.close()
+
+    os.replace(partial, path)
+    _prune(database, keep=path)
+    return path
+
+
+def _prune(database, keep):
+    """Delete superseded snapshots nobody here reads and nobody elsewhere should."""
+    cutoff = time.time() - SNAPSHOT_HOLD_SECONDS
+    with _lock:
+        leased = {path for path, count in _leases.items() if count}
+    for taken, path in _snapshots(database):
+        if path == keep or path in leased or taken > cutoff:
+            continue
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Warning: could not delete snapshot {path}{suffix}: {e}")
+
+
+def current_snapshot(database, max_age=SNAPSHOT_MAX_AGE):
+    """
+    A snapshot of a database no older than max_age, taken if needed.
+
+    Returns:
+        str: Snapshot path
+    """
+    snapshots = _snapshots(database)
+    if snapshots and time.time() - snapshots[0][0] <= max_age:
+        return snapshots[0][1]
+
+    # One copy at a time; a report that waited here reuses the fresh one
+    with _take_lock:
+        snapshots = _snapshots(database)
+        if snapshots and time.time() - snapshots[0][0] <= max_age:
+            return snapshots[0][1]
+        return take_snapshot(database)
+
+
+# ===============================================
+# Report Routing
+# ===============================================
+
+@contextmanager
+def report_snapshot(database=DATABASE, max_age=SNAPSHOT_MAX_AGE):
+    """
+    Snapshots for a report to read, held until the block exits.
+
+    Args:
+        database (str): Database the report covers (the application
+                        database covers every shard)
+        max_age (float): Oldest snapshot reused, in seconds
+
+    Yields:
+        list: Snapshot paths, one per shard (the live database on PostgreSQL)
+    """
+    if is_postgres(database):
+        yield [database]
+        return
+
+    sources = shard_databases() if SHARDING and database == DATABASE else [database]
+    paths = []
+    try:
+        for source in sources:
+            # Leased before it can be pruned by another report's snapshot
+            with _take_lock:
+                path = current_snapshot(source, max_age)
+                with _lock:
+                    _leases[path] = _leases.get(path, 0) + 1
+            paths.append(path)
+        yield paths
+    finally:
+        with _lock:
+            for path in paths:
+                _leases[path] -= 1
+                if not _leases[path]:
+                    del _leases[path]
+
+
+def refresh_snapshots(database=DATABASE):
+    """Take a fresh snapshot of every database reports read."""
+    sources = shard_databases() if SHARDING and database == DATABASE else [database]
+    return [take_snapshot(source) for source in sources]
+
+
+if __name__ == '__main__':
+    if is_postgres():
+        print("PostgreSQL reports read the live database; nothing to snapshot")
+        sys.exit(0)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'refresh':
+        for path in refresh_snapshots():
+            print(path)
+    elif command == 'list':
+        sources = shard_databases() if SHARDING else [DATABASE]
+        for source in sources:
+            for taken, path in _snapshots(source):
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken))}  "
+                      f"{os.path.getsize(path) / 1024 / 1024:8.1f} MB  {path}")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,332 @@
+"""
+Route Helper Functions for BizDrive
+Frequent-route index and "log again" day templates for trip entry.
+Each user's routes are built from their trip history and held in an
+in-memory prefix trie that is rebuilt only when their trips or vehicles
+change; the add-trip page's vehicles, frequent routes and recent days
+come from the same cache.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from db_helpers import is_postgres
+from distance_helpers import normalise_address
+from trip_helpers import get_db_connection, add_trip_groups
+from vehicle_helpers import get_user_vehicles
+
+# Number of routes kept in the index per user
+MAX_INDEXED_ROUTES = 500
+
+# Number of recent days kept in the index per user
+MAX_INDEXED_DAYS = 30
+
+# Users whose index is kept in memory; the least recently used goes first
+MAX_INDEXED_USERS = int(os.environ.get('BIZDRIVE_MAX_INDEXED_USERS', '256'))
+
+# Day summary: destinations in the order they were logged. SQLite's
+# GROUP_CONCAT follows the rowid scan; PostgreSQL needs it spelled out.
+ROUTE_SUMMARY = ("string_agg(t.to_address, ' → ' ORDER BY t.id)" if is_postgres()
+                 else "GROUP_CONCAT(t.to_address, ' → ')")
+
+
+# ===============================================
+# Frequent Routes
+# ===============================================
+
+def get_frequent_routes(user_id, limit=MAX_INDEXED_ROUTES):
+    """
+    Get a user's most frequently logged routes.
+    Routes are grouped case-insensitively on from/to/purpose.
+
+    Args:
+        user_id (int): User ID
+        limit (int): Maximum number of routes
+
+    Returns:
+        list: Route dictionaries ordered by use count, most used first
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT MAX(from_address) as from_address,
+               MAX(to_address) as to_address,
+               MAX(purpose) as purpose,
+               ROUND(AVG(distance), 1) as distance,
+               MAX(trip_type) as trip_type,
+               COUNT(*) as use_count,
+               MAX(trip_date) as last_used
+        FROM trips
+        WHERE user_id = ?
+        GROUP BY lower(trim(from_address)), lower(trim(to_address)), lower(trim(COALESCE(purpose, '')))
+        ORDER BY use_count DESC, last_used DESC
+        LIMIT ?
+    ''', (user_id, limit))
+
+    routes = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return routes
+
+
+class RouteTrie:
+    """
+    Prefix trie over the words of each route's addresses and purpose.
+    Each node keeps every route with a word under it (its posting list).
+    Routes are inserted most-used first, so the lists are already in
+    ranking order and a lookup never needs to sort.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.root = {}
+
+        for index, route in enumerate(routes):
+            text = ' '.join(normalise_address(route.get(field) or '')
+                            for field in ('from_address', 'to_address', 'purpose'))
+            for word in set(text.split()):
+                self._insert(word, index)
+
+    def _insert(self, word, index):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+            postings = node.setdefault('_routes', [])
+            if not postings or postings[-1] != index:
+                postings.append(index)
+
+    def _postings(self, term):
+        node = self.root
+        for char in term:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node['_routes']
+
+    def search(self, query, limit=10):
+        """
+        Find routes where every query word prefixes a word in the route.
+
+        Args:
+            query (str): Partial address or purpose text
+            limit (int): Maximum number of routes
+
+        Returns:
+            list: Matching route dictionaries, most used first
+        """
+        terms = normalise_address(query).split()
+        if not terms:
+            return self.routes[:limit]
+
+        # Walk the shortest posting list, keeping routes every other term has
+        postings = sorted((self._postings(term) for term in set(terms)), key=len)
+        others = [set(indexes) for indexes in postings[1:]]
+
+        matches = []
+        for index in postings[0]:
+            if all(index in indexes for indexes in others):
+                matches.append(self.routes[index])
+                if len(matches) >= limit:
+                    break
+
+        return matches
+
+
+class RouteIndexCache:
+    """Route indexes by user; the least recently used user's is dropped first."""
+
+    def __init__(self, max_users=MAX_INDEXED_USERS):
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user_id -> (signature, trie, days, vehicles)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, signature):
+        """The cached entry for a user if it was built at this signature, else None."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def put(self, user_id, entry):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+
+_route_indexes = RouteIndexCache()
+
+
+def _get_trip_signature(user_id):
+    """Cheap fingerprint of a user's trips and vehicles used to detect stale indexes."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*), MAX(id), MAX(updated_at),
+               (SELECT COUNT(*) FROM vehicles WHERE user_id = ?),
+               (SELECT MAX(id) FROM vehicles WHERE user_id = ?),
+               (SELECT MAX(updated_at) FROM vehicles WHERE user_id = ?)
+        FROM trips WHERE user_id = ?
+    ''', (user_id, user_id, user_id, user_id))
+    signature = tuple(cursor.fetchone())
+    conn.close()
+    return signature
+
+
+def _get_cached_index(user_id):
+    """(signature, route trie, recent days, vehicles) for a user, rebuilt if stale."""
+    signature = _get_trip_signature(user_id)
+
+    cached = _route_indexes.get(user_id, signature)
+    if cached:
+        return cached
+
+    entry = (signature, RouteTrie(get_frequent_routes(user_id)),
+             get_day_templates(user_id, limit=MAX_INDEXED_DAYS), get_user_vehicles(user_id))
+    _route_indexes.put(user_id, entry)
+    return entry
+
+
+def get_route_index(user_id):
+    """
+    Get the route trie for a user, rebuilding it if their trips changed.
+
+    Args:
+        user_id (int): User ID
+
+    Returns:
+        RouteTrie: The user's route index
+    """
+    return _get_cached_index(user_id)[1]
+
+
+def trip_form_context(user_id, routes=10, days=10):
+    """
+    What the add-trip form shows, all from the cached route index: one
+    signature query per load while the user's trips and vehicles are
+    unchanged.
+
+    Args:
+        user_id (int): User ID
+        routes (int): Maximum number of frequent routes
+        days (int): Maximum number of recent days (up to MAX_INDEXED_DAYS)
+
+    Returns:
+        dict: vehicles (as get_user_vehicles), frequent_routes (as
+              get_frequent_routes) and day_templates (as get_day_templates)
+    """
+    _, trie, day_templates, vehicles = _get_cached_index(user_id)
+    return {
+        'vehicles': list(vehicles),
+        'frequent_routes': trie.routes[:routes],
+        'day_templates': day_templates[:days],
+    }
+
+
+def suggest_routes(user_id, query, limit=10):
+    """
+    Suggest previously logged routes matching a partial query.
+
+    Args:
+        user_id (int): User ID
+        query (str): Partial from/to address or purpose
+        limit (int): Maximum number of suggestions
+
+    Returns:
+        list: Route dictionaries
+    """
+    try:
+        return get_route_index(user_id).search(query, limit)
+    except sqlite3.Error as e:
+        print(f"Warning: Route suggestion failed: {e}")
+        return []
+
+
+# ===============================================
+# Day Templates ("Log Again")
+# ===============================================
+
+def get_day_templates(user_id, limit=10):
+    """
+    Get recent days that can be logged again as a whole.
+
+    Args:
+        user_id (int): User ID
+        limit (int): Maximum number of days
+
+    Returns:
+        list: Day dictionaries with trip_date, vehicle_id, leg_count,
+              total_distance and a route summary
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+        SELECT t.trip_date, t.vehicle_id, v.registration,
+               COUNT(*) as leg_count,
+               COALESCE(SUM(t.distance), 0) as total_distance,
+               {ROUTE_SUMMARY} as route_summary
+        FROM trips t
+        JOIN vehicles v ON t.vehicle_id = v.id
+        WHERE t.user_id = ?
+        GROUP BY t.trip_date, t.vehicle_id, v.registration
+        ORDER BY t.trip_date DESC
+        LIMIT ?
+    ''', (user_id, limit))
+
+    days = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return days
+
+
+def repeat_trip_day(user_id, source_date, trip_date, vehicle_id=None):
+    """
+    Log every leg from a previous day again on a new date.
+
+    Args:
+        user_id (int): User ID
+        source_date (str): Date to copy legs from (YYYY-MM-DD)
+        trip_date (str): Date to log the legs on (YYYY-MM-DD)
+        vehicle_id (int, optional): Only copy legs for this vehicle
+
+    Returns:
+        tuple: (trip_ids, error_messages)
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    query = '''
+        SELECT vehicle_id, trip_type, from_address, to_address, purpose, notes,
+               distance, reimbursement_rate
+        FROM trips
+        WHERE user_id = ? AND trip_date = ?
+    '''
+    params = [user_id, source_date]
+
+    if vehicle_id:
+        query += ' AND vehicle_id = ?'
+        params.append(vehicle_id)
+
+    query += ' ORDER BY created_at, id'
+
+    cursor.execute(query, params)
+    source_legs = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    if not source_legs:
+        return [], [f"No trips found on {source_date}."]
+
+    # Legs keep their own vehicle, type and rate; the whole day is one transaction
+    groups = {}
+    for leg in source_legs:
+        key = (leg['vehicle_id'], leg['trip_type'], leg['reimbursement_rate'])
+        groups.setdefault(key, []).append(leg)
+
+    return add_trip_groups(user_id, trip_date,
+                           [(leg_vehicle_id, trip_type, rate, legs)
+                            for (leg_vehicle_id, trip_type, rate), legs in groups.items()])
@@ -0,0 +1,270 @@
+"""
+Search Helper Functions for BizDrive
+Full-text search across trips, expenses and accidents using SQLite FTS5.
+The FTS tables are external-content indexes over the base tables and are
+kept in sync by triggers, so helpers never write to them directly.
+On PostgreSQL the same searches run on GIN indexes over to_tsvector()
+of the indexed columns, which PostgreSQL keeps in sync itself.
+"""
+
+import re
+import sqlite3
+
+from db_helpers import is_postgres
+from trip_helpers import get_db_connection
+
+# Indexed text columns per searchable table
+SEARCH_INDEXES = {
+    'trips': ['from_address', 'to_address', 'purpose', 'notes'],
+    'expenses': ['expense_type', 'notes'],
+    'accidents': [
+        'location', 'circumstances', 'police_report_number', 'insurance_claim_number',
+        'other_driver_name', 'other_vehicle_registration', 'witness_name', 'notes'
+    ],
+}
+
+SEARCH_KINDS = {
+    'trip': 'trips',
+    'expense': 'expenses',
+    'accident': 'accidents',
+}
+
+MONTH_NAMES = {
+    'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3,
+    'april': 4, 'apr': 4, 'may': 5, 'june': 6, 'jun': 6, 'july': 7, 'jul': 7,
+    'august': 8, 'aug': 8, 'september': 9, 'sep': 9, 'sept': 9,
+    'october': 10, 'oct': 10, 'november': 11, 'nov': 11, 'december': 12, 'dec': 12,
+}
+
+STOP_WORDS = {'the', 'a', 'an', 'in', 'on', 'at', 'of', 'for', 'to', 'and', 'or', 'with'}
+
+
+# ===============================================
+# Search Index Setup
+# ===============================================
+
+def init_search_tables():
+    """
+    Create the FTS5 indexes and their sync triggers.
+    A newly created index is populated from its base table.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    if is_postgres():
+        for table in SEARCH_INDEXES:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_fts ON {table} USING gin ({_search_document(table)})")
+        conn.commit()
+        conn.close()
+        return
+
+    for table, columns in SEARCH_INDEXES.items():
+        fts_table = f"{table}_fts"
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f"new.{column}" for column in columns)
+        old_values = ', '.join(f"old.{column}" for column in columns)
+
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,))
+        exists = cursor.fetchone() is not None
+
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {column_list},
+                content='{table}',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+
+        if not exists:
+            cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+    conn.commit()
+    conn.close()
+
+
+def _search_text(table, alias=''):
+    """A table's indexed columns joined into one PostgreSQL text expression."""
+    return " || ' ' || ".join(f"coalesce({alias}{column}, '')" for column in SEARCH_INDEXES[table])
+
+
+def _search_document(table, alias=''):
+    """PostgreSQL tsvector of a table's indexed columns (must match the index expression)."""
+    return f"to_tsvector('simple', {_search_text(table, alias)})"
+
+
+# ===============================================
+# Query Parsing
+# ===============================================
+
+def parse_search_query(query):
+    """
+    Split a free-text query into an FTS5 match expression and date filters.
+    Month names and four-digit years become date filters, so
+    "parramatta job in march" searches for parramatta/job in March.
+    Remaining words are prefix terms combined with OR and ranked by bm25.
+
+    Args:
+        query (str): User search text
+
+    Returns:
+        tuple: (match_expression or None, month or None, year or None)
+    """
+    month = None
+    year = None
+    terms = []
+
+    for word in re.findall(r'\w+', (query or '').lower()):
+        if word in MONTH_NAMES and month is None:
+            month = MONTH_NAMES[word]
+        elif re.fullmatch(r'(19|20)\d{2}', word) and year is None:
+            year = int(word)
+        elif word not in STOP_WORDS:
+            terms.append(f'"{word}"*')
+
+    match_expression = ' OR '.join(terms) if terms else None
+    return match_expression, month, year
+
+
+def _date_filter(date_column, month, year):
+    """Build the date conditions for a search branch."""
+    conditions = []
+    params = []
+
+    if year:
+        conditions.append(f"{date_column} >= ? AND {date_column} < ?")
+        params.extend([f"{year}-01-01", f"{year + 1}-01-01"])
+
+    if month:
+        conditions.append(f"CAST(strftime('%m', {date_column}) AS INTEGER) = ?")
+        params.append(month)
+
+    return conditions, params
+
+
+# ===============================================
+# Search
+# ===============================================
+
+def search_records(user_id, query, kinds=None, page=1, per_page=20):
+    """
+    Search a user's trips, expenses and accidents.
+
+    Args:
+        user_id (int): User ID (results are limited to this user's records)
+        query (str): Free-text search
+        kinds (list, optional): Subset of 'trip', 'expense', 'accident'
+        page (int): Page number (1-based)
+        per_page (int): Results per page
+
+    Returns:
+        dict: results (ranked hits), total, page and per_page
+    """
+    match_expression, month, year = parse_search_query(query)
+    page = max(page, 1)
+    per_page = max(per_page, 1)
+    empty = {'results': [], 'total': 0, 'page': page, 'per_page': per_page}
+
+    if not match_expression:
+        return empty
+
+    kinds = [kind for kind in (kinds or SEARCH_KINDS) if kind in SEARCH_KINDS]
+
+    postgres = is_postgres()
+    if postgres:
+        # "word"* OR "word"* -> word:* | word:*
+        match_expression = ' | '.join(f"{word}:*" for word in re.findall(r'"(\w+)"', match_expression))
+
+    branches = {
+        'trip': ('trips_fts', 'trips', 'r.trip_date',
+                 "r.from_address || ' → ' || r.to_address"),
+        'expense': ('expenses_fts', 'expenses', 'r.expense_date',
+                    "r.expense_type || ' $' || printf('%.2f', r.amount)"),
+        'accident': ('accidents_fts', 'accidents', 'r.accident_date',
+                     'r.location'),
+    }
+
+    selects = []
+    params = []
+
+    for kind in kinds:
+        fts_table, table, date_column, title = branches[kind]
+        conditions, date_params = _date_filter(date_column, month, year)
+        params.extend([match_expression, user_id] + date_params)
+
+        if postgres:
+            document = _search_document(table, 'r.')
+            if kind == 'expense':
+                title = "r.expense_type || ' $' || to_char(r.amount, 'FM999999990.00')"
+            where = ' AND '.join([f"{document} @@ q", "r.user_id = ?"] + conditions)
+            selects.append(f'''
+                SELECT '{kind}' as kind, r.id as id, CAST({date_column} AS TEXT) as date, {title} as title,
+                       ts_headline('simple', {_search_text(table, 'r.')}, q, 'StartSel=[, StopSel=], MaxWords=12, MinWords=4') as snippet,
+                       -ts_rank({document}, q) as rank
+                FROM {table} r, to_tsquery('simple', ?) q
+                WHERE {where}
+            ''')
+            continue
+
+        where = ' AND '.join([f"{fts_table} MATCH ?", "r.user_id = ?"] + conditions)
+
+        selects.append(f'''
+            SELECT '{kind}' as kind, r.id as id, {date_column} as date, {title} as title,
+                   snippet({fts_table}, -1, '[', ']', '…', 12) as snippet,
+                   bm25({fts_table}) as rank
+            FROM {fts_table}
+            JOIN {table} r ON r.id = {fts_table}.rowid
+            WHERE {where}
+        ''')
+
+    if not selects:
+        return empty
+
+    union = ' UNION ALL '.join(selects)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM ({union}) AS hits", params)
+        total = cursor.fetchone()[0]
+
+        cursor.execute(f'''
+            SELECT * FROM ({union}) AS hits
+            ORDER BY rank, date DESC
+            LIMIT ? OFFSET ?
+        ''', params + [per_page, (page - 1) * per_page])
+        results = [dict(row) for row in cursor.fetchall()]
+    except sqlite3.OperationalError as e:
+        print(f"Warning: Search failed: {e}")
+        conn.close()
+        return empty
+
+    conn.close()
+
+    return {
+        'results': results,
+        'total': total,
+        'page': page,
+        'per_page': per_page
+    }
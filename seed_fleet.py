@@ -0,0 +1,368 @@
+"""
+Synthetic Fleet Generator for BizDrive
+Populates the application schema with a realistic fleet for benchmarks
+and load tests: drivers, vehicles, trips, expenses (with receipts) and
+accidents (with photos). Volumes are configurable and the output is
+deterministic for a given seed.
+
+Distributions:
+    vehicles   1 per driver (70%), 2 (22%) or 3 (8%)
+    trips      Poisson per day, weekdays ~5x busier than weekends, scaled by
+               a per-driver activity factor (log-normal, so a few drivers
+               log far more than the median); 80% Business
+    distances  Between suburb centroids (with the road circuity factor),
+               mostly around the driver's base suburb, or a short local hop
+    expenses   Poisson per month; category mix and amounts by category
+               (fuel is frequent and cheap, insurance rare and expensive)
+    accidents  Bernoulli per vehicle-year, each with 0..2x photos
+
+Seeded drivers share one password (SEED_PASSWORD) so login can be
+benchmarked. Receipts and photos are a small pool of generated JPEGs
+stored once in the blob store and shared between rows.
+
+Usage:
+    BIZDRIVE_DATABASE=/tmp/fleet.db python seed_fleet.py [--users 50] [--months 12] [--seed 42]
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO
+
+from db_helpers import DATABASE, get_connection
+from auth_helpers import init_database, hash_password
+from vehicle_helpers import init_vehicle_table
+from trip_helpers import init_trip_table
+from expense_helpers import init_expense_table, RECEIPT_FOLDER
+from accident_helpers import (
+    init_accident_table,
+    ACCIDENT_PHOTO_FOLDER,
+    SEVERITY_LEVELS,
+    WEATHER_CONDITIONS,
+    ROAD_CONDITIONS,
+    ACCIDENT_STATUSES
+)
+from search_helpers import init_search_tables
+from archive_store import init_archive_table
+from report_jobs import init_report_jobs_table
+from distance_helpers import POSTCODE_TABLE, ROAD_DISTANCE_FACTOR, haversine_km
+from blob_store import store_blob
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # Pillow missing: rows are seeded without receipts or photos
+    Image = None
+
+SEED_PASSWORD = 'FleetDriver1!'
+SEED_USERNAME_PREFIX = 'fleet'
+
+# Distinct generated images shared by all seeded receipts / photos
+IMAGE_POOL_SIZE = 12
+
+VEHICLE_MODELS = [
+    # (make, model, weight)
+    ('Toyota', 'HiLux', 18), ('Ford', 'Ranger', 16), ('Toyota', 'Corolla', 10),
+    ('Isuzu', 'D-Max', 8), ('Mitsubishi', 'Triton', 8), ('Toyota', 'RAV4', 9),
+    ('Mazda', 'CX-5', 7), ('Hyundai', 'i30', 7), ('Kia', 'Sportage', 6),
+    ('Toyota', 'HiAce', 6), ('Tesla', 'Model 3', 3), ('Volkswagen', 'Amarok', 2),
+]
+VEHICLE_COLORS = ['White', 'White', 'White', 'Silver', 'Grey', 'Black', 'Blue', 'Red']
+
+# category: (share of expenses, log-normal mu, sigma) - median amount is e^mu
+EXPENSE_PROFILE = {
+    'Fuel': (0.45, math.log(85), 0.35),
+    'Parking': (0.15, math.log(14), 0.6),
+    'Tolls': (0.12, math.log(9), 0.5),
+    'Car Wash': (0.05, math.log(25), 0.3),
+    'Maintenance': (0.08, math.log(320), 0.5),
+    'Repairs': (0.03, math.log(650), 0.8),
+    'Tires': (0.02, math.log(900), 0.3),
+    'Insurance': (0.02, math.log(1400), 0.3),
+    'Registration': (0.02, math.log(850), 0.2),
+    'Other': (0.06, math.log(40), 0.9),
+}
+
+TRIP_PURPOSES = ['Client visit', 'Site inspection', 'Delivery', 'Supplier pickup',
+                 'Meeting', 'Training', 'Quote', 'Service call']
+STREET_NAMES = ['George St', 'King St', 'Church St', 'High St', 'Station Rd',
+                'Victoria Rd', 'Pacific Hwy', 'Main St', 'Park Ave', 'Smith St']
+
+SEVERITY_WEIGHTS = [60, 28, 10, 2]
+
+
+# ===============================================
+# Schema
+# ===============================================
+
+def init_schema():
+    """Create every application table in the configured database."""
+    init_database()
+    init_vehicle_table()
+    init_trip_table()
+    init_expense_table()
+    init_accident_table()
+    init_search_tables()
+    init_archive_table()
+    init_report_jobs_table()
+
+
+# ===============================================
+# Samplers
+# ===============================================
+
+def _poisson(rng, mean):
+    """Poisson sample (Knuth); fine for the small means used here."""
+    if mean <= 0:
+        return 0
+    limit = math.exp(-mean)
+    count, product = 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _load_suburbs():
+    """Postcode centroids grouped by state."""
+    by_state = {}
+    with open(POSTCODE_TABLE, newline='') as f:
+        for row in csv.DictReader(f):
+            by_state.setdefault(row['state'], []).append(
+                (row['suburb'], row['state'], row['postcode'], float(row['latitude']), float(row['longitude']))
+            )
+    return by_state
+
+
+def _address(rng, suburb):
+    name, state, postcode, _, _ = suburb
+    return f"{rng.randint(1, 400)} {rng.choice(STREET_NAMES)}, {name} {state} {postcode}"
+
+
+def _trip_distance(rng, origin, destination):
+    if origin is destination:
+        return round(max(rng.lognormvariate(math.log(6), 0.6), 1.0), 1)
+    km = haversine_km(origin[3], origin[4], destination[3], destination[4]) * ROAD_DISTANCE_FACTOR
+    return round(max(km, 2.0), 1)
+
+
+def _image_pool(rng, root, size):
+    """Store IMAGE_POOL_SIZE generated JPEGs in a blob root; returns their keys."""
+    if Image is None:
+        return []
+    keys = []
+    for _ in range(IMAGE_POOL_SIZE):
+        img = Image.new('RGB', size, tuple(rng.randint(120, 255) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.rectangle([x, y, x + rng.randint(10, 200), y + rng.randint(5, 60)],
+                           fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        buffer = BytesIO()
+        img.save(buffer, 'JPEG', quality=80)
+        keys.append(store_blob(buffer.getvalue(), root, 'jpg'))
+    return keys
+
+
+def _photo_pool(rng):
+    """Accident photo blobs with their thumbnail and web versions."""
+    from photo_helpers import generate_photo_derivatives
+
+    return [(key,) + generate_photo_derivatives(key)
+            for key in _image_pool(rng, ACCIDENT_PHOTO_FOLDER, (1600, 1200))]
+
+
+# ===============================================
+# Generator
+# ===============================================
+
+def seed_fleet(users=50, months=12, trips_per_week=12, expenses_per_month=8,
+               accident_rate=0.15, photos_per_accident=3, receipt_rate=0.6, seed=42):
+    """
+    Add a synthetic fleet to the configured database (BIZDRIVE_DATABASE).
+
+    Args:
+        users (int): Drivers to create
+        months (int): Months of history, ending today
+        trips_per_week (float): Median trips per driver per week
+        expenses_per_month (float): Median expenses per driver per month
+        accident_rate (float): Probability of an accident per vehicle-year
+        photos_per_accident (int): Mean photos per accident
+        receipt_rate (float): Share of expenses with a receipt
+        seed (int): Random seed
+
+    Returns:
+        dict: Row counts, the seeded user IDs and the time taken
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    init_schema()
+
+    suburbs = _load_suburbs()
+    states = sorted(suburbs, key=lambda state: -len(suburbs[state]))
+    state_weights = [len(suburbs[state]) for state in states]
+    makes = [(make, model) for make, model, _ in VEHICLE_MODELS]
+    make_weights = [weight for _, _, weight in VEHICLE_MODELS]
+    categories = list(EXPENSE_PROFILE)
+    category_weights = [EXPENSE_PROFILE[category][0] for category in categories]
+
+    receipts = _image_pool(rng, RECEIPT_FOLDER, (600, 1000))
+    photos = _photo_pool(rng)
+
+    # Hashing is deliberately slow; every seeded driver shares one hash
+    password_hash = hash_password(SEED_PASSWORD)
+    today = date.today()
+    first_day = today - timedelta(days=round(months * 30.44))
+    days = [first_day + timedelta(days=n) for n in range((today - first_day).days + 1)]
+    now = datetime.utcnow().isoformat()
+
+    counts = {'users': 0, 'vehicles': 0, 'trips': 0, 'expenses': 0, 'receipts': 0,
+              'accidents': 0, 'photos': 0}
+    user_ids = []
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE ?", (SEED_USERNAME_PREFIX + '%',))
+    offset = cursor.fetchone()[0]
+
+    try:
+        for n in range(offset, offset + users):
+            username = f"{SEED_USERNAME_PREFIX}{n:05d}"
+            cursor.execute('''
+                INSERT INTO users (username, password_hash, email, role, created_at)
+                VALUES (?, ?, ?, 'driver', ?)
+            ''', (username, password_hash, f"{username}@bizdrive.invalid", f"{first_day} 09:00:00"))
+            user_id = cursor.lastrowid
+            user_ids.append(user_id)
+
+            state = suburbs[rng.choices(states, state_weights)[0]]
+            base = rng.choice(state)
+            # Most driving is around the driver's base; the rest anywhere in the state
+            local = sorted(state, key=lambda suburb: haversine_km(base[3], base[4], suburb[3], suburb[4]))[:6]
+            activity = rng.lognormvariate(0, 0.5)
+
+            vehicles = []
+            for k in range(rng.choices((1, 2, 3), (70, 22, 8))[0]):
+                make, model = rng.choices(makes, make_weights)[0]
+                odometer = rng.randint(5000, 180000)
+                cursor.execute('''
+                    INSERT INTO vehicles (user_id, registration, make, model, year, color, odometer)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, f"F{user_id:05d}{k}", make, model, rng.randint(2012, today.year),
+                      rng.choice(VEHICLE_COLORS), odometer))
+                vehicles.append([cursor.lastrowid, odometer])
+            # The first vehicle does most of the driving
+            vehicle_weights = [6, 3, 1][:len(vehicles)]
+
+            trips = []
+            weekday_mean = trips_per_week * activity / 5.5
+            for day in days:
+                mean = weekday_mean if day.weekday() < 5 else weekday_mean / 5
+                for _ in range(_poisson(rng, mean)):
+                    vehicle = rng.choices(vehicles, vehicle_weights)[0]
+                    origin = base if rng.random() < 0.6 else rng.choice(local)
+                    destination = origin if rng.random() < 0.25 else rng.choice(local if rng.random() < 0.97 else state)
+                    distance = _trip_distance(rng, origin, destination)
+                    trip_type = 'Business' if rng.random() < 0.8 else 'Personal'
+                    start_odometer = end_odometer = None
+                    if rng.random() < 0.5:
+                        start_odometer = vehicle[1]
+                        end_odometer = start_odometer + max(round(distance), 1)
+                    vehicle[1] += max(round(distance), 1)
+                    trips.append((
+                        user_id, vehicle[0], day.isoformat(), _address(rng, origin), _address(rng, destination),
+                        start_odometer, end_odometer, distance, trip_type,
+                        rng.choice(TRIP_PURPOSES) if trip_type == 'Business' else None,
+                        0.88, round(distance * 0.88, 2) if trip_type == 'Business' else 0.0,
+                        f"{day} {rng.randint(6, 19):02d}:{rng.randint(0, 59):02d}:00"
+                    ))
+            cursor.executemany('''
+                INSERT INTO trips (user_id, vehicle_id, trip_date, from_address, to_address,
+                                   start_odometer, end_odometer, distance, trip_type, purpose,
+                                   reimbursement_rate, reimbursement_amount, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', trips)
+            for vehicle_id, odometer in vehicles:
+                cursor.execute("UPDATE vehicles SET odometer = ? WHERE id = ?", (odometer, vehicle_id))
+
+            expenses = []
+            for _ in range(_poisson(rng, expenses_per_month * activity * months)):
+                category = rng.choices(categories, category_weights)[0]
+                _, mu, sigma = EXPENSE_PROFILE[category]
+                receipt = rng.choice(receipts) if receipts and rng.random() < receipt_rate else None
+                counts['receipts'] += receipt is not None
+                expenses.append((
+                    user_id, rng.choices(vehicles, vehicle_weights)[0][0], rng.choice(days).isoformat(),
+                    category, round(rng.lognormvariate(mu, sigma), 2), f"{category} - {rng.choice(local)[0]}",
+                    receipt, now
+                ))
+            cursor.executemany('''
+                INSERT INTO expenses (user_id, vehicle_id, expense_date, expense_type, amount,
+                                      notes, receipt_filename, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', expenses)
+
+            for vehicle_id, _ in vehicles:
+                if rng.random() >= accident_rate * months / 12:
+                    continue
+                day = rng.choice(days)
+                cursor.execute('''
+                    INSERT INTO accidents (user_id, vehicle_id, accident_date, accident_time, location,
+                                           weather_conditions, road_conditions, circumstances,
+                                           estimated_damage, notes, status, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, vehicle_id, day.isoformat(), f"{rng.randint(6, 21):02d}:{rng.randint(0, 59):02d}",
+                      _address(rng, rng.choice(local)), rng.choices(WEATHER_CONDITIONS, (60, 20, 5, 1, 10, 4))[0],
+                      rng.choices(ROAD_CONDITIONS, (65, 25, 1, 1, 4, 4))[0],
+                      f"{rng.choices(SEVERITY_LEVELS, SEVERITY_WEIGHTS)[0]} collision",
+                      round(rng.lognormvariate(math.log(2500), 0.9), 2), None,
+                      rng.choice(ACCIDENT_STATUSES), now, now))
+                accident_id = cursor.lastrowid
+                counts['accidents'] += 1
+
+                if photos:
+                    chosen = [rng.choice(photos) for _ in range(rng.randint(0, 2 * photos_per_accident))]
+                    cursor.executemany('''
+                        INSERT INTO accident_photos (accident_id, filename, description, uploaded_at,
+                                                     thumbnail_filename, web_filename)
+                        VALUES (?, ?, NULL, ?, ?, ?)
+                    ''', [(accident_id, key, now, thumbnail, web) for key, thumbnail, web in chosen])
+                    counts['photos'] += len(chosen)
+
+            counts['users'] += 1
+            counts['vehicles'] += len(vehicles)
+            counts['trips'] += len(trips)
+            counts['expenses'] += len(expenses)
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    counts['user_ids'] = user_ids
+    counts['seconds'] = round(time.perf_counter() - start, 2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a synthetic BizDrive fleet')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--trips-per-week', type=float, default=12)
+    parser.add_argument('--expenses-per-month', type=float, default=8)
+    parser.add_argument('--accident-rate', type=float, default=0.15)
+    parser.add_argument('--photos-per-accident', type=int, default=3)
+    parser.add_argument('--receipt-rate', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=42)
+
+    result = seed_fleet(**vars(parser.parse_args()))
+    result.pop('user_ids')
+    result['database'] = DATABASE
+    result['password'] = SEED_PASSWORD
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,681 @@
+"""
+Tenant Shard Router for BizDrive
+Splits tenant data (vehicles, trips, expenses, accidents and their photos)
+into one SQLite file per shard, so one organisation's exports, reports and
+bulk imports only lock its own file. Each user belongs to one shard: an
+organisation's drivers are assigned to a named shard, everyone else stays
+in the default shard.
+
+BIZDRIVE_DATABASE becomes the directory database: users, password reset
+tokens, settings and report jobs, plus the shard list and the user -> shard
+map. Shard connections attach it as 'directory', so the existing joins
+against users keep working unchanged.
+
+get_connection() (db_helpers) routes the application database to the
+current request's shard, set from the session user; use_tenant() and
+use_shard() switch shard explicitly, each_shard() visits every shard in
+turn and fan_out() runs a function against every shard in parallel for
+admin-wide figures. Idle shard connections are kept in an LRU and reused.
+
+Each shard hands out ids from its own range (shard index << SHARD_ID_BITS),
+so ids stay unique across shards. Moving a user gives their rows new ids in
+the target shard.
+
+Sharding is on when BIZDRIVE_SHARD_DIR is set. The first start with it set
+moves the existing tenant tables out of BIZDRIVE_DATABASE into the default
+shard.
+
+Usage:
+    python shard_router.py list
+    python shard_router.py create <shard>
+    python shard_router.py assign <shard> <username> [<username> ...]
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from flask import session
+
+from db_helpers import (
+    DATABASE,
+    SHARD_DIR,
+    TallyConnection,
+    get_connection,
+    get_directory_connection,
+    is_postgres,
+    set_journal_mode
+)
+
+SHARDING = bool(SHARD_DIR)
+
+DEFAULT_SHARD = 'default'
+SHARD_NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,39}$')
+
+# Ids in shard n start above n << SHARD_ID_BITS
+SHARD_ID_BITS = 40
+
+# Tables that stay in the directory database; everything else is tenant data
+DIRECTORY_TABLES = ('users', 'password_reset_tokens', 'settings', 'report_jobs',
+                    'shards', 'user_shards')
+
+# Idle connections kept open: shards in the LRU, and handles per shard
+MAX_OPEN_SHARDS = int(os.environ.get('BIZDRIVE_MAX_OPEN_SHARDS', '64'))
+IDLE_HANDLES_PER_SHARD = 4
+
+FANOUT_WORKERS = int(os.environ.get('BIZDRIVE_SHARD_FANOUT_WORKERS', '8'))
+
+# Seconds a user's shard is cached; other processes see a move after this long
+SHARD_MAP_TTL = 30
+
+_current_shard = ContextVar('bizdrive_shard', default=None)
+
+_setup_lock = threading.Lock()
+_directory_ready = False
+
+_shard_map_lock = threading.Lock()
+_shard_map = {}     # user_id -> (shard, expires)
+
+_fanout_pool = None
+_fanout_pool_lock = threading.Lock()
+
+
+# ===============================================
+# Shard Connections
+# ===============================================
+
+class ShardConnection(TallyConnection):
+    """Shard connection with the directory attached; close() returns pooled handles to the LRU."""
+
+    _pooled = False
+    _idle = False
+
+    def close(self):
+        if self._unit is not None:
+            self._unit.leave(self)
+        elif self._pooled:
+            _handles.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        """Really close the connection."""
+        sqlite3.Connection.close(self)
+
+
+def shard_database(name):
+    """Path of a shard's database file."""
+    return os.path.join(SHARD_DIR, f"{name}.db")
+
+
+def shard_path(database=DATABASE):
+    """The file a shard database routes to (the current shard's, for the application database)."""
+    return shard_database(current_shard()) if database == DATABASE else database
+
+
+def is_shard_database(database):
+    """True if a path is a shard file (or the application database, which routes to one)."""
+    if not SHARDING or not isinstance(database, str):
+        return False
+    if database == DATABASE:
+        return True
+    return (database != ':memory:'
+            and os.path.dirname(os.path.abspath(database)) == os.path.abspath(SHARD_DIR))
+
+
+def _open_shard(path, **kwargs):
+    conn = sqlite3.connect(path, factory=ShardConnection, check_same_thread=False, **kwargs)
+    conn.database = path
+    set_journal_mode(conn, path)
+    # Foreign keys stay off: SQLite cannot check users(id) in the attached
+    # directory, so cascade_deletes.py removes dependent rows instead
+    conn.execute("ATTACH DATABASE ? AS directory", (DATABASE,))
+    return conn
+
+
+class HandleCache:
+    """Idle shard connections by path; the least recently used shard is closed first."""
+
+    def __init__(self, max_shards=MAX_OPEN_SHARDS, per_shard=IDLE_HANDLES_PER_SHARD):
+        self.max_shards = max_shards
+        self.per_shard = per_shard
+        self._idle = OrderedDict()  # path -> [ShardConnection]
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        with self._lock:
+            handles = self._idle.get(path)
+            if handles:
+                conn = handles.pop()
+                self._idle.move_to_end(path)
+                conn._idle = False
+                return conn
+        conn = _open_shard(path)
+        conn._pooled = True
+        return conn
+
+    def release(self, conn):
+        if conn._idle:
+            return
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        conn.row_factory = None
+
+        evicted = []
+        with self._lock:
+            handles = self._idle.setdefault(conn.database, [])
+            self._idle.move_to_end(conn.database)
+            if len(handles) < self.per_shard:
+                conn._idle = True
+                handles.append(conn)
+            else:
+                evicted.append(conn)
+            while len(self._idle) > self.max_shards:
+                _, old = self._idle.popitem(last=False)
+                evicted.extend(old)
+
+        for old in evicted:
+            old.discard()
+
+    def clear(self):
+        """Close every idle connection."""
+        with self._lock:
+            handles = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in handles:
+            conn.discard()
+
+    def stats(self):
+        with self._lock:
+            return {'shards': len(self._idle), 'idle': sum(len(conns) for conns in self._idle.values())}
+
+
+_handles = HandleCache()
+
+
+def connect(database=DATABASE, **kwargs):
+    """
+    Open a shard connection (called by db_helpers.get_connection).
+
+    Args:
+        database (str): The application database (routed to the current
+                        shard) or a shard file
+        **kwargs: Passed to sqlite3.connect; the connection is then not pooled
+
+    Returns:
+        ShardConnection: Connection with the directory attached
+    """
+    _ensure_directory()
+    path = shard_path(database)
+    if kwargs:
+        return _open_shard(path, **kwargs)
+    return _handles.acquire(path)
+
+
+# ===============================================
+# Directory
+# ===============================================
+
+def _tenant_schema():
+    """Table initialisers run in every shard."""
+    from vehicle_helpers import init_vehicle_table
+    from trip_helpers import init_trip_table
+    from expense_helpers import init_expense_table
+    from accident_helpers import init_accident_table
+    from search_helpers import init_search_tables
+    from archive_store import init_archive_table
+    return [init_vehicle_table, init_trip_table, init_expense_table,
+            init_accident_table, init_search_tables, init_archive_table]
+
+
+def _ensure_directory():
+    """Create the shard tables, and split a pre-sharding database, once per process."""
+    global _directory_ready
+    if _directory_ready:
+        return
+
+    with _setup_lock:
+        if _directory_ready:
+            return
+        if is_postgres():
+            raise RuntimeError("BIZDRIVE_SHARD_DIR needs a SQLite BIZDRIVE_DATABASE")
+
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        conn = get_directory_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS shards (
+                name TEXT PRIMARY KEY,
+                shard_index INTEGER UNIQUE NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_shards (
+                user_id INTEGER PRIMARY KEY,
+                shard TEXT NOT NULL REFERENCES shards(name)
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO shards (name, shard_index) VALUES (?, 0)", (DEFAULT_SHARD,))
+        conn.commit()
+
+        if not os.path.exists(shard_database(DEFAULT_SHARD)):
+            _split_directory(conn)
+        conn.close()
+        _directory_ready = True
+
+
+def _split_directory(conn):
+    """Move the tenant tables of a pre-sharding database into the default shard."""
+    conn.row_factory = None
+    # Dropping a parent table deletes its rows, which enforced foreign keys would refuse
+    conn.execute("PRAGMA foreign_keys = OFF")
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'vehicles'")
+    if cursor.fetchone() is None:
+        return
+
+    path = shard_database(DEFAULT_SHARD)
+    cursor.execute("VACUUM INTO ?", (path,))
+
+    shard = sqlite3.connect(path)
+    for table in DIRECTORY_TABLES:
+        shard.execute(f"DROP TABLE IF EXISTS {table}")
+    shard.commit()
+    shard.execute("VACUUM")
+    shard.close()
+
+    # Virtual tables first: dropping them drops their shadow tables
+    placeholders = ', '.join('?' * len(DIRECTORY_TABLES))
+    for virtual in (True, False):
+        cursor.execute(f'''
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+              AND name NOT IN ({placeholders}) AND (sql LIKE 'CREATE VIRTUAL%') = ?
+        ''', DIRECTORY_TABLES + (virtual,))
+        for (table,) in cursor.fetchall():
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.commit()
+    cursor.execute("VACUUM")
+    print(f"Moved tenant tables from {DATABASE} into shard '{DEFAULT_SHARD}'")
+
+
+def list_shards():
+    """Shard names, in shard index order."""
+    if not SHARDING:
+        return [DEFAULT_SHARD]
+    _ensure_directory()
+    conn = get_directory_connection()
+    names = [row[0] for row in conn.execute("SELECT name FROM shards ORDER BY shard_index")]
+    conn.close()
+    return names
+
+
+def shard_databases():
+    """Every database holding tenant data (the application database when unsharded)."""
+    if not SHARDING:
+        return [DATABASE]
+    return [shard_database(name) for name in list_shards()]
+
+
+def shard_for_user(user_id, cached=True):
+    """
+    Shard holding a user's data.
+
+    Args:
+        user_id (int): User ID
+        cached (bool): Allow an answer up to SHARD_MAP_TTL seconds old
+
+    Returns:
+        str: Shard name
+    """
+    if not SHARDING or user_id is None:
+        return DEFAULT_SHARD
+
+    now = time.monotonic()
+    if cached:
+        entry = _shard_map.get(user_id)
+        if entry and entry[1] > now:
+            return entry[0]
+
+    _ensure_directory()
+    conn = get_directory_connection()
+    row = conn.execute("SELECT shard FROM user_shards WHERE user_id = ?", (user_id,)).fetchone()
+    conn.close()
+
+    shard = row[0] if row else DEFAULT_SHARD
+    with _shard_map_lock:
+        _shard_map[user_id] = (shard, now + SHARD_MAP_TTL)
+    return shard
+
+
+# ===============================================
+# Tenant Context
+# ===============================================
+
+def current_shard():
+    """Shard the application database currently routes to."""
+    return _current_shard.get() or DEFAULT_SHARD
+
+
+@contextmanager
+def use_shard(name):
+    """Route the application database to a shard inside the block."""
+    token = _current_shard.set(name)
+    try:
+        yield name
+    finally:
+        _current_shard.reset(token)
+
+
+@contextmanager
+def use_tenant(user_id):
+    """Route the application database to a user's shard inside the block."""
+    with use_shard(shard_for_user(user_id)) as name:
+        yield name
+
+
+def each_shard():
+    """
+    Visit every shard in turn, routing the application database to it.
+
+    Yields:
+        str: Shard name (once, DEFAULT_SHARD, when unsharded)
+    """
+    for name in list_shards():
+        with use_shard(name):
+            yield name
+
+
+def _get_fanout_pool():
+    global _fanout_pool
+    with _fanout_pool_lock:
+        if _fanout_pool is None:
+            _fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='shard-fanout')
+        return _fanout_pool
+
+
+def fan_out(fn, shards=None):
+    """
+    Run a function against every shard in parallel.
+    SQLite releases the GIL while it works, so shards are read concurrently.
+
+    Args:
+        fn (callable): Called with a connection to one shard
+        shards (list, optional): Shard names (defaults to every shard)
+
+    Returns:
+        list: fn's results, in shard order
+    """
+    if not SHARDING:
+        conn = get_connection()
+        try:
+            return [fn(conn)]
+        finally:
+            conn.close()
+
+    def run(name):
+        conn = connect(shard_database(name))
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+    names = list_shards() if shards is None else shards
+    if len(names) == 1:
+        return [run(names[0])]
+
+    # Each task runs in a copy of this context, so its queries are tallied
+    pool = _get_fanout_pool()
+    futures = [pool.submit(copy_context().run, run, name) for name in names]
+    return [future.result() for future in futures]
+
+
+# ===============================================
+# Shard Management
+# ===============================================
+
+def create_shard(name):
+    """
+    Create an empty shard with the tenant schema.
+
+    Args:
+        name (str): Lowercase letters, digits, '-' and '_'
+
+    Returns:
+        tuple: (success, message, name)
+    """
+    if not SHARDING:
+        return False, "Sharding is off (set BIZDRIVE_SHARD_DIR)", None
+    if not SHARD_NAME_PATTERN.match(name or ''):
+        return False, "Shard names use lowercase letters, digits, '-' and '_'", None
+
+    _ensure_directory()
+    conn = get_directory_connection()
+    try:
+        conn.execute('''
+            INSERT INTO shards (name, shard_index)
+            SELECT ?, COALESCE(MAX(shard_index), 0) + 1 FROM shards
+        ''', (name,))
+        conn.commit()
+        index = conn.execute("SELECT shard_index FROM shards WHERE name = ?", (name,)).fetchone()[0]
+    except sqlite3.IntegrityError:
+        return False, f"Shard {name} already exists", None
+    finally:
+        conn.close()
+
+    with use_shard(name):
+        for init in _tenant_schema():
+            init()
+
+    conn = connect(shard_database(name))
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM main.sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'")
+    for (table,) in cursor.fetchall():
+        cursor.execute("DELETE FROM main.sqlite_sequence WHERE name = ?", (table,))
+        cursor.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)",
+                       (table, index << SHARD_ID_BITS))
+    conn.commit()
+    conn.close()
+    return True, f"Shard {name} created", name
+
+
+def _copy_rows(cursor, table, where, params, remap=None, keep_ids=False):
+    """
+    Copy rows from the source shard (main) into the target (dest).
+    The target assigns new ids; remap rewrites foreign key columns.
+
+    Returns:
+        dict: Old id -> new id, when keep_ids is set
+    """
+    remap = remap or {}
+    source = [row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})").fetchall()]
+    target = {row[1] for row in cursor.execute(f"PRAGMA dest.table_info({table})").fetchall()}
+    columns = [column for column in source if column in target]
+    values = [column for column in columns if column != 'id']
+
+    cursor.execute(f"SELECT {', '.join(columns)} FROM main.{table} WHERE {where} ORDER BY id", params)
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for row in rows:
+        for column, ids in remap.items():
+            row[column] = ids.get(row[column], row[column])
+
+    insert = f"INSERT INTO dest.{table} ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})"
+    if not keep_ids:
+        cursor.executemany(insert, [[row[column] for column in values] for row in rows])
+        return {}
+
+    ids = {}
+    for row in rows:
+        cursor.execute(insert, [row[column] for column in values])
+        ids[row['id']] = cursor.lastrowid
+    return ids
+
+
+def assign_user_shard(user_id, shard):
+    """
+    Move a user's data to a shard (created if needed) and route them there.
+    The copy, the delete from the old shard and the directory update are
+    one transaction. Other processes route the user to the new shard
+    within SHARD_MAP_TTL seconds, so move users while they are idle.
+
+    Args:
+        user_id (int): User ID
+        shard (str): Target shard
+
+    Returns:
+        tuple: (success, message, shard)
+    """
+    if not SHARDING:
+        return False, "Sharding is off (set BIZDRIVE_SHARD_DIR)", None
+    if shard not in list_shards():
+        success, message, _ = create_shard(shard)
+        if not success:
+            return False, message, None
+
+    source = shard_for_user(user_id, cached=False)
+    if source == shard:
+        return True, f"User already in shard {shard}", shard
+
+    conn = _open_shard(shard_database(source))
+
+    # Archived years stay with the shard they were archived from
+    from archive_store import ARCHIVE_TABLES, query_archives
+    for table in ARCHIVE_TABLES:
+        if query_archives(conn, table, f"SELECT 1 FROM {table} WHERE user_id = ? LIMIT 1", (user_id,)):
+            conn.close()
+            return False, f"User {user_id} has archived {table} in shard {source} and cannot be moved", None
+
+    conn.execute("ATTACH DATABASE ? AS dest", (shard_database(shard),))
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        params = (user_id,)
+        vehicles = _copy_rows(cursor, 'vehicles', 'user_id = ?', params, keep_ids=True)
+        _copy_rows(cursor, 'trips', 'user_id = ?', params, {'vehicle_id': vehicles})
+        _copy_rows(cursor, 'expenses', 'user_id = ?', params, {'vehicle_id': vehicles})
+        accidents = _copy_rows(cursor, 'accidents', 'user_id = ?', params,
+                               {'vehicle_id': vehicles}, keep_ids=True)
+        _copy_rows(cursor, 'accident_photos',
+                   'accident_id IN (SELECT id FROM main.accidents WHERE user_id = ?)', params,
+                   {'accident_id': accidents})
+
+        cursor.execute('''
+            DELETE FROM main.accident_photos
+            WHERE accident_id IN (SELECT id FROM main.accidents WHERE user_id = ?)
+        ''', params)
+        for table in ('trips', 'expenses', 'accidents', 'vehicles'):
+            cursor.execute(f"DELETE FROM main.{table} WHERE user_id = ?", params)
+
+        cursor.execute("INSERT OR REPLACE INTO directory.user_shards (user_id, shard) VALUES (?, ?)",
+                       (user_id, shard))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        return False, f"Could not move user {user_id}: {e}", None
+    finally:
+        conn.close()
+        with _shard_map_lock:
+            _shard_map.pop(user_id, None)
+
+    return True, f"User {user_id} moved from {source} to {shard}", shard
+
+
+# ===============================================
+# Flask Hooks
+# ===============================================
+
+def init_shard_router(app):
+    """
+    Bring every shard's schema up to date and route each request to its
+    user's shard. Call before the table initialisers. Does nothing unless
+    BIZDRIVE_SHARD_DIR is set.
+
+    Args:
+        app (Flask): The application
+    """
+    if not SHARDING:
+        return
+
+    _ensure_directory()
+    for _ in each_shard():
+        for init in _tenant_schema():
+            init()
+
+    @app.before_request
+    def _route_tenant_request():
+        # Set on every request rather than reset at teardown: streamed
+        # bodies are produced after teardown and must still see the shard
+        user_id = session.get('user_id')
+        _current_shard.set(shard_for_user(user_id) if user_id else None)
+
+
+# ===============================================
+# Command Line
+# ===============================================
+
+def _print_shards():
+    _ensure_directory()
+    conn = get_directory_connection()
+    counts = dict(conn.execute("SELECT shard, COUNT(*) FROM user_shards GROUP BY shard").fetchall())
+    total = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    conn.close()
+
+    for name in list_shards():
+        path = shard_database(name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        users = total - sum(counts.values()) if name == DEFAULT_SHARD else counts.get(name, 0)
+        print(f"{name:<20} {users:>6} users  {size / 1024 / 1024:>8.1f} MB  {path}")
+
+
+def main(argv):
+    if not SHARDING:
+        print("Sharding is off: set BIZDRIVE_SHARD_DIR")
+        return 1
+    if len(argv) < 2 or argv[1] not in ('list', 'create', 'assign'):
+        print(__doc__)
+        return 1
+
+    if argv[1] == 'list':
+        _print_shards()
+        return 0
+
+    if argv[1] == 'create':
+        if len(argv) != 3:
+            print(__doc__)
+            return 1
+        success, message, _ = create_shard(argv[2])
+        print(message)
+        return 0 if success else 1
+
+    if len(argv) < 4:
+        print(__doc__)
+        return 1
+    from auth_helpers import get_user_info
+
+    failed = False
+    for username in argv[3:]:
+        user = get_user_info(username)
+        if not user:
+            print(f"Unknown user: {username}")
+            failed = True
+            continue
+        success, message, _ = assign_user_shard(user['id'], argv[2])
+        print(message)
+        failed = failed or not success
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    # Run through the imported module: get_connection() routes with its state
+    import shard_router
+    sys.exit(shard_router.main(sys.argv))
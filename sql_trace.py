@@ -0,0 +1,412 @@
+"""
+SQL Tracing for BizDrive
+Records every statement a request runs (fingerprint, duration, rows
+fetched and the calling line of application code), then after the request:
+    - aggregates time and calls per statement fingerprint
+    - logs statements slower than BIZDRIVE_SLOW_QUERY_MS (default 100)
+      together with their EXPLAIN QUERY PLAN
+    - warns when one request runs the same fingerprint more than
+      BIZDRIVE_N_PLUS_ONE_THRESHOLD times (default 10), the usual sign
+      of a query issued inside a loop
+
+Statement parameters are never stored, so traces cannot leak passwords or
+personal data. Recent request traces are kept in memory for the admin
+trace page. Set BIZDRIVE_SQL_TRACE=0 to switch tracing off.
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from itertools import count
+from functools import lru_cache
+
+TRACE_ENABLED = os.environ.get('BIZDRIVE_SQL_TRACE', '1') != '0'
+SLOW_QUERY_SECONDS = float(os.environ.get('BIZDRIVE_SLOW_QUERY_MS', '100')) / 1000
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('BIZDRIVE_N_PLUS_ONE_THRESHOLD', '10'))
+
+# Recent request traces, slow statements and N+1 warnings kept in memory
+TRACE_HISTORY = 200
+SLOW_QUERY_HISTORY = 200
+N_PLUS_ONE_HISTORY = 200
+
+# Statements recorded per request; later ones are only counted
+MAX_STATEMENTS_PER_TRACE = 500
+
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_TRACER_FILES = (os.path.join(_PROJECT_ROOT, 'db_helpers.py'), os.path.abspath(__file__))
+
+_lock = threading.Lock()
+_traces = deque(maxlen=TRACE_HISTORY)
+_slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+_n_plus_one = deque(maxlen=N_PLUS_ONE_HISTORY)
+_fingerprints = {}      # fingerprint -> aggregate stats
+_plans = {}             # fingerprint -> EXPLAIN QUERY PLAN lines
+_trace_ids = count(1)
+
+
+def set_tracing(enabled):
+    """Switch tracing on or off for new requests."""
+    global TRACE_ENABLED
+    TRACE_ENABLED = bool(enabled)
+
+
+def tracing_enabled():
+    return TRACE_ENABLED
+
+
+# ===============================================
+# Statement Records
+# ===============================================
+
+class TracedStatement:
+    """One executed statement; fetches add their rows and time to it."""
+
+    __slots__ = ('sql', 'database', 'offset', 'seconds', 'rows', 'call_site')
+
+    def __init__(self, sql, database, offset, seconds, call_site):
+        self.sql = sql
+        self.database = database
+        self.offset = offset
+        self.seconds = seconds
+        self.rows = 0
+        self.call_site = call_site
+
+    def add_fetch(self, rows, seconds):
+        self.rows += rows
+        self.seconds += seconds
+
+
+_application_code = {}  # code object -> whether it is application code
+
+
+def find_call_site():
+    """
+    The innermost application frame outside the database layer.
+
+    Returns:
+        tuple: (code object, line number), or None; see format_call_site
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        is_application = _application_code.get(code)
+        if is_application is None:
+            filename = code.co_filename
+            is_application = _application_code[code] = (
+                filename not in _TRACER_FILES and filename.startswith(_PROJECT_ROOT)
+            )
+        if is_application:
+            return code, frame.f_lineno
+        frame = frame.f_back
+    return None
+
+
+@lru_cache(maxsize=4096)
+def format_call_site(call_site):
+    """'module.py:line in function' for a find_call_site result."""
+    if call_site is None:
+        return 'unknown'
+    code, line = call_site
+    return f"{os.path.basename(code.co_filename)}:{line} in {code.co_name}"
+
+
+# ===============================================
+# Fingerprints
+# ===============================================
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_LIST = re.compile(r'(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+|(\(\?\))(?:\s*,\s*\(\?\))+')
+_WHITESPACE = re.compile(r'\s+')
+_NAMED_PARAMETER = re.compile(r'[:@$]([A-Za-z_]\w*)')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """
+    Normalise a statement so dynamically built variants group together:
+    literals become ?, placeholder lists collapse to (?...), whitespace
+    and comments are dropped.
+
+    Args:
+        sql (str): SQL text
+
+    Returns:
+        str: Fingerprint
+    """
+    text = _COMMENT.sub(' ', sql)
+    text = _STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _WHITESPACE.sub(' ', text).strip()
+    text = _PLACEHOLDER_LIST.sub('(?...)', text)
+    text = _VALUES_LIST.sub(lambda m: m.group(1) or m.group(2), text)
+    return text
+
+
+# ===============================================
+# Query Plans
+# ===============================================
+
+def _null_parameters(sql):
+    """NULL bindings matching a statement's placeholders."""
+    text = _STRING.sub('', _COMMENT.sub(' ', sql))
+    named = _NAMED_PARAMETER.findall(text)
+    if named:
+        return {name: None for name in named}
+    return [None] * text.count('?')
+
+
+def explain_query_plan(sql, database):
+    """
+    EXPLAIN QUERY PLAN for a statement, with every parameter bound to NULL.
+    Uses its own plain connection so the tracer never traces itself.
+
+    Args:
+        sql (str): SQL text
+        database (str): Database path
+
+    Returns:
+        list: Plan lines, indented by depth
+    """
+    if not database or database == ':memory:' or not os.path.exists(database):
+        return []
+
+    try:
+        conn = sqlite3.connect(database)
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", _null_parameters(sql)).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+    depth = {0: 0}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, 0) + 1
+        lines.append('  ' * (depth[node_id] - 1) + detail)
+    return lines
+
+
+def _plan_for(key, statement):
+    with _lock:
+        plan = _plans.get(key)
+    if plan is None:
+        plan = explain_query_plan(statement.sql, statement.database)
+        with _lock:
+            if len(_plans) >= 1000:
+                _plans.clear()
+            _plans[key] = plan
+    return plan
+
+
+# ===============================================
+# Request Analysis
+# ===============================================
+
+def _timestamp(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch))
+
+
+def record_request(endpoint, method, status, seconds, tally):
+    """
+    Analyse and store the trace of a finished request. Only slow statements
+    and N+1 patterns are reported here; everything else is formatted when
+    the admin page asks for it, to keep the request path cheap.
+
+    Args:
+        endpoint (str): Endpoint label
+        method (str): HTTP method
+        status (str): Response status code
+        seconds (float): Request duration
+        tally (QueryTally): Tally holding the traced statements
+    """
+    statements = tally.statements
+    trace_id = str(next(_trace_ids))
+    finished = time.time()
+
+    by_fingerprint = {}
+    slow = []
+    for statement in statements:
+        key = fingerprint(statement.sql)
+        group = by_fingerprint.get(key)
+        if group is None:
+            by_fingerprint[key] = [statement]
+        else:
+            group.append(statement)
+        if statement.seconds >= SLOW_QUERY_SECONDS:
+            slow.append((key, statement))
+
+    n_plus_one = [key for key, group in by_fingerprint.items() if len(group) > N_PLUS_ONE_THRESHOLD]
+
+    for key, statement in slow:
+        plan = _plan_for(key, statement)
+        print(f"Warning: slow query ({statement.seconds * 1000:.1f} ms, {statement.rows} rows) "
+              f"at {format_call_site(statement.call_site)} in {endpoint}: {key}")
+        for line in plan:
+            print(f"    {line}")
+        with _lock:
+            _slow_queries.append({
+                'trace_id': trace_id,
+                'endpoint': endpoint,
+                'fingerprint': key,
+                'ms': round(statement.seconds * 1000, 2),
+                'rows': statement.rows,
+                'call_site': format_call_site(statement.call_site),
+                'plan': plan,
+                'at': _timestamp(finished),
+            })
+
+    for key in n_plus_one:
+        group = by_fingerprint[key]
+        call_sites = sorted({format_call_site(statement.call_site) for statement in group})
+        print(f"Warning: possible N+1 in {endpoint}: {len(group)} executions of "
+              f"'{key}' from {', '.join(call_sites)}")
+        with _lock:
+            _n_plus_one.append({
+                'trace_id': trace_id,
+                'endpoint': endpoint,
+                'fingerprint': key,
+                'executions': len(group),
+                'call_sites': call_sites,
+                'at': _timestamp(finished),
+            })
+
+    trace = (trace_id, endpoint, method, status, seconds, tally.count, tally.seconds,
+             len(slow), n_plus_one, statements, finished)
+
+    with _lock:
+        _traces.append(trace)
+        for key, group in by_fingerprint.items():
+            stats = _fingerprints.get(key)
+            if stats is None:
+                stats = _fingerprints[key] = FingerprintStats(key)
+            stats.add(endpoint, group)
+
+
+class FingerprintStats:
+    """Totals for one statement fingerprint across all traced requests."""
+
+    __slots__ = ('fingerprint', 'calls', 'seconds', 'max_seconds', 'rows', 'call_sites', 'endpoints')
+
+    def __init__(self, key):
+        self.fingerprint = key
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.call_sites = set()
+        self.endpoints = set()
+
+    def add(self, endpoint, statements):
+        self.calls += len(statements)
+        self.endpoints.add(endpoint)
+        for statement in statements:
+            self.seconds += statement.seconds
+            self.rows += statement.rows
+            if statement.seconds > self.max_seconds:
+                self.max_seconds = statement.seconds
+            if len(self.call_sites) < 10:
+                self.call_sites.add(statement.call_site)
+
+    def as_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'calls': self.calls,
+            'total_ms': round(self.seconds * 1000, 2),
+            'mean_ms': round(self.seconds * 1000 / self.calls, 3),
+            'max_ms': round(self.max_seconds * 1000, 2),
+            'rows': self.rows,
+            'call_sites': sorted(format_call_site(site) for site in self.call_sites),
+            'endpoints': sorted(self.endpoints),
+        }
+
+
+# ===============================================
+# Admin View
+# ===============================================
+
+def _trace_dict(trace, with_statements=False):
+    (trace_id, endpoint, method, status, seconds, queries, db_seconds,
+     slow_count, n_plus_one, statements, finished) = trace
+    result = {
+        'id': trace_id,
+        'endpoint': endpoint,
+        'method': method,
+        'status': status,
+        'ms': round(seconds * 1000, 2),
+        'queries': queries,
+        'db_ms': round(db_seconds * 1000, 2),
+        'slow_queries': slow_count,
+        'n_plus_one': n_plus_one,
+        'at': _timestamp(finished),
+    }
+    if with_statements:
+        result['statements'] = [
+            {
+                'fingerprint': fingerprint(statement.sql),
+                'offset_ms': round(statement.offset * 1000, 2),
+                'ms': round(statement.seconds * 1000, 3),
+                'rows': statement.rows,
+                'call_site': format_call_site(statement.call_site),
+            }
+            for statement in statements
+        ]
+    return result
+
+
+def trace_summary(limit=25):
+    """
+    Tracer state for the admin page.
+
+    Args:
+        limit (int): Rows per list
+
+    Returns:
+        dict: Settings, top fingerprints by total time, recent slow
+              statements, N+1 warnings and recent request traces
+    """
+    with _lock:
+        top = sorted(_fingerprints.values(), key=lambda stats: stats.seconds, reverse=True)[:limit]
+        top = [stats.as_dict() for stats in top]
+        slow = list(_slow_queries)[::-1][:limit]
+        n_plus_one = list(_n_plus_one)[::-1][:limit]
+        recent = list(_traces)[::-1][:limit]
+
+    return {
+        'settings': {
+            'enabled': TRACE_ENABLED,
+            'slow_query_ms': SLOW_QUERY_SECONDS * 1000,
+            'n_plus_one_threshold': N_PLUS_ONE_THRESHOLD,
+        },
+        'top_statements': top,
+        'slow_queries': slow,
+        'n_plus_one': n_plus_one,
+        'recent_requests': [_trace_dict(trace) for trace in recent],
+    }
+
+
+def get_trace(trace_id):
+    """A stored request trace with its statements, or None."""
+    with _lock:
+        traces = list(_traces)
+    for trace in traces:
+        if trace[0] == trace_id:
+            return _trace_dict(trace, with_statements=True)
+    return None
+
+
+def reset_traces():
+    """Forget all stored traces and statistics."""
+    with _lock:
+        _traces.clear()
+        _slow_queries.clear()
+        _n_plus_one.clear()
+        _fingerprints.clear()
+        _plans.clear()
@@ -0,0 +1,94 @@
+"""
+Query Plan Tests for BizDrive
+Period-filtered list, stats and export queries must be answered from the
+(user_id, date) indexes, never by scanning trips, expenses or accidents.
+Each helper runs with SQL tracing on against a freshly built schema and
+every statement touching those tables is explained.
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# The database path is fixed when the helpers are imported
+_workdir = tempfile.mkdtemp(prefix='bizdrive-plans-')
+os.environ['BIZDRIVE_DATABASE'] = os.path.join(_workdir, 'bizdrive.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accident_helpers import get_user_accidents, init_accident_table  # noqa: E402
+from auth_helpers import init_database  # noqa: E402
+from db_helpers import DATABASE, start_query_tally, stop_query_tally  # noqa: E402
+from expense_helpers import get_expense_summary, get_user_expenses, init_expense_table  # noqa: E402
+from export_helpers import stream_export  # noqa: E402
+from sql_trace import explain_query_plan  # noqa: E402
+from trip_helpers import get_user_trip_stats, get_user_trips, init_trip_table  # noqa: E402
+from vehicle_helpers import init_vehicle_table  # noqa: E402
+
+USER_ID = 1
+START, END = '2026-01-01', '2026-01-31'
+
+# Table (and alias) named after FROM or JOIN
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(trips|expenses|accidents)'
+                         r'(?:\s+(?:AS\s+)?(?!WHERE|JOIN|LEFT|ON|GROUP|ORDER)(\w+))?', re.I)
+
+
+def _export(dataset):
+    _, _, (chunks, _, _) = stream_export(dataset, 'csv', START, END, user_id=USER_ID)
+    list(chunks)
+
+
+SCENARIOS = [
+    ('trip_list', 'trips', lambda: get_user_trips(USER_ID, start_date=START, end_date=END)),
+    ('trip_stats', 'trips', lambda: get_user_trip_stats(USER_ID, START, END)),
+    ('trip_export', 'trips', lambda: _export('trips')),
+    ('expense_list', 'expenses', lambda: get_user_expenses(USER_ID, start_date=START, end_date=END)),
+    ('expense_stats', 'expenses', lambda: get_expense_summary(USER_ID, None, START, END)),
+    ('expense_export', 'expenses', lambda: _export('expenses')),
+    ('accident_list', 'accidents', lambda: get_user_accidents(USER_ID)),
+    ('accident_export', 'accidents', lambda: _export('accidents')),
+]
+
+
+@pytest.fixture(scope='module', autouse=True)
+def schema():
+    init_database()
+    init_vehicle_table()
+    init_trip_table()
+    init_expense_table()
+    init_accident_table()
+    yield
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+def _plans(scenario, table):
+    """(sql, plan, names the table goes by) for each statement reading the table."""
+    tally = start_query_tally(trace=True)
+    try:
+        scenario()
+    finally:
+        stop_query_tally()
+
+    plans = []
+    for sql in dict.fromkeys(statement.sql for statement in tally.statements):
+        names = {alias or name.lower() for name, alias in TABLE_ALIAS.findall(sql) if name.lower() == table}
+        if names:
+            plans.append((' '.join(sql.split()), explain_query_plan(sql, DATABASE), names | {table}))
+    return plans
+
+
+@pytest.mark.parametrize('name, table, scenario', SCENARIOS, ids=[name for name, _, _ in SCENARIOS])
+def test_uses_user_date_index(name, table, scenario):
+    plans = _plans(scenario, table)
+    assert plans, f"{name} ran no query on {table}"
+
+    index = f"INDEX idx_{table}_user_date"
+    assert any(index in line for _, plan, _ in plans for line in plan), \
+        f"{name} never used idx_{table}_user_date:\n" + '\n'.join(f"{sql}\n  {plan}" for sql, plan, _ in plans)
+
+    for sql, plan, names in plans:
+        scans = [line for line in plan if (match := re.match(r'\s*SCAN (\w+)', line)) and match.group(1) in names]
+        assert not scans, f"{name} scans {table}:\n{sql}\n" + '\n'.join(plan)
@@ -7,6 +7,10 @@ Address-based trip tracking with multiple distance entry methods
 import sqlite3
 from datetime import datetime, date
 from decimal import Decimal
+from archive_store import with_archives
+from db_helpers import get_connection
+from distance_helpers import resolve_trip_distance, resolve_trip_distances
+from write_pipeline import run_write
 
 # ===============================================
 # Database Connection
@@ -14,7 +18,7 @@ from decimal import Decimal
 
 def get_db_connection():
     """Create and return a database connection."""
-    conn = sqlite3.connect('bizdrive.db')
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -42,11 +46,17 @@ def init_trip_table():
             reimbursement_amount DECIMAL(10,2),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 1,
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
             FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
         )
     ''')
     
+    # Row version for optimistic concurrency (added after the original schema)
+    cursor.execute("PRAGMA table_info(trips)")
+    if 'version' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE trips ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    
     # Create indexes
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_trips_user_vehicle 
@@ -68,6 +78,19 @@ def init_trip_table():
         ON trips(trip_date, user_id)
     ''')
     
+    # Period filters compare the raw ISO date (trip_date >= ? AND trip_date < ?)
+    # so these indexes apply; never wrap the column in strftime()
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_trips_user_date
+        ON trips(user_id, trip_date)
+    ''')
+    
+    # Child key of the vehicles foreign key: deleting a vehicle finds its trips by it
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_trips_vehicle
+        ON trips(vehicle_id)
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -176,12 +199,16 @@ def validate_trip_data(vehicle_id, trip_date, from_address, to_address, trip_typ
 # Trip CRUD Operations
 # ===============================================
 
+TRIP_CHANGED_MESSAGE = "This trip was changed by someone else since you opened it. Reload it and try again."
+
+
 def add_trip(user_id, vehicle_id, trip_date, from_address, to_address, trip_type, 
              start_odometer=None, end_odometer=None, purpose=None, notes=None, 
              reimbursement_rate=None, distance=None):
     """
     Add a new trip to the database with optional distance tracking.
     Supports 3 methods: odometer-based, manual distance, or address-only.
+    Address-only trips get their distance from the distance resolver.
     
     Args:
         user_id (int): ID of the user
@@ -215,7 +242,9 @@ def add_trip(user_id, vehicle_id, trip_date, from_address, to_address, trip_type
     # Method 2: Use manually entered distance
     elif distance is not None and distance > 0:
         final_distance = distance
-    # Method 3: No distance (address-only trip)
+    # Method 3: Address-only trip - resolve distance from the addresses
+    else:
+        final_distance = resolve_trip_distance(from_address, to_address)
     
     if reimbursement_rate is None:
         reimbursement_rate = get_default_rate()
@@ -225,47 +254,168 @@ def add_trip(user_id, vehicle_id, trip_date, from_address, to_address, trip_type
     # Only calculate reimbursement for business trips with distance
     reimbursement_amount = calculate_reimbursement(final_distance, reimbursement_rate) if trip_type == 'Business' else Decimal('0.00')
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+    row = (user_id, vehicle_id, trip_date, from_address.strip(), to_address.strip(),
+           start_odometer, end_odometer, final_distance, trip_type, purpose, notes,
+           float(reimbursement_rate), float(reimbursement_amount))
     try:
-        # Verify vehicle belongs to user
-        cursor.execute('SELECT id FROM vehicles WHERE id = ? AND user_id = ?', 
-                      (vehicle_id, user_id))
-        if not cursor.fetchone():
-            conn.close()
-            return False, "Vehicle not found or you don't have permission.", None
-        
-        # Insert trip
-        cursor.execute('''
-            INSERT INTO trips (user_id, vehicle_id, trip_date, from_address, to_address, 
-                             start_odometer, end_odometer, distance, trip_type, 
-                             purpose, notes, reimbursement_rate, reimbursement_amount)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, vehicle_id, trip_date, from_address.strip(), to_address.strip(), 
-              start_odometer, end_odometer, final_distance, trip_type, purpose, notes, 
-              float(reimbursement_rate), float(reimbursement_amount)))
-        
-        trip_id = cursor.lastrowid
-        
-        # Update vehicle odometer only if end_odometer provided
-        if end_odometer is not None:
-            cursor.execute('''
-                UPDATE vehicles 
-                SET odometer = ?, updated_at = ?
-                WHERE id = ?
-            ''', (end_odometer, datetime.now(), vehicle_id))
-        
-        conn.commit()
-        conn.close()
-        return True, "Trip logged successfully!", trip_id
-        
+        trip_id = run_write(_insert_trip, row, end_odometer)
     except Exception as e:
-        conn.close()
         return False, f"Database error: {str(e)}", None
+    if trip_id is None:
+        return False, "Vehicle not found or you don't have permission.", None
+    return True, "Trip logged successfully!", trip_id
+
 
+def _insert_trip(conn, row, end_odometer):
+    """
+    The writes of add_trip (committed by run_write).
 
-def get_user_trips(user_id, vehicle_id=None, trip_type=None, start_date=None, 
+    Returns:
+        int: New trip ID, or None if the vehicle is not the user's
+    """
+    user_id, vehicle_id = row[0], row[1]
+    cursor = conn.cursor()
+
+    # Verify vehicle belongs to user
+    cursor.execute('SELECT id FROM vehicles WHERE id = ? AND user_id = ?',
+                  (vehicle_id, user_id))
+    if not cursor.fetchone():
+        return None
+
+    cursor.execute('''
+        INSERT INTO trips (user_id, vehicle_id, trip_date, from_address, to_address,
+                         start_odometer, end_odometer, distance, trip_type,
+                         purpose, notes, reimbursement_rate, reimbursement_amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', row)
+    trip_id = cursor.lastrowid
+
+    # Update vehicle odometer only if end_odometer provided
+    if end_odometer is not None:
+        cursor.execute('''
+            UPDATE vehicles
+            SET odometer = ?, updated_at = ?
+            WHERE id = ?
+        ''', (end_odometer, datetime.now(), vehicle_id))
+
+    return trip_id
+
+
+def add_trips(user_id, vehicle_id, trip_date, trip_type, legs, reimbursement_rate=None):
+    """
+    Add several trip legs for one day in a single transaction.
+    Legs that fail validation are skipped and reported; address-only legs
+    have their distances resolved in one batch.
+
+    Args:
+        user_id (int): ID of the user
+        vehicle_id (int): ID of the vehicle used for every leg
+        trip_date (str): Trip date (YYYY-MM-DD)
+        trip_type (str): Trip type (Business/Personal)
+        legs (list): Leg dictionaries with from_address, to_address and
+                     optional purpose, notes and distance (km)
+        reimbursement_rate (Decimal, optional): Rate per km
+
+    Returns:
+        tuple: (trip_ids, error_messages)
+    """
+    return add_trip_groups(user_id, trip_date, [(vehicle_id, trip_type, reimbursement_rate, legs)])
+
+
+def add_trip_groups(user_id, trip_date, groups):
+    """
+    Add legs for one day that differ in vehicle, trip type or rate, all in
+    a single transaction: either every valid leg is saved or none is.
+    Address-only legs of every group have their distances resolved in one
+    batch.
+
+    Args:
+        user_id (int): ID of the user
+        trip_date (str): Trip date (YYYY-MM-DD)
+        groups (list): (vehicle_id, trip_type, reimbursement_rate, legs)
+                       tuples, with legs and rate as for add_trips
+
+    Returns:
+        tuple: (trip_ids, error_messages)
+    """
+    default_rate = None
+    valid_legs = []   # (vehicle_id, trip_type, rate, leg)
+    error_messages = []
+    number = 0
+
+    for vehicle_id, trip_type, reimbursement_rate, legs in groups:
+        if reimbursement_rate is not None:
+            rate = Decimal(str(reimbursement_rate))
+        else:
+            if default_rate is None:
+                default_rate = get_default_rate()
+            rate = default_rate
+
+        for leg in legs:
+            number += 1
+            is_valid, error_msg = validate_trip_data(vehicle_id, trip_date, leg.get('from_address'),
+                                                     leg.get('to_address'), trip_type,
+                                                     distance=leg.get('distance'))
+            if is_valid:
+                valid_legs.append((vehicle_id, trip_type, rate, leg))
+            else:
+                error_messages.append(f"Trip {number}: {error_msg}")
+
+    if not valid_legs:
+        return [], error_messages
+
+    # Resolve all address-only legs in one batch
+    address_only = [leg for *_, leg in valid_legs if not leg.get('distance')]
+    resolved = resolve_trip_distances([(leg['from_address'], leg['to_address']) for leg in address_only])
+    resolved_distances = {id(leg): distance for leg, distance in zip(address_only, resolved)}
+
+    rows = []
+    for vehicle_id, trip_type, rate, leg in valid_legs:
+        final_distance = leg.get('distance') or resolved_distances.get(id(leg))
+        reimbursement_amount = calculate_reimbursement(final_distance, rate) if trip_type == 'Business' else Decimal('0.00')
+        rows.append((user_id, vehicle_id, trip_date, leg['from_address'].strip(), leg['to_address'].strip(),
+                     final_distance, trip_type, leg.get('purpose'), leg.get('notes'),
+                     float(rate), float(reimbursement_amount)))
+
+    try:
+        trip_ids = run_write(_insert_trips, user_id, rows)
+    except Exception as e:
+        return [], error_messages + [f"Database error: {str(e)}"]
+    if trip_ids is None:
+        return [], ["Vehicle not found or you don't have permission."]
+    return trip_ids, error_messages
+
+
+def _insert_trips(conn, user_id, rows):
+    """
+    The writes of add_trip_groups (committed by run_write).
+
+    Returns:
+        list: New trip IDs, or None if a vehicle is not the user's
+    """
+    cursor = conn.cursor()
+
+    # Verify every vehicle belongs to user
+    vehicle_ids = sorted({row[1] for row in rows})
+    placeholders = ', '.join('?' * len(vehicle_ids))
+    cursor.execute(f'SELECT COUNT(*) FROM vehicles WHERE user_id = ? AND id IN ({placeholders})',
+                   [user_id, *vehicle_ids])
+    if cursor.fetchone()[0] != len(vehicle_ids):
+        return None
+
+    trip_ids = []
+    for row in rows:
+        cursor.execute('''
+            INSERT INTO trips (user_id, vehicle_id, trip_date, from_address, to_address,
+                             distance, trip_type, purpose, notes,
+                             reimbursement_rate, reimbursement_amount)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', row)
+        trip_ids.append(cursor.lastrowid)
+    return trip_ids
+
+
+def get_user_trips(user_id, vehicle_id=None, trip_type=None, start_date=None,
                    end_date=None, trip_date=None, limit=None):
     """
     Get trips for a user with optional filters.
@@ -287,7 +437,7 @@ def get_user_trips(user_id, vehicle_id=None, trip_type=None, start_date=None,
     
     query = '''
         SELECT t.*, v.registration, v.make, v.model
-        FROM trips t
+        FROM {trips} t
         JOIN vehicles v ON t.vehicle_id = v.id
         WHERE t.user_id = ?
     '''
@@ -319,6 +469,7 @@ def get_user_trips(user_id, vehicle_id=None, trip_type=None, start_date=None,
         query += ' LIMIT ?'
         params.append(limit)
     
+    query = with_archives(conn, query, trip_date or start_date, trip_date or end_date)
     cursor.execute(query, params)
     trips = cursor.fetchall()
     conn.close()
@@ -326,6 +477,51 @@ def get_user_trips(user_id, vehicle_id=None, trip_type=None, start_date=None,
     return [dict(trip) for trip in trips]
 
 
+def iter_user_trips(user_id, batch_size=500, start_date=None, end_date=None):
+    """
+    Stream a user's trips for exports without loading them all at once.
+    
+    Args:
+        user_id (int): User ID
+        batch_size (int): Rows fetched from the cursor per batch
+        start_date (str, optional): Filter from date (YYYY-MM-DD)
+        end_date (str, optional): Filter to date (YYYY-MM-DD)
+        
+    Yields:
+        sqlite3.Row: Trip columns plus vehicle registration, make and model
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    query = '''
+        SELECT t.*, v.registration, v.make, v.model
+        FROM {trips} t
+        JOIN vehicles v ON t.vehicle_id = v.id
+        WHERE t.user_id = ?
+    '''
+    params = [user_id]
+    
+    if start_date:
+        query += ' AND t.trip_date >= ?'
+        params.append(start_date)
+    
+    if end_date:
+        query += ' AND t.trip_date <= ?'
+        params.append(end_date)
+    
+    query += ' ORDER BY t.trip_date DESC, t.created_at DESC'
+    cursor.execute(with_archives(conn, query, start_date, end_date), params)
+    
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
 def get_daily_trips(user_id, trip_date, vehicle_id=None):
     """
     Get all trips for a specific date (for multiple daily site visits).
@@ -362,146 +558,179 @@ def get_trip_by_id(trip_id, user_id):
 def update_trip(trip_id, user_id, vehicle_id=None, trip_date=None, 
                 from_address=None, to_address=None, start_odometer=None, 
                 end_odometer=None, trip_type=None, purpose=None, notes=None,
-                reimbursement_rate=None, distance=None):
+                reimbursement_rate=None, distance=None, expected_version=None):
     """
     Update an existing trip.
     
+    The ownership check, the distance and reimbursement recalculation and
+    the write run on one connection, and the UPDATE only applies to the
+    version of the row that was read, so an edit that lands in between is
+    reported instead of silently overwritten.
+    
     Args:
         trip_id (int): Trip ID to update
         user_id (int): User ID (for security check)
+        expected_version (int, optional): Version the editor loaded; the
+                                          update is refused if the trip
+                                          has changed since
         Other args: Fields to update (None = don't update)
         
     Returns:
         tuple: (success, message)
     """
-    trip = get_trip_by_id(trip_id, user_id)
-    if not trip:
-        return False, "Trip not found or you don't have permission to edit it."
-    
-    # Collect new values or use existing
-    new_vehicle_id = vehicle_id if vehicle_id is not None else trip['vehicle_id']
-    new_trip_date = trip_date if trip_date is not None else trip['trip_date']
-    new_from = from_address if from_address is not None else trip['from_address']
-    new_to = to_address if to_address is not None else trip['to_address']
-    new_type = trip_type if trip_type is not None else trip['trip_type']
-    new_start = start_odometer if start_odometer is not None else trip['start_odometer']
-    new_end = end_odometer if end_odometer is not None else trip['end_odometer']
-    new_distance = distance if distance is not None else trip['distance']
-    
-    # Validate the complete trip data
-    is_valid, error_msg = validate_trip_data(new_vehicle_id, new_trip_date, 
-                                             new_from, new_to, new_type, new_start, new_end, new_distance)
-    if not is_valid:
-        return False, error_msg
-    
-    # Build update query
-    updates = []
-    values = []
-    
-    if vehicle_id is not None:
-        updates.append("vehicle_id = ?")
-        values.append(vehicle_id)
-    
-    if trip_date is not None:
-        updates.append("trip_date = ?")
-        values.append(trip_date)
-    
-    if from_address is not None:
-        updates.append("from_address = ?")
-        values.append(from_address.strip())
-    
-    if to_address is not None:
-        updates.append("to_address = ?")
-        values.append(to_address.strip())
-    
-    if start_odometer is not None:
-        updates.append("start_odometer = ?")
-        values.append(start_odometer)
-    
-    if end_odometer is not None:
-        updates.append("end_odometer = ?")
-        values.append(end_odometer)
-    
-    if trip_type is not None:
-        updates.append("trip_type = ?")
-        values.append(trip_type)
-    
-    if purpose is not None:
-        updates.append("purpose = ?")
-        values.append(purpose)
-    
-    if notes is not None:
-        updates.append("notes = ?")
-        values.append(notes)
-    
-    if reimbursement_rate is not None:
-        updates.append("reimbursement_rate = ?")
-        values.append(float(reimbursement_rate))
-    
-    # Recalculate distance based on what was updated
-    calc_distance = None
-    if start_odometer is not None or end_odometer is not None:
-        calc_start = start_odometer if start_odometer is not None else trip['start_odometer']
-        calc_end = end_odometer if end_odometer is not None else trip['end_odometer']
-        
-        if calc_start is not None and calc_end is not None:
-            calc_distance = calc_end - calc_start
-    elif distance is not None:
-        calc_distance = distance
-    else:
-        calc_distance = trip['distance']
-    
-    # Always update distance
-    updates.append("distance = ?")
-    values.append(calc_distance)
-    
-    # Recalculate reimbursement
-    rate = Decimal(str(reimbursement_rate)) if reimbursement_rate is not None else Decimal(str(trip['reimbursement_rate']))
-    reimbursement = calculate_reimbursement(calc_distance, rate) if new_type == 'Business' else Decimal('0.00')
-    
-    updates.append("reimbursement_amount = ?")
-    values.append(float(reimbursement))
-    
-    if not updates:
-        return False, "No fields to update."
-    
-    updates.append("updated_at = ?")
-    values.append(datetime.now())
-    
-    values.extend([trip_id, user_id])
-    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        query = f"UPDATE trips SET {', '.join(updates)} WHERE id = ? AND user_id = ?"
-        cursor.execute(query, values)
+        cursor.execute('SELECT * FROM trips WHERE id = ? AND user_id = ?', (trip_id, user_id))
+        trip = cursor.fetchone()
+        if not trip:
+            return False, "Trip not found or you don't have permission to edit it."
+        if expected_version is not None and trip['version'] != expected_version:
+            return False, TRIP_CHANGED_MESSAGE
+        
+        # Collect new values or use existing
+        new_vehicle_id = vehicle_id if vehicle_id is not None else trip['vehicle_id']
+        new_trip_date = trip_date if trip_date is not None else trip['trip_date']
+        new_from = from_address if from_address is not None else trip['from_address']
+        new_to = to_address if to_address is not None else trip['to_address']
+        new_type = trip_type if trip_type is not None else trip['trip_type']
+        new_start = start_odometer if start_odometer is not None else trip['start_odometer']
+        new_end = end_odometer if end_odometer is not None else trip['end_odometer']
+        new_distance = distance if distance is not None else trip['distance']
+        
+        # Validate the complete trip data
+        is_valid, error_msg = validate_trip_data(new_vehicle_id, new_trip_date, 
+                                                 new_from, new_to, new_type, new_start, new_end, new_distance)
+        if not is_valid:
+            return False, error_msg
+        
+        # Build update query
+        updates = []
+        values = []
+        
+        if vehicle_id is not None:
+            updates.append("vehicle_id = ?")
+            values.append(vehicle_id)
+        
+        if trip_date is not None:
+            updates.append("trip_date = ?")
+            values.append(trip_date)
+        
+        if from_address is not None:
+            updates.append("from_address = ?")
+            values.append(from_address.strip())
+        
+        if to_address is not None:
+            updates.append("to_address = ?")
+            values.append(to_address.strip())
+        
+        if start_odometer is not None:
+            updates.append("start_odometer = ?")
+            values.append(start_odometer)
+        
+        if end_odometer is not None:
+            updates.append("end_odometer = ?")
+            values.append(end_odometer)
+        
+        if trip_type is not None:
+            updates.append("trip_type = ?")
+            values.append(trip_type)
+        
+        if purpose is not None:
+            updates.append("purpose = ?")
+            values.append(purpose)
+        
+        if notes is not None:
+            updates.append("notes = ?")
+            values.append(notes)
+        
+        if reimbursement_rate is not None:
+            updates.append("reimbursement_rate = ?")
+            values.append(float(reimbursement_rate))
+        
+        # Recalculate distance based on what was updated
+        calc_distance = None
+        if start_odometer is not None or end_odometer is not None:
+            if new_start is not None and new_end is not None:
+                calc_distance = new_end - new_start
+        elif distance is not None:
+            calc_distance = distance
+        elif (new_from.strip(), new_to.strip()) != (trip['from_address'], trip['to_address']) \
+                and new_start is None and new_end is None:
+            # The stored distance was for the old addresses
+            calc_distance = resolve_trip_distance(new_from.strip(), new_to.strip())
+        else:
+            calc_distance = trip['distance']
+        
+        # Always update distance
+        updates.append("distance = ?")
+        values.append(calc_distance)
+        
+        # Recalculate reimbursement
+        rate = Decimal(str(reimbursement_rate)) if reimbursement_rate is not None else Decimal(str(trip['reimbursement_rate']))
+        reimbursement = calculate_reimbursement(calc_distance, rate) if new_type == 'Business' else Decimal('0.00')
+        
+        updates.append("reimbursement_amount = ?")
+        values.append(float(reimbursement))
+        
+        updates.append("updated_at = ?")
+        values.append(datetime.now())
+        updates.append("version = version + 1")
+        
+        values.extend([trip_id, user_id, trip['version']])
+        
+        cursor.execute(f'''
+            UPDATE trips SET {', '.join(updates)}
+            WHERE id = ? AND user_id = ? AND version = ?
+            RETURNING version
+        ''', values)
+        if cursor.fetchone() is None:
+            conn.rollback()
+            return False, TRIP_CHANGED_MESSAGE
         conn.commit()
-        conn.close()
         return True, "Trip updated successfully!"
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Database error: {str(e)}"
+    finally:
+        conn.close()
 
 
-def delete_trip(trip_id, user_id):
-    """Delete a trip from the database."""
-    trip = get_trip_by_id(trip_id, user_id)
-    if not trip:
-        return False, "Trip not found or you don't have permission to delete it."
+def delete_trip(trip_id, user_id, expected_version=None):
+    """
+    Delete a trip from the database in one statement (the ownership check
+    is part of the DELETE).
     
+    Args:
+        trip_id (int): Trip ID to delete
+        user_id (int): User ID (for security check)
+        expected_version (int, optional): Only delete this version of the trip
+        
+    Returns:
+        tuple: (success, message)
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute('DELETE FROM trips WHERE id = ? AND user_id = ?', 
-                      (trip_id, user_id))
+        cursor.execute('''
+            DELETE FROM trips
+            WHERE id = ? AND user_id = ? AND (? IS NULL OR version = ?)
+            RETURNING id
+        ''', (trip_id, user_id, expected_version, expected_version))
+        if cursor.fetchone() is None:
+            conn.rollback()
+            if expected_version is not None and get_trip_by_id(trip_id, user_id):
+                return False, TRIP_CHANGED_MESSAGE
+            return False, "Trip not found or you don't have permission to delete it."
         conn.commit()
-        conn.close()
         return True, "Trip deleted successfully!"
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Database error: {str(e)}"
+    finally:
+        conn.close()
 
 
 # ===============================================
@@ -525,7 +754,7 @@ def get_vehicle_trip_stats(vehicle_id, user_id, start_date=None, end_date=None):
             COALESCE(SUM(CASE WHEN trip_type = 'Business' AND distance IS NOT NULL THEN distance ELSE 0 END), 0) as business_distance,
             COALESCE(SUM(CASE WHEN trip_type = 'Personal' AND distance IS NOT NULL THEN distance ELSE 0 END), 0) as personal_distance,
             COALESCE(SUM(CASE WHEN trip_type = 'Business' THEN reimbursement_amount ELSE 0 END), 0) as total_reimbursement
-        FROM trips
+        FROM {trips}
         WHERE vehicle_id = ? AND user_id = ?
     '''
     params = [vehicle_id, user_id]
@@ -538,7 +767,7 @@ def get_vehicle_trip_stats(vehicle_id, user_id, start_date=None, end_date=None):
         query += ' AND trip_date <= ?'
         params.append(end_date)
     
-    cursor.execute(query, params)
+    cursor.execute(with_archives(conn, query, start_date, end_date), params)
     result = cursor.fetchone()
     conn.close()
     
@@ -568,7 +797,7 @@ def get_user_trip_stats(user_id, start_date=None, end_date=None):
             COALESCE(SUM(CASE WHEN trip_type = 'Business' AND distance IS NOT NULL THEN distance ELSE 0 END), 0) as business_distance,
             COALESCE(SUM(CASE WHEN trip_type = 'Personal' AND distance IS NOT NULL THEN distance ELSE 0 END), 0) as personal_distance,
             COALESCE(SUM(CASE WHEN trip_type = 'Business' THEN reimbursement_amount ELSE 0 END), 0) as total_reimbursement
-        FROM trips
+        FROM {trips}
         WHERE user_id = ?
     '''
     params = [user_id]
@@ -581,7 +810,7 @@ def get_user_trip_stats(user_id, start_date=None, end_date=None):
         query += ' AND trip_date <= ?'
         params.append(end_date)
     
-    cursor.execute(query, params)
+    cursor.execute(with_archives(conn, query, start_date, end_date), params)
     result = cursor.fetchone()
     conn.close()
     
@@ -3,17 +3,21 @@ Vehicle Helper Functions for BizDrive
 This module contains utility functions for vehicle management operations.
 """
 
-import os
 import sqlite3
 from datetime import datetime
 
+from cascade_deletes import delete_vehicle_rows
+from db_helpers import get_connection
+
+VEHICLE_CHANGED_MESSAGE = "This vehicle was changed by someone else since you opened it. Reload it and try again."
+
 # ===============================================
 # Database Connection
 # ===============================================
 
 def get_db_connection():
     """Create and return a database connection."""
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'bizdrive.db'))
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -38,10 +42,22 @@ def init_vehicle_table():
             notes TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 1,
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         )
     ''')
     
+    # Row version for optimistic concurrency (added after the original schema)
+    cursor.execute("PRAGMA table_info(vehicles)")
+    if 'version' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE vehicles ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    
+    # Child key of the users foreign key: deleting a user finds their vehicles by it
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_vehicles_user
+        ON vehicles(user_id)
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -269,23 +285,22 @@ def get_vehicle_by_registration(registration, user_id):
 
 def update_vehicle(vehicle_id, user_id, registration=None, make=None, model=None,
                    year=None, color=None, odometer=None, status=None, 
-                   purchase_date=None, notes=None):
+                   purchase_date=None, notes=None, expected_version=None):
     """
-    Update an existing vehicle.
+    Update an existing vehicle in one statement: the ownership (and
+    version) check is part of the UPDATE.
     
     Args:
         vehicle_id (int): Vehicle ID to update
         user_id (int): User ID (for security check)
+        expected_version (int, optional): Version the editor loaded; the
+                                          update is refused if the vehicle
+                                          has changed since
         Other args: Fields to update (None = don't update)
         
     Returns:
         tuple: (success, message)
     """
-    # Check if vehicle exists and belongs to user
-    vehicle = get_vehicle_by_id(vehicle_id, user_id)
-    if not vehicle:
-        return False, "Vehicle not found or you don't have permission to edit it."
-    
     # Build update query dynamically
     updates = []
     values = []
@@ -344,60 +359,73 @@ def update_vehicle(vehicle_id, user_id, registration=None, make=None, model=None
     if not updates:
         return False, "No fields to update."
     
-    # Add updated timestamp
+    # Add updated timestamp and bump the version
     updates.append("updated_at = ?")
     values.append(datetime.now())
+    updates.append("version = version + 1")
     
     # Add WHERE clause values
-    values.extend([vehicle_id, user_id])
+    values.extend([vehicle_id, user_id, expected_version, expected_version])
     
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        query = f"UPDATE vehicles SET {', '.join(updates)} WHERE id = ? AND user_id = ?"
-        cursor.execute(query, values)
+        cursor.execute(f'''
+            UPDATE vehicles SET {', '.join(updates)}
+            WHERE id = ? AND user_id = ? AND (? IS NULL OR version = ?)
+            RETURNING version
+        ''', values)
+        if cursor.fetchone() is None:
+            conn.rollback()
+            return False, _missing_vehicle_message(vehicle_id, user_id, expected_version, 'edit')
         conn.commit()
-        conn.close()
         return True, "Vehicle updated successfully!"
         
     except sqlite3.IntegrityError:
-        conn.close()
+        conn.rollback()
         return False, "This registration number already exists."
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Database error: {str(e)}"
+    finally:
+        conn.close()
 
 
-def delete_vehicle(vehicle_id, user_id):
+def delete_vehicle(vehicle_id, user_id, expected_version=None):
     """
-    Delete a vehicle from the database.
+    Delete a vehicle with its trips, expenses and accidents (archived ones
+    too) and release their receipts and photos. The dependent rows are
+    deleted in short batches (see cascade_deletes.py), after the ownership
+    and version check.
     
     Args:
         vehicle_id (int): Vehicle ID to delete
         user_id (int): User ID (for security check)
+        expected_version (int, optional): Only delete this version of the vehicle
         
     Returns:
         tuple: (success, message)
     """
-    # Check if vehicle exists and belongs to user
     vehicle = get_vehicle_by_id(vehicle_id, user_id)
-    if not vehicle:
-        return False, "Vehicle not found or you don't have permission to delete it."
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if vehicle is None or (expected_version is not None and vehicle['version'] != expected_version):
+        return False, _missing_vehicle_message(vehicle_id, user_id, expected_version, 'delete')
     
     try:
-        cursor.execute('DELETE FROM vehicles WHERE id = ? AND user_id = ?', 
-                      (vehicle_id, user_id))
-        conn.commit()
-        conn.close()
-        return True, f"Vehicle {vehicle['registration']} deleted successfully!"
-        
+        registration = delete_vehicle_rows(vehicle_id, user_id)
     except Exception as e:
-        conn.close()
         return False, f"Database error: {str(e)}"
+    
+    if registration is None:
+        return False, _missing_vehicle_message(vehicle_id, user_id, None, 'delete')
+    return True, f"Vehicle {registration} deleted successfully!"
+
+
+def _missing_vehicle_message(vehicle_id, user_id, expected_version, action):
+    """Why a guarded UPDATE or DELETE matched no vehicle."""
+    if expected_version is not None and get_vehicle_by_id(vehicle_id, user_id):
+        return VEHICLE_CHANGED_MESSAGE
+    return f"Vehicle not found or you don't have permission to {action} it."
 
 
 def get_vehicle_count(user_id, status=None):
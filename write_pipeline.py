@@ -0,0 +1,241 @@
+"""
+Write Pipeline for BizDrive
+Optional single-writer path for high-rate inserts. With
+BIZDRIVE_WRITE_PIPELINE=1, the database part of add_trip, add_trips and
+add_expense is queued to one writer thread per process instead of each
+request thread taking SQLite's write lock in turn. The writer gathers
+whatever arrives within a few milliseconds into one transaction (a group
+commit: one lock and one fsync for the whole group) and then resolves
+each caller's future.
+
+Every queued write runs in its own savepoint, so one that raises is
+rolled back alone and the rest of its group still commits. Callers only
+see their result after the group has committed. The statements count
+towards the caller's query tally, but the commit is the writer's, so it
+is not in the request's commits. Writes made inside
+unit_of_work() stay on the caller's connection, so they still commit
+with the rest of the unit. PostgreSQL does row-level locking and does
+not need the pipeline; there writes always run on the caller's thread.
+
+Worker processes each have their own writer; between processes SQLite's
+busy timeout still decides who writes next, but there is one contender
+per process instead of one per request thread.
+"""
+
+import atexit
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import shard_router
+from db_helpers import DATABASE, current_unit_of_work, get_connection, is_postgres
+
+# BIZDRIVE_WRITE_PIPELINE=1 funnels helper writes through the writer thread
+WRITE_PIPELINE = os.environ.get('BIZDRIVE_WRITE_PIPELINE', '0') == '1' and not is_postgres()
+
+# How long the writer waits for more writes after the first of a group
+GROUP_COMMIT_MS = float(os.environ.get('BIZDRIVE_GROUP_COMMIT_MS', '2'))
+
+# Most writes committed together
+MAX_GROUP_SIZE = int(os.environ.get('BIZDRIVE_MAX_GROUP_SIZE', '500'))
+
+
+# ===============================================
+# Writer Thread
+# ===============================================
+
+class _Write:
+    """One queued write: fn(conn, *args) run in the submitting context."""
+
+    __slots__ = ('fn', 'args', 'kwargs', 'context', 'database', 'future')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        # Carries the caller's shard, query tally and SQL trace to the writer
+        self.context = contextvars.copy_context()
+        self.database = shard_router.shard_path() if shard_router.SHARDING else DATABASE
+        self.future = Future()
+
+
+class WritePipeline:
+    """A writer thread and its queue; groups queued writes into one commit."""
+
+    def __init__(self, window=GROUP_COMMIT_MS / 1000, max_group=MAX_GROUP_SIZE):
+        self.window = window
+        self.max_group = max_group
+        self.groups = 0
+        self.writes = 0
+        self._queue = queue.SimpleQueue()
+        self._connections = {}   # database -> the writer's connection
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue fn(conn, *args, **kwargs) for the writer thread. fn does its
+        writes on conn and must not commit, roll back or close it.
+
+        Returns:
+            Future: fn's return value once its group has committed, or the
+                    exception fn (or the commit) raised
+        """
+        write = _Write(fn, args, kwargs)
+        self._start()
+        self._queue.put(write)
+        return write.future
+
+    def stop(self):
+        """Commit whatever is queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join()
+
+    def _start(self):
+        # A forked worker inherits the queue but not the thread: start afresh
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._connections = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='bizdrive-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            self._loop()
+        finally:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections = {}
+            # Should the loop ever end unexpectedly, the next submit starts a new writer
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            group = [first]
+            deadline = time.perf_counter() + self.window
+            while len(group) < self.max_group:
+                try:
+                    write = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if write is None:
+                    stopping = True
+                    break
+                group.append(write)
+
+            by_database = {}
+            for write in group:
+                by_database.setdefault(write.database, []).append(write)
+            for database, writes in by_database.items():
+                try:
+                    self._commit_group(database, writes)
+                except Exception as e:
+                    # One bad group must not stop the writer: fail what it left undecided
+                    print(f"Warning: write group of {len(writes)} on {database} failed: {e}")
+                    for write in writes:
+                        if not write.future.done():
+                            write.future.set_exception(e)
+
+    def _connection(self, write):
+        conn = self._connections.get(write.database)
+        if conn is None:
+            # Opened in the caller's context, so it routes to the caller's shard
+            conn = write.context.run(get_connection, DATABASE)
+            conn.row_factory = None
+            self._connections[write.database] = conn
+        return conn
+
+    def _commit_group(self, database, writes):
+        """Run a group of writes for one database in one transaction."""
+        # Writes whose caller cancelled them are dropped
+        writes = [write for write in writes if write.future.set_running_or_notify_cancel()]
+        if not writes:
+            return
+        conn = None
+        try:
+            conn = self._connection(writes[0])
+            conn.execute("BEGIN IMMEDIATE")
+            results = []
+            for write in writes:
+                conn.execute("SAVEPOINT pipeline_write")
+                try:
+                    result = write.context.run(write.fn, conn, *write.args, **write.kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO pipeline_write")
+                    results.append((False, e))
+                else:
+                    results.append((True, result))
+                conn.execute("RELEASE pipeline_write")
+            conn.commit()
+        except Exception as e:
+            # Nothing in the group was committed; the next group reconnects
+            print(f"Warning: write group of {len(writes)} on {database} failed: {e}")
+            self._connections.pop(database, None)
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+                conn.close()
+            results = [(False, e)] * len(writes)
+
+        self.groups += 1
+        self.writes += len(writes)
+        for write, (ok, value) in zip(writes, results):
+            if ok:
+                write.future.set_result(value)
+            else:
+                write.future.set_exception(value)
+
+
+_pipeline = WritePipeline()
+atexit.register(_pipeline.stop)
+
+
+# ===============================================
+# Helper Entry Points
+# ===============================================
+
+def run_write(fn, *args, **kwargs):
+    """
+    Run fn(conn, *args, **kwargs), commit, and return its result. Errors
+    from fn or the commit are raised to the caller, with fn's writes
+    rolled back.
+    """
+    if WRITE_PIPELINE and current_unit_of_work() is None:
+        return _pipeline.submit(fn, *args, **kwargs).result()
+    conn = get_connection()
+    try:
+        result = fn(conn, *args, **kwargs)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def pipeline_stats():
+    """Groups committed and writes in them since the process started."""
+    return {'enabled': WRITE_PIPELINE, 'groups': _pipeline.groups, 'writes': _pipeline.writes}